@@ -0,0 +1,59 @@
+"""Add demand forecasts table
+
+Revision ID: 5f2c8e1a9d47
+Revises: accd3b0e26ba
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import core.db
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2c8e1a9d47'
+down_revision: Union[str, None] = 'accd3b0e26ba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('demand_forecasts',
+    sa.Column('variant_id', core.db.GUID(), nullable=False),
+    sa.Column('method', sa.String(length=20), nullable=False),
+    sa.Column('daily_rate', sa.Float(), nullable=False),
+    sa.Column('demand_std', sa.Float(), nullable=False),
+    sa.Column('subscription_demand', sa.Float(), nullable=False),
+    sa.Column('horizon_days', sa.Integer(), nullable=False),
+    sa.Column('history_days', sa.Integer(), nullable=False),
+    sa.Column('forecast_demand', sa.Float(), nullable=False),
+    sa.Column('safety_stock', sa.Float(), nullable=False),
+    sa.Column('days_until_stockout', sa.Float(), nullable=True),
+    sa.Column('suggested_quantity', sa.Integer(), nullable=False),
+    sa.Column('generated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('id', core.db.GUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_by', core.db.GUID(), nullable=True),
+    sa.Column('updated_by', core.db.GUID(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['variant_id'], ['product_variants.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('variant_id')
+    )
+    op.create_index('idx_demand_forecasts_days_until_stockout', 'demand_forecasts', ['days_until_stockout'], unique=False)
+    op.create_index('idx_demand_forecasts_generated_at', 'demand_forecasts', ['generated_at'], unique=False)
+    op.create_index(op.f('ix_demand_forecasts_created_at'), 'demand_forecasts', ['created_at'], unique=False)
+    op.create_index(op.f('ix_demand_forecasts_created_by'), 'demand_forecasts', ['created_by'], unique=False)
+    op.create_index(op.f('ix_demand_forecasts_id'), 'demand_forecasts', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_demand_forecasts_id'), table_name='demand_forecasts')
+    op.drop_index(op.f('ix_demand_forecasts_created_by'), table_name='demand_forecasts')
+    op.drop_index(op.f('ix_demand_forecasts_created_at'), table_name='demand_forecasts')
+    op.drop_index('idx_demand_forecasts_generated_at', table_name='demand_forecasts')
+    op.drop_index('idx_demand_forecasts_days_until_stockout', table_name='demand_forecasts')
+    op.drop_table('demand_forecasts')
@@ -0,0 +1,74 @@
+"""Add daily and hourly metric rollup tables
+
+Revision ID: 8b3d6f0c2e71
+Revises: 5f2c8e1a9d47
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import core.db
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b3d6f0c2e71'
+down_revision: Union[str, None] = '5f2c8e1a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('daily_metrics',
+    sa.Column('bucket', sa.Date(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('paid_order_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('new_users', sa.Integer(), nullable=False),
+    sa.Column('status_breakdown', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('id', core.db.GUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_by', core.db.GUID(), nullable=True),
+    sa.Column('updated_by', core.db.GUID(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('bucket')
+    )
+    op.create_index(op.f('ix_daily_metrics_created_at'), 'daily_metrics', ['created_at'], unique=False)
+    op.create_index(op.f('ix_daily_metrics_created_by'), 'daily_metrics', ['created_by'], unique=False)
+    op.create_index(op.f('ix_daily_metrics_id'), 'daily_metrics', ['id'], unique=False)
+    op.create_table('hourly_metrics',
+    sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('paid_order_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('new_users', sa.Integer(), nullable=False),
+    sa.Column('status_breakdown', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('id', core.db.GUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_by', core.db.GUID(), nullable=True),
+    sa.Column('updated_by', core.db.GUID(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('bucket')
+    )
+    op.create_index(op.f('ix_hourly_metrics_created_at'), 'hourly_metrics', ['created_at'], unique=False)
+    op.create_index(op.f('ix_hourly_metrics_created_by'), 'hourly_metrics', ['created_by'], unique=False)
+    op.create_index(op.f('ix_hourly_metrics_id'), 'hourly_metrics', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_hourly_metrics_id'), table_name='hourly_metrics')
+    op.drop_index(op.f('ix_hourly_metrics_created_by'), table_name='hourly_metrics')
+    op.drop_index(op.f('ix_hourly_metrics_created_at'), table_name='hourly_metrics')
+    op.drop_table('hourly_metrics')
+    op.drop_index(op.f('ix_daily_metrics_id'), table_name='daily_metrics')
+    op.drop_index(op.f('ix_daily_metrics_created_by'), table_name='daily_metrics')
+    op.drop_index(op.f('ix_daily_metrics_created_at'), table_name='daily_metrics')
+    op.drop_table('daily_metrics')
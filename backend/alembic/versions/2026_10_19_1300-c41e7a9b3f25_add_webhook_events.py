@@ -0,0 +1,56 @@
+"""Add webhook_events inbox table
+
+Revision ID: c41e7a9b3f25
+Revises: 8b3d6f0c2e71
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import core.db
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7a9b3f25'
+down_revision: Union[str, None] = '8b3d6f0c2e71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_events',
+    sa.Column('stripe_event_id', sa.String(length=255), nullable=False),
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('stripe_payment_intent_id', sa.String(length=255), nullable=True),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('stripe_created', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('id', core.db.GUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_by', core.db.GUID(), nullable=True),
+    sa.Column('updated_by', core.db.GUID(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('stripe_event_id')
+    )
+    op.create_index('idx_webhook_events_status_created', 'webhook_events', ['status', 'stripe_created'], unique=False)
+    op.create_index('idx_webhook_events_payment_intent', 'webhook_events', ['stripe_payment_intent_id'], unique=False)
+    op.create_index(op.f('ix_webhook_events_created_at'), 'webhook_events', ['created_at'], unique=False)
+    op.create_index(op.f('ix_webhook_events_created_by'), 'webhook_events', ['created_by'], unique=False)
+    op.create_index(op.f('ix_webhook_events_id'), 'webhook_events', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_webhook_events_id'), table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_created_by'), table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_created_at'), table_name='webhook_events')
+    op.drop_index('idx_webhook_events_payment_intent', table_name='webhook_events')
+    op.drop_index('idx_webhook_events_status_created', table_name='webhook_events')
+    op.drop_table('webhook_events')
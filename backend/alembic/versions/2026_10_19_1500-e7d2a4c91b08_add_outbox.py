@@ -0,0 +1,52 @@
+"""Add outbox table
+
+Revision ID: e7d2a4c91b08
+Revises: c41e7a9b3f25
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import core.db
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7d2a4c91b08'
+down_revision: Union[str, None] = 'c41e7a9b3f25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox',
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('aggregate_id', sa.String(length=255), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('dispatched_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('id', core.db.GUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_by', core.db.GUID(), nullable=True),
+    sa.Column('updated_by', core.db.GUID(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_outbox_pending', 'outbox', ['created_at'], unique=False, postgresql_where=sa.text('dispatched_at IS NULL'))
+    op.create_index('idx_outbox_aggregate', 'outbox', ['aggregate_id'], unique=False)
+    op.create_index(op.f('ix_outbox_created_at'), 'outbox', ['created_at'], unique=False)
+    op.create_index(op.f('ix_outbox_created_by'), 'outbox', ['created_by'], unique=False)
+    op.create_index(op.f('ix_outbox_id'), 'outbox', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_outbox_id'), table_name='outbox')
+    op.drop_index(op.f('ix_outbox_created_by'), table_name='outbox')
+    op.drop_index(op.f('ix_outbox_created_at'), table_name='outbox')
+    op.drop_index('idx_outbox_aggregate', table_name='outbox')
+    op.drop_index('idx_outbox_pending', table_name='outbox', postgresql_where=sa.text('dispatched_at IS NULL'))
+    op.drop_table('outbox')
@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_
 from sqlalchemy.orm import selectinload
 from typing import Optional, Dict, Any, List
-from core.db import get_db
+from core.db import get_db, db_manager
 from core.utils.response import Response
 from core.errors import APIException
 from core.logging import get_logger
@@ -246,6 +246,7 @@ async def get_admin_stats(
     date_to: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
+    refresh: bool = Query(False, description="Bypass the cached response and recompute"),
     current_user: User = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
@@ -256,7 +257,8 @@ async def get_admin_stats(
             date_from=date_from,
             date_to=date_to,
             status=status,
-            category=category
+            category=category,
+            refresh=refresh
         )
         return Response.success(data=stats)
     except Exception as e:
@@ -271,6 +273,7 @@ async def get_dashboard_data(
     date_to: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
+    refresh: bool = Query(False, description="Bypass the cached response and recompute"),
     current_user: User = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
@@ -283,7 +286,8 @@ async def get_dashboard_data(
             date_from=date_from,
             date_to=date_to,
             status=status,
-            category=category
+            category=category,
+            refresh=refresh
         )
         
         return Response.success(data=stats)
@@ -597,10 +601,9 @@ async def get_order_invoice_admin(
     db: AsyncSession = Depends(get_db)
 ):
     """Get order invoice (admin only)."""
-    from fastapi.responses import StreamingResponse, FileResponse
+    from fastapi.responses import FileResponse
     from services.orders import OrderService as OrderService
     import os
-    import io
     
     try:
         order_service = OrderService(db)
@@ -625,32 +628,13 @@ async def get_order_invoice_admin(
                 message=error_msg
             )
         
-        # Handle pdf_bytes response (new format)
-        if 'pdf_bytes' in invoice:
-            pdf_bytes = invoice['pdf_bytes']
-            return StreamingResponse(
-                io.BytesIO(pdf_bytes),
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f"attachment; filename=invoice-{order_id}.pdf"
-                }
-            )
-        
-        # Handle invoice_path response (legacy format)
+        # Rendered (or cached) invoices are served straight from the invoice cache
         if 'invoice_path' in invoice and os.path.exists(invoice['invoice_path']):
-            file_path = invoice['invoice_path']
-            if file_path.endswith('.pdf'):
-                return FileResponse(
-                    path=file_path,
-                    filename=f"invoice-{order_id}.pdf",
-                    media_type="application/pdf"
-                )
-            else:
-                return FileResponse(
-                    path=file_path,
-                    filename=f"invoice-{order_id}.docx",
-                    media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
+            return FileResponse(
+                path=invoice['invoice_path'],
+                filename=f"invoice-{order_id}.pdf",
+                media_type="application/pdf"
+            )
         
         # Fallback: return invoice data as JSON
         return Response.success(data=invoice)
@@ -1115,6 +1099,10 @@ async def update_variant_stock_admin(
         )
 
 # Export Routes
+# PDFs are rendered in memory, so they stay capped; csv/excel stream any size
+PDF_EXPORT_MAX_ORDERS = 5000
+
+
 @router.get("/orders/export")
 async def export_orders(
     format: str = Query("csv"),
@@ -1127,9 +1115,15 @@ async def export_orders(
     current_user: User = Depends(require_admin),
     db: AsyncSession = Depends(get_db)
 ):
-    """Export orders to CSV, Excel, or PDF (admin only)."""
+    """
+    Export orders to CSV, Excel, or PDF (admin only).
+    CSV and Excel are streamed from a server-side cursor, so export size doesn't affect memory.
+    """
     from fastapi.responses import StreamingResponse
-    from services.export import ExportService
+    import io
+    from core.utils.render_pool import RenderPoolBusy, run_in_render_pool
+    from services.export import ExportService, order_export_dict
+    from services.export_jobs import render_orders_pdf_bytes
     
     if format not in ['csv', 'excel', 'pdf']:
         raise APIException(
@@ -1137,59 +1131,55 @@ async def export_orders(
             message="Invalid format. Use csv, excel, or pdf"
         )
     
+    filters = dict(
+        order_status=order_status,
+        q=q,
+        date_from=date_from,
+        date_to=date_to,
+        min_price=min_price,
+        max_price=max_price
+    )
+    
+    async def export_rows():
+        # The request-scoped session is closed before a streaming body is sent, so use our own
+        async with db_manager.session_factory() as export_db:
+            async for row in AdminService(export_db).stream_orders_for_export(**filters):
+                yield row
+    
     try:
-        admin_service = AdminService(db)
-        
-        # Fetch all orders using pagination to avoid limit restrictions
-        all_orders = []
-        page = 1
-        limit = 100
-        
-        while True:
-            orders_data = await admin_service.get_all_orders(
-                page=page, 
-                limit=limit,
-                order_status=order_status,
-                q=q,
-                date_from=date_from,
-                date_to=date_to,
-                min_price=min_price,
-                max_price=max_price
-            )
-            
-            orders_batch = orders_data.get('data', [])
-            if not orders_batch:
-                break
-                
-            all_orders.extend(orders_batch)
-            
-            # If we got less than the limit, we've reached the end
-            if len(orders_batch) < limit:
-                break
-                
-            page += 1
-        
-        orders = all_orders
-        
-        export_service = ExportService()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         if format == "csv":
-            output = export_service.export_orders_to_csv(orders)
+            output = ExportService.stream_orders_to_csv(export_rows())
             media_type = "text/csv"
-            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            filename = f"orders_export_{timestamp}.csv"
         elif format == "excel":
-            output = export_service.export_orders_to_excel(orders)
+            output = ExportService.stream_orders_to_excel(export_rows())
             media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        elif format == "pdf":
-            output = export_service.export_orders_to_pdf(orders)
-            media_type = "application/pdf"
-            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+            filename = f"orders_export_{timestamp}.xlsx"
         else:
-            raise APIException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                message="Invalid format. Use csv, excel, or pdf"
-            )
+            # PDFs are rendered in one piece, so they are capped rather than streamed
+            orders = []
+            rows = export_rows()
+            try:
+                async for row in rows:
+                    if len(orders) >= PDF_EXPORT_MAX_ORDERS:
+                        raise APIException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            message=f"PDF exports are limited to {PDF_EXPORT_MAX_ORDERS} orders; use csv or excel, or narrow the filters"
+                        )
+                    orders.append(order_export_dict(row))
+            finally:
+                await rows.aclose()
+            try:
+                output = io.BytesIO(await run_in_render_pool(render_orders_pdf_bytes, orders, wait=False))
+            except RenderPoolBusy:
+                raise APIException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    message="PDF rendering is busy; retry shortly or use POST /admin/exports"
+                )
+            media_type = "application/pdf"
+            filename = f"orders_export_{timestamp}.pdf"
         
         return StreamingResponse(
             output,
@@ -1207,6 +1197,63 @@ async def export_orders(
             message=f"Failed to export orders: {str(e)}"
         )
 
+class ExportJobRequest(BaseModel):
+    kind: str = "orders"
+    format: str = "csv"
+    filters: Dict[str, Any] = {}
+
+
+@router.post("/exports", status_code=status.HTTP_202_ACCEPTED)
+async def create_export_job(
+    payload: ExportJobRequest,
+    current_user: User = Depends(require_admin)
+):
+    """
+    Start a background export (admin only).
+    Orders export to csv, excel, pdf or json; subscriptions to csv, json or html.
+    Poll GET /exports/{job_id} and download from /exports/{job_id}/download once completed.
+    """
+    from services.export_jobs import create_export_job as start_export_job
+    
+    job = await start_export_job(payload.kind, payload.format, payload.filters, user_id=current_user.id)
+    return Response.success(data=job, message="Export started")
+
+
+@router.get("/exports/{job_id}")
+async def get_export_job_status(
+    job_id: UUID,
+    current_user: User = Depends(require_admin)
+):
+    """Get the status and progress of an export job (admin only)."""
+    from services.export_jobs import get_export_job
+    
+    job = await get_export_job(str(job_id))
+    if not job:
+        raise APIException(status_code=status.HTTP_404_NOT_FOUND, message="Export job not found")
+    return Response.success(data=job)
+
+
+@router.get("/exports/{job_id}/download")
+async def download_export(
+    job_id: UUID,
+    current_user: User = Depends(require_admin)
+):
+    """Download the artifact of a completed export job (admin only)."""
+    import os
+    from fastapi.responses import FileResponse
+    from services.export_jobs import get_export_job, artifact_path
+    
+    job = await get_export_job(str(job_id))
+    if not job:
+        raise APIException(status_code=status.HTTP_404_NOT_FOUND, message="Export job not found")
+    if job["status"] != "completed":
+        raise APIException(status_code=status.HTTP_409_CONFLICT, message=f"Export is {job['status']}")
+    
+    path = artifact_path(job["job_id"], job["format"], job["kind"])
+    if not os.path.exists(path):
+        raise APIException(status_code=status.HTTP_410_GONE, message="Export artifact has expired")
+    return FileResponse(path=path, filename=job["filename"], media_type=job["media_type"])
+
 # Shipping Methods Management Routes
 @router.get("/shipping-methods")
 async def get_all_shipping_methods(
@@ -2240,7 +2287,7 @@ async def recalculate_all_product_ratings(
         
         return Response.success(
             data={"updated_count": updated_count},
-            message=f"Successfully recalculated ratings for {updated_count} products"
+            message=f"Successfully recalculated ratings, {updated_count} products changed"
         )
     except Exception as e:
         logger.error(f"Error recalculating product ratings: {str(e)}")
@@ -68,7 +68,7 @@ async def track_event(
         )
         
         return Response.success(
-            data={"event_id": str(event.id)},
+            data={"event_id": event["id"]},
             message="Event tracked successfully"
         )
         
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, Query, status, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
@@ -8,6 +9,7 @@ from core.utils.response import Response
 from core.errors import APIException
 from core.logging import get_logger
 from core.dependencies import require_admin_or_supplier, get_inventory_service
+from core.inventory_feed import stock_feed_broadcaster
 from models.user import User
 
 from schemas.inventory import (
@@ -16,6 +18,9 @@ from schemas.inventory import (
     StockAdjustmentCreate, StockAdjustmentResponse
 )
 from services.inventory import InventoryService
+from services.warehouse_import import (
+    WarehouseImportService, SUPPORTED_FORMATS, store_import_progress, get_import_progress
+)
 
 logger = get_logger(__name__)
 
@@ -117,6 +122,42 @@ async def check_bulk_stock_availability(
         )
 
 
+# --- Live Stock Stream (Server-Sent Events) ---
+@router.get("/live")
+async def stream_live_stock(
+    request: Request,
+    variant_id: Optional[List[UUID]] = Query(None, description="Variants to watch"),
+    product_id: Optional[List[UUID]] = Query(None, description="Products to watch"),
+):
+    """Stream stock changes for the given variants/products as they are committed (Public endpoint)."""
+    import asyncio
+    import json
+    
+    if not variant_id and not product_id:
+        raise APIException(status_code=status.HTTP_400_BAD_REQUEST, message="Provide at least one variant_id or product_id")
+    
+    variant_ids = {str(v) for v in variant_id or []}
+    product_ids = {str(p) for p in product_id or []}
+    
+    async def events():
+        async with stock_feed_broadcaster.subscribe() as queue:
+            while not await request.is_disconnected():
+                try:
+                    change = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if change["variant_id"] in variant_ids or change["product_id"] in product_ids:
+                    payload = {k: change[k] for k in ("variant_id", "product_id", "new_available", "version")}
+                    yield f"id: {change['id']}\nevent: stock\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # --- WarehouseLocation Endpoints ---
 @router.post("/locations")
 async def create_warehouse_location(
@@ -349,5 +390,73 @@ async def get_all_stock_adjustments(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch all stock adjustments: {e}")
 
 
+# --- Warehouse Feed Import Endpoints ---
+@router.post("/warehouse-import")
+async def import_warehouse_feed(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv or ndjson; inferred from Content-Type when omitted"),
+    import_id: Optional[UUID] = Query(None, description="Client-chosen id to poll progress while the upload runs"),
+    current_user: User = Depends(require_admin_or_supplier),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream a warehouse feed (raw CSV or NDJSON request body) into inventory (Admin/Supplier access).
+    Rows set absolute quantities; CSV needs a header with quantity and variant_id or sku.
+    """
+    fmt = format or ("ndjson" if any(t in request.headers.get("content-type", "") for t in ("ndjson", "jsonl")) else "csv")
+    if fmt not in SUPPORTED_FORMATS:
+        raise APIException(status_code=status.HTTP_400_BAD_REQUEST, message=f"Unsupported import format '{fmt}'")
+    
+    try:
+        summary = await WarehouseImportService(db).import_feed(
+            request.stream(),
+            fmt=fmt,
+            import_id=str(import_id) if import_id else None,
+            user_id=current_user.id,
+            progress=store_import_progress
+        )
+        return Response.success(data=summary, message="Warehouse feed imported")
+    except APIException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to import warehouse feed: {e}")
+
+
+async def _get_own_import(import_id: UUID, current_user: User) -> dict:
+    """The import's progress record if the caller ran it or is an admin; 404 otherwise"""
+    progress = await get_import_progress(str(import_id))
+    is_admin = (current_user.role or "").lower() in ["admin", "superadmin"]
+    if not progress or not (is_admin or progress.get("user_id") == str(current_user.id)):
+        raise APIException(status_code=status.HTTP_404_NOT_FOUND, message="Import not found")
+    return progress
+
+
+@router.get("/warehouse-import/{import_id}")
+async def get_warehouse_import_progress(
+    import_id: UUID,
+    current_user: User = Depends(require_admin_or_supplier)
+):
+    """Get progress of a running or recent warehouse import (importer or Admin access)."""
+    progress = await _get_own_import(import_id, current_user)
+    return Response.success(data=progress)
+
+
+@router.get("/warehouse-import/{import_id}/errors")
+async def download_warehouse_import_errors(
+    import_id: UUID,
+    current_user: User = Depends(require_admin_or_supplier),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download the rejected-rows file for a warehouse import (importer or Admin access)."""
+    import os
+    
+    # The file holds raw feed rows; ownership comes from the import's progress record
+    await _get_own_import(import_id, current_user)
+    path = WarehouseImportService(db).error_file_path(str(import_id))
+    if not os.path.exists(path):
+        raise APIException(status_code=status.HTTP_404_NOT_FOUND, message="No errors recorded for this import")
+    return FileResponse(path=path, filename=f"warehouse-import-{import_id}-errors.csv", media_type="text/csv")
+
+
 # --- Warehouse Location Endpoints ---
 # (Already defined above, removing duplicates)
\ No newline at end of file
@@ -410,19 +410,15 @@ async def get_order_invoice(
 ):
     """Get order invoice."""
     from fastapi.responses import FileResponse
-    import os
     
     try:
         invoice_result = await order_service.generate_invoice(order_id, current_user.id)
-        if invoice_result.get('success') and invoice_result.get('pdf_bytes'):
-            # Return PDF bytes as response
-            from fastapi.responses import Response
-            return Response(
-                content=invoice_result['pdf_bytes'],
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f"attachment; filename=invoice-{invoice_result.get('invoice_ref', 'unknown')}.pdf"
-                }
+        if invoice_result.get('success') and invoice_result.get('invoice_path'):
+            # Served from the content-addressed invoice cache
+            return FileResponse(
+                path=invoice_result['invoice_path'],
+                filename=f"invoice-{invoice_result.get('invoice_ref', 'unknown')}.pdf",
+                media_type="application/pdf"
             )
         else:
             raise APIException(
@@ -430,6 +426,8 @@ async def get_order_invoice(
                 message=invoice_result.get('message', 'Failed to generate invoice')
             )
             
+    except APIException:
+        raise
     except Exception as e:
         raise APIException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,5 +1,5 @@
 """
-Webhook Routes - Simple Stripe webhook handling without storage
+Webhook Routes - Stripe webhook ingestion (verify, record, acknowledge)
 """
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -19,7 +19,7 @@ async def stripe_webhook(
 ):
     """
     Handle Stripe webhooks with signature verification
-    Processes webhooks immediately without storing webhook events
+    Records the event in the webhook inbox and acknowledges; worker jobs process it
     """
     try:
         # Get request body and signature
@@ -33,7 +33,7 @@ async def stripe_webhook(
         client_ip = request.client.host if request.client else None
         logger.info(f"Webhook request from IP: {client_ip}")
         
-        # Process webhook
+        # Record webhook
         webhook_service = WebhookService(db)
         result = await webhook_service.handle_stripe_webhook(
             request=request,
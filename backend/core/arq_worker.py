@@ -3,6 +3,7 @@ ARQ (Async Redis Queue) Worker Configuration
 Handles background tasks: emails, subscriptions, and scheduled jobs
 """
 import asyncio
+import time
 from typing import Dict, Any
 from datetime import datetime, timedelta
 from arq import create_pool, Worker
@@ -57,6 +58,17 @@ async def startup(ctx: Dict[str, Any]) -> None:
         logger.error(f"Failed to initialize database session factory: {e}")
         ctx['db_session'] = None
 
+    # Long-lived Mailjet connection pool and batching sender, shared by all email jobs
+    from core.utils.messages.mailjet import get_mail_sender
+    ctx['mail_sender'] = get_mail_sender()
+
+    try:
+        from core.utils.templating import warm_templates
+        compiled = await asyncio.to_thread(warm_templates)
+        logger.info(f"Compiled {compiled} templates")
+    except Exception as e:
+        logger.warning(f"Template warm-up failed: {e}")
+
     try:
         pool = await create_pool(ARQ_REDIS_SETTINGS)
         ctx['arq_pool'] = pool
@@ -65,10 +77,42 @@ async def startup(ctx: Dict[str, Any]) -> None:
         logger.warning(f"Failed to create ARQ pool in worker startup: {e}")
         ctx['arq_pool'] = None
 
+    # Seed/correct promocode usage counters before anything redeems or flushes them
+    if ctx.get('db_session') and ctx.get('arq_pool'):
+        try:
+            from services.promocode.usage import reconcile_usage_counters
+            async with ctx['db_session']() as db:
+                stats = await reconcile_usage_counters(db, ctx['arq_pool'])
+            logger.info(f"Reconciled promocode usage counters", metadata=stats)
+        except Exception as e:
+            logger.warning(f"Promocode usage reconciliation failed: {e}")
+
+    # Create the change feed consumer groups up front, so no event waits on a group's first read
+    if settings.INVENTORY_FEED_ENABLED and ctx.get('arq_pool'):
+        try:
+            from core.inventory_feed import StockFeedConsumer
+            from services.marketing import STOCK_FEED_GROUP
+            for group in (AVAILABILITY_SYNC_FEED_GROUP, STOCK_FEED_GROUP):
+                await StockFeedConsumer(group, group, redis=ctx['arq_pool']).ensure_group()
+        except Exception as e:
+            logger.warning(f"Failed to create inventory feed consumer groups: {e}")
+
 
 async def shutdown(ctx: Dict[str, Any]) -> None:
     """Worker shutdown - cleanup resources"""
     logger.info("ARQ Worker shutting down...")
+    from core.utils.render_pool import shutdown_render_pool
+    shutdown_render_pool()
+    try:
+        from core.utils.messages.mailjet import close_mail_sender
+        await close_mail_sender()
+    except Exception as e:
+        logger.warning(f"Error closing Mailjet sender during shutdown: {e}")
+    try:
+        from services.payments.stripe_gateway import close_stripe_gateway
+        await close_stripe_gateway()
+    except Exception as e:
+        logger.warning(f"Error closing Stripe gateway during shutdown: {e}")
     try:
         pool = ctx.get('arq_pool')
         if pool is not None:
@@ -161,10 +205,53 @@ async def send_email_task(ctx: Dict[str, Any], email_type: str, recipient: str,
 # SUBSCRIPTION TASKS - Recurring order processing
 # ============================================================================
 
+SUBSCRIPTION_BATCH_TIMEOUT = 900
+
+async def _send_subscription_order_confirmation(ctx: Dict[str, Any], db, order_result: Dict[str, Any]):
+    """Send the order confirmation email for a renewed subscription"""
+    try:
+        # Get order details for email
+        from models.orders import Order
+        from sqlalchemy import select
+        from sqlalchemy.orm import selectinload
+        
+        order_query = await db.execute(
+            select(Order).where(Order.id == order_result["order_id"])
+            .options(selectinload(Order.items))
+        )
+        order = order_query.scalar_one_or_none()
+        
+        if order:
+            # Format items for email
+            email_items = []
+            for item in order.items:
+                email_items.append({
+                    "name": item.variant.name if hasattr(item, 'variant') and item.variant else "Item",
+                    "quantity": item.quantity,
+                    "price": float(item.price_per_unit or 0)
+                })
+            
+            # Send order confirmation email
+            await send_email_task(
+                ctx,
+                "order_confirmation",
+                order_result["user_email"],
+                customer_name="Customer",
+                order_number=order_result["order_number"],
+                order_date=order.created_at or datetime.now(),
+                total_amount=float(order.total_amount),
+                items=email_items,
+                shipping_address=order.shipping_address or {}
+            )
+            logger.info(f"Sent order confirmation email for subscription order {order_result['order_number']}")
+    except Exception as email_error:
+        logger.error(f"Failed to send email for order {order_result.get('order_id')}: {email_error}")
+
+
 async def process_subscription_renewal_task(ctx: Dict[str, Any], subscription_id: str, **kwargs) -> str:
-    """Process subscription renewal background task"""
+    """Renew a single subscription now (if it is due)"""
     try:
-        from services.subscriptions.subscription_scheduler import SubscriptionSchedulerService
+        from services.subscriptions.scheduler import SubscriptionScheduler
         from uuid import UUID
         
         factory = _get_session_factory(ctx)
@@ -172,19 +259,12 @@ async def process_subscription_renewal_task(ctx: Dict[str, Any], subscription_id
             raise RuntimeError('Database session factory not available in ARQ context')
 
         async with factory() as db:
-            scheduler = SubscriptionSchedulerService(db)
-            result = await scheduler.process_specific_subscription(UUID(subscription_id))
+            result = await SubscriptionScheduler(db).process_subscription_id(UUID(subscription_id))
             
+            if result.get('skipped'):
+                return f"Subscription {subscription_id} not due or already being renewed"
             if result.get('success'):
-                # Send confirmation email
-                await send_email_task(
-                    ctx,
-                    "order_confirmation",
-                    kwargs.get('user_email', ''),
-                    subscription_id=subscription_id,
-                    order_id=result.get('order_id'),
-                    **kwargs
-                )
+                await _send_subscription_order_confirmation(ctx, db, result)
                 return f"Subscription renewal completed for {subscription_id}"
             else:
                 logger.error(f"Subscription renewal failed for {subscription_id}: {result.get('error')}")
@@ -196,63 +276,123 @@ async def process_subscription_renewal_task(ctx: Dict[str, Any], subscription_id
 
 
 async def process_subscription_orders_task(ctx: Dict[str, Any]) -> str:
-    """Process all due subscription orders"""
+    """
+    Dispatch a renewal run: page due subscription ids by keyset and enqueue one batch job
+    per page. Progress is counted in Redis under the run id.
+    """
     try:
-        from services.subscriptions.scheduler import SubscriptionScheduler
+        from services.subscriptions.scheduler import SubscriptionScheduler, record_renewal_progress
+        from core.utils.uuid_utils import uuid7
+        from datetime import timezone
         
         factory = _get_session_factory(ctx)
         if not factory:
             raise RuntimeError('Database session factory not available in ARQ context')
+        
+        redis = ctx.get('redis') or ctx.get('arq_pool')
+        pool = ctx.get('arq_pool') or await get_arq_pool()
+        run_id = str(uuid7())
+        current_time = datetime.now(timezone.utc)  # One cutoff for every page of the run
+        total_due = 0
+        batches = 0
+        after = None
 
         async with factory() as db:
             scheduler = SubscriptionScheduler(db)
-            result = await scheduler.process_due_subscriptions()
+            while True:
+                subscription_ids = await scheduler.due_subscription_ids(after=after, current_time=current_time)
+                if not subscription_ids:
+                    break
+                after = subscription_ids[-1]
+                await pool.enqueue_job(
+                    'process_subscription_batch_task',
+                    run_id,
+                    [str(subscription_id) for subscription_id in subscription_ids],
+                    _job_id=f"subscription_batch:{run_id}:{batches}",
+                    _job_timeout=SUBSCRIPTION_BATCH_TIMEOUT
+                )
+                batches += 1
+                total_due += len(subscription_ids)
+                await record_renewal_progress(run_id, redis, due=len(subscription_ids), batches=1)
+        
+        logger.info(
+            f"Dispatched subscription renewal run {run_id}",
+            metadata={"run_id": run_id, "due": total_due, "batches": batches}
+        )
+        return f"Renewal run {run_id}: {total_due} due subscriptions in {batches} batches"
             
-            # Send order confirmation emails for successful orders
-            for order_result in result.get("results", []):
-                if order_result["status"] == "success" and order_result.get("user_email"):
-                    try:
-                        # Get order details for email
-                        from models.orders import Order
-                        from sqlalchemy import select
-                        from sqlalchemy.orm import selectinload
-                        
-                        order_query = await db.execute(
-                            select(Order).where(Order.id == order_result["order_id"])
-                            .options(selectinload(Order.items))
-                        )
-                        order = order_query.scalar_one_or_none()
-                        
-                        if order:
-                            # Format items for email
-                            email_items = []
-                            for item in order.items:
-                                email_items.append({
-                                    "name": item.variant.name if hasattr(item, 'variant') and item.variant else "Item",
-                                    "quantity": item.quantity,
-                                    "price": float(item.price_per_unit or 0)
-                                })
-                            
-                            # Send order confirmation email
-                            await send_email_task(
-                                ctx,
-                                "order_confirmation",
-                                order_result["user_email"],
-                                customer_name="Customer",
-                                order_number=order_result["order_number"],
-                                order_date=order.created_at or datetime.now(),
-                                total_amount=float(order.total_amount),
-                                items=email_items,
-                                shipping_address=order.shipping_address or {}
-                            )
-                            logger.info(f"Sent order confirmation email for subscription order {order_result['order_number']}")
-                    except Exception as email_error:
-                        logger.error(f"Failed to send email for order {order_result.get('order_id')}: {email_error}")
+    except Exception as e:
+        logger.error(f"Error processing subscription orders: {e}")
+        raise
+
+
+async def process_subscription_batch_task(ctx: Dict[str, Any], run_id: str, subscription_ids: list) -> str:
+    """Renew one keyset batch of a renewal run with bounded concurrency"""
+    try:
+        from uuid import UUID
+        from services.subscriptions.scheduler import process_subscription_batch, record_renewal_progress
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        results = await process_subscription_batch(factory, [UUID(subscription_id) for subscription_id in subscription_ids])
+        succeeded = [result for result in results if result.get("success")]
+        skipped = sum(1 for result in results if result.get("skipped"))
+        failed = len(results) - len(succeeded) - skipped
+        
+        await record_renewal_progress(
+            run_id,
+            ctx.get('redis') or ctx.get('arq_pool'),
+            processed=len(results),
+            succeeded=len(succeeded),
+            failed=failed,
+            skipped=skipped
+        )
+        
+        # Send order confirmation emails for successful orders
+        if succeeded:
+            async with factory() as db:
+                for order_result in succeeded:
+                    if order_result.get("user_email"):
+                        await _send_subscription_order_confirmation(ctx, db, order_result)
+        
+        logger.info(
+            f"Renewed subscription batch for run {run_id}",
+            metadata={"run_id": run_id, "succeeded": len(succeeded), "failed": failed, "skipped": skipped}
+        )
+        return f"Batch of {len(results)}: {len(succeeded)} renewed, {failed} failed, {skipped} skipped"
+        
+    except Exception as e:
+        logger.error(f"Error processing subscription batch for run {run_id}: {e}")
+        raise
+
+
+async def retry_subscription_payment_task(ctx: Dict[str, Any], subscription_id: str, attempt: int, retry_at: str) -> str:
+    """Retry a failed subscription payment at its scheduled time (see schedule_subscription_retry)"""
+    try:
+        from uuid import UUID
+        from services.subscriptions.scheduler import SubscriptionScheduler
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            result = await SubscriptionScheduler(db).process_subscription_id(
+                UUID(subscription_id),
+                due_by=datetime.fromisoformat(retry_at)
+            )
             
-            return f"Processed {result.get('total_due', 0)} subscription orders: {result.get('processed_count', 0)} succeeded, {result.get('failed_count', 0)} failed"
+            if result.get('skipped'):
+                return f"Subscription {subscription_id} retry {attempt} no longer due"
+            if result.get('success'):
+                await _send_subscription_order_confirmation(ctx, db, result)
+                return f"Subscription {subscription_id} renewed on retry {attempt}"
+            return f"Subscription {subscription_id} retry {attempt} failed: {result.get('error')}"
             
     except Exception as e:
-        logger.error(f"Error processing subscription orders: {e}")
+        logger.error(f"Error retrying payment for subscription {subscription_id}: {e}")
         raise
 
 
@@ -277,8 +417,8 @@ async def sync_product_availability_task(ctx: Dict[str, Any], product_id: str =
                 # Sync single product
                 result = await inventory_service.sync_product_availability_status(UUID(product_id))
                 if result["success"]:
-                    logger.info(f"✅ Synced product {product_id}: {result['old_status']} → {result['new_status']} (stock: {result['total_stock']})")
-                    return f"Product {product_id} synced: {result['old_status']} → {result['new_status']}"
+                    logger.info(f"✅ Synced product {product_id}: {result['new_status']} (stock: {result['total_stock']})")
+                    return f"Product {product_id} synced: {result['new_status']}"
                 else:
                     logger.warning(f"Failed to sync product {product_id}: {result['message']}")
                     return f"Failed to sync product {product_id}"
@@ -297,6 +437,341 @@ async def sync_product_availability_task(ctx: Dict[str, Any], product_id: str =
         raise
 
 
+# Dirty products drained per SPOP; each batch is synced with a single UPDATE
+AVAILABILITY_SYNC_BATCH_SIZE = 500
+AVAILABILITY_SYNC_MAX_BATCHES = 20
+
+# Consumer group (and consumer name - drains never overlap) on the inventory change feed
+AVAILABILITY_SYNC_FEED_GROUP = "availability-sync"
+
+
+async def drain_product_availability_task(ctx: Dict[str, Any]) -> str:
+    """
+    Drain stock changes from the inventory change feed (plus any explicitly marked products)
+    and sync availability for the affected products in batches
+    Runs every few seconds, so bursts of stock changes coalesce into one job
+    """
+    from core.cache import RedisKeyManager
+    
+    redis = ctx.get('redis') or ctx.get('arq_pool')
+    if redis is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    dirty_key = RedisKeyManager.availability_dirty_key()
+    total_products = 0
+    total_updated = 0
+    
+    try:
+        from services.inventory import InventoryService
+        from uuid import UUID
+        
+        from core.inventory_feed import StockFeedConsumer
+        
+        feed = StockFeedConsumer(
+            AVAILABILITY_SYNC_FEED_GROUP,
+            AVAILABILITY_SYNC_FEED_GROUP,
+            redis=redis,
+            batch_size=AVAILABILITY_SYNC_BATCH_SIZE
+        ) if settings.INVENTORY_FEED_ENABLED else None
+        
+        for _ in range(AVAILABILITY_SYNC_MAX_BATCHES):
+            changes = await feed.read() if feed else []
+            members = await redis.spop(dirty_key, AVAILABILITY_SYNC_BATCH_SIZE)
+            if not changes and not members:
+                break
+            
+            raw_ids = [m.decode('utf-8') if isinstance(m, bytes) else m for m in members or []]
+            product_ids = set(raw_ids) | {change["product_id"] for change in changes if change["product_id"]}
+            
+            try:
+                async with factory() as db:
+                    result = await InventoryService(db, None).sync_products_availability(
+                        [UUID(product_id) for product_id in product_ids]
+                    )
+            except Exception:
+                # The ids are already popped; put them back before giving up on this run
+                if raw_ids:
+                    await redis.sadd(dirty_key, *raw_ids)
+                raise
+            
+            if not result["success"]:
+                # Put the batch back so the next run retries it; unacked feed events are redelivered
+                if raw_ids:
+                    await redis.sadd(dirty_key, *raw_ids)
+                logger.warning(f"Availability sync batch failed, re-queued {len(product_ids)} products: {result['message']}")
+                break
+            
+            if feed:
+                await feed.ack(changes)
+            
+            total_products += len(product_ids)
+            total_updated += result["updated_count"]
+            
+            if len(changes) < AVAILABILITY_SYNC_BATCH_SIZE and len(raw_ids) < AVAILABILITY_SYNC_BATCH_SIZE:
+                break
+        
+        if total_products:
+            logger.info(f"✅ Availability sync drained {total_products} products, {total_updated} variants changed")
+        return f"Synced {total_products} products ({total_updated} variants changed)"
+        
+    except Exception as e:
+        logger.error(f"Error draining product availability set: {e}")
+        raise
+
+
+# Flushes per run; each flush is one transaction of up to ANALYTICS_FLUSH_BATCH_SIZE events
+ANALYTICS_FLUSH_MAX_BATCHES = 20
+
+
+async def flush_analytics_events_task(ctx: Dict[str, Any]) -> str:
+    """
+    Bulk-insert buffered analytics events and bump session/funnel aggregates
+    Runs every few seconds; a batch is acked only after its transaction commits
+    """
+    redis = ctx.get('redis') or ctx.get('arq_pool')
+    if redis is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    total_inserted = 0
+    total_dropped = 0
+    
+    try:
+        from services.analytics_ingestion import (
+            AnalyticsEventConsumer, AnalyticsIngestionService, ANALYTICS_INGEST_GROUP
+        )
+        
+        consumer = AnalyticsEventConsumer(
+            ANALYTICS_INGEST_GROUP,
+            ANALYTICS_INGEST_GROUP,
+            redis=redis,
+            batch_size=settings.ANALYTICS_FLUSH_BATCH_SIZE
+        )
+        
+        for _ in range(ANALYTICS_FLUSH_MAX_BATCHES):
+            entries = await consumer.read()
+            if not entries:
+                break
+            
+            async with factory() as db:
+                result = await AnalyticsIngestionService(db).flush(
+                    [entry["event"] for entry in entries if entry["event"]]
+                )
+            await consumer.ack(entries)
+            
+            total_inserted += result["inserted_count"]
+            total_dropped += result["dropped_count"] + sum(1 for entry in entries if not entry["event"])
+            
+            if len(entries) < settings.ANALYTICS_FLUSH_BATCH_SIZE:
+                break
+        
+        if total_inserted or total_dropped:
+            logger.info(f"✅ Flushed {total_inserted} analytics events ({total_dropped} dropped)")
+        return f"Flushed {total_inserted} analytics events ({total_dropped} dropped)"
+        
+    except Exception as e:
+        logger.error(f"Error flushing analytics events: {e}")
+        raise
+
+
+async def refresh_demand_forecasts_task(ctx: Dict[str, Any]) -> str:
+    """Recompute demand forecasts for every inventoried variant in one vectorized pass"""
+    try:
+        from services.forecasting import DemandForecastService
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            result = await DemandForecastService(db).refresh_forecasts()
+            message = (
+                f"Refreshed {result['variant_count']} demand forecasts in {result['elapsed_seconds']}s "
+                f"({result['ses_count']} ses, {result['croston_count']} croston, {result['no_history_count']} no history)"
+            )
+            logger.info(f"✅ {message}")
+            return message
+            
+    except Exception as e:
+        logger.error(f"Error refreshing demand forecasts: {e}")
+        raise
+
+
+async def refresh_metric_rollups_task(ctx: Dict[str, Any], reconcile: bool = False) -> str:
+    """Recompute the trailing daily/hourly metric rollup buckets that admin charts read"""
+    try:
+        from services.metrics_rollup import MetricsRollupService
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            result = await MetricsRollupService(db).refresh_recent(reconcile=reconcile)
+            return f"Refreshed {result['daily_buckets']} daily and {result['hourly_buckets']} hourly metric buckets"
+            
+    except Exception as e:
+        logger.error(f"Error refreshing metric rollups: {e}")
+        raise
+
+
+async def reconcile_metric_rollups_task(ctx: Dict[str, Any]) -> str:
+    """Nightly wider rollup pass so late status changes on older orders are reflected"""
+    message = await refresh_metric_rollups_task(ctx, reconcile=True)
+    logger.info(f"✅ {message}")
+    return message
+
+
+# ============================================================================
+# EXPORT TASKS - Large exports rendered off the request path
+# ============================================================================
+
+EXPORT_JOB_TIMEOUT = 3600
+
+async def run_export_job_task(ctx: Dict[str, Any], job_id: str) -> str:
+    """Produce the artifact for an export job created through the admin API"""
+    try:
+        from services.export_jobs import ExportJobRunner
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            job = await ExportJobRunner(db).run(job_id)
+            return f"Export {job_id} {job['status']} ({job['rows']} rows)"
+            
+    except Exception as e:
+        logger.error(f"Error running export job {job_id}: {e}")
+        raise
+
+
+async def cleanup_export_artifacts_task(ctx: Dict[str, Any]) -> str:
+    """Delete export artifacts older than EXPORT_ARTIFACT_TTL_HOURS"""
+    from services.export_jobs import cleanup_export_artifacts
+    
+    removed = await asyncio.to_thread(cleanup_export_artifacts)
+    if removed:
+        logger.info(f"🧹 Removed {removed} expired export artifacts")
+    return f"Removed {removed} export artifacts"
+
+
+async def cleanup_invoice_cache_task(ctx: Dict[str, Any]) -> str:
+    """Delete cached invoice PDFs not served within INVOICE_CACHE_TTL_HOURS"""
+    from services.invoices import cleanup_invoice_cache
+    
+    removed = await asyncio.to_thread(cleanup_invoice_cache)
+    if removed:
+        logger.info(f"🧹 Removed {removed} expired cached invoices")
+    return f"Removed {removed} cached invoices"
+
+
+async def pregenerate_invoice_task(ctx: Dict[str, Any], order_id: str) -> str:
+    """Render a confirmed order's invoice into the invoice cache"""
+    try:
+        from uuid import UUID
+        from services.orders import OrderService
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            result = await OrderService(db).pregenerate_invoice(UUID(order_id))
+            if not result.get("success"):
+                return f"Invoice for order {order_id} not rendered: {result.get('message')}"
+            return f"Invoice for order {order_id} {'already cached' if result['cached'] else 'rendered'}"
+            
+    except Exception as e:
+        logger.error(f"Error pre-generating invoice for order {order_id}: {e}")
+        raise
+
+
+# ============================================================================
+# MARKETING TASKS - Back in stock, price drop and cart abandonment fan-out
+# ============================================================================
+
+MARKETING_CAMPAIGN_TIMEOUT = 3600
+MARKETING_FEED_MAX_BATCHES = 20
+
+async def run_marketing_campaign_task(ctx: Dict[str, Any], kind: str, campaign_id: str, **params) -> str:
+    """Send one marketing campaign to its whole audience, page by page"""
+    try:
+        from services.marketing import MarketingService
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            record = await MarketingService(db, ctx.get('redis') or ctx.get('arq_pool')).run_campaign(kind, campaign_id, **params)
+            return f"Campaign {campaign_id} {record['status']}: {record['sent']} sent, {record['capped']} capped, {record['rejected']} rejected"
+            
+    except Exception as e:
+        logger.error(f"Error running marketing campaign {campaign_id}: {e}")
+        raise
+
+
+async def detect_back_in_stock_task(ctx: Dict[str, Any]) -> str:
+    """
+    Read the inventory change feed and start a back-in-stock campaign for every variant
+    that went from 0 available to more
+    """
+    if not settings.MARKETING_EMAILS_ENABLED or not settings.INVENTORY_FEED_ENABLED:
+        return "Back-in-stock detection disabled"
+    
+    redis = ctx.get('redis') or ctx.get('arq_pool')
+    if redis is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    try:
+        from core.inventory_feed import StockFeedConsumer
+        from services.marketing import STOCK_FEED_GROUP, detect_restocks
+        
+        feed = StockFeedConsumer(STOCK_FEED_GROUP, STOCK_FEED_GROUP, redis=redis)
+        started = 0
+        for _ in range(MARKETING_FEED_MAX_BATCHES):
+            changes = await feed.read()
+            if not changes:
+                break
+            for change in await detect_restocks(changes, redis):
+                await enqueue_marketing_campaign(
+                    "back_in_stock",
+                    f"back_in_stock:{change['variant_id']}:{change['id']}",
+                    variant_id=change["variant_id"]
+                )
+                started += 1
+            await feed.ack(changes)
+        
+        if started:
+            logger.info(f"📣 Started {started} back-in-stock campaigns")
+        return f"Started {started} back-in-stock campaigns"
+        
+    except Exception as e:
+        logger.error(f"Error detecting restocked variants: {e}")
+        raise
+
+
+async def start_cart_abandonment_campaign_task(ctx: Dict[str, Any]) -> str:
+    """Start the cart abandonment campaign for the hour of carts that just went idle"""
+    if not settings.MARKETING_EMAILS_ENABLED:
+        return "Marketing emails disabled"
+    
+    from services.marketing import cart_abandonment_window
+    
+    window = cart_abandonment_window()
+    campaign_id = f"cart_abandonment:{window['idle_before']}"
+    await enqueue_marketing_campaign("cart_abandonment", campaign_id, **window)
+    return f"Started campaign {campaign_id}"
+
+
 # ============================================================================
 # PROMOCODE TASKS - Scheduled status updates
 # ============================================================================
@@ -312,9 +787,11 @@ async def update_promocode_statuses_task(ctx: Dict[str, Any]) -> str:
 
         async with factory() as db:
             scheduler = PromoCodeScheduler(db)
-            result = await scheduler.update_promocode_statuses()
+            result = await scheduler.update_promocode_statuses(redis=ctx.get('redis'))
+            timers = await scheduler.schedule_upcoming_timers()
             
             if result.get("success"):
+                logger.info(f"Scheduled promocode timers for {timers} codes changing state within a day")
                 logger.info(f"✅ Promocode status update completed: {result.get('activated_count', 0)} activated, {result.get('deactivated_count', 0)} deactivated")
                 return f"Promocode update completed: {result.get('activated_count', 0)} activated, {result.get('deactivated_count', 0)} deactivated"
             else:
@@ -326,6 +803,179 @@ async def update_promocode_statuses_task(ctx: Dict[str, Any]) -> str:
         raise
 
 
+async def refresh_promocode_status_task(ctx: Dict[str, Any], promocode_id: str) -> str:
+    """Apply one promocode's activation/expiry at its valid_from/valid_until (delayed job)"""
+    try:
+        from uuid import UUID
+        from services.promocode.scheduler import PromoCodeScheduler
+        
+        factory = _get_session_factory(ctx)
+        if not factory:
+            raise RuntimeError('Database session factory not available in ARQ context')
+        
+        async with factory() as db:
+            result = await PromoCodeScheduler(db).update_promocode_statuses(UUID(promocode_id), redis=ctx.get('redis'))
+            if not result.get("success"):
+                raise RuntimeError(result.get("error"))
+            changes = ", ".join(f"{r['action']} ({r['reason']})" for r in result["results"])
+            return f"Promocode {promocode_id}: {changes or 'no change'}"
+            
+    except Exception as e:
+        logger.error(f"Error refreshing promocode {promocode_id}: {e}")
+        raise
+
+
+async def flush_promocode_usage_task(ctx: Dict[str, Any]) -> str:
+    """
+    Write promocode usage counted in Redis to promocodes.used_count
+    Drains the dirty set in batches; codes that reached their limit are deactivated
+    """
+    redis = ctx.get('redis') or ctx.get('arq_pool')
+    if redis is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    try:
+        from services.promocode.usage import drain_usage_counts
+        
+        async with factory() as db:
+            result = await drain_usage_counts(db, redis)
+        
+        return f"Flushed usage for {result['flushed']} promocodes, {result['deactivated']} deactivated"
+        
+    except Exception as e:
+        logger.error(f"Error flushing promocode usage: {e}")
+        raise
+
+
+WEBHOOK_DRAIN_MAX_BATCHES = 20
+WEBHOOK_DRAIN_LOCK_SECONDS = 120
+
+# Only the holder's token may extend or release the drain lock, so a drain that outlived
+# its lock can't extend or delete the lock a newer drain has taken since
+EXTEND_LOCK_LUA = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+else
+    return 0
+end
+"""
+
+RELEASE_LOCK_LUA = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+async def process_webhook_events_task(ctx: Dict[str, Any]) -> str:
+    """
+    Drain the Stripe webhook inbox
+    Enqueued when an event is recorded and run on a schedule as a safety net; a Redis lock
+    keeps it to one drain at a time, so events for a payment intent are handled in order
+    """
+    redis = ctx.get('redis') or ctx.get('arq_pool')
+    if redis is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    from uuid import uuid4
+    from core.cache import RedisKeyManager
+    lock_key = RedisKeyManager.webhook_drain_lock_key()
+    lock_token = uuid4().hex
+    lock_ms = WEBHOOK_DRAIN_LOCK_SECONDS * 1000
+    if not await redis.set(lock_key, lock_token, nx=True, px=lock_ms):
+        return "Webhook inbox drain already running"
+    
+    total_processed = 0
+    total_failed = 0
+    
+    try:
+        from services.webhooks import WebhookService, WEBHOOK_BATCH_SIZE
+        
+        async with factory() as db:
+            service = WebhookService(db)
+            for _ in range(WEBHOOK_DRAIN_MAX_BATCHES):
+                stats = await service.process_pending_events()
+                total_processed += stats["processed"]
+                total_failed += stats["failed"]
+                if stats["fetched"] < WEBHOOK_BATCH_SIZE:
+                    break
+                if not await redis.eval(EXTEND_LOCK_LUA, 1, lock_key, lock_token, lock_ms):
+                    # Another drain holds the lock now; leave the rest to it to keep the order
+                    logger.warning("Webhook drain lock lost, stopping", metadata={"processed": total_processed})
+                    break
+        
+        return f"Processed {total_processed} webhook events, {total_failed} failed"
+        
+    except Exception as e:
+        logger.error(f"Error processing webhook events: {e}")
+        raise
+    finally:
+        await redis.eval(RELEASE_LOCK_LUA, 1, lock_key, lock_token)
+
+
+OUTBOX_RELAY_MAX_BATCHES = 20
+
+
+async def relay_outbox_task(ctx: Dict[str, Any]) -> str:
+    """
+    Dispatch undispatched outbox rows to ARQ/Redis
+    Enqueued after writes that add outbox rows and run on a schedule as a safety net;
+    rows are claimed with SKIP LOCKED, so overlapping relays never send the same batch
+    """
+    pool = ctx.get('redis') or ctx.get('arq_pool')
+    if pool is None:
+        raise RuntimeError('Redis not available in ARQ context')
+    
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    total_dispatched = 0
+    total_failed = 0
+    
+    try:
+        from services.outbox import relay_outbox, OUTBOX_BATCH_SIZE
+        
+        async with factory() as db:
+            for _ in range(OUTBOX_RELAY_MAX_BATCHES):
+                stats = await relay_outbox(db, pool)
+                total_dispatched += stats["dispatched"]
+                total_failed += stats["failed"]
+                if stats["fetched"] < OUTBOX_BATCH_SIZE:
+                    break
+        
+        return f"Dispatched {total_dispatched} outbox events, {total_failed} failed"
+        
+    except Exception as e:
+        logger.error(f"Error relaying outbox events: {e}")
+        raise
+
+
+async def purge_outbox_task(ctx: Dict[str, Any]) -> str:
+    """Delete outbox rows dispatched more than OUTBOX_RETENTION_DAYS ago"""
+    factory = _get_session_factory(ctx)
+    if not factory:
+        raise RuntimeError('Database session factory not available in ARQ context')
+    
+    from services.outbox import purge_dispatched_events
+    
+    async with factory() as db:
+        removed = await purge_dispatched_events(db)
+    if removed:
+        logger.info(f"🧹 Purged {removed} dispatched outbox events")
+    return f"Purged {removed} outbox events"
+
+
 # ============================================================================
 # CLEANUP TASKS - Scheduled maintenance
 # ============================================================================
@@ -358,13 +1008,107 @@ class WorkerSettings:
         send_email_task,
         process_subscription_renewal_task,
         process_subscription_orders_task,
+        process_subscription_batch_task,
+        retry_subscription_payment_task,
+        sync_product_availability_task,
+        refresh_demand_forecasts_task,
+        refresh_metric_rollups_task,
+        run_export_job_task,
+        pregenerate_invoice_task,
+        run_marketing_campaign_task,
         update_promocode_statuses_task,
+        refresh_promocode_status_task,
+        process_webhook_events_task,
+        relay_outbox_task,
+        purge_outbox_task,
     ]
     
     # Cron jobs - Scheduled tasks that run automatically
     cron_jobs = [
-        # Process subscription renewals and retries - runs every 6 hours
-        # This catches both regular billing (2 AM) and retry attempts (6 hours, 24 hours)
+        # Drain products marked dirty by stock changes - runs every 5 seconds
+        # Coalesces per-order availability syncs into one set-based UPDATE per batch
+        cron(
+            drain_product_availability_task,
+            second=set(range(0, 60, 5)),
+            run_at_startup=True,  # Flush anything left over from before a restart
+            unique=True,  # Prevent overlapping drains
+            timeout=60,
+        ),
+        
+        # Flush buffered analytics events - runs every 5 seconds
+        # Events are bulk-inserted and session/funnel aggregates bumped once per batch
+        cron(
+            flush_analytics_events_task,
+            second=set(range(0, 60, 5)),
+            run_at_startup=True,  # Flush anything buffered before a restart
+            unique=True,  # Prevent overlapping flushes
+            timeout=60,
+        ),
+        
+        # Drain the Stripe webhook inbox - runs every 10 seconds
+        # Each recorded event also enqueues a drain; this picks up retries and missed nudges
+        cron(
+            process_webhook_events_task,
+            second=set(range(0, 60, 10)),
+            run_at_startup=True,  # Process events recorded while workers were down
+            unique=True,
+            timeout=300,
+        ),
+        
+        # Relay the transactional outbox - runs every 5 seconds
+        # Writes that add outbox rows also enqueue a relay; this picks up retries and missed nudges
+        cron(
+            relay_outbox_task,
+            second=set(range(0, 60, 5)),
+            run_at_startup=True,  # Dispatch rows committed while workers were down
+            unique=True,
+            timeout=120,
+        ),
+        
+        # Flush promocode usage counters - runs every 10 seconds
+        # Limits are enforced in Redis at redemption; this persists the counts
+        cron(
+            flush_promocode_usage_task,
+            second=set(range(0, 60, 10)),
+            run_at_startup=True,  # Persist counts left unflushed before a restart
+            unique=True,  # Prevent overlapping flushes
+            timeout=60,
+        ),
+        
+        # Detect restocked variants on the inventory change feed - runs every 10 seconds
+        # Each variant going from 0 to available starts one back-in-stock campaign
+        cron(
+            detect_back_in_stock_task,
+            second=set(range(0, 60, 10)),
+            run_at_startup=True,  # Pick up feed events from before a restart
+            unique=True,  # One reader at a time, so levels are compared in order
+            timeout=60,
+        ),
+        
+        # Start the cart abandonment campaign - runs hourly
+        # Each run covers the carts that went idle in one hour-long window
+        cron(
+            start_cart_abandonment_campaign_task,
+            minute=5,
+            run_at_startup=False,
+            unique=True,
+            timeout=60,
+        ),
+        
+        # Refresh metric rollups - runs every 10 minutes
+        # Only the last few daily/hourly buckets are recomputed; charts compute the open bucket live
+        cron(
+            refresh_metric_rollups_task,
+            minute=set(range(0, 60, 10)),
+            run_at_startup=True,  # Backfills empty rollup tables on first deploy
+            unique=True,  # Prevent overlapping refreshes
+            timeout=600,
+        ),
+        
+        # Dispatch subscription renewals - runs every 6 hours
+        # Payment retries run as delayed jobs at their retry time; this run also picks up
+        # any retry that is overdue, as a safety net. Due subscriptions are paged into
+        # batch jobs, so the dispatch itself is quick
         cron(
             process_subscription_orders_task,
             hour={2, 8, 14, 20},  # Run at 2 AM, 8 AM, 2 PM, 8 PM
@@ -374,8 +1118,59 @@ class WorkerSettings:
             timeout=600,  # 10 minutes timeout
         ),
         
+        # Refresh demand forecasts - runs daily at 3 AM
+        # Feeds reorder suggestions and per-variant demand predictions
+        cron(
+            refresh_demand_forecasts_task,
+            hour=3,  # Run at 3 AM, after the 2 AM subscription run
+            minute=0,
+            run_at_startup=False,  # Don't run immediately on worker start
+            unique=True,  # Prevent duplicate runs
+            timeout=1800,  # 30 minutes timeout
+        ),
+        
+        # Reconcile metric rollups - runs daily at 4 AM
+        # Recomputes the last month of daily buckets to pick up cancellations and refunds
+        cron(
+            reconcile_metric_rollups_task,
+            hour=4,
+            minute=0,
+            run_at_startup=False,  # Don't run immediately on worker start
+            unique=True,  # Prevent duplicate runs
+            timeout=600,  # 10 minutes timeout
+        ),
+        
+        # Remove cached invoices that are no longer served - runs hourly
+        cron(
+            cleanup_invoice_cache_task,
+            minute=40,
+            run_at_startup=False,
+            unique=True,
+            timeout=300,
+        ),
+        
+        # Purge dispatched outbox rows - runs daily at 5 AM
+        cron(
+            purge_outbox_task,
+            hour=5,
+            minute=0,
+            run_at_startup=False,
+            unique=True,
+            timeout=300,
+        ),
+        
+        # Remove expired export artifacts - runs hourly
+        cron(
+            cleanup_export_artifacts_task,
+            minute=30,
+            run_at_startup=False,
+            unique=True,
+            timeout=300,
+        ),
+        
         # Update promocode statuses - runs daily at 12 AM (midnight)
-        # Activates/deactivates promocodes based on validity dates and usage limits
+        # Exact activation/expiry runs on per-code timers; this sweep is the safety net
+        # and schedules timers for codes changing state within the next day
         cron(
             update_promocode_statuses_task,
             hour=0,  # Run at 12 AM (midnight)
@@ -397,9 +1192,27 @@ class WorkerSettings:
 # HELPER FUNCTIONS - For enqueueing jobs
 # ============================================================================
 
+_arq_pool = None
+
+
 async def get_arq_pool():
-    """Get ARQ Redis pool for enqueueing jobs"""
-    return await create_pool(ARQ_REDIS_SETTINGS)
+    """Get shared ARQ Redis pool for enqueueing jobs"""
+    global _arq_pool
+    if _arq_pool is None:
+        _arq_pool = await create_pool(ARQ_REDIS_SETTINGS)
+    return _arq_pool
+
+
+async def enqueue_at(function: str, run_at: datetime, *args, job_id: str, **kwargs):
+    """
+    Enqueue a job to run at run_at (to the second)
+    Deferred jobs wait in ARQ's queue - a sorted set scored by due time that workers poll
+    continuously - rather than being found by a periodic scan. job_id makes scheduling
+    exactly-once: scheduling the same id again is a no-op while the job is pending or its
+    result is kept. Returns the Job, or None if it was already scheduled.
+    """
+    pool = await get_arq_pool()
+    return await pool.enqueue_job(function, *args, _job_id=job_id, _defer_until=run_at, **kwargs)
 
 
 async def enqueue_subscription_renewal(subscription_id: str, **kwargs):
@@ -414,12 +1227,22 @@ async def enqueue_subscription_processing():
     await pool.enqueue_job('process_subscription_orders_task')
 
 
-async def enqueue_sync_product_availability(product_id: str = None):
-    """Enqueue product availability sync task"""
+async def mark_product_availability_dirty(*product_ids: str):
+    """Add products to the dirty set drained by drain_product_availability_task"""
+    from core.cache import RedisKeyManager
+    
+    if not product_ids:
+        return
     pool = await get_arq_pool()
+    await pool.sadd(RedisKeyManager.availability_dirty_key(), *product_ids)
+
+
+async def enqueue_sync_product_availability(product_id: str = None):
+    """Enqueue product availability sync; single products are debounced through the dirty set"""
     if product_id:
-        await pool.enqueue_job('sync_product_availability_task', product_id)
+        await mark_product_availability_dirty(product_id)
     else:
+        pool = await get_arq_pool()
         await pool.enqueue_job('sync_product_availability_task')
 
 
@@ -429,6 +1252,43 @@ async def enqueue_cart_cleanup():
     await pool.enqueue_job('cleanup_expired_carts_task')
 
 
+async def enqueue_export_job(job_id: str):
+    """Enqueue an export job; exports may run well past the default job timeout"""
+    pool = await get_arq_pool()
+    await pool.enqueue_job('run_export_job_task', job_id, _job_timeout=EXPORT_JOB_TIMEOUT)
+
+
+async def enqueue_invoice_pregeneration(order_id: str):
+    """Enqueue invoice pre-rendering for a confirmed order; one pending job per order"""
+    pool = await get_arq_pool()
+    await pool.enqueue_job('pregenerate_invoice_task', order_id, _job_id=f"invoice:{order_id}")
+
+
+async def enqueue_webhook_processing():
+    """Ask for a webhook inbox drain; at most one job per second is queued"""
+    pool = await get_arq_pool()
+    await pool.enqueue_job('process_webhook_events_task', _job_id=f"webhook-drain:{int(time.time())}")
+
+
+async def enqueue_outbox_relay():
+    """Ask for an outbox relay run; at most one job per second is queued"""
+    pool = await get_arq_pool()
+    await pool.enqueue_job('relay_outbox_task', _job_id=f"outbox-relay:{int(time.time())}")
+
+
+async def enqueue_marketing_campaign(kind: str, campaign_id: str, **params):
+    """Enqueue a marketing campaign; the campaign id doubles as the job id, so triggers can't start it twice"""
+    pool = await get_arq_pool()
+    await pool.enqueue_job(
+        'run_marketing_campaign_task',
+        kind,
+        campaign_id,
+        _job_id=f"marketing:{campaign_id}",
+        _job_timeout=MARKETING_CAMPAIGN_TIMEOUT,
+        **params
+    )
+
+
 async def enqueue_promocode_update():
     """Enqueue promocode status update task"""
     pool = await get_arq_pool()
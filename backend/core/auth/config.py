@@ -8,10 +8,14 @@ from dataclasses import dataclass
 
 @dataclass
 class RateLimitConfig:
-    """Rate limit configuration for different endpoints"""
+    """
+    Rate limit configuration for different endpoints
+    Limits are per user for requests with a valid access token and per client IP otherwise,
+    so the anonymous ones leave room for several people behind one NAT.
+    """
     
     # Authentication endpoints (per minute)
-    AUTH_LOGIN = 5           # Login attempts
+    AUTH_LOGIN = 10          # Login attempts
     AUTH_REGISTER = 3        # Registration attempts  
     AUTH_PASSWORD_RESET = 3  # Password reset requests
     AUTH_EMAIL_VERIFY = 5    # Email verification attempts
@@ -23,7 +27,7 @@ class RateLimitConfig:
     
     # General API endpoints (per minute)
     API_GENERAL = 300        # General API calls (increased for polling)
-    SEARCH = 60              # Search requests
+    SEARCH = 120             # Search requests (typeahead fires one per keystroke pause)
     UPLOAD = 20              # File uploads
     
     # Security thresholds
@@ -97,6 +101,16 @@ class SecuritySettings:
         "/upload": "upload",
     }
     
+    # Categories always checked against Redis on every request, even in hybrid rate-limit mode
+    STRICT_RATE_LIMIT_CATEGORIES = {
+        "auth_login",
+        "auth_register",
+        "auth_password_reset",
+        "auth_email_verify",
+        "checkout",
+        "coupon_validation",
+    }
+    
     # Security-sensitive endpoints requiring additional protection
     SECURITY_ENDPOINTS = {
         "price_sensitive": [
@@ -3,7 +3,10 @@ Redis Configuration and Connection Management
 Implements Redis best practices for e-commerce MVP
 """
 import redis.asyncio as redis
+import asyncio
+from abc import ABC, abstractmethod
 import json
+import time
 from typing import Any, Optional, Dict, List, Union
 from datetime import datetime, timedelta
 from core.config import settings
@@ -256,6 +259,164 @@ class RedisService:
             logger.error(f"Redis LIST GET error for key {key}: {e}")
             return []
 
+class RedisStreamConsumer:
+    """
+    Consumer-group reader for a Redis stream
+    Each read returns this consumer's unacknowledged entries first, then new ones, so a
+    batch whose handler failed is redelivered on the next read. Handlers must be idempotent.
+    """
+    
+    def __init__(self, stream_key: str, group: str, consumer: str, redis: Optional[redis.Redis] = None, batch_size: int = 500):
+        self.stream_key = stream_key
+        self.group = group
+        self.consumer = consumer
+        self.redis = redis
+        self.batch_size = batch_size
+        self._group_ready = False
+    
+    async def _get_redis(self) -> redis.Redis:
+        if self.redis is None:
+            self.redis = await get_redis()
+        return self.redis
+    
+    def decode(self, message_id: Any, fields: Dict[Any, Any]) -> Dict[str, Any]:
+        """Turn a raw stream entry into a dict; subclasses return their own event shape"""
+        decoded = {
+            (k.decode('utf-8') if isinstance(k, bytes) else k): (v.decode('utf-8') if isinstance(v, bytes) else v)
+            for k, v in fields.items()
+        }
+        decoded["id"] = message_id.decode('utf-8') if isinstance(message_id, bytes) else message_id
+        return decoded
+    
+    async def ensure_group(self):
+        """
+        Create the consumer group (and stream) if needed
+        Starts at the oldest retained entry, so events published before the group existed
+        are still delivered; call at startup rather than relying on the first read.
+        """
+        if self._group_ready:
+            return
+        redis_client = await self._get_redis()
+        try:
+            await redis_client.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+    
+    async def read(self, count: Optional[int] = None, block_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Read this consumer's pending entries first, then new ones"""
+        await self.ensure_group()
+        redis_client = await self._get_redis()
+        count = count or self.batch_size
+        
+        for stream_id, block in (("0", None), (">", block_ms)):
+            response = await redis_client.xreadgroup(
+                self.group, self.consumer, {self.stream_key: stream_id}, count=count, block=block
+            )
+            messages = [message for _, stream_messages in (response or []) for message in stream_messages]
+            
+            # Pending entries already trimmed from the stream come back without fields; just ack them
+            trimmed = [message_id for message_id, fields in messages if not fields]
+            if trimmed:
+                await redis_client.xack(self.stream_key, self.group, *trimmed)
+            
+            entries = [self.decode(message_id, fields) for message_id, fields in messages if fields]
+            if entries:
+                return entries
+        return []
+    
+    async def ack(self, entries: List[Dict[str, Any]]):
+        if not entries:
+            return
+        redis_client = await self._get_redis()
+        await redis_client.xack(self.stream_key, self.group, *[entry["id"] for entry in entries])
+    
+    async def consume(self, handler, stop=None, block_ms: int = 5000):
+        """Run handler(entries) for every batch until stop is set; a batch is acked only if handler succeeds"""
+        while not (stop and stop.is_set()):
+            entries = await self.read(block_ms=block_ms)
+            if not entries:
+                continue
+            await handler(entries)
+            await self.ack(entries)
+
+
+class ChannelRefreshedCache(ABC):
+    """
+    Base for in-process snapshots of database rows that follow a pub/sub channel
+    Subclasses implement channel() and load(). The snapshot is reloaded whenever anything
+    is published on the channel (bursts are coalesced into one reload) and at least every
+    max_age seconds. Without a running listener (scripts, the worker), ensure_fresh()
+    reloads lazily once the snapshot is older than max_age.
+    """
+    
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self._loaded_at: Optional[float] = None
+        self._listener: Optional[asyncio.Task] = None
+    
+    @abstractmethod
+    def channel(self) -> str:
+        """Pub/sub channel announcing changes to the cached rows"""
+    
+    @abstractmethod
+    async def load(self):
+        """Replace the snapshot with the current rows"""
+    
+    async def refresh(self):
+        await self.load()
+        self._loaded_at = time.monotonic()
+    
+    async def ensure_fresh(self):
+        stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+        # With the listener running, changes arrive as they happen
+        if self._loaded_at is None or (stale and self._listener is None):
+            await self.refresh()
+    
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                redis_client = await get_redis()
+                pubsub = redis_client.pubsub()
+                await pubsub.subscribe(self.channel())
+                # Changes published while we were (re)subscribing would otherwise be missed
+                await self.refresh()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.max_age)
+                    if message is not None:
+                        while await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1):
+                            pass
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Listener on {self.channel()} failed, resubscribing", exception=e)
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.reset()
+                    except Exception:
+                        pass
+    
+    async def start(self):
+        """Load the snapshot and follow the channel"""
+        await self.refresh()
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+    
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
 class RedisKeyManager:
     """
     Centralized Redis key management with consistent naming conventions
@@ -267,7 +428,16 @@ class RedisKeyManager:
     SECURITY_PREFIX = "security"
     PRODUCT_CACHE_PREFIX = "product"
     INVENTORY_LOCK_PREFIX = "inventory_lock"
+    INVENTORY_PREFIX = "inventory"
+    ANALYTICS_PREFIX = "analytics"
     USER_CACHE_PREFIX = "user"
+    ADMIN_PREFIX = "admin"
+    EXPORT_PREFIX = "export"
+    MARKETING_PREFIX = "marketing"
+    SUBSCRIPTION_PREFIX = "subscription"
+    PROMOCODE_PREFIX = "promocode"
+    DISCOUNT_PREFIX = "discount"
+    WEBHOOK_PREFIX = "webhook"
     
     @staticmethod
     def cart_key(user_id: str) -> str:
@@ -299,6 +469,91 @@ class RedisKeyManager:
         """Generate inventory lock key"""
         return f"{RedisKeyManager.INVENTORY_LOCK_PREFIX}:{variant_id}"
     
+    @staticmethod
+    def availability_dirty_key() -> str:
+        """Generate key for the set of products awaiting an availability sync"""
+        return f"{RedisKeyManager.INVENTORY_PREFIX}:availability_dirty"
+    
+    @staticmethod
+    def inventory_feed_key() -> str:
+        """Generate key for the stream of committed stock changes"""
+        return f"{RedisKeyManager.INVENTORY_PREFIX}:changes"
+    
+    @staticmethod
+    def analytics_events_key() -> str:
+        """Generate key for the stream of tracked analytics events awaiting insert"""
+        return f"{RedisKeyManager.ANALYTICS_PREFIX}:events"
+    
+    @staticmethod
+    def warehouse_import_key(import_id: str) -> str:
+        """Generate key for warehouse import progress"""
+        return f"{RedisKeyManager.INVENTORY_PREFIX}:import:{import_id}"
+    
+    @staticmethod
+    def admin_dashboard_key(filters_hash: str) -> str:
+        """Generate key for a cached admin dashboard response"""
+        return f"{RedisKeyManager.ADMIN_PREFIX}:dashboard:{filters_hash}"
+    
+    @staticmethod
+    def export_job_key(job_id: str) -> str:
+        """Generate key for an export job record"""
+        return f"{RedisKeyManager.EXPORT_PREFIX}:job:{job_id}"
+    
+    @staticmethod
+    def marketing_cooldown_key(user_id: str, kind: str) -> str:
+        """Generate key marking a user as recently sent a campaign of this kind"""
+        return f"{RedisKeyManager.MARKETING_PREFIX}:cooldown:{kind}:{user_id}"
+    
+    @staticmethod
+    def marketing_daily_count_key(user_id: str, day: str) -> str:
+        """Generate key counting marketing emails sent to a user on a day (YYYYMMDD)"""
+        return f"{RedisKeyManager.MARKETING_PREFIX}:daily:{day}:{user_id}"
+    
+    @staticmethod
+    def marketing_stock_levels_key() -> str:
+        """Generate key for the last seen available quantity per variant"""
+        return f"{RedisKeyManager.MARKETING_PREFIX}:stock_levels"
+    
+    @staticmethod
+    def marketing_campaign_key(campaign_id: str) -> str:
+        """Generate key for a campaign's progress record (resume cursor and counts)"""
+        return f"{RedisKeyManager.MARKETING_PREFIX}:campaign:{campaign_id}"
+    
+    @staticmethod
+    def subscription_renewal_run_key(run_id: str) -> str:
+        """Generate key for a subscription renewal run's progress counters"""
+        return f"{RedisKeyManager.SUBSCRIPTION_PREFIX}:renewal_run:{run_id}"
+    
+    @staticmethod
+    def promocode_changes_channel() -> str:
+        """Generate pub/sub channel for promocode status changes"""
+        return f"{RedisKeyManager.PROMOCODE_PREFIX}:changes"
+    
+    @staticmethod
+    def discount_changes_channel() -> str:
+        """Generate pub/sub channel for discount changes (rule index reloads)"""
+        return f"{RedisKeyManager.DISCOUNT_PREFIX}:changes"
+    
+    @staticmethod
+    def promocode_usage_key(promocode_id: str) -> str:
+        """Generate key for a promocode's redeemed count (authoritative until flushed)"""
+        return f"{RedisKeyManager.PROMOCODE_PREFIX}:used:{promocode_id}"
+    
+    @staticmethod
+    def promocode_usage_dirty_key() -> str:
+        """Generate key for the set of promocode ids with unflushed usage counts"""
+        return f"{RedisKeyManager.PROMOCODE_PREFIX}:usage_dirty"
+    
+    @staticmethod
+    def webhook_event_seen_key(event_id: str) -> str:
+        """Generate key marking a webhook event as already received (fast dedupe)"""
+        return f"{RedisKeyManager.WEBHOOK_PREFIX}:seen:{event_id}"
+    
+    @staticmethod
+    def webhook_drain_lock_key() -> str:
+        """Generate key for the single-flight lock on webhook inbox processing"""
+        return f"{RedisKeyManager.WEBHOOK_PREFIX}:drain_lock"
+    
     @staticmethod
     def user_cache_key(user_id: str) -> str:
         """Generate user cache key"""
@@ -508,6 +508,11 @@ class Settings:
         self.SECRET_KEY: str = os.getenv('SECRET_KEY')
         self.STRIPE_SECRET_KEY: str = os.getenv('STRIPE_SECRET_KEY')
         self.STRIPE_WEBHOOK_SECRET: str = os.getenv('STRIPE_WEBHOOK_SECRET')
+        # Async, pooled Stripe gateway; point STRIPE_API_URL at the local stand-in for testing
+        self.STRIPE_API_URL: str = os.getenv('STRIPE_API_URL', 'https://api.stripe.com')
+        self.STRIPE_POOL_SIZE: int = int(os.getenv('STRIPE_POOL_SIZE', '20'))
+        self.STRIPE_TIMEOUT: float = float(os.getenv('STRIPE_TIMEOUT', '20'))
+        self.STRIPE_MAX_RETRIES: int = int(os.getenv('STRIPE_MAX_RETRIES', '2'))
         self.ALGORITHM: str = os.getenv('ALGORITHM', "HS256")
         
         # Session and Token Configuration
@@ -522,6 +527,16 @@ class Settings:
         self.REDIS_URL: str = os.getenv('REDIS_URL')
         self.REDIS_CACHE_ENABLED: bool = os.getenv('REDIS_CACHE_ENABLED', 'true').lower() == 'true'
         self.REDIS_RATELIMIT_ENABLED: bool = os.getenv('REDIS_RATELIMIT_ENABLED', 'true').lower() == 'true'
+        # Reverse proxies (IPs or CIDRs) whose X-Forwarded-For / X-Real-IP are believed;
+        # from anyone else the connecting address is the client
+        self.RATE_LIMIT_TRUSTED_PROXIES: List[str] = [
+            proxy.strip() for proxy in os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if proxy.strip()
+        ]
+        # "strict" checks every request against Redis; "hybrid" serves non-sensitive categories
+        # from per-worker token leases (a fraction of the limit, returned after the TTL if unused)
+        self.RATE_LIMIT_MODE: str = os.getenv('RATE_LIMIT_MODE', 'strict').lower()
+        self.RATE_LIMIT_LEASE_FRACTION: float = float(os.getenv('RATE_LIMIT_LEASE_FRACTION', '0.1'))
+        self.RATE_LIMIT_LEASE_TTL_SECONDS: float = float(os.getenv('RATE_LIMIT_LEASE_TTL_SECONDS', '2'))
         self.REDIS_CACHE_TTL: int = int(os.getenv('REDIS_CACHE_TTL', '3600'))
         self.REDIS_CART_TTL_GUEST: int = int(os.getenv('REDIS_CART_TTL_GUEST', '1800'))  # 30 minutes for guests
         self.REDIS_CART_TTL_USER: int = int(os.getenv('REDIS_CART_TTL_USER', '259200'))  # 3 days for users
@@ -531,6 +546,62 @@ class Settings:
         self.ENABLE_ARQ: bool = os.getenv('ENABLE_ARQ', 'true').lower() == 'true'
         self.ARQ_REDIS_URL: str = os.getenv('ARQ_REDIS_URL', 'redis://redis:6379/0')
         
+        # --- Inventory Concurrency ---
+        # Stock updates use version-checked compare-and-swap; the Redis lock is an optional extra
+        self.INVENTORY_USE_DISTRIBUTED_LOCK: bool = os.getenv('INVENTORY_USE_DISTRIBUTED_LOCK', 'false').lower() == 'true'
+        self.INVENTORY_CAS_MAX_RETRIES: int = int(os.getenv('INVENTORY_CAS_MAX_RETRIES', '3'))
+        
+        # --- Inventory Change Feed ---
+        # Committed stock changes are published to a Redis stream for availability sync and live stock
+        self.INVENTORY_FEED_ENABLED: bool = os.getenv('INVENTORY_FEED_ENABLED', 'true').lower() == 'true'
+        self.INVENTORY_FEED_MAXLEN: int = int(os.getenv('INVENTORY_FEED_MAXLEN', '100000'))
+        
+        # --- Warehouse Import ---
+        # Streaming CSV/NDJSON feeds are staged and applied this many rows at a time
+        self.WAREHOUSE_IMPORT_CHUNK_SIZE: int = int(os.getenv('WAREHOUSE_IMPORT_CHUNK_SIZE', '5000'))
+        self.WAREHOUSE_IMPORT_ERROR_DIR: str = os.getenv('WAREHOUSE_IMPORT_ERROR_DIR', '/tmp/warehouse_imports')
+        
+        # --- Analytics Ingestion ---
+        # Tracked events are buffered on a Redis stream and bulk-inserted by the worker
+        self.ANALYTICS_STREAM_MAXLEN: int = int(os.getenv('ANALYTICS_STREAM_MAXLEN', '1000000'))
+        self.ANALYTICS_FLUSH_BATCH_SIZE: int = int(os.getenv('ANALYTICS_FLUSH_BATCH_SIZE', '1000'))
+        
+        # --- Admin Dashboard ---
+        # Dashboard responses are cached per filter combination; ?refresh=true bypasses the cache
+        self.ADMIN_DASHBOARD_CACHE_TTL: int = int(os.getenv('ADMIN_DASHBOARD_CACHE_TTL', '45'))
+        
+        # --- Exports & Rendering ---
+        # Export jobs write artifacts here; PDFs and reports render in a process pool of this size
+        self.EXPORT_ARTIFACT_DIR: str = os.getenv('EXPORT_ARTIFACT_DIR', '/tmp/exports')
+        self.EXPORT_ARTIFACT_TTL_HOURS: int = int(os.getenv('EXPORT_ARTIFACT_TTL_HOURS', '24'))
+        self.RENDER_POOL_PROCESSES: int = int(os.getenv('RENDER_POOL_PROCESSES', '2'))
+        self.RENDER_POOL_MAX_PENDING: int = int(os.getenv('RENDER_POOL_MAX_PENDING', '16'))
+        # Rendered invoices, named by a hash of their content so unchanged orders are served from disk
+        self.INVOICE_CACHE_DIR: str = os.getenv('INVOICE_CACHE_DIR', '/tmp/invoices')
+        self.INVOICE_CACHE_TTL_HOURS: int = int(os.getenv('INVOICE_CACHE_TTL_HOURS', '168'))
+        
+        # --- Templates ---
+        # Compiled Jinja bytecode is persisted here (empty disables); with auto-reload off (the
+        # production default) source changes are only picked up through invalidate_template_cache
+        self.TEMPLATE_BYTECODE_CACHE_DIR: str = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', '/tmp/jinja_cache')
+        self.TEMPLATE_AUTO_RELOAD: bool = os.getenv(
+            'TEMPLATE_AUTO_RELOAD', 'false' if self.ENVIRONMENT == 'production' else 'true'
+        ).lower() == 'true'
+        
+        # --- Subscription Renewals ---
+        # Due subscriptions are renewed in keyset batches, this many at a time within a batch
+        self.SUBSCRIPTION_RENEWAL_BATCH_SIZE: int = int(os.getenv('SUBSCRIPTION_RENEWAL_BATCH_SIZE', '100'))
+        self.SUBSCRIPTION_RENEWAL_CONCURRENCY: int = int(os.getenv('SUBSCRIPTION_RENEWAL_CONCURRENCY', '5'))
+        
+        # --- Marketing Emails ---
+        # Back-in-stock, price-drop and cart-abandonment campaigns, paged and frequency-capped per user
+        self.MARKETING_EMAILS_ENABLED: bool = os.getenv('MARKETING_EMAILS_ENABLED', 'true').lower() == 'true'
+        self.MARKETING_AUDIENCE_PAGE_SIZE: int = int(os.getenv('MARKETING_AUDIENCE_PAGE_SIZE', '1000'))
+        self.MARKETING_COOLDOWN_HOURS: int = int(os.getenv('MARKETING_COOLDOWN_HOURS', '24'))
+        self.MARKETING_DAILY_CAP: int = int(os.getenv('MARKETING_DAILY_CAP', '2'))
+        self.MARKETING_MIN_PRICE_DROP_PERCENT: float = float(os.getenv('MARKETING_MIN_PRICE_DROP_PERCENT', '5'))
+        self.CART_ABANDONMENT_AFTER_HOURS: int = int(os.getenv('CART_ABANDONMENT_AFTER_HOURS', '4'))
+        
         # --- CORS Configuration ---
         self.BACKEND_CORS_ORIGINS: List[str] = parse_cors(cors_origins)
         
@@ -538,6 +609,13 @@ class Settings:
         self.MAILJET_API_KEY: str = os.getenv('MAILJET_API_KEY', '')
         self.MAILJET_API_SECRET: str = os.getenv('MAILJET_API_SECRET', '')
         self.MAILJET_FROM_EMAIL: str = os.getenv('MAILJET_FROM_EMAIL', 'Banwee <noreply@banwee.com>')
+        # Pooled, batched Mailjet transport; point MAILJET_API_URL at the local stand-in for testing
+        self.MAILJET_API_URL: str = os.getenv('MAILJET_API_URL', 'https://api.mailjet.com')
+        self.MAILJET_BATCH_SIZE: int = int(os.getenv('MAILJET_BATCH_SIZE', '50'))
+        self.MAILJET_BATCH_LINGER_MS: int = int(os.getenv('MAILJET_BATCH_LINGER_MS', '50'))
+        self.MAILJET_POOL_SIZE: int = int(os.getenv('MAILJET_POOL_SIZE', '10'))
+        self.MAILJET_TIMEOUT: float = float(os.getenv('MAILJET_TIMEOUT', '30'))
+        self.MAILJET_MAX_RETRIES: int = int(os.getenv('MAILJET_MAX_RETRIES', '4'))
         self.TELEGRAM_BOT_TOKEN: str = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.WHATSAPP_ACCESS_TOKEN: str = os.getenv('WHATSAPP_ACCESS_TOKEN', '')
         self.PHONE_NUMBER_ID: str = os.getenv('PHONE_NUMBER_ID', '')
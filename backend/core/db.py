@@ -1,13 +1,13 @@
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy import text, Column, DateTime, func, TypeDecorator, CHAR, Index, String, Boolean, Integer, Text
+from sqlalchemy import text, select, Column, DateTime, func, TypeDecorator, CHAR, Index, String, Boolean, Integer, Text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.exc import SQLAlchemyError, DisconnectionError, OperationalError
 from sqlalchemy.pool import QueuePool
 import asyncio
 import time
 import uuid
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, Optional, Tuple, Any
 from contextlib import asynccontextmanager
 from fastapi import HTTPException
 from fastapi.exceptions import RequestValidationError
@@ -635,6 +635,40 @@ async def get_db_pool_status() -> dict:
     return await db_manager.get_connection_pool_status()
 
 
+async def iter_id_ranges(
+    db: AsyncSession,
+    id_column,
+    chunk_size: int = 1000
+) -> AsyncGenerator[Tuple[Optional[Any], Optional[Any]], None]:
+    """
+    Walk a table's primary key in keyset chunks for batched set-based updates
+
+    Yields (lower, upper) bounds meaning lower < id <= upper; lower is None for the
+    first chunk and upper is None for the last. Each boundary lookup is a single
+    index-only probe, so callers can commit between chunks to keep locks short.
+    """
+    lower = None
+    while True:
+        boundary = select(id_column).order_by(id_column).offset(chunk_size - 1).limit(1)
+        if lower is not None:
+            boundary = boundary.where(id_column > lower)
+        upper = await db.scalar(boundary)
+        yield lower, upper
+        if upper is None:
+            return
+        lower = upper
+
+
+def id_range_conditions(id_column, lower: Optional[Any], upper: Optional[Any]) -> list:
+    """Build WHERE conditions for a (lower, upper] range produced by iter_id_ranges"""
+    conditions = []
+    if lower is not None:
+        conditions.append(id_column > lower)
+    if upper is not None:
+        conditions.append(id_column <= upper)
+    return conditions
+
+
 # Async context manager for optimized database sessions
 class OptimizedAsyncSession:
     """Optimized async session context manager"""
@@ -0,0 +1,221 @@
+"""
+Inventory change feed (Redis Streams)
+Every committed stock mutation is published as a compact event
+{variant_id, product_id, new_available, version} on one stream.
+
+- ORM changes to Inventory.quantity_available are captured automatically on flush
+- Core UPDATEs that bypass the ORM call queue_stock_change() themselves
+- Events are only published after the transaction commits; rollbacks discard them
+
+Consumers either join a consumer group (StockFeedConsumer - at-least-once, with acks)
+or fan out in-process from a single tail (stock_feed_broadcaster - live, best effort).
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+from core.cache import RedisStreamConsumer
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+# Session.info key holding changes waiting for commit, keyed by variant_id
+PENDING_CHANGES_KEY = "pending_stock_changes"
+
+# Keeps fire-and-forget publish tasks referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _stream_key() -> str:
+    from core.cache import RedisKeyManager
+    return RedisKeyManager.inventory_feed_key()
+
+
+def _decode(value: Any) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def encode_stock_change(change: Dict[str, Any]) -> Dict[str, str]:
+    """Flatten a change into stream fields"""
+    return {
+        "variant_id": str(change["variant_id"]),
+        "product_id": str(change["product_id"]) if change.get("product_id") else "",
+        "new_available": str(int(change["new_available"])),
+        "version": str(int(change.get("version") or 0)),
+    }
+
+
+def decode_stock_change(message_id: Any, fields: Dict[Any, Any]) -> Dict[str, Any]:
+    """Turn a raw stream entry back into a change dict"""
+    data = {_decode(k): _decode(v) for k, v in fields.items()}
+    return {
+        "id": _decode(message_id),
+        "variant_id": data.get("variant_id"),
+        "product_id": data.get("product_id") or None,
+        "new_available": int(data.get("new_available", 0)),
+        "version": int(data.get("version", 0)),
+    }
+
+
+def queue_stock_change(
+    db: Any,
+    variant_id: Any,
+    product_id: Any,
+    new_available: int,
+    version: Optional[int] = None
+):
+    """
+    Queue a stock change to be published when the session commits
+    Accepts an AsyncSession or a Session; later changes to the same variant replace earlier ones
+    """
+    if not settings.INVENTORY_FEED_ENABLED:
+        return
+    session = getattr(db, "sync_session", db)
+    pending = session.info.setdefault(PENDING_CHANGES_KEY, {})
+    key = str(variant_id)
+    previous = pending.get(key)
+    pending[key] = {
+        "variant_id": variant_id,
+        "product_id": product_id or (previous or {}).get("product_id"),
+        "new_available": new_available,
+        "version": version,
+    }
+
+
+async def publish_stock_changes(changes: List[Dict[str, Any]], redis=None):
+    """XADD changes to the feed in one pipeline; failures are logged, never raised"""
+    if not changes:
+        return
+    try:
+        if redis is None:
+            from core.cache import get_redis
+            redis = await get_redis()
+
+        stream_key = _stream_key()
+        async with redis.pipeline(transaction=False) as pipe:
+            for change in changes:
+                pipe.xadd(
+                    stream_key,
+                    encode_stock_change(change),
+                    maxlen=settings.INVENTORY_FEED_MAXLEN,
+                    approximate=True
+                )
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish stock changes", metadata={"count": len(changes)}, exception=e)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_inventory_changes(session: Session, flush_context):
+    """Queue events for Inventory rows whose available quantity changed in this flush"""
+    if not settings.INVENTORY_FEED_ENABLED:
+        return
+
+    from models.inventories import Inventory
+    from models.product import ProductVariant
+
+    changed = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Inventory)
+        and (obj in session.new or attributes.get_history(obj, "quantity_available").has_changes())
+    ]
+    if not changed:
+        return
+
+    variant_ids = {obj.variant_id for obj in changed if obj.variant_id}
+    product_ids = dict(
+        session.connection().execute(
+            select(ProductVariant.id, ProductVariant.product_id).where(ProductVariant.id.in_(variant_ids))
+        ).all()
+    ) if variant_ids else {}
+
+    for obj in changed:
+        queue_stock_change(session, obj.variant_id, product_ids.get(obj.variant_id), obj.quantity_available, obj.version)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session):
+    changes = session.info.pop(PENDING_CHANGES_KEY, None)
+    if not changes:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Synchronous usage (migrations, scripts) - nothing listens there
+        return
+    task = loop.create_task(publish_stock_changes(list(changes.values())))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(PENDING_CHANGES_KEY, None)
+
+
+class StockFeedConsumer(RedisStreamConsumer):
+    """
+    Consumer-group reader for the change feed
+    Unacknowledged events are redelivered to the same consumer name on its next read,
+    so handlers must be idempotent (they usually are: sync, invalidate, push latest value).
+    """
+
+    def __init__(self, group: str, consumer: str, redis=None, batch_size: int = 500):
+        super().__init__(_stream_key(), group, consumer, redis=redis, batch_size=batch_size)
+
+    def decode(self, message_id: Any, fields: Dict[Any, Any]) -> Dict[str, Any]:
+        return decode_stock_change(message_id, fields)
+
+
+class StockFeedBroadcaster:
+    """
+    Fans the feed out to in-process subscribers from a single XREAD tail
+    One blocking Redis read per process no matter how many clients are listening.
+    Slow subscribers drop their oldest events rather than stall the tail.
+    """
+
+    def __init__(self, queue_size: int = 100, block_ms: int = 5000):
+        self.queue_size = queue_size
+        self.block_ms = block_ms
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._tail())
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    def _dispatch(self, change: Dict[str, Any]):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(change)
+
+    async def _tail(self):
+        from core.cache import get_redis
+
+        last_id = "$"
+        while self._subscribers:
+            try:
+                redis = await get_redis()
+                response = await redis.xread({_stream_key(): last_id}, block=self.block_ms, count=500)
+                for _, messages in response or []:
+                    for message_id, fields in messages:
+                        last_id = message_id
+                        self._dispatch(decode_stock_change(message_id, fields))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Stock feed tail error: {e}")
+                await asyncio.sleep(1)
+
+
+stock_feed_broadcaster = StockFeedBroadcaster()
@@ -2,14 +2,17 @@
 Rate Limiting Middleware with Redis Integration and Security Features
 Implements rate limiting, coupon abuse detection, price tampering protection, and security monitoring
 """
-from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from typing import Dict, Optional, List
 from datetime import datetime, timedelta
+import asyncio
+import ipaddress
 import json
-import hashlib
+import math
+import time
+from jose import JWTError, jwt
 from core.cache import RedisService, RedisKeyManager
 from core.config import settings
 from core.utils.response import Response as APIResponse
@@ -178,11 +181,64 @@ class SecurityService(RedisService):
             logger.error(f"Error tracking suspicious activity: {e}")
 
 
+# Generic Cell Rate Algorithm in one round trip: the only state per key is the
+# theoretical arrival time (TAT) in milliseconds, so memory is O(1) however busy the key is.
+# Also serves token leases: `requested` tokens are granted at once (partially if allowed),
+# and `returned` unused tokens from an expired lease are credited back first.
+# KEYS[1] = limit key; ARGV = limit, period ms, requested, returned, allow partial (0/1)
+# Returns {granted, remaining, retry_after_ms, reset_after_ms}
+GCRA_LUA = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local returned = tonumber(ARGV[4])
+local partial = ARGV[5] == '1'
+local emission = period / limit
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if returned > 0 then
+    tat = tat - returned * emission
+end
+if tat < now then
+    tat = now
+end
+
+local available = math.floor((now - tat + period) * limit / period + 1e-6)
+local granted = math.min(requested, available)
+if granted < requested and not partial then
+    granted = 0
+end
+
+if granted > 0 or returned > 0 then
+    tat = tat + granted * emission
+    if tat > now then
+        redis.call('SET', KEYS[1], string.format('%.3f', tat), 'PX', math.ceil(tat - now))
+    else
+        redis.call('DEL', KEYS[1])
+    end
+end
+
+if granted == 0 and requested > 0 then
+    local needed = partial and 1 or requested
+    return {0, available, math.ceil(tat + needed * emission - period - now), math.ceil(tat - now)}
+end
+return {granted, available - granted, 0, math.ceil(tat - now)}
+"""
+
+
 class RateLimitService(RedisService):
-    """Redis-based rate limiting service using sliding window algorithm"""
+    """
+    Redis-based rate limiting service using GCRA (one EVALSHA per check)
+    In hybrid mode, non-sensitive categories are served from per-worker token leases
+    """
     
     def __init__(self):
         super().__init__()
+        self._script = None
+        self.leases = TokenLeaseBuckets(self) if settings.RATE_LIMIT_MODE == "hybrid" else None
         
         # Default rate limits (requests per minute) - now using security config
         self.default_limits = {
@@ -198,57 +254,65 @@ class RateLimitService(RedisService):
             "api_general": security_settings.RATE_LIMITS.API_GENERAL,
         }
     
+    async def _get_script(self):
+        """Register the GCRA script once; redis-py sends EVALSHA and reloads it on NOSCRIPT"""
+        if self._script is None:
+            redis_client = await self._get_redis()
+            self._script = redis_client.register_script(GCRA_LUA)
+        return self._script
+    
+    async def take_tokens(
+        self,
+        key: str,
+        limit: int,
+        window_seconds: int,
+        requested: int = 1,
+        returned: int = 0,
+        partial: bool = False
+    ) -> List[int]:
+        """Run the GCRA script: returns [granted, remaining, retry_after_ms, reset_after_ms]"""
+        script = await self._get_script()
+        result = await script(
+            keys=[key],
+            args=[limit, window_seconds * 1000, requested, returned, 1 if partial else 0]
+        )
+        return [int(value) for value in result]
+    
     async def check_rate_limit(
         self, 
         identifier: str, 
         endpoint_type: str = "api",
         custom_limit: Optional[int] = None,
-        window_seconds: int = 60
+        window_seconds: int = 60,
+        cost: int = 1
     ) -> Dict[str, any]:
-        """Check if request is within rate limit using sliding window"""
+        """
+        Check if request is within rate limit
+        Allows `limit` requests per window, spread evenly, with bursts of up to `limit`
+        """
+        limit = custom_limit or self.default_limits.get(endpoint_type, self.default_limits["api_general"])
         try:
-            limit = custom_limit or self.default_limits.get(endpoint_type, self.default_limits["api_general"])
             rate_limit_key = RedisKeyManager.rate_limit_key(identifier, endpoint_type)
             
-            redis_client = await self._get_redis()
-            current_time = datetime.utcnow().timestamp()
-            window_start = current_time - window_seconds
-            
-            # Use Redis sorted set for sliding window
-            # Remove old entries outside the window
-            await redis_client.zremrangebyscore(rate_limit_key, 0, window_start)
-            
-            # Count current requests in window
-            current_count = await redis_client.zcard(rate_limit_key)
-            
-            if current_count >= limit:
-                # Rate limit exceeded
-                oldest_requests = await redis_client.zrange(rate_limit_key, 0, 0, withscores=True)
-                reset_time = int(oldest_requests[0][1] + window_seconds) if oldest_requests else int(current_time + window_seconds)
-                
-                return {
-                    "allowed": False,
-                    "limit": limit,
-                    "remaining": 0,
-                    "reset_time": reset_time,
-                    "retry_after": reset_time - int(current_time)
-                }
-            
-            # Add current request to the window
-            await redis_client.zadd(rate_limit_key, {str(current_time): current_time})
-            
-            # Set expiry for the key (cleanup)
-            await redis_client.expire(rate_limit_key, window_seconds + 10)
+            if (
+                self.leases is not None
+                and cost == 1
+                and endpoint_type not in security_settings.STRICT_RATE_LIMIT_CATEGORIES
+                and self.leases.lease_size(limit) > 1
+            ):
+                return await self.leases.acquire(rate_limit_key, limit, window_seconds)
             
-            remaining = limit - current_count - 1
-            reset_time = int(current_time + window_seconds)
+            granted, remaining, retry_after_ms, reset_after_ms = await self.take_tokens(
+                rate_limit_key, limit, window_seconds, requested=cost
+            )
             
+            current_time = time.time()
             return {
-                "allowed": True,
+                "allowed": granted > 0,
                 "limit": limit,
                 "remaining": remaining,
-                "reset_time": reset_time,
-                "retry_after": 0
+                "reset_time": int(current_time + math.ceil(reset_after_ms / 1000)),
+                "retry_after": math.ceil(retry_after_ms / 1000)
             }
             
         except Exception as e:
@@ -256,171 +320,379 @@ class RateLimitService(RedisService):
             # On error, allow the request (fail open)
             return {
                 "allowed": True,
-                "limit": self.default_limits.get(endpoint_type, 100),
-                "remaining": 99,
-                "reset_time": int(datetime.utcnow().timestamp() + 60),
+                "limit": limit,
+                "remaining": limit - 1,
+                "reset_time": int(time.time() + window_seconds),
                 "retry_after": 0,
                 "error": str(e)
             }
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+
+class _TokenLease:
+    """Tokens leased from Redis and held by this worker until they run out or expire"""
+    __slots__ = ("tokens", "expires_at", "global_remaining", "reset_time", "limit", "window_seconds")
+    
+    def __init__(self, tokens: int, expires_at: float, global_remaining: int, reset_time: int, limit: int, window_seconds: int):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.global_remaining = global_remaining
+        self.reset_time = reset_time
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+
+class TokenLeaseBuckets:
     """
-    Enhanced middleware for rate limiting and security protection
+    Per-worker token buckets backed by Redis leases
+    Each bucket reserves a chunk of the global GCRA budget (lease_fraction of the limit) in
+    one script call and serves requests locally until the chunk is used up or the lease
+    expires. Unused tokens are credited back to Redis when the lease is renewed, or by the
+    periodic sweep for buckets that went idle. Fairness across workers is approximate: at most
+    one lease per worker can be outstanding above the global limit.
     """
     
+    def __init__(self, service: RateLimitService, lease_fraction: Optional[float] = None, lease_ttl: Optional[float] = None):
+        self.service = service
+        self.lease_fraction = lease_fraction or settings.RATE_LIMIT_LEASE_FRACTION
+        self.lease_ttl = lease_ttl or settings.RATE_LIMIT_LEASE_TTL_SECONDS
+        self._leases: Dict[str, _TokenLease] = {}
+        self._refills: Dict[str, asyncio.Future] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+    
+    def lease_size(self, limit: int) -> int:
+        return max(1, int(limit * self.lease_fraction))
+    
+    def _result(self, lease: _TokenLease) -> Dict[str, any]:
+        return {
+            "allowed": True,
+            "limit": lease.limit,
+            "remaining": lease.tokens + lease.global_remaining,
+            "reset_time": lease.reset_time,
+            "retry_after": 0
+        }
+    
+    async def acquire(self, key: str, limit: int, window_seconds: int) -> Dict[str, any]:
+        """Take one token, leasing a new chunk from Redis only when the local bucket is empty or stale"""
+        now = time.monotonic()
+        lease = self._leases.get(key)
+        if lease is not None and lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            return self._result(lease)
+        
+        # Single-flight per key: concurrent requests wait for the refill in progress and take from
+        # its lease, instead of each leasing a chunk and overwriting the other's (leaking its tokens)
+        pending = self._refills.get(key)
+        if pending is not None:
+            await asyncio.shield(pending)
+            return await self.acquire(key, limit, window_seconds)
+        
+        refill = asyncio.get_running_loop().create_future()
+        self._refills[key] = refill
+        try:
+            return await self._refill(key, lease, now, limit, window_seconds)
+        finally:
+            self._refills.pop(key, None)
+            refill.set_result(None)
+    
+    async def _refill(
+        self,
+        key: str,
+        lease: Optional[_TokenLease],
+        now: float,
+        limit: int,
+        window_seconds: int
+    ) -> Dict[str, any]:
+        self._ensure_sweeper()
+        
+        # Credit back whatever the expired lease did not use, and lease a fresh chunk. The leftovers
+        # are claimed before the await so the sweep can't credit them a second time
+        returned = 0
+        if lease is not None and lease.expires_at <= now:
+            returned, lease.tokens = lease.tokens, 0
+        granted, remaining, retry_after_ms, reset_after_ms = await self.service.take_tokens(
+            key, limit, window_seconds,
+            requested=self.lease_size(limit),
+            returned=returned,
+            partial=True
+        )
+        
+        if granted == 0:
+            self._leases.pop(key, None)
+            return {
+                "allowed": False,
+                "limit": limit,
+                "remaining": 0,
+                "reset_time": int(time.time() + math.ceil(reset_after_ms / 1000)),
+                "retry_after": math.ceil(retry_after_ms / 1000)
+            }
+        
+        lease = _TokenLease(
+            tokens=granted - 1,
+            expires_at=now + self.lease_ttl,
+            global_remaining=remaining,
+            reset_time=int(time.time() + math.ceil(reset_after_ms / 1000)),
+            limit=limit,
+            window_seconds=window_seconds
+        )
+        self._leases[key] = lease
+        return self._result(lease)
+    
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+    
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"Rate limit lease sweep failed: {e}")
+    
+    async def sweep(self):
+        """Return unused tokens from expired leases and forget idle buckets"""
+        now = time.monotonic()
+        expired = [(key, lease) for key, lease in self._leases.items() if lease.expires_at <= now]
+        for key, lease in expired:
+            self._leases.pop(key, None)
+        
+        returning = []
+        for key, lease in expired:
+            if lease.tokens > 0:
+                returning.append((key, lease.limit, lease.window_seconds, lease.tokens))
+                lease.tokens = 0
+        if returning:
+            await asyncio.gather(*[
+                self.service.take_tokens(key, limit, window_seconds, requested=0, returned=tokens)
+                for key, limit, window_seconds, tokens in returning
+            ])
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware for rate limiting and security protection
+    Avoids BaseHTTPMiddleware's per-request task and body-stream wrapping; the only
+    per-request Redis work is the single GCRA EVALSHA.
+    """
+    
+    # Stripe retries webhook deliveries in bursts from a few IPs; signatures authenticate them
+    SKIP_PATHS = {"/health", "/docs", "/redoc", "/openapi.json", "/webhooks/stripe", "/v1/webhooks/stripe"}
+    API_PREFIX = "/v1"
+    CHECKOUT_PATH = "/orders/checkout"
+    
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
         self.rate_limit_service = RateLimitService()
         self.security_service = SecurityService()
-        
-        # Define endpoint types for different rate limits - using security config
-        self.endpoint_types = security_settings.ENDPOINT_CATEGORIES
+        self.trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES]
         
         # Security-sensitive endpoints
         self.security_endpoints = security_settings.SECURITY_ENDPOINTS
     
-    def _get_client_identifier(self, request: Request) -> str:
-        """Get client identifier for tracking"""
-        # Try user ID first
-        if hasattr(request.state, "user_id") and request.state.user_id:
-            return f"user:{request.state.user_id}"
-        
-        # Fall back to IP + User-Agent hash for anonymous users
-        ip = self._get_client_ip(request)
-        user_agent = request.headers.get('user-agent', '')
-        client_hash = hashlib.md5(f"{ip}:{user_agent}".encode()).hexdigest()[:12]
-        return f"client:{client_hash}"
+    def _get_client_identifier(self, scope: Scope, headers: Headers) -> str:
+        """Get client identifier for tracking: the user for a valid access token, else the client IP"""
+        user_id = self._get_user_id(headers)
+        if user_id:
+            return f"user:{user_id}"
+        return f"ip:{self._get_client_ip(scope, headers)}"
+    
+    @staticmethod
+    def _get_user_id(headers: Headers) -> Optional[str]:
+        """
+        User id from the bearer access token, verified but without a database lookup
+        Invalid or expired tokens count as anonymous; the endpoint rejects them anyway.
+        """
+        authorization = headers.get('authorization', '')
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return None
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        if payload.get("type") != "access":
+            return None
+        return payload.get("sub")
     
-    def _get_client_ip(self, request: Request) -> str:
-        """Extract real client IP"""
-        # Check for forwarded headers
-        forwarded_for = request.headers.get('x-forwarded-for')
+    def _is_trusted_proxy(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+    
+    def _get_client_ip(self, scope: Scope, headers: Headers) -> str:
+        """
+        Extract real client IP
+        Forwarded headers are only believed from a trusted proxy. X-Forwarded-For is walked
+        from the right, skipping our own proxies, so a client-supplied prefix is ignored.
+        """
+        client = scope.get("client")
+        peer = client[0] if client else 'unknown'
+        if not self._is_trusted_proxy(peer):
+            return peer
+        
+        forwarded_for = headers.get('x-forwarded-for')
         if forwarded_for:
-            return forwarded_for.split(',')[0].strip()
+            hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+            for hop in reversed(hops):
+                if not self._is_trusted_proxy(hop):
+                    return hop
+            if hops:
+                return hops[0]
         
-        real_ip = request.headers.get('x-real-ip')
+        real_ip = headers.get('x-real-ip')
         if real_ip:
-            return real_ip
-        
-        return request.client.host if request.client else 'unknown'
+            return real_ip.strip()
+        return peer
+    
+    def _endpoint_path(self, scope: Scope) -> str:
+        """Path without the API version prefix, as used in the security config"""
+        path = scope["path"]
+        if path.startswith(self.API_PREFIX + "/"):
+            return path[len(self.API_PREFIX):]
+        return path
+    
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                return body
+    
+    @staticmethod
+    def _blocked_response(message: str, reason: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            content={
+                "success": False,
+                "message": message,
+                "errors": [reason.upper()]
+            }
+        )
     
-    async def _check_security_violations(self, request: Request, identifier: str) -> Optional[JSONResponse]:
-        """Check for various security violations"""
-        path = request.url.path
+    async def _check_security_violations(self, scope: Scope, receive: Receive, path: str, identifier: str):
+        """
+        Check for various security violations
+        Returns (blocking response or None, receive callable to pass downstream)
+        """
+        if scope["method"] != "POST":
+            return None, receive
         
         # Check coupon abuse for coupon-related endpoints
         if any(path.startswith(endpoint) for endpoint in self.security_endpoints["coupon_validation"]):
+            body = await self._read_body(receive)
+            
+            # Replay the buffered body to the application
+            replayed = False
+            
+            async def replay_receive() -> Message:
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+            
             try:
-                if request.method == "POST":
-                    body = await request.body()
-                    if body:
-                        request._body = body  # Store for later use
-                        data = json.loads(body.decode())
-                        coupon_code = data.get('code') or data.get('coupon_code')
-                        
-                        if coupon_code:
-                            abuse_result = await self.security_service.detect_coupon_abuse(identifier, coupon_code)
-                            if abuse_result.get("blocked"):
-                                return JSONResponse(
-                                    status_code=429,
-                                    content={
-                                        "success": False,
-                                        "message": abuse_result["message"],
-                                        "errors": [abuse_result["reason"].upper()]
-                                    }
-                                )
+                if body:
+                    data = json.loads(body.decode())
+                    coupon_code = data.get('code') or data.get('coupon_code')
+                    
+                    if coupon_code:
+                        abuse_result = await self.security_service.detect_coupon_abuse(identifier, coupon_code)
+                        if abuse_result.get("blocked"):
+                            return self._blocked_response(abuse_result["message"], abuse_result["reason"]), replay_receive
             except Exception as e:
                 logger.error(f"Error checking coupon abuse: {e}")
+            
+            return None, replay_receive
         
         # Check checkout abuse
-        if any(path.startswith(endpoint) for endpoint in self.security_endpoints["checkout"]):
-            if request.method == "POST":
-                abuse_result = await self.security_service.detect_checkout_abuse(identifier)
-                if abuse_result.get("blocked"):
-                    return JSONResponse(
-                        status_code=429,
-                                            content={
-                                                "success": False,
-                                                "message": abuse_result["message"],
-                                                "errors": [abuse_result["reason"].upper()]
-                                            }                    )
+        if self._is_checkout(scope, path):
+            abuse_result = await self.security_service.detect_checkout_abuse(identifier)
+            if abuse_result.get("blocked"):
+                return self._blocked_response(abuse_result["message"], abuse_result["reason"]), receive
         
-        return None
+        return None, receive
+    
+    def _is_checkout(self, scope: Scope, path: str) -> bool:
+        return scope["method"] == "POST" and path.rstrip("/") == self.CHECKOUT_PATH
+    
+    def _endpoint_type(self, scope: Scope, path: str) -> str:
+        endpoint_type = security_settings.get_endpoint_category(path)
+        # Everything else under /orders/ (reads, cancel, notes, reorder, refund) is general API traffic
+        if endpoint_type == "checkout" and not self._is_checkout(scope, path):
+            return "api_general"
+        return endpoint_type
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process request with rate limiting and security checks"""
+        if scope["type"] != "http" or scope["path"] in self.SKIP_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
         
-        # Skip for health checks and docs
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
-        
-        # Get client identifier
-        identifier = self._get_client_identifier(request)
+        headers = Headers(scope=scope)
+        path = self._endpoint_path(scope)
+        identifier = self._get_client_identifier(scope, headers)
         
         # Check security violations first
-        security_response = await self._check_security_violations(request, identifier)
+        security_response, receive = await self._check_security_violations(scope, receive, path, identifier)
         if security_response:
-            return security_response
+            await security_response(scope, receive, send)
+            return
         
         # Determine endpoint type for rate limiting
-        endpoint_type = security_settings.get_endpoint_category(request.url.path)
+        endpoint_type = self._endpoint_type(scope, path)
+        rate_limit_result = await self.rate_limit_service.check_rate_limit(
+            identifier=identifier,
+            endpoint_type=endpoint_type
+        )
         
-        # Check rate limit
-        try:
-            rate_limit_result = await self.rate_limit_service.check_rate_limit(
-                identifier=identifier,
-                endpoint_type=endpoint_type
+        if not rate_limit_result.get("allowed", True):
+            # Track rate limit violation
+            await self.security_service.track_suspicious_activity(
+                identifier, 
+                "rate_limit_violation",
+                {"endpoint": scope["path"], "endpoint_type": endpoint_type}
             )
             
-            if not rate_limit_result.get("allowed", True):
-                # Track rate limit violation
-                await self.security_service.track_suspicious_activity(
-                    identifier, 
-                    "rate_limit_violation",
-                    {"endpoint": request.url.path, "endpoint_type": endpoint_type}
-                )
-                
-                return JSONResponse(
-                    status_code=429,
-                    content={
-                        "success": False,
-                        "message": f"Rate limit exceeded. Try again in {rate_limit_result.get('retry_after', 60)} seconds.",
-                        "errors": ["RATE_LIMIT_EXCEEDED"],
-                        "data": {
+            response = JSONResponse(
+                status_code=429,
+                content={
+                    "success": False,
+                    "message": f"Rate limit exceeded. Try again in {rate_limit_result.get('retry_after', 60)} seconds.",
+                    "errors": ["RATE_LIMIT_EXCEEDED"],
+                    "data": {
+                        "limit": rate_limit_result.get("limit"),
+                        "reset_time": rate_limit_result.get("reset_time"),
+                        "details": {
                             "limit": rate_limit_result.get("limit"),
-                            "reset_time": rate_limit_result.get("reset_time"),
-                            "details": {
-                                "limit": rate_limit_result.get("limit"),
-                                "reset_time": rate_limit_result.get("reset_time")
-                            }
+                            "reset_time": rate_limit_result.get("reset_time")
                         }
-                    },
-                    headers={
-                        "X-RateLimit-Limit": str(rate_limit_result.get("limit", 100)),
-                        "X-RateLimit-Remaining": str(rate_limit_result.get("remaining", 0)),
-                        "X-RateLimit-Reset": str(rate_limit_result.get("reset_time", 0)),
-                        "Retry-After": str(rate_limit_result.get("retry_after", 60))
                     }
-                )
-            
-            # Process request
-            response = await call_next(request)
-            
-            # Add rate limit headers to response
-            response.headers["X-RateLimit-Limit"] = str(rate_limit_result.get("limit", 100))
-            response.headers["X-RateLimit-Remaining"] = str(rate_limit_result.get("remaining", 99))
-            response.headers["X-RateLimit-Reset"] = str(rate_limit_result.get("reset_time", 0))
-            
-            return response
-            
-        except Exception as e:
-            logger.error(f"Rate limiting error: {e}")
-            # On error in rate limiting, return a generic 500 error
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "success": False,
-                    "message": "Internal server error during rate limiting.",
-                    "errors": [f"Rate limiting internal error: {e}"]
+                },
+                headers={
+                    "X-RateLimit-Limit": str(rate_limit_result.get("limit", 100)),
+                    "X-RateLimit-Remaining": str(rate_limit_result.get("remaining", 0)),
+                    "X-RateLimit-Reset": str(rate_limit_result.get("reset_time", 0)),
+                    "Retry-After": str(rate_limit_result.get("retry_after", 60))
                 }
-            )
\ No newline at end of file
+            )
+            await response(scope, receive, send)
+            return
+        
+        rate_limit_headers = [
+            (b"x-ratelimit-limit", str(rate_limit_result.get("limit", 100)).encode()),
+            (b"x-ratelimit-remaining", str(rate_limit_result.get("remaining", 99)).encode()),
+            (b"x-ratelimit-reset", str(rate_limit_result.get("reset_time", 0)).encode()),
+        ]
+        
+        async def send_with_headers(message: Message) -> None:
+            # Add rate limit headers to the response
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + rate_limit_headers
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
@@ -3,9 +3,9 @@ Invoice PDF Generator using Jinja2 and WeasyPrint
 """
 from datetime import datetime, timedelta
 from typing import Dict, Optional
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 from weasyprint import HTML
 from pathlib import Path
+from core.utils.templating import get_template_env
 
 
 class InvoiceGenerator:
@@ -25,11 +25,8 @@ class InvoiceGenerator:
         
         self.template_dir = Path(template_dir)
         
-        # Setup Jinja2 environment
-        self.env = Environment(
-            loader=FileSystemLoader(str(self.template_dir)),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
+        # Shared precompiled Jinja2 environment
+        self.env = get_template_env(self.template_dir)
         
     def format_currency(self, amount: float, currency: str = "$") -> str:
         """Format amount as currency"""
@@ -65,7 +62,8 @@ class InvoiceGenerator:
         Returns:
             Dictionary with formatted invoice data
         """
-        current_date = datetime.now()
+        # A fixed issue date (the order's confirmation) keeps re-renders of an invoice identical
+        current_date = order_data.get('issue_date') or datetime.now()
         
         # Format items
         items = []
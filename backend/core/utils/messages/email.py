@@ -1,67 +1,38 @@
 """
 Mailjet email service for sending emails
 """
-import aiohttp
 import asyncio
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 from core.config import settings
+from core.logging import get_structured_logger
+from core.utils.messages.mailjet import build_message, close_mail_sender, get_mail_sender
+from core.utils.templating import get_message_env
 import os
-from pathlib import Path
-
-# Initialize Jinja environment directly to avoid circular imports
-# Use absolute path from the backend directory
-template_dir = Path(__file__).parent / "templates"
-template_dir.mkdir(parents=True, exist_ok=True)
-
-env = Environment(
-    loader=FileSystemLoader(str(template_dir)),
-    autoescape=select_autoescape(['html', 'xml']),
-    trim_blocks=True,
-    lstrip_blocks=True
-)
-
-# Add custom filters
-def _format_currency(value: float, currency: str = "USD") -> str:
-    """Format currency values"""
-    if currency == "USD":
-        return f"${value:.2f}"
-    return f"{value:.2f} {currency}"
-
-def _format_date(value) -> str:
-    """Format date values"""
-    if hasattr(value, 'strftime'):
-        return value.strftime('%B %d, %Y')
-    return str(value)
-
-def _format_datetime(value) -> str:
-    """Format datetime values"""
-    if hasattr(value, 'strftime'):
-        return value.strftime('%B %d, %Y at %I:%M %p')
-    return str(value)
-
-env.filters['currency'] = _format_currency
-env.filters['date'] = _format_date
-env.filters['datetime'] = _format_datetime
+
+logger = get_structured_logger(__name__)
+
+# Shared, precompiled environment (filters: currency, date, datetime)
+env = get_message_env()
+
+
+def email_context(context: dict) -> dict:
+    """Add common email context variables"""
+    return {
+        **context,
+        'company_name': context.get('company_name', 'Banwee'),
+        'support_email': context.get('support_email', 'support@banwee.com'),
+        'current_year': context.get('current_year', '2026'),
+        'frontend_url': context.get('frontend_url', settings.FRONTEND_URL),
+        'logo_url': context.get('logo_url', f"{settings.FRONTEND_URL}/banwee_logo_green.png"),
+    }
 
 
 async def render_email(template_name: str, context: dict) -> str:
     """Render Jinja2 template with context"""
     try:
         template = env.get_template(template_name)
-        
-        # Add common email context variables
-        email_context = {
-            **context,
-            'company_name': context.get('company_name', 'Banwee'),
-            'support_email': context.get('support_email', 'support@banwee.com'),
-            'current_year': context.get('current_year', '2026'),
-            'frontend_url': context.get('frontend_url', settings.FRONTEND_URL),
-            'logo_url': context.get('logo_url', f"{settings.FRONTEND_URL}/banwee_logo_green.png"),
-        }
-        
-        return template.render(**email_context)
+        return template.render(**email_context(context))
     except Exception as e:
-        print(f"Template rendering error: {e}")
+        logger.error(f"Template rendering error: {e}", metadata={"template": template_name})
         raise RuntimeError(f"Template rendering error: {e}")
 
 
@@ -89,90 +60,25 @@ async def send_email_mailjet(
     if not subject:
         subject = "Notification from Banwee"
 
-    try:
-        # Use pre-rendered HTML if provided, otherwise render template
-        if html_content:
-            html_body = html_content
-            print(f"🔧 Debug: Using provided html_content ({len(html_body)} chars)")
-        else:
-            html_body = await render_email(template_name, context)
-            print(f"🔧 Debug: Rendered template {template_name} ({len(html_body)} chars)")
-        
-        text_body = context.get("text_body", "This is a plain-text fallback.")
-        print(f"🔧 Debug: text_body = '{text_body}'")
-        
-        print(f'📤 Sending email via Mailjet to {to_email}...')
+    # Use pre-rendered HTML if provided, otherwise render template
+    html_body = html_content if html_content else await render_email(template_name, context)
+    text_body = context.get("text_body", "This is a plain-text fallback.")
 
-        # Mailjet API endpoint (v3.1)
-        mailjet_url = "https://api.mailjet.com/v3.1/send"
-        
-        # Parse from email
-        from_email = settings.MAILJET_FROM_EMAIL
-        print(f"🔧 Debug: MAILJET_FROM_EMAIL = '{from_email}'")
-        
-        if '<' in from_email and '>' in from_email:
-            # Format: "Name <email@domain.com>"
-            from_name = from_email.split('<')[0].strip()
-            from_address = from_email.split('<')[1].split('>')[0].strip()
-        else:
-            # Format: "email@domain.com"
-            from_name = "Banwee"
-            from_address = from_email
-        
-        # Ensure from_address is not empty and is a valid email
-        if not from_address or '@' not in from_address:
-            print(f"🔧 Debug: Invalid from_address '{from_address}', using fallback")
-            from_address = "oscarchiagoziem@gmail.com"
-            from_name = "BanweeTest"
-        
-        print(f"🔧 Debug: from_name = '{from_name}', from_address = '{from_address}'")
-        
-        # Prepare Mailjet payload (v3.0 format - working version)
-        payload = {
-            "FromEmail": str(from_address).strip(),
-            "FromName": str(from_name).strip(),
-            "Recipients": [
-                {
-                    "Email": str(to_email).strip(),
-                    "Name": str(context.get("to_name", "") or "").strip()
-                }
-            ],
-            "Subject": str(subject).strip(),
-            "Text-part": str(text_body).strip(),
-            "Html-part": str(html_body).strip()
-        }
-        
-        print(f"🔧 Debug: Using Mailjet v3.0 format - FromEmail: '{payload['FromEmail']}'")
-        
-        # Send async request to Mailjet (use v3.0 since v3.1 has issues)
-        async with aiohttp.ClientSession() as session:
-            try:
-                # Use v3.0 API which works correctly
-                async with session.post(
-                    "https://api.mailjet.com/v3/send",
-                    auth=aiohttp.BasicAuth(settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET),
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        print(f"✅ Email sent successfully via Mailjet v3.0: {result}")
-                        return result
-                    else:
-                        error_text = await response.text()
-                        print(f"❌ Mailjet error ({response.status}): {error_text}")
-                        raise Exception(f"Mailjet API error: {error_text}")
-            except Exception as e:
-                print(f"❌ Exception during Mailjet request: {e}")
-                raise
-
-    except asyncio.TimeoutError:
-        print("❌ Request timed out.")
-        raise
-
-    except Exception as err:
-        print(f"❌ Unexpected error: {err}")
-        raise
+    message = build_message(
+        to_email=to_email,
+        subject=subject,
+        html_body=html_body,
+        text_body=text_body,
+        to_name=context.get("to_name", "")
+    )
+
+    # Queued on the shared sender and flushed to Mailjet with other pending messages
+    result = await get_mail_sender().send(message)
+    logger.info(
+        f"Email sent via Mailjet to {to_email}",
+        metadata={"template": template_name, "message_ids": result["message_ids"]}
+    )
+    return result
 
 
 # Legacy function for backward compatibility with old mail_type system
@@ -332,7 +238,7 @@ async def send_email_mailjet_legacy(
     template_name = template_map.get(mail_type)
 
     if not template_name:
-        print(f"No template found for mail_type: {mail_type}")
+        logger.warning(f"No template found for mail_type: {mail_type}")
         return
 
     return await send_email_mailjet(
@@ -355,6 +261,8 @@ def send_email_mailjet_sync(to_email: str, mail_type: str, context: dict = {}):
             send_email_mailjet_legacy(to_email, mail_type, context)
         )
     finally:
+        # The sender's connection pool belongs to this throwaway loop
+        loop.run_until_complete(close_mail_sender())
         loop.close()
 
 
@@ -0,0 +1,291 @@
+"""
+Pooled, batched Mailjet transport
+One long-lived aiohttp session per process keeps TCP/TLS connections to Mailjet open.
+Individual sends are queued and flushed as bulk v3.1 `Messages` arrays (up to
+MAILJET_BATCH_SIZE per call); each caller gets back the result for its own message.
+429s, 5xx responses and connection errors are retried with exponential backoff.
+
+Point MAILJET_API_URL at the stand-in server (core.utils.messages.mailjet_standin)
+to exercise the full send path locally without delivering anything.
+"""
+import asyncio
+import random
+from typing import Any, Dict, List, Optional, Set, Tuple
+import aiohttp
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+# Mailjet accepts at most 50 messages per v3.1 send call
+MAILJET_MAX_BATCH = 50
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 30.0
+
+
+class MailjetError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, errors: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors or []
+
+
+def parse_sender(from_email: str) -> Tuple[str, str]:
+    """(address, name) from "Name <email@domain.com>" or a bare address"""
+    if '<' in from_email and '>' in from_email:
+        from_name = from_email.split('<')[0].strip()
+        from_address = from_email.split('<')[1].split('>')[0].strip()
+    else:
+        from_name = "Banwee"
+        from_address = from_email.strip()
+
+    # Ensure from_address is not empty and is a valid email
+    if not from_address or '@' not in from_address:
+        logger.warning(f"Invalid MAILJET_FROM_EMAIL '{from_email}', using fallback sender")
+        return "oscarchiagoziem@gmail.com", "BanweeTest"
+    return from_address, from_name
+
+
+def build_message(
+    to_email: str,
+    subject: str,
+    html_body: str,
+    text_body: str = "",
+    to_name: str = "",
+    custom_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """A single v3.1 message"""
+    from_address, from_name = parse_sender(settings.MAILJET_FROM_EMAIL)
+    message = {
+        "From": {"Email": from_address, "Name": from_name},
+        "To": [{"Email": str(to_email).strip(), "Name": str(to_name or "").strip()}],
+        "Subject": str(subject).strip(),
+        "TextPart": str(text_body or "").strip(),
+        "HTMLPart": str(html_body).strip(),
+    }
+    if custom_id:
+        message["CustomID"] = custom_id
+    return message
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        except ValueError:
+            pass
+    return min(0.5 * (2 ** attempt), MAX_RETRY_DELAY) * random.uniform(0.8, 1.2)
+
+
+def _message_result(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize one entry of the v3.1 response's Messages array"""
+    return {
+        "status": entry.get("Status", "error"),
+        "message_ids": [str(to.get("MessageID")) for to in entry.get("To", []) if to.get("MessageID")],
+        "recipients": [to.get("Email") for to in entry.get("To", [])],
+        "errors": entry.get("Errors", []),
+    }
+
+
+class MailjetTransport:
+    """Keep-alive HTTP client for the Mailjet send API"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.url = f"{(base_url or settings.MAILJET_API_URL).rstrip('/')}/v3.1/send"
+        self.pool_size = pool_size or settings.MAILJET_POOL_SIZE
+        self.timeout = timeout or settings.MAILJET_TIMEOUT
+        self.max_retries = settings.MAILJET_MAX_RETRIES if max_retries is None else max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=60),
+                auth=aiohttp.BasicAuth(settings.MAILJET_API_KEY, settings.MAILJET_API_SECRET),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def send_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        POST one bulk request and return a result per message, in order
+        Mailjet answers 400 when any message is rejected; the others are still sent, so
+        both 200 and 400 bodies are mapped per message rather than failing the batch.
+        """
+        if len(messages) > MAILJET_MAX_BATCH:
+            raise ValueError(f"At most {MAILJET_MAX_BATCH} messages per send call")
+
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.post(self.url, json={"Messages": messages}) as response:
+                    if response.status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                        delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                        logger.warning(
+                            f"Mailjet returned {response.status}, retrying in {delay:.1f}s",
+                            metadata={"attempt": attempt + 1, "batch_size": len(messages)}
+                        )
+                        await asyncio.sleep(delay)
+                        continue
+
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = await response.text()
+                    entries = body.get("Messages") if isinstance(body, dict) else None
+                    if response.status in (200, 400) and isinstance(entries, list) and len(entries) == len(messages):
+                        return [_message_result(entry) for entry in entries]
+
+                    raise MailjetError(
+                        f"Mailjet API error ({response.status}): {body}",
+                        status=response.status,
+                        errors=body.get("Errors") if isinstance(body, dict) else None
+                    )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise MailjetError(f"Mailjet request failed: {e}") from e
+                delay = _retry_delay(attempt)
+                logger.warning(
+                    f"Mailjet request failed, retrying in {delay:.1f}s",
+                    metadata={"attempt": attempt + 1, "batch_size": len(messages)},
+                    exception=e
+                )
+                await asyncio.sleep(delay)
+
+        raise MailjetError("Mailjet retries exhausted")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class MailjetBatchSender:
+    """
+    Coalesces concurrent sends into bulk calls
+    A batch is flushed when it reaches batch_size or linger_ms after its first message,
+    and is delivered in the background so the next batch can fill meanwhile.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[MailjetTransport] = None,
+        batch_size: Optional[int] = None,
+        linger_ms: Optional[int] = None
+    ):
+        self.transport = transport or MailjetTransport()
+        self.batch_size = min(batch_size or settings.MAILJET_BATCH_SIZE, MAILJET_MAX_BATCH)
+        self.linger = (settings.MAILJET_BATCH_LINGER_MS if linger_ms is None else linger_ms) / 1000
+        self.loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+
+    async def send(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one message and wait for its result; raises MailjetError if it was rejected"""
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect())
+        future = self.loop.create_future()
+        self._queue.put_nowait((message, future))
+        result = await future
+        if result["status"] != "success":
+            raise MailjetError(f"Mailjet rejected message to {result['recipients']}: {result['errors']}", errors=result["errors"])
+        return result
+
+    async def send_bulk(self, messages: List[Dict[str, Any]], concurrency: int = 4) -> List[Dict[str, Any]]:
+        """
+        Send many messages directly in full batches (campaigns)
+        Returns a result per message, in order; rejected messages don't raise.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def deliver(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self.transport.send_messages(chunk)
+                except MailjetError as e:
+                    error = {"ErrorMessage": str(e), "StatusCode": e.status}
+                    return [
+                        {"status": "error", "message_ids": [], "recipients": [to["Email"] for to in m["To"]], "errors": [error]}
+                        for m in chunk
+                    ]
+
+        chunks = [messages[i:i + self.batch_size] for i in range(0, len(messages), self.batch_size)]
+        results = await asyncio.gather(*(deliver(chunk) for chunk in chunks))
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self.loop.time() + self.linger
+            try:
+                while len(batch) < self.batch_size:
+                    remaining = deadline - self.loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                self._start_delivery(batch)
+
+    def _start_delivery(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        task = asyncio.create_task(self._deliver(batch))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        try:
+            results = await self.transport.send_messages([message for message, _ in batch])
+        except Exception as e:
+            logger.error(f"Mailjet batch failed", metadata={"batch_size": len(batch)}, exception=e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Stop collecting, let in-flight batches finish and close the connection pool"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for i in range(0, len(pending), self.batch_size):
+            self._start_delivery(pending[i:i + self.batch_size])
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        await self.transport.close()
+
+
+_sender: Optional[MailjetBatchSender] = None
+
+
+def get_mail_sender() -> MailjetBatchSender:
+    """Process-wide sender, bound to the running event loop (recreated if the loop changed)"""
+    global _sender
+    if _sender is None or _sender.loop is not asyncio.get_running_loop():
+        _sender = MailjetBatchSender()
+    return _sender
+
+
+async def close_mail_sender():
+    global _sender
+    if _sender is not None:
+        sender, _sender = _sender, None
+        await sender.close()
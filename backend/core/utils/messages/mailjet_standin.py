@@ -0,0 +1,83 @@
+"""
+Local stand-in for the Mailjet v3.1 send API
+Accepts bulk sends, records every message in memory and answers with Mailjet-shaped
+per-message results, so the pooled transport, batching and retry paths can be exercised
+without delivering mail. Recipients containing "reject" come back as per-message errors,
+and fail_every=N answers every Nth request with a 503 to exercise retries.
+
+    python -m core.utils.messages.mailjet_standin --port 8025
+    MAILJET_API_URL=http://localhost:8025
+"""
+import argparse
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+from aiohttp import web
+
+_message_ids = itertools.count(1)
+
+
+class MailjetStandIn:
+    def __init__(self, fail_every: int = 0, max_batch: int = 50):
+        self.fail_every = fail_every
+        self.max_batch = max_batch
+        self.requests = 0
+        self.batches: List[List[Dict[str, Any]]] = []
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        return [message for batch in self.batches for message in batch]
+
+    def _result(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        recipients = message.get("To") or []
+        if not recipients or any("reject" in (to.get("Email") or "") for to in recipients):
+            return {
+                "Status": "error",
+                "Errors": [{"ErrorCode": "mj-0013", "StatusCode": 400, "ErrorMessage": "Invalid recipient"}],
+            }
+        return {
+            "Status": "success",
+            "CustomID": message.get("CustomID", ""),
+            "To": [{"Email": to.get("Email"), "MessageID": next(_message_ids)} for to in recipients],
+        }
+
+    async def send(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return web.json_response({"ErrorMessage": "Service unavailable"}, status=503)
+
+        body = await request.json()
+        messages = body.get("Messages") or []
+        if not messages or len(messages) > self.max_batch:
+            return web.json_response({"ErrorMessage": f"Send between 1 and {self.max_batch} messages"}, status=400)
+
+        results = [self._result(message) for message in messages]
+        self.batches.append([m for m, r in zip(messages, results) if r["Status"] == "success"])
+        status = 200 if all(r["Status"] == "success" for r in results) else 400
+        return web.json_response({"Messages": results}, status=status)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v3.1/send", self.send)
+        return app
+
+
+async def start_standin(host: str = "127.0.0.1", port: int = 8025, fail_every: int = 0) -> Tuple[web.AppRunner, MailjetStandIn]:
+    """Start the stand-in on host:port; call runner.cleanup() to stop it"""
+    standin = MailjetStandIn(fail_every=fail_every)
+    runner = web.AppRunner(standin.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, standin
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local Mailjet send API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 503")
+    args = parser.parse_args(argv)
+    web.run_app(MailjetStandIn(fail_every=args.fail_every).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Process pool for CPU-heavy rendering (WeasyPrint PDFs, large spreadsheets)
+Rendering in the event loop stalls every other request on the worker, and threads don't
+help because the work holds the GIL. Callables and arguments must be picklable, i.e.
+module-level functions taking plain data.
+
+Submissions are bounded: at most RENDER_POOL_MAX_PENDING renders may be queued or running
+per process. Background callers wait for a slot; request handlers pass wait=False and get
+RenderPoolBusy instead of piling more work behind a saturated pool.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+class RenderPoolBusy(Exception):
+    """Raised when a non-waiting submission finds every render slot taken"""
+
+
+def _init_render_process():
+    """Compile templates in each new render process before it takes work"""
+    try:
+        from core.utils.templating import warm_templates
+        warm_templates()
+    except Exception as e:
+        logger.warning(f"Template warm-up failed in render process: {e}")
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Create the pool on first use so processes that never render don't fork workers"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.RENDER_POOL_PROCESSES, initializer=_init_render_process)
+        logger.info(f"Render pool started with {settings.RENDER_POOL_PROCESSES} processes")
+    return _pool
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.RENDER_POOL_MAX_PENDING)
+    return _slots
+
+
+async def run_in_render_pool(func: Callable[..., Any], *args: Any, wait: bool = True) -> Any:
+    """
+    Run func(*args) in the render pool and await its result
+    With wait=False, raise RenderPoolBusy rather than queue behind a full pool.
+    """
+    slots = _get_slots()
+    if not wait and slots.locked():
+        raise RenderPoolBusy(f"All {settings.RENDER_POOL_MAX_PENDING} render slots are busy")
+    async with slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_render_pool(), func, *args)
+
+
+def shutdown_render_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,224 @@
+"""
+Shared Jinja environments
+Every renderer (emails, invoices, exports) gets its environment from here instead of
+building its own, so each template is compiled once per process. Compiled bytecode is
+persisted with FileSystemBytecodeCache, which makes fresh workers (and render pool
+processes) start warm, and auto_reload is off in production so cached templates are
+used without stat-ing their source files. Instead each lookup stats one marker file per
+template directory, which invalidate_template_cache rewrites, so a template written by
+one process is picked up by every API worker, ARQ worker and render pool process.
+"""
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+    TemplateError,
+    select_autoescape,
+)
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+MESSAGE_TEMPLATES_DIR = Path(__file__).parent / "messages" / "templates"
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Rewritten in a template directory whenever its templates are invalidated
+INVALIDATION_MARKER = ".invalidated"
+
+_environments: Dict[Tuple, Environment] = {}
+_string_templates: Dict[str, Template] = {}
+
+
+def _format_currency(value: float, currency: str = "USD") -> str:
+    """Format currency values"""
+    if currency == "USD":
+        return f"${value:.2f}"
+    return f"{value:.2f} {currency}"
+
+
+def _format_date(value) -> str:
+    """Format date values"""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%B %d, %Y')
+    return str(value)
+
+
+def _format_datetime(value) -> str:
+    """Format datetime values"""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%B %d, %Y at %I:%M %p')
+    return str(value)
+
+
+def _bytecode_cache(options_key: str) -> Optional[FileSystemBytecodeCache]:
+    """
+    Bytecode cache for one option set
+    Cache keys only cover the template name and source, so environments with different
+    options (e.g. trim_blocks) get separate directories.
+    """
+    if not settings.TEMPLATE_BYTECODE_CACHE_DIR:
+        return None
+    directory = os.path.join(settings.TEMPLATE_BYTECODE_CACHE_DIR, options_key)
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+def _marker_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class SharedEnvironment(Environment):
+    """
+    Environment for one template directory
+    Compiled templates are dropped whenever the directory's invalidation marker changes,
+    so invalidations from other processes apply even with auto_reload off.
+    """
+
+    def __init__(self, template_dir: str, **options):
+        super().__init__(loader=FileSystemLoader(template_dir), **options)
+        self.marker_path = os.path.join(template_dir, INVALIDATION_MARKER)
+        self.marker_version = _marker_version(self.marker_path)
+
+    def check_invalidated(self):
+        version = _marker_version(self.marker_path)
+        if version != self.marker_version:
+            self.marker_version = version
+            if self.cache is not None:
+                self.cache.clear()
+
+    def get_template(self, *args, **kwargs) -> Template:
+        self.check_invalidated()
+        return super().get_template(*args, **kwargs)
+
+    def select_template(self, *args, **kwargs) -> Template:
+        self.check_invalidated()
+        return super().select_template(*args, **kwargs)
+
+
+def get_template_env(
+    template_dir: Union[str, Path] = MESSAGE_TEMPLATES_DIR,
+    trim_blocks: bool = False,
+    lstrip_blocks: bool = False
+) -> Environment:
+    """Shared environment for template_dir with the common filters registered"""
+    template_dir = str(Path(template_dir).resolve())
+    key = (template_dir, trim_blocks, lstrip_blocks)
+    env = _environments.get(key)
+    if env is None:
+        options_key = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+        env = SharedEnvironment(
+            template_dir,
+            autoescape=select_autoescape(['html', 'xml']),
+            trim_blocks=trim_blocks,
+            lstrip_blocks=lstrip_blocks,
+            auto_reload=settings.TEMPLATE_AUTO_RELOAD,
+            bytecode_cache=_bytecode_cache(options_key),
+            cache_size=-1  # Never evict: the template set is small and fixed
+        )
+        env.filters['currency'] = _format_currency
+        env.filters['date'] = _format_date
+        env.filters['datetime'] = _format_datetime
+        _environments[key] = env
+    return env
+
+
+def invalidate_template_cache(template_dir: Union[str, Path]):
+    """
+    Drop compiled templates for template_dir in every process, so a rewritten file is picked
+    up even with auto_reload off (bytecode is keyed by source, so it never serves the old version)
+    The marker is replaced rather than rewritten in place, so its inode changes even when
+    two invalidations land within the filesystem's mtime resolution.
+    """
+    template_dir = str(Path(template_dir).resolve())
+    marker_path = os.path.join(template_dir, INVALIDATION_MARKER)
+    temp_path = f"{marker_path}.{os.getpid()}"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(str(time.time_ns()))
+        os.replace(temp_path, marker_path)
+    except OSError as e:
+        logger.warning(
+            f"Failed to write template invalidation marker",
+            metadata={"template_dir": template_dir},
+            exception=e
+        )
+
+    for (env_dir, _, _), env in _environments.items():
+        if env_dir == template_dir:
+            env.check_invalidated()
+            if env.cache is not None:
+                env.cache.clear()
+
+
+def get_message_env() -> Environment:
+    """Environment for email/message templates (whitespace-trimmed)"""
+    return get_template_env(MESSAGE_TEMPLATES_DIR, trim_blocks=True, lstrip_blocks=True)
+
+
+def get_string_template(name: str, source: str) -> Template:
+    """Compile an inline template once per process, keyed by name"""
+    template = _string_templates.get(name)
+    if template is None:
+        template = get_template_env().from_string(source)
+        _string_templates[name] = template
+    return template
+
+
+def stream_template(template: Template, context: Dict[str, Any], chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """Render with generate() and yield UTF-8 chunks of about chunk_bytes"""
+    parts = []
+    size = 0
+    for part in template.generate(context):
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_bytes:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+            size = 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def render_template_to_file(template: Template, context: Dict[str, Any], path: str) -> int:
+    """Stream a rendering straight to path without holding the whole document; returns bytes written"""
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in stream_template(template, context):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def warm_templates() -> int:
+    """
+    Compile every message template (and the invoice/export templates) up front
+    Called at API and worker startup and in each render pool process, so no request pays
+    first-use compile latency. Broken templates are logged, not raised.
+    """
+    from core.utils.invoice_generator import InvoiceGenerator
+    from services.export import ORDERS_PDF_TEMPLATE, ORDERS_PDF_TEMPLATE_NAME
+
+    compiled = 0
+    environments = [get_message_env(), InvoiceGenerator().env]
+    for env in environments:
+        for name in env.list_templates(extensions=["html", "txt"]):
+            try:
+                env.get_template(name)
+                compiled += 1
+            except TemplateError as e:
+                logger.warning(f"Template {name} failed to compile", metadata={"template": name}, exception=e)
+
+    get_string_template(ORDERS_PDF_TEMPLATE_NAME, ORDERS_PDF_TEMPLATE)
+    return compiled + 1
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Import a warehouse feed (CSV or NDJSON) into inventory
+Streams the file in chunks, so nightly feeds of any size run in constant memory.
+
+Usage:
+    python import_warehouse_feed.py feed.csv
+    python import_warehouse_feed.py feed.ndjson --chunk-size 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+from core.config import settings
+from core.db import initialize_db, db_manager
+
+READ_SIZE = 256 * 1024
+
+
+async def read_file(path: str):
+    """Yield the file in fixed-size byte chunks without blocking the event loop"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def print_progress(summary):
+    print(
+        f"⏳ {summary['total_rows']} rows read, {summary['updated_count']} updated, "
+        f"{summary['error_count']} errors ({summary['elapsed_seconds']}s)",
+        flush=True
+    )
+
+
+async def import_feed(path: str, fmt: str, chunk_size: int, error_dir: str) -> bool:
+    from services.warehouse_import import WarehouseImportService
+
+    initialize_db(
+        database_uri=settings.POSTGRES_DB_URL,
+        env_is_local=settings.ENVIRONMENT == "local",
+        use_optimized_engine=True
+    )
+
+    async with db_manager.session_factory() as db:
+        service = WarehouseImportService(db, chunk_size=chunk_size, error_dir=error_dir)
+        try:
+            summary = await service.import_feed(read_file(path), fmt=fmt, progress=print_progress)
+        except Exception as e:
+            # Chunks committed before the failure stay applied
+            print(f"❌ Import failed: {getattr(e, 'message', None) or e}")
+            return False
+
+    print(
+        f"✅ Import {summary['import_id']} {summary['status']}: {summary['total_rows']} rows, "
+        f"{summary['updated_count']} updated, {summary['unchanged_count']} unchanged, "
+        f"{summary['error_count']} errors in {summary['chunks']} chunks"
+    )
+    if summary["error_file"]:
+        print(f"❌ Rejected rows written to {summary['error_file']}")
+    return summary["error_count"] == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a warehouse stock feed")
+    parser.add_argument("path", help="CSV or NDJSON file")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=settings.WAREHOUSE_IMPORT_CHUNK_SIZE)
+    parser.add_argument("--error-dir", default=settings.WAREHOUSE_IMPORT_ERROR_DIR)
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if os.path.splitext(args.path)[1].lower() in (".ndjson", ".jsonl") else "csv")
+    ok = asyncio.run(import_feed(args.path, fmt, args.chunk_size, args.error_dir))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
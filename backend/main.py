@@ -21,6 +21,8 @@ from core.errors import (
     general_exception_handler
 )
 
+from core.middleware import RateLimitMiddleware
+
 from api import (
     admin_router,
     analytics_router,
@@ -109,12 +111,47 @@ async def lifespan(app: FastAPI):
             if settings.ENVIRONMENT != "local":
                 raise RuntimeError("Redis connection required for production")
 
+    # Compile email/invoice/export templates so first requests don't pay for it
+    try:
+        from core.utils.templating import warm_templates
+        compiled = warm_templates()
+        logger.info(f"Compiled {compiled} templates ✅")
+    except Exception as e:
+        logger.warning(f"Template warm-up failed: {e}")
+    
+    # Keep active promocodes and discount rules in memory, following their change channels
+    if settings.ENABLE_REDIS:
+        from services.promocode.usage import active_promocodes
+        from services.discounts import discount_rules
+        for cache in (active_promocodes, discount_rules):
+            try:
+                await cache.start()
+            except Exception as e:
+                logger.warning(f"{type(cache).__name__} failed to start: {e}")
     
     yield
     
     # Shutdown event
     logger.info("Application shutting down...")
     
+    # Stop following promocode and discount changes
+    from services.promocode.usage import active_promocodes
+    from services.discounts import discount_rules
+    await active_promocodes.stop()
+    await discount_rules.stop()
+    
+    # Stop render worker processes (PDF exports)
+    from core.utils.render_pool import shutdown_render_pool
+    shutdown_render_pool()
+    
+    # Flush queued emails and close the Mailjet connection pool
+    from core.utils.messages.mailjet import close_mail_sender
+    await close_mail_sender()
+    
+    # Close the Stripe connection pool
+    from services.payments.stripe_gateway import close_stripe_gateway
+    await close_stripe_gateway()
+    
     # Close Redis connections
     if settings.ENABLE_REDIS:
         try:
@@ -133,6 +170,12 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Middleware Stack (order matters - last added is executed first)
+# Rate limiting: one GCRA EVALSHA per request, pure ASGI. Added before CORS so
+# 429 responses still carry CORS headers. On by default; REDIS_RATELIMIT_ENABLED=false turns it off
+if settings.ENABLE_REDIS and settings.REDIS_RATELIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # Add standard FastAPI middleware
 # CORS middleware
 app.add_middleware(
@@ -151,9 +194,6 @@ if hasattr(settings, 'ALLOWED_HOSTS'):
         allowed_hosts=settings.ALLOWED_HOSTS
     )
 
-# Middleware Stack (order matters - last added is executed first)
-# Note: Rate limiting disabled for MVP (was using Redis)
-# app.add_middleware(RateLimitMiddleware)
 
 # API v1 Router
 v1_router = APIRouter(prefix="/v1")
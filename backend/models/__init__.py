@@ -7,7 +7,7 @@ from .review import Review
 from .promocode import Promocode
 from .shipping import ShippingMethod
 from .wishlist import Wishlist, WishlistItem
-from .analytics import UserSession, AnalyticsEvent, ConversionFunnel, CustomerLifecycleMetrics
+from .analytics import UserSession, AnalyticsEvent, ConversionFunnel, CustomerLifecycleMetrics, DailyMetric, HourlyMetric
 from .refunds import Refund, RefundItem
 from .tax_rates import TaxRate
 from .shipping_tracking import ShipmentTracking, ShippingCarrier,ShipmentTrackingEvent
@@ -16,12 +16,13 @@ from .contact_message import ContactMessage, MessageStatus, MessagePriority
 # Consolidated models - single source of truth
 from .orders import Order, OrderItem, TrackingEvent
 from .subscriptions import Subscription, SubscriptionProduct
-from .payments import PaymentMethod, PaymentIntent, Transaction
-from .inventories import WarehouseLocation, Inventory, StockAdjustment
+from .payments import PaymentMethod, PaymentIntent, Transaction, WebhookEvent
+from .inventories import WarehouseLocation, Inventory, StockAdjustment, DemandForecast
 from .admin import PricingConfig, SubscriptionCostHistory, SubscriptionAnalytics, PaymentAnalytics
 from .discounts import Discount, SubscriptionDiscount, ProductRemovalAudit
 from .validation_rules import TaxValidationRule, ShippingValidationRule
 from .variant_tracking import VariantTrackingEntry, VariantPriceHistory, VariantAnalytics, VariantSubstitution
+from .outbox import OutboxEvent
 
 # Import utils if they exist
 try:
@@ -48,6 +49,7 @@ __all__ = [
     "Order",
     "OrderItem",
     "TrackingEvent",
+    "OutboxEvent",
 
     # Subscription models (consolidated)
     "Subscription",
@@ -66,11 +68,13 @@ __all__ = [
     "PaymentMethod",
     "PaymentIntent",
     "Transaction",
+    "WebhookEvent",
 
     # Inventory models (consolidated)
     "WarehouseLocation",
     "Inventory",
     "StockAdjustment",
+    "DemandForecast",
 
     # Admin models (consolidated)
     "PricingConfig",
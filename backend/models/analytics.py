@@ -1,8 +1,8 @@
 """
 Analytics models for tracking business metrics
-Includes: UserSession, ConversionEvent, CartEvent, PurchaseMetrics
+Includes: UserSession, ConversionEvent, CartEvent, PurchaseMetrics, DailyMetric, HourlyMetric
 """
-from sqlalchemy import Column, String, ForeignKey, Float, Text, Integer, DateTime, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, String, ForeignKey, Float, Text, Integer, Date, DateTime, Boolean, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from core.db import BaseModel, GUID, Index
@@ -295,4 +295,66 @@ class CustomerLifecycleMetrics(BaseModel):
             "total_page_views": self.total_page_views,
             "average_session_duration": self.average_session_duration,
             "metrics_updated_at": self.metrics_updated_at.isoformat() if self.metrics_updated_at else None,
-        }
\ No newline at end of file
+        }
+
+
+class DailyMetric(BaseModel):
+    """
+    Pre-aggregated orders, revenue and signups per UTC day
+    Maintained by the metrics rollup job; chart endpoints read these instead of scanning orders.
+    """
+    __tablename__ = "daily_metrics"
+    __table_args__ = {'extend_existing': True}
+
+    bucket = Column(Date, nullable=False, unique=True)
+    
+    # All orders created in the bucket, and the paid subset (confirmed through delivered)
+    order_count = Column(Integer, nullable=False, default=0)
+    paid_order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    
+    # Non-admin users registered in the bucket
+    new_users = Column(Integer, nullable=False, default=0)
+    
+    # {order_status: {"orders": n, "revenue": x}} so status-filtered charts need no rescan
+    status_breakdown = Column(JSONB, nullable=False, default=dict)
+    
+    computed_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket": self.bucket.isoformat() if self.bucket else None,
+            "order_count": self.order_count,
+            "paid_order_count": self.paid_order_count,
+            "revenue": self.revenue,
+            "new_users": self.new_users,
+            "status_breakdown": self.status_breakdown,
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None,
+        }
+
+
+class HourlyMetric(BaseModel):
+    """Pre-aggregated orders, revenue and signups per UTC hour (same shape as DailyMetric)"""
+    __tablename__ = "hourly_metrics"
+    __table_args__ = {'extend_existing': True}
+
+    bucket = Column(DateTime(timezone=True), nullable=False, unique=True)
+    
+    order_count = Column(Integer, nullable=False, default=0)
+    paid_order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    new_users = Column(Integer, nullable=False, default=0)
+    status_breakdown = Column(JSONB, nullable=False, default=dict)
+    
+    computed_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket": self.bucket.isoformat() if self.bucket else None,
+            "order_count": self.order_count,
+            "paid_order_count": self.paid_order_count,
+            "revenue": self.revenue,
+            "new_users": self.new_users,
+            "status_breakdown": self.status_breakdown,
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None,
+        }
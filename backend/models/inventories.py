@@ -1,16 +1,19 @@
 """
 Consolidated inventory models with atomic stock operations
-Includes: WarehouseLocation, Inventory, StockAdjustment
+Includes: WarehouseLocation, Inventory, StockAdjustment, DemandForecast
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, DateTime, Boolean, Index, select, update
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Text, DateTime, Boolean, Index, select, update
+from sqlalchemy.orm import relationship, identity_key
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.db import BaseModel, CHAR_LENGTH, GUID
+from core.utils.uuid_utils import uuid7
 from datetime import datetime, timedelta
+import asyncio
 from typing import Dict, Any, Optional, List
 from uuid import UUID as UUIDType
 from core.logging import get_structured_logger
+from core.inventory_feed import queue_stock_change
 
 logger = get_structured_logger(__name__)
 
@@ -166,7 +169,73 @@ class Inventory(BaseModel):
         
         return adjustment
 
+    @classmethod
+    async def compare_and_swap_stock(
+        cls,
+        db: AsyncSession,
+        inventory_id: UUIDType,
+        expected_version: int,
+        quantity_change: int
+    ) -> Optional[Any]:
+        """
+        Apply a stock change with a single conditional UPDATE ... RETURNING
+        Needs no SELECT ... FOR UPDATE; the version column guards against lost updates
+
+        Args:
+            db: Database session
+            inventory_id: Inventory row to update
+            expected_version: Version the caller read before computing the change
+            quantity_change: Positive for increase, negative for decrease
+
+        Returns:
+            Row with (id, variant_id, product_id, quantity_available, version) on success,
+            None if the version moved on or the change would take stock below zero
+
+        An Inventory instance for the row already loaded in the session is refreshed after
+        a successful swap, so later reads in the same request don't see the old quantity/version.
+        """
+        from models.product import ProductVariant
+
+        values = {
+            "quantity_available": cls.quantity_available + quantity_change,
+            "quantity": cls.quantity_available + quantity_change,  # Update legacy field
+            "version": cls.version + 1,
+        }
+        if quantity_change < 0:
+            values["last_sold_at"] = datetime.utcnow()
+        elif quantity_change > 0:
+            values["last_restocked_at"] = datetime.utcnow()
 
+        product_id = (
+            select(ProductVariant.product_id)
+            .where(ProductVariant.id == cls.variant_id)
+            .scalar_subquery()
+        )
+
+        stmt = (
+            update(cls)
+            .where(
+                cls.id == inventory_id,
+                cls.version == expected_version,
+                cls.quantity_available >= -quantity_change
+            )
+            .values(**values)
+            .returning(
+                cls.id,
+                cls.variant_id,
+                product_id.label("product_id"),
+                cls.quantity_available,
+                cls.version
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(stmt)
+        updated = result.one_or_none()
+        if updated is not None:
+            loaded = db.identity_map.get(identity_key(cls, updated.id))
+            if loaded is not None:
+                await db.refresh(loaded)
+        return updated
 
     @property
     def stock_status(self) -> str:
@@ -221,6 +290,52 @@ class StockAdjustment(BaseModel):
     inventory = relationship("Inventory", back_populates="adjustments")
     adjusted_by = relationship("User", back_populates="stock_adjustments")
 
+class DemandForecast(BaseModel):
+    """Per-variant demand forecast, refreshed nightly by the forecasting job"""
+    __tablename__ = "demand_forecasts"
+    __table_args__ = (
+        # Indexes for reorder queries
+        Index('idx_demand_forecasts_days_until_stockout', 'days_until_stockout'),
+        Index('idx_demand_forecasts_generated_at', 'generated_at'),
+        {'extend_existing': True}
+    )
+
+    variant_id = Column(GUID(), ForeignKey("product_variants.id"), nullable=False, unique=True)
+    
+    # Model output
+    method = Column(String(20), nullable=False)  # "ses", "croston" or "none" (no sales history)
+    daily_rate = Column(Float, nullable=False, default=0.0)  # Expected one-off units sold per day
+    demand_std = Column(Float, nullable=False, default=0.0)  # Std dev of daily units over the history window
+    subscription_demand = Column(Float, nullable=False, default=0.0)  # Units due from subscription renewals within the horizon
+    
+    # Derived at refresh time for the stored horizon
+    horizon_days = Column(Integer, nullable=False)
+    history_days = Column(Integer, nullable=False)
+    forecast_demand = Column(Float, nullable=False, default=0.0)
+    safety_stock = Column(Float, nullable=False, default=0.0)
+    days_until_stockout = Column(Float, nullable=True)  # NULL when there is no expected demand
+    suggested_quantity = Column(Integer, nullable=False, default=0)
+    generated_at = Column(DateTime(timezone=True), nullable=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert forecast to dictionary for API responses"""
+        return {
+            "id": str(self.id),
+            "variant_id": str(self.variant_id),
+            "method": self.method,
+            "daily_rate": self.daily_rate,
+            "demand_std": self.demand_std,
+            "subscription_demand": self.subscription_demand,
+            "horizon_days": self.horizon_days,
+            "history_days": self.history_days,
+            "forecast_demand": self.forecast_demand,
+            "safety_stock": self.safety_stock,
+            "days_until_stockout": self.days_until_stockout,
+            "suggested_quantity": self.suggested_quantity,
+            "generated_at": self.generated_at.isoformat() if self.generated_at else None,
+        }
+
+
 # Utility functions for atomic operations
 async def atomic_stock_operation(
     db: AsyncSession,
@@ -347,4 +462,97 @@ async def atomic_bulk_stock_update(
     except Exception as e:
         await db.rollback()
         logger.error(f"Error in bulk stock update: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+async def optimistic_stock_update(
+    db: AsyncSession,
+    variant_id: UUIDType,
+    quantity_change: int,
+    reason: str,
+    user_id: Optional[UUIDType] = None,
+    notes: Optional[str] = None,
+    location_id: Optional[UUIDType] = None,
+    max_retries: int = 3
+) -> Dict[str, Any]:
+    """
+    Update stock using the version column instead of SELECT ... FOR UPDATE
+    Reads the current version, then compare-and-swaps; on a version conflict
+    the row is re-read and the swap retried up to max_retries times.
+    Does not commit - the caller owns the transaction.
+
+    Args:
+        db: Database session
+        variant_id: Product variant ID
+        quantity_change: Positive for increase, negative for decrease
+        reason: Reason for stock change
+        user_id: User making the change
+        notes: Additional notes
+        location_id: Restrict to inventory at this location
+        max_retries: Re-read/swap attempts after the first conflict
+
+    Returns:
+        Operation result dictionary
+    """
+    from core.errors import APIException
+
+    query = select(Inventory.id, Inventory.version, Inventory.quantity_available).where(
+        Inventory.variant_id == variant_id
+    )
+    if location_id:
+        query = query.where(Inventory.location_id == location_id)
+
+    for attempt in range(max_retries + 1):
+        current = (await db.execute(query)).one_or_none()
+
+        if not current:
+            raise APIException(
+                status_code=404,
+                message=f"Inventory not found for variant {variant_id}"
+            )
+
+        if current.quantity_available + quantity_change < 0:
+            raise APIException(
+                status_code=400,
+                message=f"Insufficient stock. Available: {current.quantity_available}, Requested: {abs(quantity_change)}"
+            )
+
+        updated = await Inventory.compare_and_swap_stock(
+            db, current.id, current.version, quantity_change
+        )
+
+        if updated:
+            adjustment = StockAdjustment(
+                id=uuid7(),
+                inventory_id=updated.id,
+                quantity_change=quantity_change,
+                reason=reason,
+                adjusted_by_user_id=user_id,
+                notes=notes or f"Stock changed from {current.quantity_available} to {updated.quantity_available}"
+            )
+            db.add(adjustment)
+            queue_stock_change(db, updated.variant_id, updated.product_id, updated.quantity_available, updated.version)
+
+            logger.info(f"Stock updated optimistically: variant={variant_id}, change={quantity_change}, new_stock={updated.quantity_available}, attempts={attempt + 1}")
+
+            return {
+                "inventory_id": updated.id,
+                "variant_id": updated.variant_id,
+                "product_id": updated.product_id,
+                "previous_quantity": current.quantity_available,
+                "new_quantity": updated.quantity_available,
+                "version": updated.version,
+                "adjustment_id": adjustment.id,
+                "attempts": attempt + 1
+            }
+
+        logger.debug(f"Stock version conflict: variant={variant_id}, expected_version={current.version}, attempt={attempt + 1}")
+
+        # Brief backoff before re-reading so contending writers spread out
+        if attempt < max_retries:
+            await asyncio.sleep(0.005 * (2 ** attempt))
+
+    raise APIException(
+        status_code=409,
+        message=f"Stock for variant {variant_id} is being updated concurrently, please retry"
+    )
@@ -0,0 +1,47 @@
+"""
+Transactional outbox
+Includes: OutboxEvent
+"""
+from sqlalchemy import Column, String, Text, Integer, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from core.db import BaseModel
+from typing import Dict, Any
+
+
+class OutboxEvent(BaseModel):
+    """
+    Side effect of a committed write, waiting to be dispatched
+    Rows are added in the same transaction as the write they belong to (an order, a stock
+    change), so a side effect exists if and only if the write committed. The outbox relay
+    hands undispatched rows to ARQ/Redis in batches and stamps dispatched_at; delivery is
+    at-least-once.
+    """
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # The relay only ever reads undispatched rows, oldest first
+        Index('idx_outbox_pending', 'created_at', postgresql_where=Column('dispatched_at').is_(None)),
+        Index('idx_outbox_aggregate', 'aggregate_id'),
+        {'extend_existing': True}
+    )
+
+    # e.g. order.confirmation_email, order.invoice_pregeneration, product.availability_changed
+    event_type = Column(String(100), nullable=False)
+    # Id of the row the event is about (order id, product id)
+    aggregate_id = Column(String(255), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": str(self.id),
+            "event_type": self.event_type,
+            "aggregate_id": self.aggregate_id,
+            "payload": self.payload,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "dispatched_at": self.dispatched_at.isoformat() if self.dispatched_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
@@ -1,6 +1,6 @@
 """
 Consolidated payment models
-Includes: PaymentMethod, PaymentIntent, Transaction
+Includes: PaymentMethod, PaymentIntent, Transaction, WebhookEvent
 """
 from sqlalchemy import Column, String, Boolean, ForeignKey, Float, Text, Integer, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ENUM as PG_ENUM
@@ -263,4 +263,45 @@ class Transaction(BaseModel):
             "metadata": self.transaction_metadata,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-        }
\ No newline at end of file
+        }
+
+
+class WebhookEvent(BaseModel):
+    """
+    Inbox of verified Stripe webhook events
+    The webhook endpoint only records the event (stripe_event_id is unique, so a redelivery
+    is a no-op) and returns; worker jobs process pending events in order per payment intent.
+    """
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        Index('idx_webhook_events_status_created', 'status', 'stripe_created'),
+        Index('idx_webhook_events_payment_intent', 'stripe_payment_intent_id'),
+        {'extend_existing': True}
+    )
+
+    stripe_event_id = Column(String(255), nullable=False, unique=True)
+    event_type = Column(String(100), nullable=False)
+    # Ordering key: the payment intent the event is about, if any
+    stripe_payment_intent_id = Column(String(255), nullable=True)
+    payload = Column(JSONB, nullable=False)
+    stripe_created = Column(DateTime(timezone=True), nullable=False)
+
+    # pending, processed, failed (gave up after repeated errors)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": str(self.id),
+            "stripe_event_id": self.stripe_event_id,
+            "event_type": self.event_type,
+            "stripe_payment_intent_id": self.stripe_payment_intent_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "stripe_created": self.stripe_created.isoformat() if self.stripe_created else None,
+            "processed_at": self.processed_at.isoformat() if self.processed_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
@@ -1,22 +1,41 @@
 # Consolidated admin service
 # This file includes all admin-related functionality including pricing and analytics
 
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc, String
+from sqlalchemy import select, func, and_, or_, desc, cast, String
 from sqlalchemy.orm import selectinload
 from fastapi import HTTPException
 from models.user import User
 from models.orders import Order, OrderItem
 from models.product import Product, ProductVariant
 from uuid import UUID
-from datetime import datetime, timedelta, date
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta, date, timezone
+from typing import Optional, List, Dict, Any, AsyncIterator
 from decimal import Decimal
 
+from core.cache import RedisService, RedisKeyManager
+from core.config import settings
+from core.db import db_manager
 from core.logging import get_structured_logger
 
 logger = get_structured_logger(__name__)
 
+# Rows fetched per round-trip from the order export cursor
+EXPORT_FETCH_SIZE = 1000
+
+# Order statuses counted as revenue on the dashboard
+DASHBOARD_PAID_STATUSES = ['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED']
+
+
+def _parse_date(value: Optional[str], default: date) -> date:
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        return default
+
 
 
 class AdminService:
@@ -147,170 +166,171 @@ class AdminService:
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
         status: Optional[str] = None,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        refresh: bool = False
     ) -> Dict[str, Any]:
-        """Get admin dashboard statistics with optional filters"""
+        """
+        Get admin dashboard statistics with optional filters
+        Responses are cached per filter combination for ADMIN_DASHBOARD_CACHE_TTL seconds;
+        refresh=True recomputes and replaces the cached copy.
+        """
+        today = datetime.utcnow().date()
+        start_date = _parse_date(date_from, today - timedelta(days=30))
+        end_date = _parse_date(date_to, today)
+        
+        cache_key = RedisKeyManager.admin_dashboard_key(RedisKeyManager.generate_filters_hash({
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "status": status,
+            "category": category,
+        }))
+        cache = RedisService()
+        
+        if not refresh:
+            cached = await cache.get_data(cache_key)
+            if cached:
+                return cached
+        
         try:
-            from models.orders import Order
-            from models.product import Product
-            from models.subscriptions import Subscription
-            from datetime import datetime, timedelta
-            
-            logger.info(f"📊 Dashboard stats request: date_from={date_from}, date_to={date_to}, status={status}, category={category}")
-            
-            # Parse date filters
-            today = datetime.utcnow().date()
-            yesterday = today - timedelta(days=1)
-            last_week = today - timedelta(days=7)
-            last_month = today - timedelta(days=30)
-            
-            # Parse date_from and date_to
-            if date_from:
-                try:
-                    start_date = datetime.fromisoformat(date_from).date()
-                except:
-                    start_date = last_month
-            else:
-                start_date = last_month
-            
-            if date_to:
-                try:
-                    end_date = datetime.fromisoformat(date_to).date()
-                except:
-                    end_date = today
-            else:
-                end_date = today
-            
-            # Get total users (excluding admin users, filtered by date range)
-            total_users = await self.db.scalar(
-                select(func.count(User.id)).where(
-                    and_(
-                        User.role != 'admin',
-                        User.created_at >= start_date,
-                        User.created_at <= end_date
-                    )
-                )
-            )
-            logger.info(f"👥 Total users (customers) in date range: {total_users}")
-            
-            active_users = await self.db.scalar(
-                select(func.count(User.id)).where(
-                    and_(
-                        User.is_active == True,
-                        User.role != 'admin',
-                        User.created_at >= start_date,
-                        User.created_at <= end_date
-                    )
-                )
-            )
-            logger.info(f"✅ Active users (customers) in date range: {active_users}")
-            
-            # Get total orders with optional status filter (filtered by date range)
-            order_conditions = [
-                Order.created_at >= start_date,
-                Order.created_at <= end_date
-            ]
-            if status:
-                order_conditions.append(Order.order_status == status)
-            
-            total_orders = await self.db.scalar(
-                select(func.count(Order.id)).where(and_(*order_conditions)) if order_conditions else select(func.count(Order.id))
-            )
-            logger.info(f"📦 Total orders (filtered by {status}): {total_orders}")
-            
-            orders_today = await self.db.scalar(
-                select(func.count(Order.id)).where(
-                    func.date(Order.created_at) == today
-                )
-            )
-            logger.info(f"📅 Orders today: {orders_today}")
-            
-            # Get total products with optional category filter
-            product_conditions = []
-            if category:
-                product_conditions.append(Product.category == category)
-            
-            total_products = await self.db.scalar(
-                select(func.count(Product.id)).where(and_(*product_conditions)) if product_conditions else select(func.count(Product.id))
-            )
-            active_products = await self.db.scalar(
-                select(func.count(Product.id)).where(Product.is_active == True)
+            stats = await self._compute_dashboard_stats(today, start_date, end_date, status, category)
+        except Exception as e:
+            logger.error(f"Failed to compute dashboard stats: {e}")
+            # Return basic stats on error (never cached)
+            return {
+                "overview": {
+                    "total_users": 0,
+                    "active_users": 0,
+                    "total_orders": 0,
+                    "orders_today": 0,
+                    "total_products": 0,
+                    "active_products": 0,
+                    "total_subscriptions": 0,
+                    "active_subscriptions": 0
+                },
+                "revenue": {
+                    "total_revenue": 0.0,
+                    "revenue_today": 0.0,
+                    "revenue_this_month": 0.0,
+                    "currency": "USD"
+                },
+                "recent_orders": [],
+                "chart_data": [],
+                "error": f"Failed to fetch complete stats: {str(e)}",
+                "generated_at": datetime.utcnow().isoformat()
+            }
+        
+        await cache.set_with_expiry(cache_key, stats, settings.ADMIN_DASHBOARD_CACHE_TTL)
+        return stats
+    
+    async def _compute_dashboard_stats(
+        self,
+        today: date,
+        start_date: date,
+        end_date: date,
+        status: Optional[str],
+        category: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Scalar metrics come from one statement (a FILTER-aggregate CTE per table); the list
+        sections and chart run concurrently, each on its own pooled session.
+        """
+        from models.subscriptions import Subscription
+        from models.product import Category
+        
+        logger.info(f"📊 Dashboard stats request: start_date={start_date}, end_date={end_date}, status={status}, category={category}")
+        
+        range_start = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+        today_start = datetime.combine(today, datetime.min.time(), tzinfo=timezone.utc)
+        last_month = today_start - timedelta(days=30)
+        
+        in_range = and_(Order.created_at >= range_start, Order.created_at < range_end)
+        is_today = Order.created_at >= today_start
+        is_paid = Order.order_status.in_(DASHBOARD_PAID_STATUSES)
+        if status:
+            in_range = and_(in_range, Order.order_status == status)
+            is_paid = and_(is_paid, Order.order_status == status)
+        
+        users = select(
+            func.count().label("total_users"),
+            func.count().filter(User.is_active == True).label("active_users")
+        ).where(
+            User.role != 'admin',
+            User.created_at >= range_start,
+            User.created_at < range_end
+        ).cte("user_stats")
+        
+        orders = select(
+            func.count().filter(in_range).label("total_orders"),
+            func.count().filter(is_today).label("orders_today"),
+            func.coalesce(func.sum(Order.total_amount).filter(is_paid), 0).label("total_revenue"),
+            func.coalesce(func.sum(Order.total_amount).filter(
+                Order.order_status.in_(DASHBOARD_PAID_STATUSES), is_today
+            ), 0).label("revenue_today"),
+            func.coalesce(func.sum(Order.total_amount).filter(
+                Order.order_status.in_(DASHBOARD_PAID_STATUSES), Order.created_at >= last_month
+            ), 0).label("revenue_this_month")
+        ).cte("order_stats")
+        
+        total_products = func.count().filter(Product.category_id.in_(
+            select(Category.id).where(or_(Category.name == category, cast(Category.id, String) == category))
+        )) if category else func.count()
+        products = select(
+            total_products.label("total_products"),
+            func.count().filter(Product.is_active == True).label("active_products")
+        ).cte("product_stats")
+        
+        subscriptions = select(
+            func.count().label("total_subscriptions"),
+            func.count().filter(Subscription.status == "active").label("active_subscriptions")
+        ).cte("subscription_stats")
+        
+        async def scalar_metrics(db: AsyncSession):
+            result = await db.execute(
+                select(users, orders, products, subscriptions)
             )
-            
-            # Get revenue data (include confirmed, processing, shipped, and delivered orders)
-            revenue_conditions = [Order.order_status.in_(['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED'])]
-            if status:
-                revenue_conditions.append(Order.order_status == status)
-            
-            total_revenue = await self.db.scalar(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(and_(*revenue_conditions))
-            ) or 0
-            
-            revenue_today = await self.db.scalar(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.order_status.in_(['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED']),
-                        func.date(Order.created_at) == today
-                    )
-                )
-            ) or 0
-            
-            revenue_this_month = await self.db.scalar(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.order_status.in_(['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED']),
-                        Order.created_at >= last_month
-                    )
-                )
-            ) or 0
-            
-            # Get subscription stats if available
-            total_subscriptions = 0
-            active_subscriptions = 0
-            try:
-                total_subscriptions = await self.db.scalar(select(func.count(Subscription.id))) or 0
-                active_subscriptions = await self.db.scalar(
-                    select(func.count(Subscription.id)).where(Subscription.status == "active")
-                ) or 0
-            except Exception:
-                # Subscription table might not exist
-                pass
-            
-            # Generate chart data for selected date range
-            chart_data = await self._generate_daily_metrics(start_date, end_date, status, category)
-            
-            # Recent orders (filtered by date range)
-            recent_orders_result = await self.db.execute(
+            return result.one()._mapping
+        
+        async def recent_orders(db: AsyncSession):
+            result = await db.execute(
                 select(Order)
                 .options(selectinload(Order.user))
-                .where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date
-                    )
-                )
+                .where(Order.created_at >= range_start, Order.created_at < range_end)
                 .order_by(desc(Order.created_at))
                 .limit(5)
             )
-            recent_orders = recent_orders_result.scalars().all()
-            
-            # Recent users (excluding admin users, filtered by date range)
-            recent_users_result = await self.db.execute(
+            return [
+                {
+                    "id": str(order.id),
+                    "user_email": order.user.email if order.user else "Unknown",
+                    "total_amount": float(order.total_amount),
+                    "status": order.order_status,
+                    "created_at": order.created_at.isoformat() if order.created_at else None
+                }
+                for order in result.scalars().all()
+            ]
+        
+        async def recent_users(db: AsyncSession):
+            result = await db.execute(
                 select(User)
-                .where(
-                    and_(
-                        User.role != 'admin',
-                        User.created_at >= start_date,
-                        User.created_at <= end_date
-                    )
-                )
+                .where(User.role != 'admin', User.created_at >= range_start, User.created_at < range_end)
                 .order_by(desc(User.created_at))
                 .limit(5)
             )
-            recent_users = recent_users_result.scalars().all()
-            
-            # Top products by sales (within date range)
-            top_products_query = await self.db.execute(
+            return [
+                {
+                    "id": str(user.id),
+                    "email": user.email,
+                    "firstname": user.firstname,
+                    "lastname": user.lastname,
+                    "is_active": user.is_active,
+                    "created_at": user.created_at.isoformat() if user.created_at else None
+                }
+                for user in result.scalars().all()
+            ]
+        
+        async def top_products(db: AsyncSession):
+            result = await db.execute(
                 select(
                     Product.id,
                     Product.name,
@@ -322,124 +342,63 @@ class AdminService:
                 .join(Product, ProductVariant.product_id == Product.id)
                 .join(Order, OrderItem.order_id == Order.id)
                 .where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date,
-                        Order.order_status.in_(['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED'])
-                    )
+                    Order.created_at >= range_start,
+                    Order.created_at < range_end,
+                    Order.order_status.in_(DASHBOARD_PAID_STATUSES)
                 )
                 .group_by(Product.id, Product.name)
                 .order_by(func.sum(OrderItem.quantity * OrderItem.price_per_unit).desc())
                 .limit(6)
             )
-            
-            top_products = [
+            return [
                 {
                     "id": str(product.id),
                     "name": product.name,
                     "sales": int(product.sales or 0),
                     "revenue": float(product.revenue or 0)
                 }
-                for product in top_products_query.all()
+                for product in result.all()
             ]
-            
-            return {
-                "overview": {
-                    "total_users": total_users,
-                    "active_users": active_users,
-                    "total_orders": total_orders,
-                    "orders_today": orders_today,
-                    "total_products": total_products,
-                    "active_products": active_products,
-                    "total_subscriptions": total_subscriptions,
-                    "active_subscriptions": active_subscriptions
-                },
-                "revenue": {
-                    "total_revenue": float(total_revenue),
-                    "revenue_today": float(revenue_today),
-                    "revenue_this_month": float(revenue_this_month),
-                    "currency": "USD"
-                },
-                "chart_data": chart_data,
-                "recent_orders": [
-                    {
-                        "id": str(order.id),
-                        "user_email": order.user.email if order.user else "Unknown",
-                        "total_amount": float(order.total_amount),
-                        "status": order.order_status,
-                        "created_at": order.created_at.isoformat() if order.created_at else None
-                    }
-                    for order in recent_orders
-                ],
-                "recent_users": [
-                    {
-                        "id": str(user.id),
-                        "email": user.email,
-                        "firstname": user.firstname,
-                        "lastname": user.lastname,
-                        "is_active": user.is_active,
-                        "created_at": user.created_at.isoformat() if user.created_at else None
-                    }
-                    for user in recent_users
-                ],
-                "top_products": top_products,
-                "generated_at": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            # Return basic stats on error
-            return {
-                "overview": {
-                    "total_users": 0,
-                    "active_users": 0,
-                    "total_products": total_products,
-                    "active_products": active_products,
-                    "total_subscriptions": total_subscriptions,
-                    "active_subscriptions": active_subscriptions
-                },
-                "revenue": {
-                    "total_revenue": float(total_revenue),
-                    "revenue_today": float(revenue_today),
-                    "revenue_this_month": float(revenue_this_month),
-                    "currency": "USD"
-                },
-                "recent_orders": [
-                    {
-                        "id": str(order.id),
-                        "user_email": order.user.email if order.user else "Unknown",
-                        "total_amount": float(order.total_amount),
-                        "status": order.order_status,
-                        "created_at": order.created_at.isoformat() if order.created_at else None
-                    }
-                    for order in recent_orders
-                ],
-                "generated_at": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            # Return basic stats on error
-            return {
-                "overview": {
-                    "total_users": 0,
-                    "active_users": 0,
-                    "total_orders": 0,
-                    "orders_today": 0,
-                    "total_products": 0,
-                    "active_products": 0,
-                    "total_subscriptions": 0,
-                    "active_subscriptions": 0
-                },
-                "revenue": {
-                    "total_revenue": 0.0,
-                    "revenue_today": 0.0,
-                    "revenue_this_month": 0.0,
-                    "currency": "USD"
-                },
-                "recent_orders": [],
-                "chart_data": [],
-                "error": f"Failed to fetch complete stats: {str(e)}",
-                "generated_at": datetime.utcnow().isoformat()
-            }
+        
+        async def chart_data(db: AsyncSession):
+            return await AdminService(db)._generate_daily_metrics(start_date, end_date, status, category)
+        
+        metrics, orders_list, users_list, products_list, chart = await asyncio.gather(
+            self._run_in_session(scalar_metrics),
+            self._run_in_session(recent_orders),
+            self._run_in_session(recent_users),
+            self._run_in_session(top_products),
+            self._run_in_session(chart_data),
+        )
+        
+        return {
+            "overview": {
+                "total_users": metrics["total_users"],
+                "active_users": metrics["active_users"],
+                "total_orders": metrics["total_orders"],
+                "orders_today": metrics["orders_today"],
+                "total_products": metrics["total_products"],
+                "active_products": metrics["active_products"],
+                "total_subscriptions": metrics["total_subscriptions"],
+                "active_subscriptions": metrics["active_subscriptions"]
+            },
+            "revenue": {
+                "total_revenue": float(metrics["total_revenue"]),
+                "revenue_today": float(metrics["revenue_today"]),
+                "revenue_this_month": float(metrics["revenue_this_month"]),
+                "currency": "USD"
+            },
+            "chart_data": chart,
+            "recent_orders": orders_list,
+            "recent_users": users_list,
+            "top_products": products_list,
+            "generated_at": datetime.utcnow().isoformat()
+        }
+    
+    async def _run_in_session(self, query):
+        """Run query(db) on its own pooled session so independent sections can run concurrently"""
+        async with db_manager.session_factory() as db:
+            return await query(db)
     
     async def _generate_daily_metrics(
         self,
@@ -448,56 +407,31 @@ class AdminService:
         status: Optional[str] = None,
         category: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Generate daily metrics for chart data between date range"""
-        from models.orders import Order
-        from models.product import Product
+        """
+        Generate chart data between date range from the metric rollups
+        A single-day range is charted per hour instead of as one point.
+        """
+        from services.metrics_rollup import MetricsRollupService, bucket_revenue
         
-        chart_data = []
-        current_date = start_date
+        start = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
+        end = datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc)
         
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            
-            # Build conditions for this day (include confirmed, processing, shipped, delivered)
-            date_conditions = [
-                func.date(Order.created_at) == current_date,
-                Order.order_status.in_(['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED'])
-            ]
-            if status:
-                date_conditions.append(Order.order_status == status)
-            
-            # Get daily revenue
-            daily_revenue = await self.db.scalar(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(and_(*date_conditions))
-            ) or 0
-            
-            # Get daily orders count
-            daily_orders = await self.db.scalar(
-                select(func.count(Order.id)).where(
-                    func.date(Order.created_at) == current_date
-                )
-            ) or 0
-            
-            # Get daily new users (excluding admin users)
-            daily_users = await self.db.scalar(
-                select(func.count(User.id)).where(
-                    and_(
-                        func.date(User.created_at) == current_date,
-                        User.role != 'admin'
-                    )
-                )
-            ) or 0
-            
-            chart_data.append({
-                "date": current_date.strftime('%b %d'),
-                "revenue": float(daily_revenue),
-                "orders": int(daily_orders),
-                "users": int(daily_users)
-            })
-            
-            current_date = next_date
+        if start_date == end_date:
+            series = await MetricsRollupService(self.db).get_series("hour", start, end + timedelta(hours=23))
+            label_format = '%H:00'
+        else:
+            series = await MetricsRollupService(self.db).get_series("day", start, end)
+            label_format = '%b %d'
         
-        return chart_data
+        return [
+            {
+                "date": metrics["bucket"].strftime(label_format),
+                "revenue": bucket_revenue(metrics, status),
+                "orders": int(metrics["order_count"]),
+                "users": int(metrics["new_users"])
+            }
+            for metrics in series
+        ]
 
     async def get_platform_overview(self) -> Dict[str, Any]:
         """Get platform overview statistics"""
@@ -604,39 +538,9 @@ class AdminService:
             )
             count_query = select(func.count(Order.id))
             
-            conditions = []
-            
-            if order_status:
-                conditions.append(Order.order_status == order_status)
-            
-            if q:
-                logger.debug(f"DEBUG: Processing 'q' filter. q type: {type(q)}, q value: {q}")
-                conditions.append(
-                    or_(
-                        Order.id.cast(String).ilike(f"%{q}%"),
-                        Order.user.has(User.email.ilike(f"%{q}%"))
-                    )
-                )
-            
-            if date_from:
-                try:
-                    date_from_dt = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-                    conditions.append(Order.created_at >= date_from_dt)
-                except ValueError:
-                    pass
-            
-            if date_to:
-                try:
-                    date_to_dt = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-                    conditions.append(Order.created_at <= date_to_dt)
-                except ValueError:
-                    pass
-            
-            if min_price is not None:
-                conditions.append(Order.total_amount >= min_price)
-            
-            if max_price is not None:
-                conditions.append(Order.total_amount <= max_price)
+            conditions = self._order_filter_conditions(
+                order_status, q, date_from, date_to, min_price, max_price
+            )
             
             if conditions:
                 query = query.where(and_(*conditions))
@@ -692,6 +596,96 @@ class AdminService:
                 "error": f"Failed to fetch orders: {str(e)}"
             }
 
+    @staticmethod
+    def _order_filter_conditions(
+        order_status: Optional[str] = None,
+        q: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Any]:
+        """WHERE conditions shared by the admin order list and the order export"""
+        conditions = []
+        
+        if order_status:
+            conditions.append(Order.order_status == order_status)
+        
+        if q:
+            conditions.append(
+                or_(
+                    Order.id.cast(String).ilike(f"%{q}%"),
+                    Order.user.has(User.email.ilike(f"%{q}%"))
+                )
+            )
+        
+        if date_from:
+            try:
+                date_from_dt = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+                conditions.append(Order.created_at >= date_from_dt)
+            except ValueError:
+                pass
+        
+        if date_to:
+            try:
+                date_to_dt = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+                conditions.append(Order.created_at <= date_to_dt)
+            except ValueError:
+                pass
+        
+        if min_price is not None:
+            conditions.append(Order.total_amount >= min_price)
+        
+        if max_price is not None:
+            conditions.append(Order.total_amount <= max_price)
+        
+        return conditions
+    
+    async def stream_orders_for_export(
+        self,
+        order_status: Optional[str] = None,
+        q: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        """
+        Yield flat order rows for export from a server-side cursor
+        One projection query (no ORM objects, item count as a subquery), fetched
+        EXPORT_FETCH_SIZE rows at a time, so memory stays flat for any export size.
+        """
+        items_count = (
+            select(func.count(OrderItem.id))
+            .where(OrderItem.order_id == Order.id)
+            .correlate(Order)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                Order.id,
+                Order.order_number,
+                User.firstname,
+                User.lastname,
+                User.email,
+                Order.order_status,
+                Order.payment_status,
+                Order.total_amount,
+                items_count.label("items_count"),
+                Order.created_at
+            )
+            .outerjoin(User, Order.user_id == User.id)
+            .where(*self._order_filter_conditions(
+                order_status, q, date_from, date_to, min_price, max_price
+            ))
+            .order_by(desc(Order.created_at))
+            .execution_options(yield_per=EXPORT_FETCH_SIZE)
+        )
+        
+        result = await self.db.stream(query)
+        async for row in result:
+            yield row
+    
     def _calculate_subtotal_from_items(self, items: List) -> float:
         """
         Calculate subtotal from order items considering quantity and unit price.
@@ -42,38 +42,27 @@ class AnalyticsService:
         order_id: Optional[UUID] = None,
         product_id: Optional[UUID] = None,
         revenue: Optional[float] = None
-    ) -> AnalyticsEvent:
-        """Track an analytics event"""
-        try:
-            event = AnalyticsEvent(
-                id=uuid7(),
-                session_id=session_id,
-                user_id=user_id,
-                event_type=event_type,
-                page_url=page_url,
-                page_title=page_title,
-                event_data=event_data or {},
-                order_id=order_id,
-                product_id=product_id,
-                revenue=revenue
-            )
-            
-            self.db.add(event)
-            
-            # Update session metrics
-            await self._update_session_metrics(session_id)
-            
-            # Update conversion funnel
-            if user_id:
-                await self._update_conversion_funnel(session_id, user_id, event_type)
-            
-            await self.db.commit()
-            return event
-            
-        except Exception as e:
-            logger.error(f"Failed to track event: {e}")
-            await self.db.rollback()
-            raise
+    ) -> Dict[str, Any]:
+        """
+        Track an analytics event
+        The event is buffered on a Redis stream and written in bulk by the worker
+        (see services.analytics_ingestion), so tracking never waits on the database.
+        """
+        from services.analytics_ingestion import build_event, enqueue_event
+        
+        event = build_event(
+            session_id=session_id,
+            event_type=event_type,
+            user_id=user_id,
+            event_data=event_data,
+            page_url=page_url,
+            page_title=page_title,
+            order_id=order_id,
+            product_id=product_id,
+            revenue=revenue
+        )
+        enqueue_event(event)
+        return event
     
     async def get_conversion_metrics(
         self,
@@ -418,93 +407,6 @@ class AnalyticsService:
             logger.error(f"Failed to get comprehensive dashboard data: {e}")
             raise HTTPException(status_code=500, detail="Failed to retrieve dashboard data")
     
-    async def _update_session_metrics(self, session_id: str):
-        """Update session metrics when events are tracked"""
-        try:
-            # Get session
-            session_result = await self.db.execute(
-                select(UserSession).where(UserSession.session_id == session_id)
-            )
-            session = session_result.scalar_one_or_none()
-            
-            if session:
-                # Count events
-                events_count = await self.db.execute(
-                    select(func.count(AnalyticsEvent.id)).where(
-                        AnalyticsEvent.session_id == session_id
-                    )
-                )
-                session.events_count = events_count.scalar() or 0
-                
-                # Check for conversion
-                purchase_event = await self.db.execute(
-                    select(AnalyticsEvent).where(
-                        and_(
-                            AnalyticsEvent.session_id == session_id,
-                            AnalyticsEvent.event_type == EventType.PURCHASE
-                        )
-                    ).limit(1)
-                )
-                
-                if purchase_event.scalar_one_or_none():
-                    session.converted = True
-                    # Get conversion value
-                    revenue_sum = await self.db.execute(
-                        select(func.sum(AnalyticsEvent.revenue)).where(
-                            and_(
-                                AnalyticsEvent.session_id == session_id,
-                                AnalyticsEvent.event_type == EventType.PURCHASE
-                            )
-                        )
-                    )
-                    session.conversion_value = revenue_sum.scalar() or 0
-                
-        except Exception as e:
-            logger.error(f"Failed to update session metrics: {e}")
-    
-    async def _update_conversion_funnel(self, session_id: str, user_id: UUID, event_type: EventType):
-        """Update conversion funnel tracking"""
-        try:
-            # Get or create funnel record
-            funnel_result = await self.db.execute(
-                select(ConversionFunnel).where(
-                    ConversionFunnel.session_id == session_id
-                )
-            )
-            funnel = funnel_result.scalar_one_or_none()
-            
-            if not funnel:
-                funnel = ConversionFunnel(
-                    id=uuid7(),
-                    session_id=session_id,
-                    user_id=user_id
-                )
-                self.db.add(funnel)
-            
-            # Update funnel step based on event type
-            now = datetime.now(timezone.utc)
-            
-            if event_type == EventType.PAGE_VIEW and not funnel.landing_at:
-                funnel.landing_at = now
-                funnel.current_step = max(funnel.current_step, 0)
-                funnel.max_step_reached = max(funnel.max_step_reached, 0)
-            elif event_type == EventType.CART_ADD:
-                funnel.cart_add_at = now
-                funnel.current_step = max(funnel.current_step, 2)
-                funnel.max_step_reached = max(funnel.max_step_reached, 2)
-            elif event_type == EventType.CHECKOUT_START:
-                funnel.checkout_start_at = now
-                funnel.current_step = max(funnel.current_step, 3)
-                funnel.max_step_reached = max(funnel.max_step_reached, 3)
-            elif event_type == EventType.PURCHASE:
-                funnel.purchase_at = now
-                funnel.current_step = 4
-                funnel.max_step_reached = 4
-                funnel.completed = True
-                
-        except Exception as e:
-            logger.error(f"Failed to update conversion funnel: {e}")
-
     async def get_sales_trend_data(
         self,
         start_date: datetime,
@@ -512,35 +414,26 @@ class AnalyticsService:
     ) -> Dict[str, Any]:
         """Get sales trend data over the specified period"""
         try:
-            # Get daily sales data
-            daily_sales = await self.db.execute(
-                select(
-                    func.date(Order.created_at).label('date'),
-                    func.count(Order.id).label('order_count'),
-                    func.sum(Order.total_amount).label('revenue'),
-                    func.avg(Order.total_amount).label('avg_order_value')
-                ).where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date,
-                        Order.order_status.in_(['CONFIRMED', 'SHIPPED', 'DELIVERED', 'PROCESSING'])
-                    )
-                ).group_by(func.date(Order.created_at)).order_by(func.date(Order.created_at))
-            )
+            from services.metrics_rollup import MetricsRollupService
+            
+            # Daily sales come from the rollup; only today's bucket is aggregated live
+            series = await MetricsRollupService(self.db).get_series("day", start_date, end_date)
             
             trend_data = []
             total_revenue = 0
             total_orders = 0
             
-            for row in daily_sales:
-                daily_revenue = float(row.revenue or 0)
-                daily_orders = row.order_count or 0
+            for day in series:
+                if not day["paid_order_count"]:
+                    continue
+                daily_revenue = float(day["revenue"])
+                daily_orders = day["paid_order_count"]
                 
                 trend_data.append({
-                    "date": row.date.isoformat() if row.date else None,
+                    "date": day["bucket"].isoformat(),
                     "order_count": daily_orders,
                     "revenue": daily_revenue,
-                    "avg_order_value": float(row.avg_order_value or 0)
+                    "avg_order_value": daily_revenue / daily_orders
                 })
                 
                 total_revenue += daily_revenue
@@ -730,56 +623,25 @@ class AnalyticsService:
     ) -> Dict[str, Any]:
         """Get revenue analytics metrics"""
         try:
-            # Total revenue from completed orders
-            total_revenue_result = await self.db.execute(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date,
-                        Order.status.in_(["completed", "shipped", "delivered"])
-                    )
-                )
-            )
-            total_revenue = float(total_revenue_result.scalar() or 0)
+            from services.metrics_rollup import MetricsRollupService
             
-            # Number of completed orders
-            completed_orders_result = await self.db.execute(
-                select(func.count(Order.id)).where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date,
-                        Order.status.in_(["completed", "shipped", "delivered"])
-                    )
-                )
-            )
-            completed_orders = completed_orders_result.scalar() or 0
+            # Paid orders per day from the rollup; only today's bucket is aggregated live
+            series = await MetricsRollupService(self.db).get_series("day", start_date, end_date)
             
-            # Average order value
-            avg_order_value = total_revenue / completed_orders if completed_orders > 0 else 0
+            daily_data = [
+                {
+                    "date": day["bucket"].isoformat(),
+                    "revenue": float(day["revenue"]),
+                    "orders": day["paid_order_count"]
+                }
+                for day in series if day["paid_order_count"]
+            ]
             
-            # Revenue by day (daily breakdown)
-            daily_revenue_result = await self.db.execute(
-                select(
-                    func.date(Order.created_at).label("date"),
-                    func.sum(Order.total_amount).label("revenue"),
-                    func.count(Order.id).label("orders")
-                ).where(
-                    and_(
-                        Order.created_at >= start_date,
-                        Order.created_at <= end_date,
-                        Order.status.in_(["completed", "shipped", "delivered"])
-                    )
-                ).group_by(func.date(Order.created_at))
-            )
+            total_revenue = sum(day["revenue"] for day in daily_data)
+            completed_orders = sum(day["orders"] for day in daily_data)
             
-            daily_data = []
-            for row in daily_revenue_result:
-                if row[0]:  # date exists
-                    daily_data.append({
-                        "date": row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
-                        "revenue": float(row[1] or 0),
-                        "orders": row[2]
-                    })
+            # Average order value
+            avg_order_value = total_revenue / completed_orders if completed_orders > 0 else 0
             
             return {
                 "period": {
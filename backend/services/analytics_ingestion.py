@@ -0,0 +1,321 @@
+"""
+Buffered analytics event ingestion
+track_event() only appends to a Redis stream; a worker drains the stream in batches and
+writes each batch with a handful of set-based statements:
+
+- missing user_sessions rows are created (ON CONFLICT DO NOTHING)
+- events are bulk-inserted (executemany, ON CONFLICT (id) DO NOTHING so redelivery is safe)
+- session counters and funnel steps are bumped incrementally from the rows actually inserted
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+from sqlalchemy import select, func, case, bindparam, Integer, Float, Boolean, DateTime, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.cache import RedisStreamConsumer
+from core.config import settings
+from core.logging import get_structured_logger
+from core.utils.uuid_utils import uuid7
+from models.analytics import UserSession, AnalyticsEvent, ConversionFunnel, EventType
+
+logger = get_structured_logger(__name__)
+
+# Consumer group (and consumer name - flushes never overlap) on the analytics event stream
+ANALYTICS_INGEST_GROUP = "analytics-ingest"
+
+# Funnel step and timestamp column reached by each event type
+FUNNEL_STEPS = {
+    EventType.PAGE_VIEW: (0, "landing_at"),
+    EventType.CART_ADD: (2, "cart_add_at"),
+    EventType.CHECKOUT_START: (3, "checkout_start_at"),
+    EventType.PURCHASE: (4, "purchase_at"),
+}
+
+# Keeps fire-and-forget enqueue tasks referenced until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _stream_key() -> str:
+    from core.cache import RedisKeyManager
+    return RedisKeyManager.analytics_events_key()
+
+
+def _as_uuid(value: Any) -> Optional[UUID]:
+    return UUID(str(value)) if value else None
+
+
+def encode_event(event: Dict[str, Any]) -> Dict[str, str]:
+    """Serialize an event into a single stream field"""
+    return {"event": json.dumps(event, default=str)}
+
+
+def decode_event(fields: Dict[Any, Any]) -> Dict[str, Any]:
+    """Turn a raw stream entry back into an insert-ready event row"""
+    data = json.loads(fields.get(b"event", fields.get("event")))
+    return {
+        "id": UUID(data["id"]),
+        "session_id": data["session_id"],
+        "user_id": _as_uuid(data.get("user_id")),
+        "event_type": EventType(data["event_type"]),
+        "page_url": data.get("page_url"),
+        "page_title": data.get("page_title"),
+        "event_data": data.get("event_data") or {},
+        "order_id": _as_uuid(data.get("order_id")),
+        "product_id": _as_uuid(data.get("product_id")),
+        "revenue": data.get("revenue"),
+        "timestamp": datetime.fromisoformat(data["timestamp"]),
+    }
+
+
+async def publish_events(events: List[Dict[str, Any]], redis=None):
+    """XADD events to the stream in one pipeline; failures are logged, never raised"""
+    if not events:
+        return
+    try:
+        if redis is None:
+            from core.cache import get_redis
+            redis = await get_redis()
+
+        stream_key = _stream_key()
+        async with redis.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(
+                    stream_key,
+                    encode_event(event),
+                    maxlen=settings.ANALYTICS_STREAM_MAXLEN,
+                    approximate=True
+                )
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to buffer analytics events", metadata={"count": len(events)}, exception=e)
+
+
+def enqueue_event(event: Dict[str, Any]):
+    """Buffer an event without waiting on Redis; the request never blocks on tracking"""
+    task = asyncio.get_running_loop().create_task(publish_events([event]))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class AnalyticsEventConsumer(RedisStreamConsumer):
+    """Consumer-group reader for buffered analytics events; entries are {id, event}"""
+
+    def __init__(self, group: str, consumer: str, redis=None, batch_size: int = 1000):
+        super().__init__(_stream_key(), group, consumer, redis=redis, batch_size=batch_size)
+
+    def decode(self, message_id: Any, fields: Dict[Any, Any]) -> Dict[str, Any]:
+        message_id = message_id.decode("utf-8") if isinstance(message_id, bytes) else message_id
+        try:
+            return {"id": message_id, "event": decode_event(fields)}
+        except (KeyError, TypeError, ValueError) as e:
+            # Malformed entries are returned empty rather than raised so they still get acked
+            logger.warning(f"Dropping malformed analytics event {message_id}: {e}")
+            return {"id": message_id, "event": None}
+
+
+_sessions = UserSession.__table__
+_funnels = ConversionFunnel.__table__
+
+# Per-session increments; executed once per session with executemany
+UPDATE_SESSION_COUNTERS = _sessions.update().where(
+    _sessions.c.session_id == bindparam("b_session_id", type_=String)
+).values(
+    events_count=func.coalesce(_sessions.c.events_count, 0) + bindparam("b_events", type_=Integer),
+    page_views=func.coalesce(_sessions.c.page_views, 0) + bindparam("b_page_views", type_=Integer),
+    converted=func.coalesce(_sessions.c.converted, False) | bindparam("b_converted", type_=Boolean),
+    conversion_value=case(
+        (bindparam("b_converted", type_=Boolean), func.coalesce(_sessions.c.conversion_value, 0) + bindparam("b_revenue", type_=Float)),
+        else_=_sessions.c.conversion_value
+    ),
+)
+
+# Steps only move forward; landing keeps the first page view, later steps take the latest event
+UPDATE_FUNNEL = _funnels.update().where(
+    _funnels.c.session_id == bindparam("b_session_id", type_=String)
+).values(
+    current_step=func.greatest(func.coalesce(_funnels.c.current_step, 0), bindparam("b_step", type_=Integer)),
+    max_step_reached=func.greatest(func.coalesce(_funnels.c.max_step_reached, 0), bindparam("b_step", type_=Integer)),
+    landing_at=func.coalesce(_funnels.c.landing_at, bindparam("b_landing_at", type_=DateTime(timezone=True))),
+    cart_add_at=func.coalesce(bindparam("b_cart_add_at", type_=DateTime(timezone=True)), _funnels.c.cart_add_at),
+    checkout_start_at=func.coalesce(bindparam("b_checkout_start_at", type_=DateTime(timezone=True)), _funnels.c.checkout_start_at),
+    purchase_at=func.coalesce(bindparam("b_purchase_at", type_=DateTime(timezone=True)), _funnels.c.purchase_at),
+    completed=func.coalesce(_funnels.c.completed, False) | bindparam("b_completed", type_=Boolean),
+)
+
+
+class AnalyticsIngestionService:
+    """Writes batches of buffered events and their session/funnel aggregates"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def flush(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Write a batch in one transaction
+        If the batch is rejected (e.g. an event references a deleted order), events are
+        retried one by one and the offending ones dropped, so one bad event can't wedge the stream.
+        """
+        if not events:
+            return {"inserted_count": 0, "dropped_count": 0}
+
+        try:
+            inserted = await self._write(events)
+            return {"inserted_count": inserted, "dropped_count": 0}
+        except DBAPIError as e:
+            await self.db.rollback()
+            logger.warning(f"Analytics batch rejected, retrying {len(events)} events individually", exception=e)
+
+        inserted = dropped = 0
+        for event in events:
+            try:
+                inserted += await self._write([event])
+            except DBAPIError as e:
+                await self.db.rollback()
+                dropped += 1
+                logger.warning(
+                    f"Dropping analytics event",
+                    metadata={"event_id": str(event["id"]), "session_id": event["session_id"]},
+                    exception=e
+                )
+        return {"inserted_count": inserted, "dropped_count": dropped}
+
+    async def _write(self, events: List[Dict[str, Any]]) -> int:
+        await self._ensure_sessions(events)
+
+        result = await self.db.execute(
+            pg_insert(AnalyticsEvent)
+            .on_conflict_do_nothing(index_elements=["id"])
+            .returning(AnalyticsEvent.id),
+            [{**event, "created_at": event["timestamp"]} for event in events]
+        )
+        # Only aggregate events that were actually inserted - redelivered ones are already counted
+        inserted_ids = set(result.scalars().all())
+        fresh = [event for event in events if event["id"] in inserted_ids]
+
+        if fresh:
+            await self._increment_sessions(fresh)
+            await self._advance_funnels(fresh)
+
+        await self.db.commit()
+        return len(fresh)
+
+    async def _ensure_sessions(self, events: List[Dict[str, Any]]):
+        sessions: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            session = sessions.setdefault(event["session_id"], {
+                "session_id": event["session_id"],
+                "user_id": event["user_id"],
+                "started_at": event["timestamp"],
+            })
+            session["user_id"] = session["user_id"] or event["user_id"]
+            session["started_at"] = min(session["started_at"], event["timestamp"])
+
+        await self.db.execute(
+            pg_insert(UserSession).on_conflict_do_nothing(index_elements=["session_id"]),
+            list(sessions.values())
+        )
+
+    async def _increment_sessions(self, events: List[Dict[str, Any]]):
+        counters: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            counter = counters.setdefault(event["session_id"], {
+                "b_session_id": event["session_id"],
+                "b_events": 0,
+                "b_page_views": 0,
+                "b_converted": False,
+                "b_revenue": 0.0,
+            })
+            counter["b_events"] += 1
+            if event["event_type"] == EventType.PAGE_VIEW:
+                counter["b_page_views"] += 1
+            elif event["event_type"] == EventType.PURCHASE:
+                counter["b_converted"] = True
+                counter["b_revenue"] += float(event["revenue"] or 0)
+
+        await self.db.execute(UPDATE_SESSION_COUNTERS, list(counters.values()))
+
+    async def _advance_funnels(self, events: List[Dict[str, Any]]):
+        funnels: Dict[str, Dict[str, Any]] = {}
+        for event in sorted(events, key=lambda e: e["timestamp"]):
+            if not event["user_id"] or event["event_type"] not in FUNNEL_STEPS:
+                continue
+            step, column = FUNNEL_STEPS[event["event_type"]]
+            funnel = funnels.setdefault(event["session_id"], {
+                "b_session_id": event["session_id"],
+                "user_id": event["user_id"],
+                "b_step": 0,
+                "b_landing_at": None,
+                "b_cart_add_at": None,
+                "b_checkout_start_at": None,
+                "b_purchase_at": None,
+                "b_completed": False,
+            })
+            funnel["b_step"] = max(funnel["b_step"], step)
+            if column != "landing_at" or funnel["b_landing_at"] is None:
+                funnel[f"b_{column}"] = event["timestamp"]
+            if event["event_type"] == EventType.PURCHASE:
+                funnel["b_completed"] = True
+
+        if not funnels:
+            return
+
+        existing = set((await self.db.execute(
+            select(ConversionFunnel.session_id).where(ConversionFunnel.session_id.in_(funnels.keys()))
+        )).scalars().all())
+
+        updates = [
+            {k: v for k, v in funnel.items() if k != "user_id"}
+            for session_id, funnel in funnels.items() if session_id in existing
+        ]
+        if updates:
+            await self.db.execute(UPDATE_FUNNEL, updates)
+
+        inserts = [
+            {
+                "session_id": funnel["b_session_id"],
+                "user_id": funnel["user_id"],
+                "current_step": funnel["b_step"],
+                "max_step_reached": funnel["b_step"],
+                "landing_at": funnel["b_landing_at"],
+                "cart_add_at": funnel["b_cart_add_at"],
+                "checkout_start_at": funnel["b_checkout_start_at"],
+                "purchase_at": funnel["b_purchase_at"],
+                "completed": funnel["b_completed"],
+            }
+            for session_id, funnel in funnels.items() if session_id not in existing
+        ]
+        if inserts:
+            await self.db.execute(pg_insert(ConversionFunnel), inserts)
+
+
+def build_event(
+    session_id: str,
+    event_type: EventType,
+    user_id: Optional[UUID] = None,
+    event_data: Optional[Dict[str, Any]] = None,
+    page_url: Optional[str] = None,
+    page_title: Optional[str] = None,
+    order_id: Optional[UUID] = None,
+    product_id: Optional[UUID] = None,
+    revenue: Optional[float] = None
+) -> Dict[str, Any]:
+    """Build a JSON-ready event with its id and timestamp assigned up front"""
+    if not session_id:
+        raise ValueError("session_id is required")
+    return {
+        "id": str(uuid7()),
+        "session_id": session_id,
+        "user_id": str(user_id) if user_id else None,
+        "event_type": event_type.value,
+        "page_url": page_url,
+        "page_title": page_title,
+        "event_data": event_data or {},
+        "order_id": str(order_id) if order_id else None,
+        "product_id": str(product_id) if product_id else None,
+        "revenue": float(revenue) if revenue is not None else None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
@@ -2,15 +2,24 @@
 Discount Engine Service for subscription discount management
 Implements discount code validation, calculation logic, and optimal discount selection
 Requirements: 3.1, 3.2, 3.5
+
+Active discounts are compiled into an in-process DiscountRuleIndex (discount_rules),
+rebuilt whenever a change is published on the discount change channel, so applicable
+and optimal discounts are found without querying the database. Usage counts are not
+compiled: applying a discount checks its limit on the locked row, and only a discount
+running out (or getting uses back) is published, not every use.
 """
+import json
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_, func
 from models.discounts import Discount, SubscriptionDiscount
 from models.subscriptions import Subscription
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from bisect import bisect_right
 from decimal import Decimal
 from enum import Enum
+from core.cache import ChannelRefreshedCache, RedisKeyManager, get_redis
 from core.logging import get_structured_logger
 
 logger = get_structured_logger(__name__)
@@ -39,6 +48,193 @@ class DiscountCalculationResult:
         self.discount_type = discount_type
 
 
+def compute_discount_amount(
+    discount_type: str,
+    value: Decimal,
+    maximum_discount: Optional[Decimal],
+    subtotal: Decimal,
+    shipping_cost: Decimal = Decimal('0')
+) -> Decimal:
+    """Discount amount for one discount; pure, so it can score many candidates in a loop"""
+    if discount_type == DiscountType.PERCENTAGE.value:
+        # Percentage of the subtotal, capped at the maximum discount if specified
+        amount = subtotal * (value / Decimal('100'))
+        if maximum_discount is not None:
+            amount = min(amount, maximum_discount)
+    elif discount_type == DiscountType.FIXED_AMOUNT.value:
+        # Fixed amount, never more than the subtotal
+        amount = min(value, subtotal)
+    elif discount_type == DiscountType.FREE_SHIPPING.value:
+        amount = shipping_cost
+    else:
+        raise ValueError(f"Unknown discount type: {discount_type}")
+    return max(amount, Decimal('0'))
+
+
+def _calculation(
+    discount_type: str,
+    amount: Decimal,
+    subtotal: Decimal,
+    shipping_cost: Decimal,
+    tax_amount: Decimal
+) -> DiscountCalculationResult:
+    return DiscountCalculationResult(
+        discount_amount=amount,
+        final_total=max(Decimal('0'), subtotal + shipping_cost + tax_amount - amount),
+        discount_type=discount_type
+    )
+
+
+async def publish_discount_changes(codes: List[str], action: str):
+    """Publish discount changes so in-process rule indexes reload; failures are logged, never raised"""
+    if not codes:
+        return
+    try:
+        redis = await get_redis()
+        await redis.publish(RedisKeyManager.discount_changes_channel(), json.dumps({"codes": codes, "action": action}))
+    except Exception as e:
+        logger.warning(f"Failed to publish discount changes", metadata={"count": len(codes)}, exception=e)
+
+
+class DiscountRule:
+    """An active discount compiled for evaluation: amounts as Decimals, no ORM state"""
+    __slots__ = (
+        "id", "code", "type", "value", "minimum_amount", "maximum_discount",
+        "valid_from", "valid_until", "snapshot"
+    )
+    
+    def __init__(self, discount: Discount):
+        self.id = discount.id
+        self.code = discount.code
+        self.type = discount.type
+        self.value = Decimal(str(discount.value))
+        self.minimum_amount = Decimal(str(discount.minimum_amount or 0))
+        self.maximum_discount = Decimal(str(discount.maximum_discount)) if discount.maximum_discount else None
+        self.valid_from = discount.valid_from
+        self.valid_until = discount.valid_until
+        self.snapshot = {column.key: getattr(discount, column.key) for column in Discount.__table__.columns}
+    
+    def is_available(self, now: datetime) -> bool:
+        return self.valid_from <= now <= self.valid_until
+    
+    def amount(self, subtotal: Decimal, shipping_cost: Decimal = Decimal('0')) -> Decimal:
+        return compute_discount_amount(self.type, self.value, self.maximum_discount, subtotal, shipping_cost)
+    
+    def to_discount(self) -> Discount:
+        """Detached Discount with the compiled row's values"""
+        return Discount(**self.snapshot)
+
+
+class DiscountRuleIndex:
+    """
+    Active discounts grouped by type, each group sorted by minimum amount
+    Evaluation is pure and synchronous: a subtotal's candidates are a bisect per group,
+    and the validity window is checked at evaluation time, so codes start and stop
+    applying at the right moment without a reload. Discounts that have used up their
+    usage_limit are left out when the index is built.
+    """
+    
+    def __init__(self, rules: Iterable[DiscountRule]):
+        known_types = {discount_type.value for discount_type in DiscountType}
+        grouped: Dict[str, List[DiscountRule]] = {}
+        for rule in rules:
+            if rule.type not in known_types:
+                logger.warning(f"Unknown discount type: {rule.type}", metadata={"code": rule.code})
+                continue
+            grouped.setdefault(rule.type, []).append(rule)
+        
+        self.groups: Dict[str, Tuple[List[Decimal], List[DiscountRule]]] = {}
+        for discount_type, group in grouped.items():
+            group.sort(key=lambda rule: rule.minimum_amount)
+            self.groups[discount_type] = ([rule.minimum_amount for rule in group], group)
+    
+    def __len__(self) -> int:
+        return sum(len(group) for _, group in self.groups.values())
+    
+    def candidates(self, subtotal: Decimal, now: Optional[datetime] = None) -> List[DiscountRule]:
+        """Rules applicable to subtotal right now"""
+        now = now or datetime.now(timezone.utc)
+        applicable = []
+        for minimums, group in self.groups.values():
+            for rule in group[:bisect_right(minimums, subtotal)]:
+                if rule.is_available(now):
+                    applicable.append(rule)
+        return applicable
+    
+    def score(
+        self,
+        subtotal: Decimal,
+        shipping_cost: Decimal = Decimal('0'),
+        tax_amount: Decimal = Decimal('0'),
+        now: Optional[datetime] = None
+    ) -> List[Tuple[DiscountRule, DiscountCalculationResult]]:
+        """Every applicable rule with its calculation, in one pass"""
+        return [
+            (rule, _calculation(rule.type, rule.amount(subtotal, shipping_cost), subtotal, shipping_cost, tax_amount))
+            for rule in self.candidates(subtotal, now)
+        ]
+    
+    def best(
+        self,
+        subtotal: Decimal,
+        shipping_cost: Decimal = Decimal('0'),
+        tax_amount: Decimal = Decimal('0'),
+        now: Optional[datetime] = None
+    ) -> Tuple[Optional[DiscountRule], Optional[DiscountCalculationResult]]:
+        """The rule with the largest savings, or (None, None)"""
+        best_rule = None
+        best_amount = Decimal('0')
+        for rule in self.candidates(subtotal, now):
+            amount = rule.amount(subtotal, shipping_cost)
+            if amount > best_amount:
+                best_rule, best_amount = rule, amount
+        if best_rule is None:
+            return None, None
+        return best_rule, _calculation(best_rule.type, best_amount, subtotal, shipping_cost, tax_amount)
+    
+    def best_many(
+        self,
+        vectors: Iterable[Tuple[Decimal, Decimal, Decimal]],
+        now: Optional[datetime] = None
+    ) -> List[Tuple[Optional[DiscountRule], Optional[DiscountCalculationResult]]]:
+        """best() for many (subtotal, shipping_cost, tax_amount) vectors, e.g. repricing subscriptions"""
+        now = now or datetime.now(timezone.utc)
+        return [self.best(subtotal, shipping_cost, tax_amount, now) for subtotal, shipping_cost, tax_amount in vectors]
+
+
+class DiscountRuleCache(ChannelRefreshedCache):
+    """In-process DiscountRuleIndex, rebuilt from the discount change channel"""
+    
+    def __init__(self, max_age: float = 60.0):
+        super().__init__(max_age)
+        self._index = DiscountRuleIndex([])
+    
+    def channel(self) -> str:
+        return RedisKeyManager.discount_changes_channel()
+    
+    async def load(self):
+        from core.db import db_manager
+        
+        now = datetime.now(timezone.utc)
+        async with db_manager.session_factory() as db:
+            # Not-yet-valid discounts are included; the index checks the window per evaluation
+            result = await db.execute(
+                select(Discount).where(and_(
+                    Discount.is_active == True,
+                    Discount.valid_until >= now,
+                    or_(Discount.usage_limit == None, Discount.used_count < Discount.usage_limit)
+                ))
+            )
+            self._index = DiscountRuleIndex(DiscountRule(discount) for discount in result.scalars().all())
+    
+    async def get_index(self) -> DiscountRuleIndex:
+        await self.ensure_fresh()
+        return self._index
+
+
+discount_rules = DiscountRuleCache()
+
+
 class DiscountEngine:
     """Engine for managing subscription discounts with validation and optimization"""
     
@@ -49,7 +245,8 @@ class DiscountEngine:
         self,
         discount_code: str,
         subscription_id: Optional[str] = None,
-        subtotal: Optional[Decimal] = None
+        subtotal: Optional[Decimal] = None,
+        lock: bool = False
     ) -> DiscountValidationResult:
         """
         Validate discount code against promotional rules
@@ -59,20 +256,22 @@ class DiscountEngine:
             discount_code: The discount code to validate
             subscription_id: Optional subscription ID for duplicate checking
             subtotal: Optional subtotal for minimum amount validation
+            lock: Lock the discount row until commit, so the usage limit check holds while it's applied
             
         Returns:
             DiscountValidationResult with validation status and details
         """
         try:
             # Find the discount by code
-            discount_result = await self.db.execute(
-                select(Discount).where(
-                    and_(
-                        Discount.code == discount_code.upper(),
-                        Discount.is_active == True
-                    )
+            query = select(Discount).where(
+                and_(
+                    Discount.code == discount_code.upper(),
+                    Discount.is_active == True
                 )
             )
+            if lock:
+                query = query.with_for_update()
+            discount_result = await self.db.execute(query)
             discount = discount_result.scalar_one_or_none()
             
             if not discount:
@@ -160,35 +359,18 @@ class DiscountEngine:
             DiscountCalculationResult with calculated amounts
         """
         try:
-            discount_amount = Decimal('0')
-            
-            if discount.type == DiscountType.PERCENTAGE.value:
-                # Calculate percentage discount on subtotal
-                discount_amount = subtotal * (Decimal(str(discount.value)) / Decimal('100'))
-                
-                # Apply maximum discount limit if specified
-                if discount.maximum_discount:
-                    max_discount = Decimal(str(discount.maximum_discount))
-                    discount_amount = min(discount_amount, max_discount)
-            
-            elif discount.type == DiscountType.FIXED_AMOUNT.value:
-                # Fixed amount discount
-                discount_amount = Decimal(str(discount.value))
-                
-                # Ensure discount doesn't exceed subtotal
-                discount_amount = min(discount_amount, subtotal)
-            
-            elif discount.type == DiscountType.FREE_SHIPPING.value:
-                # Free shipping discount
-                discount_amount = shipping_cost
-            
-            else:
+            try:
+                discount_amount = compute_discount_amount(
+                    discount.type,
+                    Decimal(str(discount.value)),
+                    Decimal(str(discount.maximum_discount)) if discount.maximum_discount else None,
+                    subtotal,
+                    shipping_cost
+                )
+            except ValueError:
                 logger.warning(f"Unknown discount type: {discount.type}")
                 discount_amount = Decimal('0')
             
-            # Ensure discount amount is not negative
-            discount_amount = max(discount_amount, Decimal('0'))
-            
             # Calculate final total (ensure non-negative)
             final_total = max(
                 Decimal('0'),
@@ -223,7 +405,7 @@ class DiscountEngine:
         Requirements: 3.2
         
         Args:
-            available_discounts: List of valid discounts to choose from
+            available_discounts: List of valid discounts (or compiled DiscountRules) to choose from
             subtotal: Subscription subtotal
             shipping_cost: Shipping cost
             tax_amount: Tax amount
@@ -239,20 +421,23 @@ class DiscountEngine:
         max_savings = Decimal('0')
         
         try:
+            # Score every candidate synchronously; only the winner's totals are built
             for discount in available_discounts:
-                # Calculate discount amount for this discount
-                calculation = await self.calculate_discount_amount(
-                    discount=discount,
-                    subtotal=subtotal,
-                    shipping_cost=shipping_cost,
-                    tax_amount=tax_amount
-                )
+                if isinstance(discount, DiscountRule):
+                    rule = discount
+                else:
+                    rule = DiscountRule(discount)
+                try:
+                    savings = rule.amount(subtotal, shipping_cost)
+                except ValueError:
+                    logger.warning(f"Unknown discount type: {rule.type}")
+                    continue
                 
                 # Check if this discount provides better savings
-                if calculation.discount_amount > max_savings:
-                    max_savings = calculation.discount_amount
+                if savings > max_savings:
+                    max_savings = savings
                     best_discount = discount
-                    best_calculation = calculation
+                    best_calculation = _calculation(rule.type, savings, subtotal, shipping_cost, tax_amount)
             
             if best_discount:
                 logger.info(f"Selected optimal discount: {best_discount.code} with savings of {max_savings}")
@@ -311,7 +496,8 @@ class DiscountEngine:
             validation_result = await self.validate_discount_code(
                 discount_code=discount_code,
                 subscription_id=subscription_id,
-                subtotal=Decimal(str(subscription.subtotal or 0))
+                subtotal=Decimal(str(subscription.subtotal or 0)),
+                lock=True
             )
             
             if not validation_result.is_valid:
@@ -344,6 +530,7 @@ class DiscountEngine:
             )
             
             # If there are existing discounts, compare and select optimal
+            restored_codes = []
             if existing_discounts:
                 current_discount_amount = sum(
                     Decimal(str(ed.discount_amount)) for ed in existing_discounts
@@ -361,10 +548,12 @@ class DiscountEngine:
                     
                     # Decrement usage count of removed discount
                     removed_discount_result = await self.db.execute(
-                        select(Discount).where(Discount.id == existing_discount.discount_id)
+                        select(Discount).where(Discount.id == existing_discount.discount_id).with_for_update()
                     )
                     removed_discount = removed_discount_result.scalar_one_or_none()
                     if removed_discount:
+                        if removed_discount.usage_limit and removed_discount.used_count >= removed_discount.usage_limit:
+                            restored_codes.append(removed_discount.code)
                         removed_discount.used_count = max(0, removed_discount.used_count - 1)
             
             # Apply the new discount
@@ -375,14 +564,19 @@ class DiscountEngine:
             )
             self.db.add(subscription_discount)
             
-            # Update discount usage count
+            # Update discount usage count (the row is locked, so the limit check above still holds)
             discount.used_count += 1
+            exhausted = bool(discount.usage_limit) and discount.used_count >= discount.usage_limit
             
             # Update subscription totals
             subscription.discount_amount = float(new_calculation.discount_amount)
             subscription.total = float(new_calculation.final_total)
             
             await self.db.commit()
+            # Rule indexes leave out used-up discounts, so only crossing the limit reloads them
+            if exhausted:
+                await publish_discount_changes([discount.code], "exhausted")
+            await publish_discount_changes(restored_codes, "restored")
             
             logger.info(f"Successfully applied discount {discount_code} to subscription {subscription_id}")
             
@@ -456,6 +650,7 @@ class DiscountEngine:
                 discount.is_active = False
             
             await self.db.commit()
+            await publish_discount_changes([d.code for d in expired_discounts], "expired")
             
             # TODO: Send notifications to affected users
             # This would typically integrate with a notification service
@@ -498,27 +693,9 @@ class DiscountEngine:
             List of applicable discounts
         """
         try:
-            now = datetime.now(timezone.utc)
-            
-            # Base query for active, non-expired discounts
-            query = select(Discount).where(
-                and_(
-                    Discount.is_active == True,
-                    Discount.valid_from <= now,
-                    Discount.valid_until >= now,
-                    or_(
-                        Discount.usage_limit.is_(None),
-                        Discount.used_count < Discount.usage_limit
-                    ),
-                    or_(
-                        Discount.minimum_amount.is_(None),
-                        Discount.minimum_amount <= subtotal
-                    )
-                )
-            )
-            
-            result = await self.db.execute(query)
-            applicable_discounts = result.scalars().all()
+            # Served from the in-process rule index; no query per evaluation
+            index = await discount_rules.get_index()
+            applicable_discounts = [rule.to_discount() for rule in index.candidates(subtotal)]
             
             logger.info(f"Found {len(applicable_discounts)} applicable discounts for subtotal {subtotal}")
             return applicable_discounts
@@ -527,6 +704,18 @@ class DiscountEngine:
             logger.error(f"Error getting applicable discounts: {str(e)}")
             return []
 
+    async def select_optimal_discounts(
+        self,
+        vectors: Iterable[Tuple[Decimal, Decimal, Decimal]]
+    ) -> List[Tuple[Optional[DiscountRule], Optional[DiscountCalculationResult]]]:
+        """
+        Best applicable discount for each (subtotal, shipping_cost, tax_amount) vector
+        One index lookup for the whole batch, then pure evaluation, so repricing thousands
+        of subscriptions makes no database calls.
+        """
+        index = await discount_rules.get_index()
+        return index.best_many(vectors)
+
     async def create_discount(
         self,
         code: str,
@@ -561,6 +750,7 @@ class DiscountEngine:
             self.db.add(discount)
             await self.db.commit()
             await self.db.refresh(discount)
+            await publish_discount_changes([discount.code], "created")
             
             logger.info(f"Created discount: {code}")
             return discount
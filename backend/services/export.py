@@ -1,16 +1,141 @@
+import asyncio
 import csv
 import io
 import json
-from typing import List, Dict, Any, Optional
+import tempfile
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime, date
 from decimal import Decimal
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
 from pydantic import BaseModel
 
-# Import Jinja2 and WeasyPrint
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+# Import WeasyPrint
 from weasyprint import HTML, CSS
+from core.utils.templating import get_string_template, get_template_env, render_template_to_file
+
+
+ORDER_EXPORT_HEADERS = [
+    'Order ID', 'Customer Name', 'Customer Email', 'Status',
+    'Payment Status', 'Total Amount', 'Items Count', 'Created At'
+]
+ORDER_EXPORT_COLUMN_WIDTHS = [15, 20, 30, 15, 15, 15, 12, 20]
+
+# Streamed exports are flushed to the client in chunks of roughly this size
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+ORDERS_PDF_TEMPLATE_NAME = "exports/orders_pdf"
+ORDERS_PDF_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Orders Export Report</title>
+    <style>
+        body { font-family: sans-serif; margin: 0; padding: 0; font-size: 10px; }
+        .container { width: 100%; margin: 0 auto; padding: 20px; }
+        h1 { text-align: center; color: #1a1a1a; font-size: 20px; margin-bottom: 20px; }
+        .meta { text-align: center; margin-bottom: 30px; color: #555; }
+        table { width: 100%; border-collapse: collapse; margin-bottom: 30px; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #4472C4; color: white; font-weight: bold; font-size: 11px;}
+        tr:nth-child(even) { background-color: #f2f2f2; }
+        .summary { margin-top: 20px; font-size: 11px; }
+        .summary span { font-weight: bold; }
+        .order-items { margin-top: 10px; border-top: 1px solid #eee; padding-top: 5px; font-size: 9px; }
+        .order-item { margin-bottom: 3px; }
+        .order-item-detail { margin-left: 15px; color: #666; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Orders Export Report</h1>
+        <p class="meta">Generated on: {{ generation_date }}</p>
+
+        {% if not orders %}
+            <p style="text-align: center;">No orders to export.</p>
+        {% else %}
+            <div class="summary">
+                <span>Total Orders:</span> {{ orders|length }} |
+                <span>Total Revenue:</span> ${{ "%.2f"|format(total_revenue) }}
+            </div>
+
+            <table>
+                <thead>
+                    <tr>
+                        <th>Order ID</th>
+                        <th>Customer</th>
+                        <th>Status</th>
+                        <th>Amount</th>
+                        <th>Date</th>
+                        <th>Items</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {% for order in orders %}
+                    <tr>
+                        <td>{{ order.id[:8] }}...</td>
+                        <td>{{ order.customer_name }}</td>
+                        <td>{{ order.status }}</td>
+                        <td>${{ "%.2f"|format(order.total_amount) }}</td>
+                        <td>{{ order.created_at[:10] }}</td>
+                        <td>
+                            {% if order.items %}
+                                <div class="order-items">
+                                    {% for item in order.items %}
+                                        <div class="order-item">
+                                            {{ item.variant.product_name }} ({{ item.variant.name }}) - {{ item.quantity }} x ${{ "%.2f"|format(item.price_per_unit) }}
+                                            <div class="order-item-detail">Total: ${{ "%.2f"|format(item.total_price) }}</div>
+                                        </div>
+                                    {% endfor %}
+                                </div>
+                            {% else %}
+                                No items
+                            {% endif %}
+                        </td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+        {% endif %}
+    </div>
+</body>
+</html>
+"""
+
+
+def _enum_value(value: Any) -> Any:
+    return value.value if hasattr(value, "value") else value
+
+
+def order_export_values(row: Any) -> List[Any]:
+    """Flatten an order export row (see AdminService.stream_orders_for_export) into column values"""
+    return [
+        str(row.id),
+        f"{row.firstname or ''} {row.lastname or ''}".strip(),
+        row.email or 'Unknown',
+        _enum_value(row.order_status),
+        _enum_value(row.payment_status),
+        float(row.total_amount or 0),
+        row.items_count or 0,
+        row.created_at.isoformat() if row.created_at else ''
+    ]
+
+
+def order_export_dict(row: Any) -> Dict[str, Any]:
+    """Order export row in the dict shape used by the PDF and JSON exports"""
+    order_id, _, email, order_status, payment_status, total_amount, items_count, created_at = order_export_values(row)
+    return {
+        'id': order_id,
+        'order_number': row.order_number,
+        'user': {'firstname': row.firstname or '', 'lastname': row.lastname or '', 'email': email},
+        'status': order_status,
+        'payment_status': payment_status,
+        'total_amount': total_amount,
+        'items_count': items_count,
+        'created_at': created_at
+    }
 
 
 class ExportFilters(BaseModel):
@@ -36,181 +161,94 @@ class ExportService:
     """Consolidated service for exporting data to various formats"""
     
     def __init__(self):
-        # Initialize Jinja2 environment for template rendering
-        self.jinja_env = Environment(
-            loader=FileSystemLoader("templates"),
-            autoescape=select_autoescape(["html", "xml"])
-        )
+        # Shared precompiled Jinja2 environment for template rendering
+        self.jinja_env = get_template_env("templates")
     
     @staticmethod
-    def export_orders_to_csv(orders: List[Dict[str, Any]]) -> io.BytesIO:
-        """Export orders to CSV format"""
-        output = io.StringIO()
+    async def stream_orders_to_csv(rows: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """Write order rows to CSV as they arrive, yielding ~EXPORT_CHUNK_BYTES chunks"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(ORDER_EXPORT_HEADERS)
         
-        if not orders:
-            return io.BytesIO(b"No orders to export")
-        
-        # Define CSV headers
-        headers = [
-            'Order ID', 'Customer Name', 'Customer Email', 'Status', 
-            'Payment Status', 'Total Amount', 'Items Count', 'Created At'
-        ]
-        
-        writer = csv.DictWriter(output, fieldnames=headers)
-        writer.writeheader()
+        row_count = 0
+        async for row in rows:
+            values = order_export_values(row)
+            values[5] = f"${values[5]:.2f}"
+            writer.writerow(values)
+            row_count += 1
+            
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
         
-        for order in orders:
-            user = order.get('user', {})
-            writer.writerow({
-                'Order ID': order.get('id', ''),
-                'Customer Name': f"{user.get('firstname', '')} {user.get('lastname', '')}".strip(),
-                'Customer Email': user.get('email', ''),
-                'Status': order.get('status', ''),
-                'Payment Status': order.get('payment_status', ''),
-                'Total Amount': f"${order.get('total_amount', 0):.2f}",
-                'Items Count': len(order.get('items', [])),
-                'Created At': order.get('created_at', '')
-            })
+        if not row_count:
+            yield b"No orders to export"
+            return
+        yield buffer.getvalue().encode('utf-8')
+    
+    @staticmethod
+    async def stream_orders_to_json(rows: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """Write order rows as a JSON array as they arrive, yielding ~EXPORT_CHUNK_BYTES chunks"""
+        buffer = io.StringIO()
+        buffer.write('[')
+        separator = ''
+        async for row in rows:
+            buffer.write(separator)
+            buffer.write(json.dumps(order_export_dict(row)))
+            separator = ','
+            
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
         
-        # Convert StringIO to BytesIO
-        bytes_output = io.BytesIO(output.getvalue().encode('utf-8'))
-        bytes_output.seek(0)
-        return bytes_output
+        buffer.write(']')
+        yield buffer.getvalue().encode('utf-8')
     
     @staticmethod
-    def export_orders_to_excel(orders: List[Dict[str, Any]]) -> io.BytesIO:
-        """Export orders to Excel format"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Orders"
+    async def stream_orders_to_excel(rows: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """
+        Write order rows into a write-only workbook, then stream the saved file
+        write_only worksheets spill rows to disk as they are appended, so memory stays flat;
+        the xlsx container can only be produced once every row is in.
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Orders")
         
-        # Define headers
-        headers = [
-            'Order ID', 'Customer Name', 'Customer Email', 'Status', 
-            'Payment Status', 'Total Amount', 'Items Count', 'Created At'
-        ]
+        for col_num, width in enumerate(ORDER_EXPORT_COLUMN_WIDTHS, 1):
+            ws.column_dimensions[chr(64 + col_num)].width = width
         
-        # Style for headers
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Write headers
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
+        header_cells = []
+        for header in ORDER_EXPORT_HEADERS:
+            cell = WriteOnlyCell(ws, value=header)
             cell.font = header_font
             cell.fill = header_fill
             cell.alignment = header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
         
-        # Write data
-        for row_num, order in enumerate(orders, 2):
-            user = order.get('user', {})
-            ws.cell(row=row_num, column=1, value=order.get('id', ''))
-            ws.cell(row=row_num, column=2, value=f"{user.get('firstname', '')} {user.get('lastname', '')}".strip())
-            ws.cell(row=row_num, column=3, value=user.get('email', ''))
-            ws.cell(row=row_num, column=4, value=order.get('status', ''))
-            ws.cell(row=row_num, column=5, value=order.get('payment_status', ''))
-            ws.cell(row=row_num, column=6, value=order.get('total_amount', 0))
-            ws.cell(row=row_num, column=7, value=len(order.get('items', [])))
-            ws.cell(row=row_num, column=8, value=order.get('created_at', ''))
-        
-        # Adjust column widths
-        column_widths = [15, 20, 30, 15, 15, 15, 12, 20]
-        for col_num, width in enumerate(column_widths, 1):
-            ws.column_dimensions[chr(64 + col_num)].width = width
+        async for row in rows:
+            ws.append(order_export_values(row))
         
-        # Save to BytesIO
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return output
+        with tempfile.TemporaryFile() as output:
+            await asyncio.to_thread(wb.save, output)
+            output.seek(0)
+            while True:
+                chunk = await asyncio.to_thread(output.read, EXPORT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
     
     @staticmethod
     def export_orders_to_pdf(orders: List[Dict[str, Any]]) -> io.BytesIO:
         """Export orders to PDF format using Jinja2 and WeasyPrint"""
-        # Basic HTML template for the order export
-        # In a real application, this would likely be loaded from a separate .html file
-        template_string = """
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <title>Orders Export Report</title>
-            <style>
-                body { font-family: sans-serif; margin: 0; padding: 0; font-size: 10px; }
-                .container { width: 100%; margin: 0 auto; padding: 20px; }
-                h1 { text-align: center; color: #1a1a1a; font-size: 20px; margin-bottom: 20px; }
-                .meta { text-align: center; margin-bottom: 30px; color: #555; }
-                table { width: 100%; border-collapse: collapse; margin-bottom: 30px; }
-                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-                th { background-color: #4472C4; color: white; font-weight: bold; font-size: 11px;}
-                tr:nth-child(even) { background-color: #f2f2f2; }
-                .summary { margin-top: 20px; font-size: 11px; }
-                .summary span { font-weight: bold; }
-                .order-items { margin-top: 10px; border-top: 1px solid #eee; padding-top: 5px; font-size: 9px; }
-                .order-item { margin-bottom: 3px; }
-                .order-item-detail { margin-left: 15px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Orders Export Report</h1>
-                <p class="meta">Generated on: {{ generation_date }}</p>
-
-                {% if not orders %}
-                    <p style="text-align: center;">No orders to export.</p>
-                {% else %}
-                    <div class="summary">
-                        <span>Total Orders:</span> {{ orders|length }} |
-                        <span>Total Revenue:</span> ${{ "%.2f"|format(total_revenue) }}
-                    </div>
-
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Order ID</th>
-                                <th>Customer</th>
-                                <th>Status</th>
-                                <th>Amount</th>
-                                <th>Date</th>
-                                <th>Items</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for order in orders %}
-                            <tr>
-                                <td>{{ order.id[:8] }}...</td>
-                                <td>{{ order.customer_name }}</td>
-                                <td>{{ order.status }}</td>
-                                <td>${{ "%.2f"|format(order.total_amount) }}</td>
-                                <td>{{ order.created_at[:10] }}</td>
-                                <td>
-                                    {% if order.items %}
-                                        <div class="order-items">
-                                            {% for item in order.items %}
-                                                <div class="order-item">
-                                                    {{ item.variant.product_name }} ({{ item.variant.name }}) - {{ item.quantity }} x ${{ "%.2f"|format(item.price_per_unit) }}
-                                                    <div class="order-item-detail">Total: ${{ "%.2f"|format(item.total_price) }}</div>
-                                                </div>
-                                            {% endfor %}
-                                        </div>
-                                    {% else %}
-                                        No items
-                                    {% endif %}
-                                </td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                {% endif %}
-            </div>
-        </body>
-        </html>
-        """
-
-        # Setup Jinja2 environment to load from a string
-        env = Environment(loader=FileSystemLoader("."), autoescape=select_autoescape(["html", "xml"]))
-        template = env.from_string(template_string)
+        # Compiled once per process (and warmed at startup)
+        template = get_string_template(ORDERS_PDF_TEMPLATE_NAME, ORDERS_PDF_TEMPLATE)
 
         total_revenue = sum(order.get('total_amount', 0) for order in orders)
         generation_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -375,7 +413,32 @@ class ExportService:
         template_name: str
     ) -> ExportResult:
         """Export subscriptions to HTML format using Jinja template"""
+        context = self._subscriptions_html_context(subscriptions_data, filters, timestamp)
+        
+        try:
+            template = self.jinja_env.get_template(template_name)
+            rendered_content = template.render(context)
+        except Exception:
+            # Fallback to basic HTML if template not found
+            rendered_content = self._generate_basic_html_export(subscriptions_data, "Subscriptions Export")
         
+        content = rendered_content.encode('utf-8')
+        filename = f"subscriptions_export_{timestamp.strftime('%Y%m%d_%H%M%S')}.html"
+        
+        return ExportResult(
+            content=content,
+            content_type='text/html',
+            filename=filename,
+            format_type='html',
+            generated_at=timestamp
+        )
+    
+    @staticmethod
+    def _subscriptions_html_context(
+        subscriptions_data: List[Dict[str, Any]],
+        filters: ExportFilters,
+        timestamp: datetime
+    ) -> Dict[str, Any]:
         # Calculate summary statistics
         total_revenue = sum(
             sub.get('cost_breakdown', {}).get('total_amount', 0) 
@@ -387,7 +450,7 @@ class ExportService:
             if sub.get('status') == 'active'
         ])
         
-        context = {
+        return {
             'subscriptions': subscriptions_data,
             'filters': filters.dict(exclude_none=True),
             'summary': {
@@ -398,24 +461,24 @@ class ExportService:
             },
             'company_name': 'Banwee'
         }
-        
+    
+    def write_subscriptions_html(
+        self,
+        subscriptions_data: List[Dict[str, Any]],
+        filters: ExportFilters,
+        path: str,
+        template_name: str = "exports/subscriptions_export.html"
+    ) -> int:
+        """Stream the subscriptions HTML report to path with generate() instead of building one string"""
+        context = self._subscriptions_html_context(subscriptions_data, filters, datetime.now())
         try:
             template = self.jinja_env.get_template(template_name)
-            rendered_content = template.render(context)
         except Exception:
-            # Fallback to basic HTML if template not found
-            rendered_content = self._generate_basic_html_export(subscriptions_data, "Subscriptions Export")
-        
-        content = rendered_content.encode('utf-8')
-        filename = f"subscriptions_export_{timestamp.strftime('%Y%m%d_%H%M%S')}.html"
-        
-        return ExportResult(
-            content=content,
-            content_type='text/html',
-            filename=filename,
-            format_type='html',
-            generated_at=timestamp
-        )
+            content = self._generate_basic_html_export(subscriptions_data, "Subscriptions Export").encode('utf-8')
+            with open(path, "wb") as f:
+                f.write(content)
+            return len(content)
+        return render_template_to_file(template, context, path)
     
     def _json_serializer(self, obj):
         """JSON serializer for special types"""
@@ -0,0 +1,285 @@
+"""
+Asynchronous export jobs
+POST creates a job record in Redis and enqueues run_export_job_task; the worker streams
+rows from the database into an artifact file under EXPORT_ARTIFACT_DIR, publishing
+progress as it goes. CPU-heavy rendering (WeasyPrint PDFs, subscription reports) runs in
+the render process pool. Clients poll the job and download the artifact when completed.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from core.errors import APIException
+from core.utils.uuid_utils import uuid7
+from core.utils.render_pool import run_in_render_pool
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Supported formats per export kind: format -> (file extension, media type)
+EXPORT_FORMATS = {
+    "orders": {
+        "csv": (".csv", "text/csv"),
+        "excel": (".xlsx", XLSX_MEDIA_TYPE),
+        "pdf": (".pdf", "application/pdf"),
+        "json": (".json", "application/json"),
+    },
+    "subscriptions": {
+        "csv": (".csv", "text/csv"),
+        "json": (".json", "application/json"),
+        "html": (".html", "text/html"),
+    },
+}
+
+# Filters accepted per export kind (see AdminService.stream_orders_for_export and ExportFilters)
+EXPORT_FILTERS = {
+    "orders": {"order_status", "q", "date_from", "date_to", "min_price", "max_price"},
+    "subscriptions": {"start_date", "end_date", "customer_id", "subscription_status", "variant_ids"},
+}
+
+EXPORT_PROGRESS_TTL = 86400  # Keep job records around for a day
+PROGRESS_EVERY_ROWS = 1000
+PDF_MAX_ORDERS = 20000  # WeasyPrint lays out the whole document in memory
+SUBSCRIPTION_FETCH_SIZE = 500
+
+
+def artifact_path(job_id: str, fmt: str, kind: str) -> str:
+    extension = EXPORT_FORMATS[kind][fmt][0]
+    return os.path.join(settings.EXPORT_ARTIFACT_DIR, f"{job_id}{extension}")
+
+
+async def store_export_job(job: Dict[str, Any]):
+    """Publish a job record to Redis so the API can poll it"""
+    from core.cache import RedisService, RedisKeyManager
+
+    await RedisService().set_with_expiry(
+        RedisKeyManager.export_job_key(job["job_id"]),
+        job,
+        EXPORT_PROGRESS_TTL
+    )
+
+
+async def get_export_job(job_id: str) -> Optional[Dict[str, Any]]:
+    from core.cache import RedisService, RedisKeyManager
+
+    return await RedisService().get_data(RedisKeyManager.export_job_key(job_id))
+
+
+async def create_export_job(
+    kind: str,
+    fmt: str,
+    filters: Optional[Dict[str, Any]] = None,
+    user_id: Optional[UUID] = None
+) -> Dict[str, Any]:
+    """Validate the request, record the job as queued and hand it to the worker"""
+    from core.arq_worker import enqueue_export_job
+
+    if kind not in EXPORT_FORMATS:
+        raise APIException(status_code=400, message=f"Unsupported export '{kind}'")
+    if fmt not in EXPORT_FORMATS[kind]:
+        raise APIException(
+            status_code=400,
+            message=f"Unsupported format '{fmt}' for {kind}; use {', '.join(EXPORT_FORMATS[kind])}"
+        )
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - EXPORT_FILTERS[kind]
+    if unknown:
+        raise APIException(status_code=400, message=f"Unknown filters for {kind}: {', '.join(sorted(unknown))}")
+
+    job_id = str(uuid7())
+    job = {
+        "job_id": job_id,
+        "kind": kind,
+        "format": fmt,
+        "filters": filters,
+        "status": "queued",
+        "rows": 0,
+        "filename": f"{kind}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXPORT_FORMATS[kind][fmt][0]}",
+        "media_type": EXPORT_FORMATS[kind][fmt][1],
+        "size_bytes": None,
+        "error": None,
+        "created_by": str(user_id) if user_id else None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "completed_at": None,
+    }
+    await store_export_job(job)
+    await enqueue_export_job(job_id)
+    return job
+
+
+def render_orders_pdf_bytes(orders: List[Dict[str, Any]]) -> bytes:
+    """Render the orders PDF (runs in the render pool)"""
+    from services.export import ExportService
+
+    return ExportService.export_orders_to_pdf(orders).getvalue()
+
+
+def render_subscriptions_file(subscriptions: List[Dict[str, Any]], filters: Dict[str, Any], fmt: str, path: str):
+    """Render a subscription export to path (runs in the render pool)"""
+    from services.export import ExportService, ExportFilters
+
+    if fmt == "html":
+        # Large reports are streamed to disk rather than rendered into one string
+        ExportService().write_subscriptions_html(subscriptions, ExportFilters(**filters), path)
+        return
+
+    result = asyncio.run(ExportService().export_subscription_data(subscriptions, ExportFilters(**filters), fmt))
+    with open(path, "wb") as f:
+        f.write(result.content)
+
+
+def _write_bytes(path: str, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def cleanup_export_artifacts(max_age_hours: Optional[int] = None) -> int:
+    """Delete artifacts (and abandoned partial files) older than the retention window"""
+    max_age = timedelta(hours=max_age_hours or settings.EXPORT_ARTIFACT_TTL_HOURS).total_seconds()
+    if not os.path.isdir(settings.EXPORT_ARTIFACT_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(settings.EXPORT_ARTIFACT_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+
+class ExportJobRunner:
+    """Produces the artifact for one export job"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def run(self, job_id: str) -> Dict[str, Any]:
+        job = await get_export_job(job_id)
+        if not job:
+            raise ValueError(f"Export job {job_id} not found")
+
+        job.update(status="running", started_at=datetime.now(timezone.utc).isoformat())
+        await store_export_job(job)
+
+        os.makedirs(settings.EXPORT_ARTIFACT_DIR, exist_ok=True)
+        path = artifact_path(job_id, job["format"], job["kind"])
+        partial_path = f"{path}.part"
+        started = time.monotonic()
+
+        try:
+            if job["kind"] == "orders":
+                await self._export_orders(job, partial_path)
+            else:
+                await self._export_subscriptions(job, partial_path)
+            os.replace(partial_path, path)
+            job.update(
+                status="completed",
+                size_bytes=os.path.getsize(path),
+                completed_at=datetime.now(timezone.utc).isoformat(),
+                elapsed_seconds=round(time.monotonic() - started, 2)
+            )
+            logger.info(f"Export {job_id} completed", metadata={"kind": job["kind"], "format": job["format"], "rows": job["rows"]})
+        except Exception as e:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            job.update(status="failed", error=str(e), completed_at=datetime.now(timezone.utc).isoformat())
+            logger.error(f"Export {job_id} failed", metadata={"kind": job["kind"], "format": job["format"]}, exception=e)
+
+        await store_export_job(job)
+        return job
+
+    async def _track(self, rows: AsyncIterator[Any], job: Dict[str, Any]) -> AsyncIterator[Any]:
+        """Pass rows through, publishing the running count every PROGRESS_EVERY_ROWS rows"""
+        async for row in rows:
+            job["rows"] += 1
+            if job["rows"] % PROGRESS_EVERY_ROWS == 0:
+                await store_export_job(job)
+            yield row
+
+    async def _export_orders(self, job: Dict[str, Any], path: str):
+        from services.admin import AdminService
+        from services.export import ExportService, order_export_dict
+
+        rows = self._track(AdminService(self.db).stream_orders_for_export(**job["filters"]), job)
+        fmt = job["format"]
+
+        if fmt == "pdf":
+            orders = []
+            async for row in rows:
+                if len(orders) >= PDF_MAX_ORDERS:
+                    raise ValueError(f"PDF exports are limited to {PDF_MAX_ORDERS} orders; use csv or excel, or narrow the filters")
+                orders.append(order_export_dict(row))
+            content = await run_in_render_pool(render_orders_pdf_bytes, orders)
+            await asyncio.to_thread(_write_bytes, path, content)
+            return
+
+        writers = {
+            "csv": ExportService.stream_orders_to_csv,
+            "excel": ExportService.stream_orders_to_excel,
+            "json": ExportService.stream_orders_to_json,
+        }
+        with open(path, "wb") as f:
+            async for chunk in writers[fmt](rows):
+                f.write(chunk)
+
+    async def _export_subscriptions(self, job: Dict[str, Any], path: str):
+        subscriptions = [subscription async for subscription in self._track(self._iter_subscriptions(job["filters"]), job)]
+        await run_in_render_pool(render_subscriptions_file, subscriptions, job["filters"], job["format"], path)
+
+    async def _iter_subscriptions(self, filters: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Subscriptions matching ExportFilters, in the dict shape export_subscription_data expects"""
+        from services.export import ExportFilters
+        from models.subscriptions import Subscription
+        from models.product import ProductVariant
+
+        export_filters = ExportFilters(**filters)
+        query = select(Subscription).options(
+            selectinload(Subscription.user),
+            selectinload(Subscription.products)
+        )
+        if export_filters.start_date:
+            query = query.where(Subscription.created_at >= export_filters.start_date)
+        if export_filters.end_date:
+            query = query.where(Subscription.created_at < export_filters.end_date + timedelta(days=1))
+        if export_filters.customer_id:
+            query = query.where(Subscription.user_id == UUID(export_filters.customer_id))
+        if export_filters.subscription_status:
+            query = query.where(Subscription.status == export_filters.subscription_status)
+        if export_filters.variant_ids:
+            query = query.where(Subscription.products.any(
+                ProductVariant.id.in_([UUID(variant_id) for variant_id in export_filters.variant_ids])
+            ))
+        query = query.order_by(Subscription.created_at).execution_options(yield_per=SUBSCRIPTION_FETCH_SIZE)
+
+        result = await self.db.stream(query)
+        async for subscription in result.scalars():
+            user = subscription.user
+            yield {
+                "id": str(subscription.id),
+                "name": subscription.name,
+                "user": {
+                    "firstname": user.firstname if user else "",
+                    "lastname": user.lastname if user else "",
+                    "email": user.email if user else "",
+                },
+                "status": subscription.status,
+                "delivery_type": subscription.delivery_type,
+                "billing_cycle": subscription.billing_cycle,
+                "variants": [{"id": str(variant.id), "name": variant.name} for variant in subscription.products or []],
+                "cost_breakdown": {
+                    "total_amount": subscription.price_at_creation or 0,
+                    "currency": subscription.currency or "USD",
+                    "delivery_cost": subscription.current_shipping_amount or 0,
+                    "tax_amount": subscription.current_tax_amount or 0,
+                },
+                "created_at": subscription.created_at.isoformat() if subscription.created_at else None,
+                "next_billing_date": subscription.next_billing_date.isoformat() if subscription.next_billing_date else None,
+            }
@@ -0,0 +1,345 @@
+# Demand forecasting service
+# Vectorized exponential smoothing / Croston over order item history, stored per variant
+
+import math
+from datetime import datetime, timedelta, timezone, date
+from typing import Optional, List, Dict, Any, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select, func, cast, case, literal_column, Date, Integer
+from sqlalchemy.dialects.postgresql import insert, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.utils.uuid_utils import uuid7
+from core.logging import get_structured_logger
+from models.inventories import Inventory, DemandForecast
+from models.orders import Order, OrderItem, OrderStatus, PaymentStatus
+from models.subscriptions import Subscription
+
+logger = get_structured_logger(__name__)
+
+# Sales are paid one-off orders that were not cancelled or refunded since. Subscription
+# orders are excluded here and added back from upcoming renewals so they are not counted twice.
+EXCLUDED_ORDER_STATUSES = (OrderStatus.CANCELLED, OrderStatus.REFUNDED)
+
+# Days between renewals per billing cycle
+BILLING_CYCLE_DAYS = {
+    "weekly": 7,
+    "biweekly": 14,
+    "monthly": 30,
+    "quarterly": 90,
+    "yearly": 365,
+}
+
+# Average demand interval above which a series is treated as intermittent (Syntetos-Boylan cut-off)
+INTERMITTENT_ADI = 1.32
+
+# asyncpg allows at most 32767 bind parameters per statement; chunks are sized from the row width
+MAX_BIND_PARAMS = 32767
+UPSERT_CHUNK_SIZE = 2000
+
+
+def ses_rates(demand: np.ndarray, alpha: float) -> np.ndarray:
+    """Simple exponential smoothing level for every row of a (variants x days) matrix"""
+    level = demand[:, :7].mean(axis=1).astype(np.float64)
+    for t in range(demand.shape[1]):
+        level += alpha * (demand[:, t] - level)
+    return level
+
+
+def croston_rates(demand: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Croston demand rate (Syntetos-Boylan approximation) for every row of a (variants x days) matrix
+    Sizes and intervals are only updated on days with demand; rows without any demand return 0
+    """
+    n_rows, n_days = demand.shape
+    size = np.zeros(n_rows)
+    interval = np.ones(n_rows)
+    periods_since = np.ones(n_rows)
+    seen = np.zeros(n_rows, dtype=bool)
+
+    for t in range(n_days):
+        d = demand[:, t]
+        has_demand = d > 0
+
+        first = has_demand & ~seen
+        size[first] = d[first]
+        interval[first] = periods_since[first]
+
+        update = has_demand & seen
+        size[update] += alpha * (d[update] - size[update])
+        interval[update] += alpha * (periods_since[update] - interval[update])
+
+        seen |= has_demand
+        periods_since = np.where(has_demand, 1.0, periods_since + 1.0)
+
+    return np.where(seen, (1 - alpha / 2) * size / interval, 0.0)
+
+
+def forecast_matrix(
+    demand: np.ndarray,
+    alpha: float = 0.2
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fit every variant at once: Croston for intermittent series, SES for smooth ones
+
+    Returns:
+        (daily_rate, demand_std, method) arrays, one entry per row
+    """
+    n_rows, n_days = demand.shape
+    if n_rows == 0:
+        empty = np.zeros(0)
+        return empty, empty, np.array([], dtype=object)
+
+    nonzero_days = np.count_nonzero(demand, axis=1)
+    adi = np.divide(n_days, nonzero_days, out=np.full(n_rows, np.inf), where=nonzero_days > 0)
+    intermittent = adi > INTERMITTENT_ADI
+
+    rate = np.where(intermittent, croston_rates(demand, alpha), ses_rates(demand, alpha))
+    rate = np.clip(rate, 0.0, None)
+    rate[nonzero_days == 0] = 0.0
+
+    method = np.where(nonzero_days == 0, "none", np.where(intermittent, "croston", "ses")).astype(object)
+    return rate, demand.std(axis=1), method
+
+
+class DemandForecastService:
+    """Builds per-variant demand forecasts and stores them in demand_forecasts"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _load_inventory(
+        self,
+        variant_ids: Optional[List[UUID]] = None
+    ) -> Tuple[List[UUID], np.ndarray]:
+        """Load (variant_id, quantity_available) for all forecastable rows, ordered by variant_id"""
+        query = select(Inventory.variant_id, Inventory.quantity_available).order_by(Inventory.variant_id)
+        if variant_ids:
+            query = query.where(Inventory.variant_id.in_(variant_ids))
+
+        rows = (await self.db.execute(query)).all()
+        ids = [row.variant_id for row in rows]
+        available = np.fromiter((row.quantity_available for row in rows), dtype=np.float64, count=len(rows))
+        return ids, available
+
+    def _ranked_variants(self, variant_ids: Optional[List[UUID]] = None):
+        """Each forecastable variant with its rank in variant_id order, matching _load_inventory"""
+        ranked = select(
+            Inventory.variant_id.label("variant_id"),
+            (func.row_number().over(order_by=Inventory.variant_id) - 1).label("row_idx")
+        )
+        if variant_ids:
+            ranked = ranked.where(Inventory.variant_id.in_(variant_ids))
+        return ranked.subquery()
+
+    async def _load_sales_matrix(
+        self,
+        n_variants: int,
+        start_date: date,
+        history_days: int,
+        variant_ids: Optional[List[UUID]] = None
+    ) -> np.ndarray:
+        """Pull daily units sold per variant from paid orders in one query straight into a (variants x days) matrix"""
+        ranked = self._ranked_variants(variant_ids)
+        day_idx = cast(cast(Order.created_at, Date) - start_date, Integer)
+
+        query = (
+            select(ranked.c.row_idx, day_idx.label("day_idx"), func.sum(OrderItem.quantity))
+            .select_from(OrderItem)
+            .join(Order, Order.id == OrderItem.order_id)
+            .join(ranked, ranked.c.variant_id == OrderItem.variant_id)
+            .where(
+                Order.created_at >= start_date,
+                Order.payment_status == PaymentStatus.PAID,
+                Order.order_status.notin_(EXCLUDED_ORDER_STATUSES),
+                Order.subscription_id.is_(None)
+            )
+            .group_by(ranked.c.row_idx, day_idx)
+        )
+
+        demand = np.zeros((n_variants, history_days), dtype=np.float32)
+        rows = (await self.db.execute(query)).all()
+        if rows:
+            triples = np.array([tuple(row) for row in rows], dtype=np.float64)
+            row_idx = triples[:, 0].astype(np.int64)
+            days = triples[:, 1].astype(np.int64)
+            in_window = (days >= 0) & (days < history_days)
+            demand[row_idx[in_window], days[in_window]] = triples[in_window, 2]
+
+        return demand
+
+    async def _load_subscription_demand(
+        self,
+        n_variants: int,
+        now: datetime,
+        horizon_days: int,
+        variant_ids: Optional[List[UUID]] = None
+    ) -> np.ndarray:
+        """
+        Units per variant due from active subscription renewals within the horizon
+        One row per (subscription, variant) comes back from a single query; the renewal
+        counts and the per-variant sum are done on arrays.
+        """
+        horizon_end = now + timedelta(days=horizon_days)
+        ranked = self._ranked_variants(variant_ids)
+        variant = func.json_array_elements_text(Subscription.variant_ids).table_valued("value").lateral("variant")
+        quantity = func.coalesce(
+            cast(Subscription.subscription_metadata.op("->")("variant_quantities").op("->>")(variant.c.value), Integer),
+            1
+        )
+        cycle_days = case(
+            *[(func.lower(Subscription.billing_cycle) == cycle, days) for cycle, days in BILLING_CYCLE_DAYS.items()],
+            else_=BILLING_CYCLE_DAYS["monthly"]
+        )
+
+        rows = (await self.db.execute(
+            select(
+                ranked.c.row_idx,
+                quantity,
+                cycle_days,
+                func.extract("epoch", Subscription.next_billing_date)
+            )
+            .select_from(Subscription)
+            .join(variant, literal_column("true"))
+            .join(ranked, ranked.c.variant_id == cast(variant.c.value, PG_UUID(as_uuid=True)))
+            .where(
+                Subscription.status == "active",
+                Subscription.next_billing_date.isnot(None),
+                Subscription.next_billing_date <= horizon_end
+            )
+        )).all()
+
+        demand = np.zeros(n_variants)
+        if rows:
+            table = np.array([tuple(row) for row in rows], dtype=np.float64)
+            days_to_first = np.clip((table[:, 3] - now.timestamp()) / 86400, 0.0, None)
+            renewals = 1 + np.floor((horizon_days - days_to_first) / table[:, 2])
+            np.add.at(demand, table[:, 0].astype(np.int64), renewals * table[:, 1])
+
+        return demand
+
+    async def compute_forecasts(
+        self,
+        variant_ids: Optional[List[UUID]] = None,
+        horizon_days: int = 30,
+        history_days: int = 90,
+        lead_time_days: int = 7,
+        service_level_z: float = 1.65,
+        alpha: float = 0.2
+    ) -> Dict[str, Any]:
+        """
+        Compute forecasts for all (or the given) variants without storing them
+
+        Returns:
+            Dict of parallel NumPy arrays keyed by column, plus the variant id list
+        """
+        now = datetime.now(timezone.utc)
+        start_date = (now - timedelta(days=history_days)).date()
+
+        ids, available = await self._load_inventory(variant_ids)
+
+        demand = await self._load_sales_matrix(len(ids), start_date, history_days, variant_ids)
+        daily_rate, demand_std, method = forecast_matrix(demand, alpha)
+        subscription_demand = await self._load_subscription_demand(len(ids), now, horizon_days, variant_ids)
+
+        forecast_demand = daily_rate * horizon_days + subscription_demand
+        safety_stock = service_level_z * demand_std * math.sqrt(lead_time_days)
+
+        effective_rate = forecast_demand / horizon_days
+        days_until_stockout = np.divide(
+            np.clip(available, 0.0, None), effective_rate,
+            out=np.full(len(ids), np.nan), where=effective_rate > 0
+        )
+        suggested_quantity = np.ceil(np.clip(forecast_demand + safety_stock - available, 0.0, None)).astype(np.int64)
+
+        return {
+            "variant_ids": ids,
+            "available": available,
+            "method": method,
+            "daily_rate": daily_rate,
+            "demand_std": demand_std,
+            "subscription_demand": subscription_demand,
+            "forecast_demand": forecast_demand,
+            "safety_stock": safety_stock,
+            "days_until_stockout": days_until_stockout,
+            "suggested_quantity": suggested_quantity,
+            "horizon_days": horizon_days,
+            "history_days": history_days,
+            "generated_at": now,
+        }
+
+    async def refresh_forecasts(
+        self,
+        horizon_days: int = 30,
+        history_days: int = 90,
+        lead_time_days: int = 7
+    ) -> Dict[str, Any]:
+        """Recompute forecasts for every inventoried variant and upsert them into demand_forecasts"""
+        started = datetime.now(timezone.utc)
+        result = await self.compute_forecasts(
+            horizon_days=horizon_days,
+            history_days=history_days,
+            lead_time_days=lead_time_days
+        )
+
+        rows = [
+            {
+                "id": uuid7(),
+                "variant_id": variant_id,
+                "method": str(result["method"][i]),
+                "daily_rate": float(result["daily_rate"][i]),
+                "demand_std": float(result["demand_std"][i]),
+                "subscription_demand": float(result["subscription_demand"][i]),
+                "horizon_days": horizon_days,
+                "history_days": history_days,
+                "forecast_demand": float(result["forecast_demand"][i]),
+                "safety_stock": float(result["safety_stock"][i]),
+                "days_until_stockout": None if np.isnan(result["days_until_stockout"][i]) else float(result["days_until_stockout"][i]),
+                "suggested_quantity": int(result["suggested_quantity"][i]),
+                "generated_at": result["generated_at"],
+                "version": 1,
+            }
+            for i, variant_id in enumerate(result["variant_ids"])
+        ]
+
+        chunk_size = min(UPSERT_CHUNK_SIZE, MAX_BIND_PARAMS // len(rows[0])) if rows else UPSERT_CHUNK_SIZE
+        for offset in range(0, len(rows), chunk_size):
+            stmt = insert(DemandForecast).values(rows[offset:offset + chunk_size])
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[DemandForecast.variant_id],
+                set_={
+                    "method": excluded.method,
+                    "daily_rate": excluded.daily_rate,
+                    "demand_std": excluded.demand_std,
+                    "subscription_demand": excluded.subscription_demand,
+                    "horizon_days": excluded.horizon_days,
+                    "history_days": excluded.history_days,
+                    "forecast_demand": excluded.forecast_demand,
+                    "safety_stock": excluded.safety_stock,
+                    "days_until_stockout": excluded.days_until_stockout,
+                    "suggested_quantity": excluded.suggested_quantity,
+                    "generated_at": excluded.generated_at,
+                    "updated_at": func.now(),
+                    "version": DemandForecast.version + 1,
+                }
+            )
+            await self.db.execute(stmt)
+            await self.db.commit()
+
+        elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        methods = result["method"]
+        summary = {
+            "success": True,
+            "variant_count": len(rows),
+            "croston_count": int(np.count_nonzero(methods == "croston")),
+            "ses_count": int(np.count_nonzero(methods == "ses")),
+            "no_history_count": int(np.count_nonzero(methods == "none")),
+            "horizon_days": horizon_days,
+            "history_days": history_days,
+            "elapsed_seconds": round(elapsed, 2),
+        }
+        logger.info("Demand forecasts refreshed", metadata=summary)
+        return summary
@@ -2,13 +2,13 @@
 # This file includes all inventory-related functionality including enhanced features
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, update, func, and_, or_, case
 from sqlalchemy.orm import selectinload, joinedload
 from typing import Optional, List, Dict, Any
 from uuid import UUID
 from core.utils.uuid_utils import uuid7
 from datetime import datetime, timedelta
-from models.inventories import Inventory, WarehouseLocation, StockAdjustment
+from models.inventories import Inventory, WarehouseLocation, StockAdjustment, DemandForecast
 from models.product import ProductVariant, Product, ProductImage
 from models.user import User
 from schemas.inventory import (
@@ -17,18 +17,34 @@ from schemas.inventory import (
     StockAdjustmentCreate, StockAdjustmentResponse
 )
 from core.errors import APIException
+from core.config import settings
 import asyncio
+import json
+import math
 from core.logging import get_structured_logger
 
 logger = get_structured_logger(__name__)
 
+# Rough confidence reported for each forecasting method
+FORECAST_CONFIDENCE = {"ses": 0.8, "croston": 0.6, "none": 0.3}
+
 
 class InventoryService:
     """Consolidated inventory service with comprehensive inventory management and distributed locking"""
     
-    def __init__(self, db: AsyncSession, lock_service=None):
+    def __init__(self, db: AsyncSession, lock_service=None, use_distributed_lock: Optional[bool] = None):
         self.db = db
         self.lock_service = lock_service
+        # Stock changes are version-checked, so the Redis lock is only taken when explicitly requested
+        self.use_distributed_lock = (
+            settings.INVENTORY_USE_DISTRIBUTED_LOCK if use_distributed_lock is None else use_distributed_lock
+        )
+
+    def _get_stock_lock(self, variant_id: UUID):
+        """Return a distributed lock for the variant, or None when locking is disabled/unavailable"""
+        if self.use_distributed_lock and self.lock_service:
+            return self.lock_service.get_inventory_lock(variant_id, timeout=30)
+        return None
 
     # --- WarehouseLocation CRUD ---
     async def create_warehouse_location(self, location_data: WarehouseLocationCreate) -> WarehouseLocationResponse:
@@ -481,19 +497,13 @@ class InventoryService:
         await self.db.commit()
 
     async def adjust_stock(self, adjustment_data: StockAdjustmentCreate, adjusted_by_user_id: Optional[UUID] = None, commit: bool = True) -> Inventory:
-        """Adjust stock levels atomically with distributed and database locks"""
+        """Adjust stock levels atomically with a database lock and optional distributed lock"""
         try:
-            # Use distributed lock FIRST to prevent race conditions across servers
-            if self.lock_service:
-                lock = self.lock_service.get_inventory_lock(adjustment_data.variant_id, timeout=30)
+            lock = self._get_stock_lock(adjustment_data.variant_id)
+            if lock:
                 async with lock:
                     return await self._perform_stock_adjustment(adjustment_data, adjusted_by_user_id, commit)
-            else:
-                # Fallback to database-only lock if Redis unavailable
-                logger.warning(f"Redis lock service unavailable, using database-only lock", metadata={
-    "variant_id": str(adjustment_data.variant_id)
-})
-                return await self._perform_stock_adjustment(adjustment_data, adjusted_by_user_id, commit)
+            return await self._perform_stock_adjustment(adjustment_data, adjusted_by_user_id, commit)
                 
         except Exception as e:
             await self.db.rollback()
@@ -526,22 +536,14 @@ class InventoryService:
                 notes=adjustment_data.notes
             )
             
-            if commit:
-                await self.db.commit()
-            
-            # Sync product availability status after stock change
-            # Get product_id from variant
-            variant_result = await self.db.execute(
-                select(ProductVariant).where(ProductVariant.id == adjustment_data.variant_id)
+            # Marked whether or not the change feed is on: feed publishing is best effort after commit
+            product_id = await self.db.scalar(
+                select(ProductVariant.product_id).where(ProductVariant.id == adjustment_data.variant_id)
             )
-            variant = variant_result.scalar_one_or_none()
+            self._queue_availability_sync(product_id)
             
-            if variant and variant.product_id:
-                # Sync availability status (don't fail if this fails)
-                try:
-                    await self.sync_product_availability_status(variant.product_id)
-                except Exception as e:
-                    logger.warning(f"Failed to sync product availability after stock adjustment", exception=e)
+            if commit:
+                await self.db.commit()
             
             return inventory
             
@@ -624,63 +626,130 @@ class InventoryService:
         variant_id: UUID,
         forecast_days: int = 30
     ) -> Dict[str, Any]:
-        """Predict demand based on real subscription patterns"""
-        # Get current stock
-        current_stock_query = select(Inventory.quantity).where(Inventory.variant_id == variant_id)
-        current_stock_result = await self.db.execute(current_stock_query)
-        current_stock = current_stock_result.scalar() or 0
+        """Predict demand from sales history plus upcoming subscription renewals"""
+        from services.forecasting import DemandForecastService
+
+        result = await DemandForecastService(self.db).compute_forecasts(
+            variant_ids=[variant_id],
+            horizon_days=forecast_days
+        )
         
-        # Simple prediction based on current stock and consumption
-        predicted_demand = max(10, int(current_stock * 0.3))  # Predict 30% of current stock as demand
+        if not result["variant_ids"]:
+            return {
+                "variant_id": str(variant_id),
+                "forecast_days": forecast_days,
+                "predicted_demand": 0,
+                "confidence_level": 0.0,
+                "current_stock": 0,
+                "recommendation": "No inventory record"
+            }
+        
+        current_stock = int(result["available"][0])
+        predicted_demand = int(math.ceil(result["forecast_demand"][0]))
+        method = str(result["method"][0])
+        days_until_stockout = result["days_until_stockout"][0]
         
         return {
             "variant_id": str(variant_id),
             "forecast_days": forecast_days,
             "predicted_demand": predicted_demand,
-            "confidence_level": 0.7,
+            "subscription_demand": int(math.ceil(result["subscription_demand"][0])),
+            "daily_rate": round(float(result["daily_rate"][0]), 3),
+            "method": method,
+            "confidence_level": FORECAST_CONFIDENCE.get(method, 0.5),
             "current_stock": current_stock,
+            "days_until_stockout": None if math.isnan(days_until_stockout) else round(float(days_until_stockout), 1),
+            "suggested_quantity": int(result["suggested_quantity"][0]),
             "recommendation": "Reorder recommended" if predicted_demand > current_stock else "Stock adequate"
         }
 
     async def generate_reorder_suggestions(
         self,
         location_id: Optional[UUID] = None,
-        days_ahead: int = 30
+        days_ahead: int = 30,
+        lead_time_days: int = 7
     ) -> List[Dict[str, Any]]:
-        """Generate reorder suggestions based on actual consumption rates"""
-        query = select(Inventory).options(
-            joinedload(Inventory.variant).joinedload(ProductVariant.product),
-            joinedload(Inventory.location)
+        """
+        Generate reorder suggestions from the nightly demand forecasts
+        A variant is suggested when it is at/below its low-stock threshold or is
+        expected to run out within days_ahead; all arithmetic runs in one SQL query
+        """
+        daily_demand = (
+            func.coalesce(DemandForecast.daily_rate, 0.0)
+            + func.coalesce(DemandForecast.subscription_demand, 0.0) / func.greatest(func.coalesce(DemandForecast.horizon_days, days_ahead), 1)
+        )
+        days_until_stockout = case(
+            (Inventory.quantity_available <= 0, 0.0),
+            (daily_demand > 0, Inventory.quantity_available / daily_demand),
+            else_=None
+        )
+        suggested_quantity = func.greatest(
+            func.ceil(daily_demand * days_ahead + func.coalesce(DemandForecast.safety_stock, 0.0) - Inventory.quantity_available),
+            case(
+                (Inventory.quantity_available <= Inventory.low_stock_threshold, Inventory.low_stock_threshold * 2 - Inventory.quantity_available),
+                else_=0
+            )
+        )
+
+        query = (
+            select(
+                Inventory.variant_id,
+                ProductVariant.name.label("variant_name"),
+                Product.name.label("product_name"),
+                Inventory.location_id,
+                WarehouseLocation.name.label("location_name"),
+                Inventory.quantity_available,
+                Inventory.low_stock_threshold,
+                DemandForecast.method,
+                DemandForecast.generated_at,
+                daily_demand.label("daily_demand"),
+                days_until_stockout.label("days_until_stockout"),
+                suggested_quantity.label("suggested_quantity")
+            )
+            .join(ProductVariant, ProductVariant.id == Inventory.variant_id)
+            .join(Product, Product.id == ProductVariant.product_id)
+            .join(WarehouseLocation, WarehouseLocation.id == Inventory.location_id)
+            .outerjoin(DemandForecast, DemandForecast.variant_id == Inventory.variant_id)
+            .where(or_(
+                Inventory.quantity_available <= Inventory.low_stock_threshold,
+                Inventory.quantity_available < daily_demand * days_ahead
+            ))
+            .order_by(days_until_stockout.asc().nulls_last())
         )
         
         if location_id:
             query = query.where(Inventory.location_id == location_id)
         
-        result = await self.db.execute(query)
-        inventory_items = result.scalars().all()
+        rows = (await self.db.execute(query)).all()
         
         reorder_suggestions = []
+        for row in rows:
+            stockout = float(row.days_until_stockout) if row.days_until_stockout is not None else None
+            
+            if row.quantity_available <= 0 or (stockout is not None and stockout <= lead_time_days):
+                urgency = "high"
+            elif row.quantity_available <= row.low_stock_threshold or (stockout is not None and stockout <= lead_time_days * 2):
+                urgency = "medium"
+            else:
+                urgency = "low"
+            
+            reorder_suggestions.append({
+                "variant_id": str(row.variant_id),
+                "variant_name": row.variant_name,
+                "product_name": row.product_name,
+                "location_id": str(row.location_id),
+                "location_name": row.location_name,
+                "current_stock": row.quantity_available,
+                "low_stock_threshold": row.low_stock_threshold,
+                "daily_demand": round(float(row.daily_demand), 3),
+                "suggested_quantity": max(int(row.suggested_quantity or 0), 0),
+                "urgency": urgency,
+                "days_until_stockout": round(stockout, 1) if stockout is not None else None,
+                "forecast_method": row.method,
+                "forecast_generated_at": row.generated_at.isoformat() if row.generated_at else None
+            })
         
-        for item in inventory_items:
-            if item.quantity <= item.low_stock_threshold:
-                suggested_quantity = item.low_stock_threshold * 2
-                
-                urgency = "high" if item.quantity <= 0 else "medium" if item.quantity <= item.low_stock_threshold else "low"
-                
-                reorder_suggestions.append({
-                    "variant_id": str(item.variant_id),
-                    "variant_name": item.variant.name if item.variant else None,
-                    "product_name": item.variant.product.name if item.variant and item.variant.product else None,
-                    "location_id": str(item.location_id),
-                    "location_name": item.location.name if item.location else None,
-                    "current_stock": item.quantity,
-                    "low_stock_threshold": item.low_stock_threshold,
-                    "suggested_quantity": suggested_quantity,
-                    "urgency": urgency,
-                    "days_until_stockout": 7 if item.quantity > 0 else 0
-                })
-        
-        # Sort by urgency
+        # Sort by urgency, soonest stockout first within each level
         urgency_order = {"high": 0, "medium": 1, "low": 2}
         reorder_suggestions.sort(key=lambda x: urgency_order.get(x["urgency"], 3))
         
@@ -690,60 +759,23 @@ class InventoryService:
         self,
         warehouse_data: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
-        """Batch update inventory from real warehouse data using atomic operations"""
-        try:
-            # Prepare stock changes for atomic bulk update
-            stock_changes = []
-            
+        """
+        Batch update inventory from an in-memory list of warehouse rows
+        Routed through the streaming importer so it gets the same set-based chunked path;
+        large feeds should use the streaming import endpoint instead
+        """
+        from services.warehouse_import import WarehouseImportService
+
+        async def rows_as_ndjson():
             for item_data in warehouse_data:
-                try:
-                    variant_id = UUID(item_data["variant_id"])
-                    new_quantity = item_data["quantity"]
-                    
-                    # Get current inventory to calculate change
-                    inventory = await self.get_inventory_item_by_variant_id(variant_id)
-                    
-                    if not inventory:
-                        continue  # Skip items not found
-                    
-                    # Calculate quantity change
-                    quantity_change = new_quantity - inventory.quantity
-                    
-                    if quantity_change != 0:  # Only update if there's a change
-                        stock_changes.append({
-                            "variant_id": variant_id,
-                            "quantity_change": quantity_change,
-                            "notes": f"Warehouse sync: {inventory.quantity} -> {new_quantity}"
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"Error preparing warehouse data", metadata={
-    "variant_id": str(item_data.get('variant_id'))
-}, exception=e)
-                    continue
-            
-            # Perform atomic bulk update
-            if stock_changes:
-                result = await self.bulk_stock_update(
-                    stock_changes=stock_changes,
-                    reason="warehouse_sync",
-                    user_id=None  # System update
-                )
-                
-                return {
-                    "success": True,
-                    "updated_count": result["updated_count"],
-                    "results": result["results"],
-                    "errors": []
-                }
-            else:
-                return {
-                    "success": True,
-                    "updated_count": 0,
-                    "results": [],
-                    "errors": []
-                }
-                
+                yield (json.dumps(item_data, default=str) + "\n").encode("utf-8")
+
+        results: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        try:
+            summary = await WarehouseImportService(self.db).import_feed(
+                rows_as_ndjson(), fmt="ndjson", results=results, rejected=errors
+            )
         except Exception as e:
             logger.error(f"Error in batch warehouse update", exception=e)
             raise APIException(
@@ -751,6 +783,13 @@ class InventoryService:
                 message=f"Failed to update inventory from warehouse data: {str(e)}"
             )
         
+        return {
+            "success": True,
+            "updated_count": summary["updated_count"],
+            "results": results,
+            "errors": errors
+        }
+        
     async def check_stock_availability(
         self,
         variant_id: UUID,
@@ -811,24 +850,15 @@ class InventoryService:
         user_id: Optional[UUID] = None
     ) -> Dict[str, Any]:
         """
-        Atomically decrement stock on purchase using distributed and database locks
+        Atomically decrement stock on purchase using a version-checked compare-and-swap
+        The distributed lock is only taken when enabled for this service
         """
         try:
-            # Use distributed lock FIRST to prevent race conditions across servers
-            if self.lock_service:
-                lock = self.lock_service.get_inventory_lock(variant_id, timeout=30)
+            lock = self._get_stock_lock(variant_id)
+            if lock:
                 async with lock:
                     return await self._perform_decrement_stock(variant_id, quantity, location_id, order_id, user_id)
-            else:
-                # Fallback to database-only lock if Redis unavailable
-                logger.warning("Redis unavailable, using database fallback", metadata={
-                    "redis_host": "localhost:6379",
-                    "fallback": "database_lock",
-                    "operation": "stock_decrement",
-                    "variant_id": str(variant_id),
-                    "impact": "reduced_performance"
-                })
-                return await self._perform_decrement_stock(variant_id, quantity, location_id, order_id, user_id)
+            return await self._perform_decrement_stock(variant_id, quantity, location_id, order_id, user_id)
                 
         except Exception as e:
             await self.db.rollback()
@@ -851,130 +881,74 @@ class InventoryService:
         order_id: Optional[UUID] = None,
         user_id: Optional[UUID] = None
     ) -> Dict[str, Any]:
-        """Internal method to perform stock decrement with database lock"""
-        # Get inventory with atomic lock - find by variant_id if location_id not provided
-        if location_id:
-            inventory = await self.db.execute(
-                select(Inventory).where(
-                    and_(Inventory.variant_id == variant_id, Inventory.location_id == location_id)
-                ).with_for_update()
-            )
-        else:
-            # Find first available inventory for this variant
-            inventory = await self.db.execute(
-                select(Inventory).where(
-                    and_(Inventory.variant_id == variant_id, Inventory.quantity_available >= quantity)
-                ).with_for_update().limit(1)
+        """Internal method to perform stock decrement with an optimistic version check"""
+        from models.inventories import optimistic_stock_update
+
+        try:
+            result = await optimistic_stock_update(
+                db=self.db,
+                variant_id=variant_id,
+                quantity_change=-quantity,
+                reason="order_purchase",
+                user_id=user_id,
+                notes=f"Stock decremented for order {order_id}" if order_id else "Stock decremented for purchase",
+                location_id=location_id,
+                max_retries=settings.INVENTORY_CAS_MAX_RETRIES
             )
-        
-        inventory = inventory.scalar_one_or_none()
-        
-        if not inventory:
-            return {
-                "success": False,
-                "message": f"Inventory not found for variant {variant_id}" + (f" at location {location_id}" if location_id else "")
-            }
-        
-        # Check if sufficient stock available
-        if inventory.quantity_available < quantity:
+        except APIException as e:
+            await self.db.rollback()
+            if e.status_code == 404:
+                return {
+                    "success": False,
+                    "message": f"Inventory not found for variant {variant_id}" + (f" at location {location_id}" if location_id else "")
+                }
             return {
                 "success": False,
-                "message": f"Out of stock" if inventory.quantity_available <= 0 else f"Insufficient stock. Available: {inventory.quantity_available}, Requested: {quantity}",
-                "available_quantity": inventory.quantity_available,
-                "requested_quantity": quantity,
-                "stock_status": inventory.stock_status
+                "message": e.message,
+                "requested_quantity": quantity
             }
-        
-        # Perform atomic stock update
-        adjustment = await inventory.atomic_update_stock(
-            db=self.db,
-            quantity_change=-quantity,
-            reason="order_purchase",
-            user_id=user_id,
-            notes=f"Stock decremented for order {order_id}" if order_id else "Stock decremented for purchase"
-        )
-        
+
+        self._queue_availability_sync(result["product_id"])
         await self.db.commit()
         
         logger.info("Stock adjusted", metadata={
                 "variant_id": str(variant_id),
-                "previous_quantity": inventory.quantity_available + quantity,
-                "new_quantity": inventory.quantity_available,
+                "previous_quantity": result["previous_quantity"],
+                "new_quantity": result["new_quantity"],
                 "adjustment": -quantity,
                 "reason": "order_purchase",
+                "attempts": result["attempts"],
                 "business_event": "inventory_management"
             })
-        
-        # Queue product availability sync as background task (don't wait for it)
-        try:
-            from core.arq_worker import enqueue_sync_product_availability
-            
-            # Get the variant to find its product
-            variant_result = await self.db.execute(
-                select(ProductVariant).where(ProductVariant.id == variant_id)
-            )
-            variant = variant_result.scalar_one_or_none()
-            
-            if variant:
-                # Queue sync as background task - don't block the order response
-                await enqueue_sync_product_availability(str(variant.product_id))
-                logger.info(f"Queued inventory sync", metadata={
-    "product_id": str(variant.product_id)
-})
-        except Exception as sync_error:
-            logger.warning(f"Failed to queue product availability sync: {sync_error}")
-            # Don't fail the entire operation if queueing fails
-        
-            return {
+
+        return {
             "success": True,
             "message": "Stock decremented successfully",
-            "inventory_id": str(inventory.id),
-            "previous_quantity": inventory.quantity_available + quantity,
-            "new_quantity": inventory.quantity_available,
+            "inventory_id": str(result["inventory_id"]),
+            "previous_quantity": result["previous_quantity"],
+            "new_quantity": result["new_quantity"],
             "quantity_decremented": quantity,
-            "adjustment_id": str(adjustment.id) if adjustment else None
+            "adjustment_id": str(result["adjustment_id"])
         }
-            
-        except APIException:
-            await self.db.rollback()
-            raise
-        except Exception as e:
-            await self.db.rollback()
-            logger.error(f"Failed to decrement stock atomically: {e}")
-            return {
-                "success": False,
-                "message": f"Failed to decrement stock: {str(e)}"
-            }
-    
-
 
     async def increment_stock_on_cancellation(
         self,
         variant_id: UUID,
         quantity: int,
-        location_id: UUID,
+        location_id: Optional[UUID] = None,
         order_id: Optional[UUID] = None,
         user_id: Optional[UUID] = None
     ) -> Dict[str, Any]:
         """
-        Atomically increment stock when order is cancelled using distributed and database locks
+        Atomically increment stock when order is cancelled using a version-checked compare-and-swap
+        The distributed lock is only taken when enabled for this service
         """
         try:
-            # Use distributed lock FIRST to prevent race conditions across servers
-            if self.lock_service:
-                lock = self.lock_service.get_inventory_lock(variant_id, timeout=30)
+            lock = self._get_stock_lock(variant_id)
+            if lock:
                 async with lock:
                     return await self._perform_increment_stock(variant_id, quantity, location_id, order_id, user_id)
-            else:
-                # Fallback to database-only lock if Redis unavailable
-                logger.warning("Redis unavailable, using database fallback", metadata={
-                    "redis_host": "localhost:6379",
-                    "fallback": "database_lock",
-                    "operation": "stock_decrement",
-                    "variant_id": str(variant_id),
-                    "impact": "reduced_performance"
-                })
-                return await self._perform_increment_stock(variant_id, quantity, location_id, order_id, user_id)
+            return await self._perform_increment_stock(variant_id, quantity, location_id, order_id, user_id)
                 
         except Exception as e:
             await self.db.rollback()
@@ -993,73 +967,49 @@ class InventoryService:
         self,
         variant_id: UUID,
         quantity: int,
-        location_id: UUID,
+        location_id: Optional[UUID] = None,
         order_id: Optional[UUID] = None,
         user_id: Optional[UUID] = None
     ) -> Dict[str, Any]:
-        """Internal method to perform stock increment with database lock"""
-        # Get inventory with atomic lock
-        inventory = await Inventory.get_with_lock(self.db, variant_id)
-        
-        if not inventory:
-            raise APIException(
-                status_code=404,
-                message=f"Inventory not found for variant {variant_id}"
-            )
-        
-        # Perform atomic stock update
-        adjustment = await inventory.atomic_update_stock(
+        """Internal method to perform stock increment with an optimistic version check"""
+        from models.inventories import optimistic_stock_update
+
+        result = await optimistic_stock_update(
             db=self.db,
+            variant_id=variant_id,
             quantity_change=quantity,
             reason="order_cancelled",
             user_id=user_id,
-            notes=f"Stock restored from cancelled order {order_id}" if order_id else "Stock restored from cancellation"
+            notes=f"Stock restored from cancelled order {order_id}" if order_id else "Stock restored from cancellation",
+            location_id=location_id,
+            max_retries=settings.INVENTORY_CAS_MAX_RETRIES
         )
         
+        self._queue_availability_sync(result["product_id"])
         await self.db.commit()
         
         logger.info(f"Atomically incremented stock for variant {variant_id}: +{quantity}")
-        
-        # Queue product availability sync as background task (don't wait for it)
-        try:
-            from core.arq_worker import enqueue_sync_product_availability
-            
-            # Get the variant to find its product
-            variant_result = await self.db.execute(
-                select(ProductVariant).where(ProductVariant.id == variant_id)
-            )
-            variant = variant_result.scalar_one_or_none()
-            
-            if variant:
-                # Queue sync as background task - don't block the cancellation response
-                await enqueue_sync_product_availability(str(variant.product_id))
-                logger.info(f"Queued inventory sync", metadata={
-    "product_id": str(variant.product_id)
-})
-        except Exception as sync_error:
-            logger.warning(f"Failed to queue product availability sync: {sync_error}")
-            # Don't fail the entire operation if queueing fails
-        
-            return {
+
+        return {
             "success": True,
             "message": "Stock incremented successfully",
-            "inventory_id": str(inventory.id),
-            "previous_quantity": inventory.quantity_available - quantity,
-            "new_quantity": inventory.quantity_available,
+            "inventory_id": str(result["inventory_id"]),
+            "previous_quantity": result["previous_quantity"],
+            "new_quantity": result["new_quantity"],
             "quantity_incremented": quantity,
-            "adjustment_id": str(adjustment.id) if adjustment else None
+            "adjustment_id": str(result["adjustment_id"])
         }
-            
-        except APIException:
-            await self.db.rollback()
-            raise
-        except Exception as e:
-            await self.db.rollback()
-            logger.error(f"Failed to increment stock atomically: {e}")
-            raise APIException(
-                status_code=500,
-                message=f"Failed to increment stock: {str(e)}"
-            )
+
+    def _queue_availability_sync(self, product_id: Optional[UUID]):
+        """
+        Mark the product for the debounced availability sync via the outbox, before the stock change commits
+        Done even with the inventory change feed on, whose events are published best effort after commit
+        """
+        if not product_id:
+            return
+        from services.outbox import add_outbox_event, PRODUCT_AVAILABILITY_CHANGED
+
+        add_outbox_event(self.db, PRODUCT_AVAILABILITY_CHANGED, product_id)
 
     async def bulk_stock_update(
         self,
@@ -1121,57 +1071,123 @@ class InventoryService:
             logger.error(f"Failed to log inventory change: {e}")
             # Don't raise exception as logging failures shouldn't break inventory operations
 
+    def _variant_availability_subquery(self, *conditions):
+        """
+        Derive each variant's availability from its inventory row:
+        out_of_stock at zero (or no inventory), limited at or below the low-stock threshold
+        """
+        return (
+            select(
+                ProductVariant.id.label("variant_id"),
+                case(
+                    (func.coalesce(Inventory.quantity_available, 0) <= 0, "out_of_stock"),
+                    (Inventory.quantity_available <= Inventory.low_stock_threshold, "limited"),
+                    else_="available"
+                ).label("new_status")
+            )
+            .select_from(ProductVariant)
+            .outerjoin(Inventory, Inventory.variant_id == ProductVariant.id)
+            .where(*conditions)
+            .subquery()
+        )
+
+    async def _apply_variant_availability(self, *conditions) -> List[Any]:
+        """
+        Run the set-based UPDATE product_variants ... FROM (inventory status) for the
+        variants matching conditions; only rows whose status actually changes are written
+        Returns (product_id, availability_status) for every changed variant
+        """
+        stock = self._variant_availability_subquery(*conditions)
+        stmt = (
+            update(ProductVariant)
+            .where(
+                ProductVariant.id == stock.c.variant_id,
+                ProductVariant.availability_status != stock.c.new_status
+            )
+            .values(availability_status=stock.c.new_status)
+            .returning(ProductVariant.product_id, ProductVariant.availability_status)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        return result.all()
+
+    async def sync_products_availability(self, product_ids: List[UUID]) -> Dict[str, Any]:
+        """
+        Sync variant availability_status for many products with one UPDATE statement
+        Used by the debounced availability pipeline to flush a whole batch of dirty products
+        """
+        if not product_ids:
+            return {"success": True, "product_count": 0, "updated_count": 0, "went_out_of_stock": 0}
+
+        try:
+            changed = await self._apply_variant_availability(ProductVariant.product_id.in_(product_ids))
+            await self.db.commit()
+
+            went_out_of_stock = sum(1 for row in changed if row.availability_status == "out_of_stock")
+
+            return {
+                "success": True,
+                "product_count": len(product_ids),
+                "updated_count": len(changed),
+                "went_out_of_stock": went_out_of_stock,
+                "changed_product_ids": sorted({str(row.product_id) for row in changed})
+            }
+
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Failed to sync availability for {len(product_ids)} products: {e}")
+            return {
+                "success": False,
+                "message": f"Failed to sync availability status: {str(e)}"
+            }
+
     async def sync_product_availability_status(self, product_id: UUID) -> Dict[str, Any]:
         """
-        Sync product availability_status based on its variants' inventory levels
+        Sync availability_status of a product's variants based on their inventory levels
         
-        Checks all variants of a product and updates the product's availability_status:
-        - "available" if at least one variant has stock > 0
-        - "out_of_stock" if all variants have stock <= 0
-        - "pre_order" if product has pre_order flag set
+        The status lives on product_variants; Product.availability_status is derived from it:
+        - "available" if the variant has stock above its low-stock threshold
+        - "limited" if the variant has stock at or below its low-stock threshold
+        - "out_of_stock" if the variant has no stock or no inventory record
         """
         try:
-            # Get product with variants and inventory
-            product_result = await self.db.execute(
-                select(Product)
-                .where(Product.id == product_id)
-                .options(selectinload(Product.variants).selectinload(ProductVariant.inventory))
-            )
-            product = product_result.scalar_one_or_none()
-            
-            if not product:
+            product_exists = await self.db.scalar(select(Product.id).where(Product.id == product_id))
+            if not product_exists:
                 return {
                     "success": False,
                     "message": f"Product {product_id} not found"
                 }
-            
-            # Check if any variant has stock
-            has_stock = False
-            total_stock = 0
-            
-            for variant in product.variants or []:
-                if variant.inventory and variant.inventory.quantity_available > 0:
-                    has_stock = True
-                    total_stock += variant.inventory.quantity_available
-            
-            # Update product availability status
-            old_status = product.availability_status
-            if has_stock:
-                product.availability_status = "available"
-            else:
-                product.availability_status = "out_of_stock"
-            
-            await self.db.commit()
-            
-            logger.info(f"Synced product {product_id} availability: {old_status} → {product.availability_status} (total stock: {total_stock})")
-            
+
+            # Product-level status before the sync, derived from the stored variant statuses
+            before = (await self.db.execute(
+                select(
+                    func.count(ProductVariant.id).label("variant_count"),
+                    func.count(ProductVariant.id).filter(ProductVariant.availability_status != "out_of_stock").label("in_stock")
+                ).where(ProductVariant.product_id == product_id)
+            )).one()
+            old_status = "available" if before.in_stock else "out_of_stock"
+
+            result = await self.sync_products_availability([product_id])
+            if not result["success"]:
+                return result
+
+            total_stock = await self.db.scalar(
+                select(func.coalesce(func.sum(Inventory.quantity_available), 0))
+                .join(ProductVariant, Inventory.variant_id == ProductVariant.id)
+                .where(ProductVariant.product_id == product_id)
+            )
+            new_status = "available" if total_stock > 0 else "out_of_stock"
+
+            logger.info(f"Synced product {product_id} availability: {old_status} → {new_status} (total stock: {total_stock}, variants updated: {result['updated_count']})")
+
             return {
                 "success": True,
                 "product_id": str(product_id),
                 "old_status": old_status,
-                "new_status": product.availability_status,
+                "new_status": new_status,
                 "total_stock": total_stock,
-                "variant_count": len(product.variants or [])
+                "variant_count": before.variant_count,
+                "updated_variants": result["updated_count"]
             }
             
         except Exception as e:
@@ -1181,57 +1197,53 @@ class InventoryService:
                 "message": f"Failed to sync availability status: {str(e)}"
             }
 
-    async def sync_all_products_availability(self) -> Dict[str, Any]:
+    async def sync_all_products_availability(self, chunk_size: int = 1000) -> Dict[str, Any]:
         """
         Sync availability_status for all products based on their inventory
+        Runs the set-based variant update per product-id range, committing each
+        chunk so no single transaction holds row locks across the whole catalogue
         Returns summary of changes made
         """
+        from core.db import iter_id_ranges, id_range_conditions
+
         try:
-            # Get all products with variants and inventory
-            products_result = await self.db.execute(
-                select(Product)
-                .options(selectinload(Product.variants).selectinload(ProductVariant.inventory))
-            )
-            products = products_result.scalars().all()
-            
+            total_products = await self.db.scalar(select(func.count(Product.id))) or 0
+
             updated_count = 0
-            still_in_stock = 0
             went_out_of_stock = 0
-            
-            for product in products:
-                total_stock = 0
-                for variant in product.variants or []:
-                    if variant.inventory:
-                        total_stock += variant.inventory.quantity_available
-                
-                old_status = product.availability_status
-                new_status = "available" if total_stock > 0 else "out_of_stock"
-                
-                if old_status != new_status:
-                    product.availability_status = new_status
-                    updated_count += 1
-                    
-                    if new_status == "out_of_stock":
-                        went_out_of_stock += 1
-                    else:
-                        still_in_stock += 1
-                    
-                    logger.info(f"Updated product {product.id} availability: {old_status} → {new_status}")
-            
-            await self.db.commit()
-            
+            changed_products = set()
+            chunks = 0
+
+            async for lower, upper in iter_id_ranges(self.db, Product.id, chunk_size):
+                changed = await self._apply_variant_availability(
+                    *id_range_conditions(ProductVariant.product_id, lower, upper)
+                )
+                await self.db.commit()
+                chunks += 1
+
+                updated_count += len(changed)
+                went_out_of_stock += sum(1 for row in changed if row.availability_status == "out_of_stock")
+                changed_products.update(row.product_id for row in changed)
+
+            back_in_stock = updated_count - went_out_of_stock
+
+            logger.info(f"Synced availability for {total_products} products in {chunks} chunks: {updated_count} variants changed")
+
             return {
                 "success": True,
-                "total_products": len(products),
+                "total_products": total_products,
                 "updated_count": updated_count,
+                "updated_products": len(changed_products),
                 "went_out_of_stock": went_out_of_stock,
-                "back_in_stock": still_in_stock,
-                "message": f"Synced {updated_count} products ({went_out_of_stock} went out of stock, {still_in_stock} back in stock)"
+                "back_in_stock": back_in_stock,
+                "chunks": chunks,
+                "message": f"Synced {updated_count} variants across {len(changed_products)} products ({went_out_of_stock} went out of stock, {back_in_stock} back in stock or limited)"
             }
             
         except Exception as e:
+            await self.db.rollback()
             logger.error(f"Failed to sync all products availability: {e}")
             return {
                 "success": False,
                 "message": f"Failed to sync all products: {str(e)}"
-            }
\ No newline at end of file
+            }
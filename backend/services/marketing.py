@@ -0,0 +1,417 @@
+"""
+Marketing fan-out
+Back-in-stock, price-drop and cart-abandonment emails. Each campaign runs as one worker
+job that pages its audience by keyset (users.id > last id), so memory stays flat however
+many recipients match. Every page goes through the per-user frequency caps in Redis and
+the survivors are handed to the batched Mailjet sender as bulk sends. The cursor is saved
+after each page, so a retried job resumes where it stopped instead of mailing the first
+pages again.
+
+Triggers:
+- back in stock: the inventory change feed, when a variant goes from 0 available to more
+- price drop: VariantTrackingService.handle_variant_price_change and product updates
+- cart abandonment: an hourly sweep of carts last touched CART_ABANDONMENT_AFTER_HOURS ago
+
+Users who set preferences.marketing_emails to false are never included.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from uuid import UUID
+from markupsafe import escape
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+# Campaign kind -> template and subject
+CAMPAIGNS = {
+    "back_in_stock": {
+        "template": "pre_purchase/back_in_stock.html",
+        "subject": "🎉 Your Favorite Item is Back in Stock!",
+    },
+    "price_drop": {
+        "template": "pre_purchase/price_drop.html",
+        "subject": "💰 Price Drop Alert - Save Now!",
+    },
+    "cart_abandonment": {
+        "template": "pre_purchase/cart_abandonment.html",
+        "subject": "🛒 Forgot Something in Your Cart?",
+    },
+}
+
+# Product campaigns render once; the recipient's name is substituted into this slot
+CUSTOMER_NAME_SLOT = "%%customer_name%%"
+
+# Consumer group on the inventory change feed used to detect restocks
+STOCK_FEED_GROUP = "marketing-back-in-stock"
+
+CAMPAIGN_RECORD_TTL = 7 * 86400
+DAILY_COUNT_TTL = 2 * 86400
+
+
+async def _get_redis(redis=None):
+    if redis is not None:
+        return redis
+    from core.cache import get_redis
+    return await get_redis()
+
+
+async def get_campaign(campaign_id: str) -> Optional[Dict[str, Any]]:
+    from core.cache import RedisService, RedisKeyManager
+
+    return await RedisService().get_data(RedisKeyManager.marketing_campaign_key(campaign_id))
+
+
+async def store_campaign(record: Dict[str, Any]):
+    from core.cache import RedisService, RedisKeyManager
+
+    await RedisService().set_with_expiry(
+        RedisKeyManager.marketing_campaign_key(record["campaign_id"]),
+        record,
+        CAMPAIGN_RECORD_TTL
+    )
+
+
+async def detect_restocks(changes: List[Dict[str, Any]], redis=None) -> List[Dict[str, Any]]:
+    """
+    Changes from the inventory feed that took a variant from 0 available to more
+    The last seen level per variant is kept in one Redis hash; a variant seen for the
+    first time only records its level, since nobody can have been waiting on it.
+    """
+    from core.cache import RedisKeyManager
+
+    if not changes:
+        return []
+    redis = await _get_redis(redis)
+    key = RedisKeyManager.marketing_stock_levels_key()
+    variant_ids = list({change["variant_id"] for change in changes})
+    previous = dict(zip(variant_ids, await redis.hmget(key, variant_ids)))
+
+    restocked = {}
+    levels = {}
+    for change in changes:
+        variant_id = change["variant_id"]
+        last = previous.get(variant_id)
+        if last is not None and int(last) <= 0 < change["new_available"]:
+            restocked[variant_id] = change
+        previous[variant_id] = change["new_available"]
+        levels[variant_id] = change["new_available"]
+
+    await redis.hset(key, mapping=levels)
+    return list(restocked.values())
+
+
+async def notify_price_drop(variant_id: Any, old_price: Optional[float], new_price: Optional[float]):
+    """
+    Start a price-drop campaign if the effective price fell by at least
+    MARKETING_MIN_PRICE_DROP_PERCENT; failures are logged, never raised
+    """
+    if not settings.MARKETING_EMAILS_ENABLED or not old_price or new_price is None:
+        return
+    if new_price >= old_price * (1 - settings.MARKETING_MIN_PRICE_DROP_PERCENT / 100):
+        return
+    try:
+        from core.arq_worker import enqueue_marketing_campaign
+        await enqueue_marketing_campaign(
+            "price_drop",
+            f"price_drop:{variant_id}:{new_price:.2f}",
+            variant_id=str(variant_id),
+            old_price=old_price,
+            new_price=new_price
+        )
+    except Exception as e:
+        logger.warning(f"Failed to enqueue price drop campaign", metadata={"variant_id": str(variant_id)}, exception=e)
+
+
+def cart_abandonment_window(now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    The hour of carts that became abandoned since the previous sweep
+    Each cart falls in exactly one window, so it gets at most one reminder per idle spell.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+    idle_before = now - timedelta(hours=settings.CART_ABANDONMENT_AFTER_HOURS)
+    return {
+        "idle_since": (idle_before - timedelta(hours=1)).isoformat(),
+        "idle_before": idle_before.isoformat(),
+    }
+
+
+def _opted_in():
+    from models.user import User
+    return func.coalesce(User.preferences["marketing_emails"].as_string(), "true") != "false"
+
+
+def _money(value: Optional[float]) -> str:
+    return f"${value:.2f}" if value is not None else ""
+
+
+class MarketingService:
+    """Runs one campaign: audience pages -> frequency caps -> render -> bulk send"""
+
+    def __init__(self, db: AsyncSession, redis=None):
+        self.db = db
+        self.redis = redis
+        self.page_size = settings.MARKETING_AUDIENCE_PAGE_SIZE
+
+    async def run_campaign(self, kind: str, campaign_id: str, **params) -> Dict[str, Any]:
+        if kind not in CAMPAIGNS:
+            raise ValueError(f"Unknown campaign '{kind}'")
+        self.redis = await _get_redis(self.redis)
+
+        record = await get_campaign(campaign_id) or {
+            "campaign_id": campaign_id,
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "cursor": None,
+            "recipients": 0,
+            "sent": 0,
+            "rejected": 0,
+            "capped": 0,
+            "started_at": None,
+            "completed_at": None,
+        }
+        if record["status"] == "completed":
+            return record
+        record.update(status="running", started_at=record["started_at"] or datetime.now(timezone.utc).isoformat())
+
+        if kind == "cart_abandonment":
+            pages = self._cart_abandonment_pages(record, **params)
+        else:
+            pages = self._product_pages(kind, record, **params)
+
+        async for messages in pages:
+            if messages:
+                results = await self._sender().send_bulk(messages)
+                sent = sum(1 for result in results if result["status"] == "success")
+                record["sent"] += sent
+                record["rejected"] += len(results) - sent
+            await store_campaign(record)
+
+        record.update(status="completed", completed_at=datetime.now(timezone.utc).isoformat())
+        await store_campaign(record)
+        logger.info(
+            f"Campaign {campaign_id} completed",
+            metadata={key: record[key] for key in ("kind", "recipients", "sent", "rejected", "capped")}
+        )
+        return record
+
+    @staticmethod
+    def _sender():
+        from core.utils.messages.mailjet import get_mail_sender
+        return get_mail_sender()
+
+    async def _admit(self, kind: str, recipients: Sequence[Any]) -> List[Any]:
+        """
+        Recipients allowed another email: no campaign of this kind within the cooldown and
+        under the daily cap. Two pipelined round trips per page; users turned away by the
+        daily cap get their cooldown back since nothing was sent to them.
+        """
+        from core.cache import RedisKeyManager
+
+        if not recipients:
+            return []
+        cooldown = settings.MARKETING_COOLDOWN_HOURS * 3600
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for recipient in recipients:
+                pipe.set(RedisKeyManager.marketing_cooldown_key(str(recipient.id), kind), 1, nx=True, ex=cooldown)
+            fresh = await pipe.execute()
+        candidates = [recipient for recipient, ok in zip(recipients, fresh) if ok]
+        if not candidates:
+            return []
+
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for recipient in candidates:
+                key = RedisKeyManager.marketing_daily_count_key(str(recipient.id), day)
+                pipe.incr(key)
+                pipe.expire(key, DAILY_COUNT_TTL)
+            counts = (await pipe.execute())[0::2]
+
+        admitted = []
+        over_cap = []
+        for recipient, count in zip(candidates, counts):
+            (admitted if count <= settings.MARKETING_DAILY_CAP else over_cap).append(recipient)
+        if over_cap:
+            await self.redis.delete(*[RedisKeyManager.marketing_cooldown_key(str(r.id), kind) for r in over_cap])
+        return admitted
+
+    def _advance(self, record: Dict[str, Any], page: Sequence[Any], admitted: Sequence[Any]):
+        record["cursor"] = str(page[-1].id)
+        record["recipients"] += len(page)
+        record["capped"] += len(page) - len(admitted)
+
+    async def _product_pages(self, kind: str, record: Dict[str, Any], variant_id: str, **prices):
+        """Messages per audience page for a back-in-stock or price-drop campaign"""
+        from models.product import ProductVariant
+        from core.utils.templating import get_message_env
+        from core.utils.messages.email import email_context
+        from core.utils.messages.mailjet import build_message
+
+        variant = (await self.db.execute(
+            select(ProductVariant)
+            .options(selectinload(ProductVariant.product))
+            .where(ProductVariant.id == UUID(variant_id))
+        )).scalar_one_or_none()
+        if variant is None or not variant.is_active or variant.product is None:
+            logger.info(f"Campaign {record['campaign_id']} skipped, variant unavailable", metadata={"variant_id": variant_id})
+            return
+
+        product = variant.product
+        image = variant.primary_image
+        context = {
+            "customer_name": CUSTOMER_NAME_SLOT,
+            "product_name": f"{product.name} - {variant.name}" if variant.name else product.name,
+            "product_description": product.description or "",
+            "product_price": _money(variant.current_price),
+            "old_price": _money(prices.get("old_price")),
+            "new_price": _money(prices.get("new_price", variant.current_price)),
+            "product_url": f"{settings.FRONTEND_URL}/products/{product.slug}",
+            "product_image_url": image.url if image else None,
+            "unsubscribe_url": f"{settings.FRONTEND_URL}/unsubscribe",
+            "privacy_policy_url": f"{settings.FRONTEND_URL}/privacy",
+        }
+        # Rendered once for the whole audience; only the greeting differs per recipient
+        html = get_message_env().get_template(CAMPAIGNS[kind]["template"]).render(**email_context(context))
+        subject = CAMPAIGNS[kind]["subject"]
+        product_id, variant_uuid = product.id, variant.id
+
+        after = UUID(record["cursor"]) if record["cursor"] else None
+        while True:
+            page = await self._product_audience_page(variant_uuid, product_id, after)
+            if not page:
+                return
+            admitted = await self._admit(kind, page)
+            self._advance(record, page, admitted)
+            yield [
+                build_message(
+                    to_email=recipient.email,
+                    subject=subject,
+                    html_body=html.replace(CUSTOMER_NAME_SLOT, str(escape(recipient.firstname or "there"))),
+                    to_name=recipient.firstname or "",
+                    custom_id=f"{record['campaign_id']}:{recipient.id}"
+                )
+                for recipient in admitted
+            ]
+            if len(page) < self.page_size:
+                return
+            after = page[-1].id
+
+    async def _product_audience_page(self, variant_id: UUID, product_id: UUID, after: Optional[UUID]) -> Sequence[Any]:
+        """
+        Next page of active users who wishlisted the variant (or the whole product) or have
+        it in their cart, ordered by id
+        """
+        from models.user import User
+        from models.wishlist import Wishlist, WishlistItem
+        from models.cart import Cart, CartItem
+
+        wishlisted = (
+            select(WishlistItem.id)
+            .join(Wishlist, Wishlist.id == WishlistItem.wishlist_id)
+            .where(
+                Wishlist.user_id == User.id,
+                WishlistItem.product_id == product_id,
+                or_(WishlistItem.variant_id == variant_id, WishlistItem.variant_id.is_(None))
+            )
+            .exists()
+        )
+        in_cart = (
+            select(CartItem.id)
+            .join(Cart, Cart.id == CartItem.cart_id)
+            .where(Cart.user_id == User.id, CartItem.variant_id == variant_id)
+            .exists()
+        )
+        query = select(User.id, User.email, User.firstname).where(
+            User.is_active == True,
+            _opted_in(),
+            or_(wishlisted, in_cart)
+        )
+        if after is not None:
+            query = query.where(User.id > after)
+        result = await self.db.execute(query.order_by(User.id).limit(self.page_size))
+        return result.all()
+
+    async def _cart_abandonment_pages(self, record: Dict[str, Any], idle_since: str, idle_before: str):
+        """Messages per page of carts last touched inside [idle_since, idle_before)"""
+        from models.user import User
+        from models.cart import Cart, CartItem
+        from models.product import ProductVariant
+        from core.utils.templating import get_message_env
+        from core.utils.messages.email import email_context
+        from core.utils.messages.mailjet import build_message
+
+        template = get_message_env().get_template(CAMPAIGNS["cart_abandonment"]["template"])
+        subject = CAMPAIGNS["cart_abandonment"]["subject"]
+        since, before = datetime.fromisoformat(idle_since), datetime.fromisoformat(idle_before)
+
+        after = UUID(record["cursor"]) if record["cursor"] else None
+        while True:
+            # Keyset over the unique carts.user_id index; the window is filtered on the way
+            query = (
+                select(User.id, User.email, User.firstname, Cart.id.label("cart_id"))
+                .join(Cart, Cart.user_id == User.id)
+                .where(
+                    User.is_active == True,
+                    _opted_in(),
+                    and_(Cart.updated_at >= since, Cart.updated_at < before),
+                    select(CartItem.id).where(CartItem.cart_id == Cart.id).exists()
+                )
+            )
+            if after is not None:
+                query = query.where(Cart.user_id > after)
+            page = (await self.db.execute(query.order_by(Cart.user_id).limit(self.page_size))).all()
+            if not page:
+                return
+
+            admitted = await self._admit("cart_abandonment", page)
+            self._advance(record, page, admitted)
+
+            items_by_cart: Dict[UUID, List[Any]] = {}
+            if admitted:
+                items = (await self.db.execute(
+                    select(CartItem)
+                    .options(selectinload(CartItem.variant).selectinload(ProductVariant.product))
+                    .where(CartItem.cart_id.in_([recipient.cart_id for recipient in admitted]))
+                )).scalars().all()
+                for item in items:
+                    items_by_cart.setdefault(item.cart_id, []).append(item)
+
+            messages = []
+            for recipient in admitted:
+                items = items_by_cart.get(recipient.cart_id)
+                if not items:
+                    continue
+                html = template.render(**email_context({
+                    "customer_name": recipient.firstname or "there",
+                    "cart_items": [
+                        {
+                            "name": item.variant.product.name if item.variant and item.variant.product else "Item",
+                            "price": _money(float(item.price_per_unit)),
+                            "quantity": item.quantity,
+                            "image_url": item.variant.primary_image.url if item.variant and item.variant.primary_image else "",
+                        }
+                        for item in items
+                    ],
+                    "cart_total": _money(float(sum(item.total_price for item in items))),
+                    "cart_url": f"{settings.FRONTEND_URL}/cart",
+                    "unsubscribe_url": f"{settings.FRONTEND_URL}/unsubscribe",
+                    "privacy_policy_url": f"{settings.FRONTEND_URL}/privacy",
+                }))
+                messages.append(build_message(
+                    to_email=recipient.email,
+                    subject=subject,
+                    html_body=html,
+                    to_name=recipient.firstname or "",
+                    custom_id=f"{record['campaign_id']}:{recipient.id}"
+                ))
+
+            # Loaded cart items aren't needed once rendered; keep the identity map from growing
+            self.db.expunge_all()
+            yield messages
+            if len(page) < self.page_size:
+                return
+            after = page[-1].id
@@ -0,0 +1,233 @@
+"""
+Daily/hourly metric rollups
+Orders, revenue and signups are pre-aggregated per UTC bucket into daily_metrics and
+hourly_metrics. The worker recomputes only the most recent buckets (plus a nightly
+reconcile window for late status changes); charts read the rollups with one range query
+and compute only the current, still-filling bucket live.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import select, func, cast, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.analytics import DailyMetric, HourlyMetric
+from models.orders import Order, OrderStatus
+from models.user import User
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+PAID_ORDER_STATUSES = (
+    OrderStatus.CONFIRMED,
+    OrderStatus.PROCESSING,
+    OrderStatus.SHIPPED,
+    OrderStatus.DELIVERED,
+)
+
+# Buckets recomputed on every run, and how far back a rebuild / nightly reconcile reaches
+RECENT_DAYS = 2
+RECENT_HOURS = 3
+RECONCILE_DAYS = 35
+HOURLY_BACKFILL_DAYS = 30
+
+UNITS = {
+    "day": (DailyMetric, timedelta(days=1)),
+    "hour": (HourlyMetric, timedelta(hours=1)),
+}
+
+Bucket = Union[date, datetime]
+
+
+def floor_bucket(unit: str, moment: datetime) -> datetime:
+    """Start of the UTC bucket containing moment"""
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    if unit == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_key(unit: str, start: datetime) -> Bucket:
+    """Value stored in the rollup's bucket column for a bucket starting at start"""
+    return start.date() if unit == "day" else start
+
+
+def iter_buckets(unit: str, start: datetime, end: datetime) -> List[datetime]:
+    """Bucket starts from the bucket containing start through the one containing end"""
+    step = UNITS[unit][1]
+    current, last = floor_bucket(unit, start), floor_bucket(unit, end)
+    buckets = []
+    while current <= last:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def empty_metrics(bucket: Bucket) -> Dict[str, Any]:
+    return {
+        "bucket": bucket,
+        "order_count": 0,
+        "paid_order_count": 0,
+        "revenue": 0.0,
+        "new_users": 0,
+        "status_breakdown": {},
+    }
+
+
+def bucket_revenue(metrics: Dict[str, Any], status: Optional[str] = None) -> float:
+    """Paid revenue for a bucket, optionally narrowed to one (paid) order status"""
+    if not status:
+        return float(metrics["revenue"])
+    status = status.upper()
+    if status not in {s.name for s in PAID_ORDER_STATUSES}:
+        return 0.0
+    return float(metrics["status_breakdown"].get(status, {}).get("revenue", 0.0))
+
+
+class MetricsRollupService:
+    """Maintains and reads the daily/hourly rollup tables"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def _bucket_column(self, unit: str, column):
+        truncated = func.date_trunc(unit, func.timezone("UTC", column))
+        if unit == "day":
+            return cast(truncated, Date)
+        return func.timezone("UTC", truncated)
+
+    async def aggregate(self, unit: str, start: datetime, end: datetime) -> Dict[Bucket, Dict[str, Any]]:
+        """Aggregate [start, end) straight from orders and users - two grouped range scans"""
+        order_bucket = self._bucket_column(unit, Order.created_at).label("bucket")
+        order_rows = await self.db.execute(
+            select(
+                order_bucket,
+                Order.order_status,
+                func.count(Order.id),
+                func.coalesce(func.sum(Order.total_amount), 0)
+            ).where(
+                Order.created_at >= start,
+                Order.created_at < end
+            ).group_by(order_bucket, Order.order_status)
+        )
+
+        user_bucket = self._bucket_column(unit, User.created_at).label("bucket")
+        user_rows = await self.db.execute(
+            select(user_bucket, func.count(User.id)).where(
+                User.created_at >= start,
+                User.created_at < end,
+                User.role != 'admin'
+            ).group_by(user_bucket)
+        )
+
+        metrics: Dict[Bucket, Dict[str, Any]] = {}
+        for bucket, order_status, count, revenue in order_rows.all():
+            entry = metrics.setdefault(bucket, empty_metrics(bucket))
+            entry["order_count"] += count
+            entry["status_breakdown"][order_status.name] = {"orders": count, "revenue": float(revenue)}
+            if order_status in PAID_ORDER_STATUSES:
+                entry["paid_order_count"] += count
+                entry["revenue"] += float(revenue)
+
+        for bucket, count in user_rows.all():
+            metrics.setdefault(bucket, empty_metrics(bucket))["new_users"] = count
+
+        return metrics
+
+    async def refresh(self, unit: str, start: datetime, end: datetime) -> int:
+        """Recompute every bucket between start and end (inclusive) and upsert it, zeros included"""
+        model, step = UNITS[unit]
+        buckets = iter_buckets(unit, start, end)
+        if not buckets:
+            return 0
+
+        aggregated = await self.aggregate(unit, buckets[0], buckets[-1] + step)
+        now = datetime.now(timezone.utc)
+        rows = [
+            {**aggregated.get(bucket_key(unit, b), empty_metrics(bucket_key(unit, b))), "computed_at": now}
+            for b in buckets
+        ]
+
+        stmt = pg_insert(model)
+        await self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["bucket"],
+                set_={
+                    "order_count": stmt.excluded.order_count,
+                    "paid_order_count": stmt.excluded.paid_order_count,
+                    "revenue": stmt.excluded.revenue,
+                    "new_users": stmt.excluded.new_users,
+                    "status_breakdown": stmt.excluded.status_breakdown,
+                    "computed_at": stmt.excluded.computed_at,
+                    "updated_at": now,
+                }
+            ),
+            rows
+        )
+        return len(rows)
+
+    async def _earliest_activity(self) -> Optional[datetime]:
+        first_order = await self.db.scalar(select(func.min(Order.created_at)))
+        first_user = await self.db.scalar(select(func.min(User.created_at)))
+        candidates = [moment for moment in (first_order, first_user) if moment]
+        return min(candidates) if candidates else None
+
+    async def refresh_recent(self, reconcile: bool = False) -> Dict[str, Any]:
+        """
+        Recompute the trailing buckets of both rollups and commit
+        Empty tables are backfilled first; reconcile widens the daily window to catch
+        status changes on older orders (cancellations, refunds).
+        """
+        now = datetime.now(timezone.utc)
+        daily_start = floor_bucket("day", now) - timedelta(days=RECONCILE_DAYS if reconcile else RECENT_DAYS)
+        hourly_start = floor_bucket("hour", now) - timedelta(hours=RECENT_HOURS)
+
+        if not await self.db.scalar(select(DailyMetric.id).limit(1)):
+            earliest = await self._earliest_activity()
+            if earliest:
+                daily_start = min(daily_start, earliest)
+        if not await self.db.scalar(select(HourlyMetric.id).limit(1)):
+            hourly_start = floor_bucket("hour", now) - timedelta(days=HOURLY_BACKFILL_DAYS)
+
+        daily_count = await self.refresh("day", daily_start, now)
+        hourly_count = await self.refresh("hour", hourly_start, now)
+        await self.db.commit()
+
+        return {"daily_buckets": daily_count, "hourly_buckets": hourly_count}
+
+    async def get_series(self, unit: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """
+        One entry per bucket from start through end
+        Closed buckets come from the rollup in a single range query; the current bucket is
+        computed live so charts are never behind, and missing buckets are zero-filled.
+        """
+        model, step = UNITS[unit]
+        buckets = iter_buckets(unit, start, end)
+        if not buckets:
+            return []
+
+        current = floor_bucket(unit, datetime.now(timezone.utc))
+        first_key, last_key = bucket_key(unit, buckets[0]), bucket_key(unit, buckets[-1])
+
+        result = await self.db.execute(
+            select(model).where(
+                model.bucket >= first_key,
+                model.bucket <= last_key,
+                model.bucket < bucket_key(unit, current)
+            )
+        )
+        series: Dict[Bucket, Dict[str, Any]] = {
+            row.bucket: {
+                "bucket": row.bucket,
+                "order_count": row.order_count,
+                "paid_order_count": row.paid_order_count,
+                "revenue": row.revenue,
+                "new_users": row.new_users,
+                "status_breakdown": row.status_breakdown or {},
+            }
+            for row in result.scalars().all()
+        }
+
+        if buckets[0] <= current <= buckets[-1]:
+            series.update(await self.aggregate(unit, current, current + step))
+
+        return [series.get(bucket_key(unit, b)) or empty_metrics(bucket_key(unit, b)) for b in buckets]
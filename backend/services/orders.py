@@ -1050,6 +1050,7 @@ class OrderService:
 
                     # Payment succeeded - update order status
                     order.status = "confirmed"
+                    order.confirmed_at = order.confirmed_at or datetime.utcnow()
                     order.version += 1  # Optimistic locking increment
                     
                 except Exception as payment_error:
@@ -1084,6 +1085,9 @@ class OrderService:
                 # Clear cart after successful order (validated cart)
                 await cart_service.clear_cart(user_id=user_id)
 
+                # Side effects go to the outbox in this transaction, so they exist iff the order commits
+                await self._add_order_outbox_events(order, user_id, validated_cart_items)
+
                 # Transaction will auto-commit here if no exceptions occurred
                 
             # Refresh order after transaction commit
@@ -1136,13 +1140,12 @@ class OrderService:
                     f.write(f"  Total: ${order.total_amount:.2f}\n\n")
             
             
-            # Send ARQ events with idempotency after successful transaction commit
+            # Nudge the outbox relay; if this fails the scheduled relay still dispatches the events
             try:
-                await self._send_order_events_with_idempotency(order, user_id, validated_cart_items)
+                from core.arq_worker import enqueue_outbox_relay
+                await enqueue_outbox_relay()
             except Exception as arq_error:
-                # Log ARQ errors but don't fail the order
-                logger.error(f"Failed to send order events for order {order.id}: {arq_error}")
-                # Order is still successful even if events fail
+                logger.warning(f"Failed to enqueue outbox relay for order {order.id}: {arq_error}")
                 
         except HTTPException:
             # Re-raise HTTP exceptions (validation errors, payment failures, etc.)
@@ -1857,78 +1860,36 @@ class OrderService:
         full_string = f"{cart_string}|{checkout_details}"
         return hashlib.md5(full_string.encode()).hexdigest()[:16]
 
-    async def _send_order_events_with_idempotency(self, order: Order, user_id: UUID, validated_cart_items: List[Dict[str, Any]]):
+    async def _add_order_outbox_events(self, order: Order, user_id: UUID, validated_cart_items: List[Dict[str, Any]]):
         """
-        Send immutable ARQ events for order creation using new event system.
-        Events are versioned, validated, and idempotent.
+        Record the order's side effects (confirmation email, invoice pre-rendering) in the outbox
+        Must run inside the order transaction; the outbox relay dispatches them after commit.
         """
-        try:
-            from core.arq_worker import enqueue_email, enqueue_notification
-            
-            # Use correlation ID for event tracing
-            correlation_id = str(order.id)
-            
-            # Prepare order items for event
-            order_items = []
-            for item in validated_cart_items:
-                order_items.append({
-                    "product_id": item.get("product_id"),
-                    "variant_id": item["variant_id"],
-                    "quantity": item["quantity"],
-                    "price_per_unit": float(item["backend_price"]),
-                    "total_price": float(item["backend_total"]),
-                    "product_name": item.get("product_name", "")
-                })
-            
-            # Get shipping address for event
-            shipping_address = {}
-            if order.shipping_address:
-                shipping_address = {
-                    "street": order.shipping_address.street,
-                    "city": order.shipping_address.city,
-                    "state": order.shipping_address.state,
-                    "country": order.shipping_address.country,
-                    "postal_code": order.shipping_address.post_code
+        from services.outbox import add_outbox_event, ORDER_CONFIRMATION_EMAIL, ORDER_INVOICE_PREGENERATION
+
+        user = (await self.db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+        if user:
+            add_outbox_event(self.db, ORDER_CONFIRMATION_EMAIL, order.id, {
+                "recipient": user.email,
+                "params": {
+                    "customer_name": user.full_name,
+                    "order_number": order.order_number,
+                    "order_date": datetime.utcnow().strftime("%B %d, %Y"),
+                    "total_amount": float(order.total_amount),
+                    "items": [
+                        {
+                            "name": item.get("product_name", ""),
+                            "quantity": item["quantity"],
+                            "price": float(item["backend_price"])
+                        }
+                        for item in validated_cart_items
+                    ],
+                    "shipping_address": order.shipping_address or {}
                 }
-            
-            # Order created event handled by hybrid task system
-            
-            # Send order confirmation email using ARQ
-            user_result = await self.db.execute(select(User).where(User.id == user_id))
-            user = user_result.scalar_one_or_none()
-            if user:
-                await enqueue_email(
-                    "order_confirmation",
-                    user.email,
-                    order_id=str(order.id),
-                    order_details={
-                        "items": order_items,
-                        "total_amount": float(order.total_amount),
-                        "currency": order.currency,
-                        "shipping_address": shipping_address
-                    }
-                )
-                
-                # Send order notification
-                await enqueue_notification(
-                    str(user_id),
-                    "order_created",
-                    title="Order Confirmed",
-                    message=f"Your order #{order.id} has been confirmed and is being processed.",
-                    data={
-                        "order_id": str(order.id),
-                        "total_amount": float(order.total_amount),
-                        "currency": order.currency
-                    }
-                )
-            
-            # Order payment event handled by hybrid task system
-            
-            logger.info(f"Successfully published order events for order {order.id} using new event system")
-            
-        except Exception as e:
-            logger.error(f"Failed to publish order events using new event system: {e}")
-            raise
+            })
+
+        add_outbox_event(self.db, ORDER_INVOICE_PREGENERATION, order.id)
+
     async def request_refund(
         self, 
         order_id: UUID, 
@@ -2188,71 +2149,27 @@ class OrderService:
                 detail="Failed to create reorder"
             )
 
+    async def _load_order_for_invoice(self, order_id: UUID, user_id: Optional[UUID] = None) -> Optional[Order]:
+        query = select(Order).where(Order.id == order_id).options(
+            selectinload(Order.items).selectinload(OrderItem.variant).selectinload(ProductVariant.product),
+            selectinload(Order.user)
+        )
+        if user_id is not None:
+            query = query.where(Order.user_id == user_id)
+        result = await self.db.execute(query)
+        return result.scalar_one_or_none()
+
     async def generate_invoice(self, order_id: UUID, user_id: UUID) -> Dict[str, Any]:
-        """Generate invoice for an order"""
+        """Generate invoice for an order, served from the invoice cache when unchanged"""
+        from services.invoices import build_invoice_data, get_or_render_invoice
+
         try:
-            # Get order with items
-            query = select(Order).where(
-                and_(Order.id == order_id, Order.user_id == user_id)
-            ).options(
-                selectinload(Order.items).selectinload(OrderItem.variant).selectinload(ProductVariant.product),
-                selectinload(Order.user)
-            )
-            
-            result = await self.db.execute(query)
-            order = result.scalar_one_or_none()
-            
+            order = await self._load_order_for_invoice(order_id, user_id)
             if not order:
                 raise HTTPException(status_code=404, detail="Order not found")
             
-            # Use invoice generator utility
-            from core.utils.invoice_generator import InvoiceGenerator
-            
-            invoice_generator = InvoiceGenerator()
-            
-            # Prepare order data for invoice
-            customer_name = "Customer"
-            if order.user:
-                firstname = order.user.firstname or ""
-                lastname = order.user.lastname or ""
-                customer_name = f"{firstname} {lastname}".strip() or order.user.email or "Customer"
-            
-            order_data = {
-                "order_id": str(order.id),
-                "order_number": order.order_number,
-                "order_date": order.created_at,
-                "customer": {
-                    "name": customer_name,
-                    "email": order.user.email if order.user else "N/A",
-                    "phone": order.user.phone if order.user and order.user.phone else None
-                },
-                "billing_address": order.billing_address,
-                "shipping_address": order.shipping_address,
-                "items": [
-                    {
-                        "name": item.variant.product.name if item.variant and item.variant.product else "Unknown Product",
-                        "variant_name": item.variant.name if item.variant else "",
-                        "quantity": item.quantity,
-                        "price": item.price_per_unit,
-                        "total": item.total_price
-                    }
-                    for item in order.items
-                ],
-                "subtotal": order.subtotal,
-                "tax_amount": order.tax_amount,
-                # Model uses `shipping_cost` (renamed) — fall back if legacy attribute exists
-                "shipping_amount": getattr(order, 'shipping_cost', getattr(order, 'shipping_amount', 0.0)),
-                # discount_amount may be missing on the model for some records — default to 0.0
-                "discount_amount": getattr(order, 'discount_amount', 0.0),
-                "total_amount": order.total_amount,
-                "currency": order.currency,
-                "payment_status": order.payment_status
-            }
-            
-            # Generate invoice
-            invoice_result = await invoice_generator.generate_invoice(order_data)
-            
-            return invoice_result
+            order_data = build_invoice_data(order)
+            return await get_or_render_invoice(order_data)
             
         except HTTPException:
             raise
@@ -2264,6 +2181,15 @@ class OrderService:
                 detail=f"Failed to generate invoice: {str(e)}"
             )
 
+    async def pregenerate_invoice(self, order_id: UUID) -> Dict[str, Any]:
+        """Render a confirmed order's invoice into the cache ahead of the first download"""
+        from services.invoices import build_invoice_data, get_or_render_invoice
+
+        order = await self._load_order_for_invoice(order_id)
+        if not order:
+            raise ValueError(f"Order {order_id} not found")
+        return await get_or_render_invoice(build_invoice_data(order), wait=True)
+
     async def add_order_note(self, order_id: UUID, user_id: UUID, note: str) -> Dict[str, Any]:
         """Add a customer note to an order"""
         try:
@@ -0,0 +1,166 @@
+"""
+Transactional outbox
+Side effects of a write (confirmation emails, invoice pre-rendering, availability syncs)
+are recorded as outbox rows in the write's own transaction instead of being enqueued
+inline after commit, where a crash or a Redis hiccup between the two would lose them.
+The relay reads undispatched rows with FOR UPDATE SKIP LOCKED, so any number of relays
+can run side by side, hands each batch to ARQ/Redis grouped by event type, and stamps
+the rows in one UPDATE.
+
+Delivery is at-least-once: a relay that dies after dispatching but before committing
+leaves its rows to be sent again. ARQ jobs get deterministic job ids (outbox row id,
+invoice:{order_id}) so a re-sent job is dropped while the first one is queued or its
+result is kept, and the availability dirty set is idempotent anyway.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import select, update, delete, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.logging import get_structured_logger
+from models.outbox import OutboxEvent
+
+logger = get_structured_logger(__name__)
+
+OUTBOX_BATCH_SIZE = 200
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_RETENTION_DAYS = 7
+
+# Event types
+ORDER_CONFIRMATION_EMAIL = "order.confirmation_email"
+ORDER_INVOICE_PREGENERATION = "order.invoice_pregeneration"
+PRODUCT_AVAILABILITY_CHANGED = "product.availability_changed"
+
+
+def add_outbox_event(
+    db: AsyncSession,
+    event_type: str,
+    aggregate_id: Any,
+    payload: Optional[Dict[str, Any]] = None
+) -> OutboxEvent:
+    """
+    Record a side effect in the caller's transaction; it's dispatched once that commits
+    payload must be JSON-serialisable.
+    """
+    event = OutboxEvent(event_type=event_type, aggregate_id=str(aggregate_id), payload=payload or {})
+    db.add(event)
+    return event
+
+
+async def _dispatch_confirmation_emails(pool, events: List[Any]):
+    await _enqueue_all(pool, [
+        (
+            'send_email_task',
+            ("order_confirmation", event.payload["recipient"]),
+            {"_job_id": f"outbox:{event.id}", **event.payload.get("params", {})}
+        )
+        for event in events
+    ])
+
+
+async def _dispatch_invoice_pregeneration(pool, events: List[Any]):
+    await _enqueue_all(pool, [
+        ('pregenerate_invoice_task', (event.aggregate_id,), {"_job_id": f"invoice:{event.aggregate_id}"})
+        for event in events
+    ])
+
+
+async def _dispatch_availability_changes(pool, events: List[Any]):
+    from core.cache import RedisKeyManager
+
+    # One SADD for the whole batch; drain_product_availability_task picks them up
+    await pool.sadd(RedisKeyManager.availability_dirty_key(), *{event.aggregate_id for event in events})
+
+
+async def _enqueue_all(pool, jobs: List[tuple]):
+    """Enqueue a batch of (function, args, kwargs) jobs concurrently over the pool"""
+    await asyncio.gather(*(pool.enqueue_job(function, *args, **kwargs) for function, args, kwargs in jobs))
+
+
+OUTBOX_DISPATCHERS: Dict[str, Callable[[Any, List[Any]], Awaitable[None]]] = {
+    ORDER_CONFIRMATION_EMAIL: _dispatch_confirmation_emails,
+    ORDER_INVOICE_PREGENERATION: _dispatch_invoice_pregeneration,
+    PRODUCT_AVAILABILITY_CHANGED: _dispatch_availability_changes,
+}
+
+
+async def relay_outbox(db: AsyncSession, pool, batch_size: int = OUTBOX_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Dispatch one batch of undispatched outbox rows, oldest first
+    A failing event type only holds back its own rows: they count an attempt and are
+    retried on the next run, until OUTBOX_MAX_ATTEMPTS leaves them for inspection.
+    """
+    rows = (await db.execute(
+        select(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.aggregate_id, OutboxEvent.payload)
+        .where(and_(
+            OutboxEvent.dispatched_at.is_(None),
+            OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS
+        ))
+        .order_by(OutboxEvent.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).all()
+    if not rows:
+        await db.rollback()
+        return {"fetched": 0, "dispatched": 0, "failed": 0}
+
+    by_type: Dict[str, List[Any]] = defaultdict(list)
+    for row in rows:
+        by_type[row.event_type].append(row)
+
+    dispatched: List[UUID] = []
+    failed = 0
+    try:
+        for event_type, events in by_type.items():
+            event_ids = [event.id for event in events]
+            try:
+                dispatcher = OUTBOX_DISPATCHERS.get(event_type)
+                if dispatcher is None:
+                    raise ValueError(f"No dispatcher for outbox event type {event_type}")
+                await dispatcher(pool, events)
+                dispatched.extend(event_ids)
+            except Exception as e:
+                failed += len(events)
+                logger.error(
+                    "Outbox dispatch failed",
+                    metadata={"event_type": event_type, "events": len(events)},
+                    exception=e
+                )
+                await db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_(event_ids))
+                    .values(attempts=OutboxEvent.attempts + 1, last_error=str(e)[:2000])
+                    .execution_options(synchronize_session=False)
+                )
+
+        if dispatched:
+            await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(dispatched))
+                .values(
+                    dispatched_at=datetime.now(timezone.utc),
+                    attempts=OutboxEvent.attempts + 1,
+                    last_error=None
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    return {"fetched": len(rows), "dispatched": len(dispatched), "failed": failed}
+
+
+async def purge_dispatched_events(db: AsyncSession, retention_days: int = OUTBOX_RETENTION_DAYS) -> int:
+    """Delete rows dispatched more than retention_days ago; returns the number removed"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    result = await db.execute(
+        delete(OutboxEvent)
+        .where(and_(OutboxEvent.dispatched_at.is_not(None), OutboxEvent.dispatched_at < cutoff))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount or 0
@@ -12,12 +12,13 @@ from models.inventories import Inventory
 from models.user import User
 from uuid import UUID
 from core.utils.uuid_utils import uuid7
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
 from enum import Enum
 from core.config import settings
 from core.logging import get_structured_logger
 import stripe
+from services.payments.stripe_gateway import get_stripe_gateway
 import json
 import time
 
@@ -61,7 +62,7 @@ class PaymentService:
             # Handle modern payment method API
             if stripe_payment_method_id:
                 # Get payment method details from Stripe
-                stripe_pm = stripe.PaymentMethod.retrieve(stripe_payment_method_id)
+                stripe_pm = await get_stripe_gateway().retrieve_payment_method(stripe_payment_method_id)
 
                 # Ensure user has a Stripe customer and attach payment method
                 user_result = await self.db.execute(select(User).where(User.id == user_id))
@@ -71,10 +72,10 @@ class PaymentService:
 
                 if user.stripe_customer_id:
                     try:
-                        stripe.Customer.retrieve(user.stripe_customer_id)
+                        await get_stripe_gateway().retrieve_customer(user.stripe_customer_id)
                     except stripe.error.InvalidRequestError as retrieve_error:
                         if "No such customer" in str(retrieve_error):
-                            customer = stripe.Customer.create(
+                            customer = await get_stripe_gateway().create_customer(
                                 email=getattr(user, "email", None),
                                 name=getattr(user, "full_name", None)
                             )
@@ -83,7 +84,7 @@ class PaymentService:
                         else:
                             raise
                 else:
-                    customer = stripe.Customer.create(
+                    customer = await get_stripe_gateway().create_customer(
                         email=getattr(user, "email", None),
                         name=getattr(user, "full_name", None)
                     )
@@ -91,7 +92,7 @@ class PaymentService:
                     await self.db.commit()
 
                 try:
-                    stripe.PaymentMethod.attach(
+                    await get_stripe_gateway().attach_payment_method(
                         stripe_payment_method_id,
                         customer=user.stripe_customer_id
                     )
@@ -132,10 +133,10 @@ class PaymentService:
             # Handle legacy token API (deprecated but supported for backward compatibility)
             elif stripe_token:
                 # Get token details from Stripe
-                stripe_token_obj = stripe.Token.retrieve(stripe_token)
+                stripe_token_obj = await get_stripe_gateway().retrieve_token(stripe_token)
                 
                 # Create payment method from token (this is the old way)
-                stripe_pm = stripe.PaymentMethod.create(
+                stripe_pm = await get_stripe_gateway().create_payment_method(
                     type="card",
                     card={"token": stripe_token}
                 )
@@ -148,10 +149,10 @@ class PaymentService:
 
                 if user.stripe_customer_id:
                     try:
-                        stripe.Customer.retrieve(user.stripe_customer_id)
+                        await get_stripe_gateway().retrieve_customer(user.stripe_customer_id)
                     except stripe.error.InvalidRequestError as retrieve_error:
                         if "No such customer" in str(retrieve_error):
-                            customer = stripe.Customer.create(
+                            customer = await get_stripe_gateway().create_customer(
                                 email=getattr(user, "email", None),
                                 name=getattr(user, "full_name", None)
                             )
@@ -160,7 +161,7 @@ class PaymentService:
                         else:
                             raise
                 else:
-                    customer = stripe.Customer.create(
+                    customer = await get_stripe_gateway().create_customer(
                         email=getattr(user, "email", None),
                         name=getattr(user, "full_name", None)
                     )
@@ -168,7 +169,7 @@ class PaymentService:
                     await self.db.commit()
 
                 try:
-                    stripe.PaymentMethod.attach(
+                    await get_stripe_gateway().attach_payment_method(
                         stripe_pm.id,
                         customer=user.stripe_customer_id
                     )
@@ -274,9 +275,9 @@ class PaymentService:
             # Detach from Stripe only if attached to a customer
             if payment_method.stripe_payment_method_id:
                 try:
-                    stripe_pm = stripe.PaymentMethod.retrieve(payment_method.stripe_payment_method_id)
+                    stripe_pm = await get_stripe_gateway().retrieve_payment_method(payment_method.stripe_payment_method_id)
                     if getattr(stripe_pm, "customer", None):
-                        stripe.PaymentMethod.detach(payment_method.stripe_payment_method_id)
+                        await get_stripe_gateway().detach_payment_method(payment_method.stripe_payment_method_id)
                 except stripe.error.InvalidRequestError as detach_error:
                     message = str(detach_error).lower()
                     if "not attached" not in message:
@@ -379,7 +380,7 @@ class PaymentService:
         """Create a payment intent with optional transaction control"""
         try:
             # Create Stripe payment intent
-            stripe_intent = stripe.PaymentIntent.create(
+            stripe_intent = await get_stripe_gateway().create_payment_intent(
                 amount=int(amount * 100),  # Convert to cents
                 currency=currency.lower(),
                 automatic_payment_methods={
@@ -431,7 +432,7 @@ class PaymentService:
         
         try:
             # Confirm with Stripe
-            stripe_intent = stripe.PaymentIntent.confirm(
+            stripe_intent = await get_stripe_gateway().confirm_payment_intent(
                 payment_intent.stripe_payment_intent_id,
                 payment_method=payment_method_id
             )
@@ -704,17 +705,26 @@ class PaymentService:
         payment_method_id: UUID,
         idempotency_key: str,
         request_id: Optional[str] = None,
-        frontend_calculated_amount: Optional[float] = None  # Amount calculated by frontend
+        frontend_calculated_amount: Optional[float] = None,  # Amount calculated by frontend
+        commit: bool = True
     ) -> Dict[str, Any]:
         """
         Process payment with idempotency guarantee and price validation
-        Validates that frontend-calculated prices match backend calculations
+        Validates that frontend-calculated prices match backend calculations.
+        With commit=False the records are only flushed, so a caller holding row locks keeps
+        them until it commits the payment together with what it was for.
         """
         start_time = time.time()
         
         if not request_id:
             request_id = str(uuid7())
         
+        async def save():
+            if commit:
+                await self.db.commit()
+            else:
+                await self.db.flush()
+        
         try:
             # Validate frontend price against backend calculation
             if frontend_calculated_amount is not None:
@@ -739,7 +749,8 @@ class PaymentService:
                     "status": existing_transaction.status,
                     "transaction_id": str(existing_transaction.id),
                     "cached": True,
-                    "amount": existing_transaction.amount
+                    "amount": existing_transaction.amount,
+                    "order_id": str(existing_transaction.order_id) if existing_transaction.order_id else None
                 }
             
             # Get payment method with validation
@@ -765,28 +776,28 @@ class PaymentService:
 
             if user.stripe_customer_id:
                 try:
-                    stripe.Customer.retrieve(user.stripe_customer_id)
+                    await get_stripe_gateway().retrieve_customer(user.stripe_customer_id)
                 except stripe.error.InvalidRequestError as retrieve_error:
                     if "No such customer" in str(retrieve_error):
-                        customer = stripe.Customer.create(
+                        customer = await get_stripe_gateway().create_customer(
                             email=getattr(user, "email", None),
                             name=getattr(user, "full_name", None)
                         )
                         user.stripe_customer_id = customer.id
-                        await self.db.commit()
+                        await save()
                     else:
                         raise
             else:
-                customer = stripe.Customer.create(
+                customer = await get_stripe_gateway().create_customer(
                     email=getattr(user, "email", None),
                     name=getattr(user, "full_name", None)
                 )
                 user.stripe_customer_id = customer.id
-                await self.db.commit()
+                await save()
 
             # Attach payment method to customer if needed
             try:
-                stripe.PaymentMethod.attach(
+                await get_stripe_gateway().attach_payment_method(
                     payment_method.stripe_payment_method_id,
                     customer=user.stripe_customer_id
                 )
@@ -794,13 +805,13 @@ class PaymentService:
                 # If already attached, Stripe returns an error; safe to ignore
                 message = str(attach_error).lower()
                 if "no such customer" in message:
-                    customer = stripe.Customer.create(
+                    customer = await get_stripe_gateway().create_customer(
                         email=getattr(user, "email", None),
                         name=getattr(user, "full_name", None)
                     )
                     user.stripe_customer_id = customer.id
-                    await self.db.commit()
-                    stripe.PaymentMethod.attach(
+                    await save()
+                    await get_stripe_gateway().attach_payment_method(
                         payment_method.stripe_payment_method_id,
                         customer=user.stripe_customer_id
                     )
@@ -808,7 +819,7 @@ class PaymentService:
                     raise
             
             # Create Stripe payment intent with idempotency key
-            stripe_intent = stripe.PaymentIntent.create(
+            stripe_intent = await get_stripe_gateway().create_payment_intent(
                 amount=int(amount * 100),  # Convert to cents
                 currency="USD",
                 idempotency_key=idempotency_key,  # Stripe-level deduplication
@@ -846,7 +857,7 @@ class PaymentService:
             
             # Confirm payment
             try:
-                confirmed = stripe.PaymentIntent.confirm(
+                confirmed = await get_stripe_gateway().confirm_payment_intent(
                     stripe_intent.id,
                     payment_method=payment_method.stripe_payment_method_id,
                     idempotency_key=f"{idempotency_key}:confirm"  # Separate idempotency for confirm
@@ -855,7 +866,7 @@ class PaymentService:
                 message = str(e).lower()
                 if "previously used" in message and "may not be used again" in message:
                     payment_method.is_active = False
-                    await self.db.commit()
+                    await save()
                     raise HTTPException(
                         status_code=400,
                         detail="Payment method is no longer usable. Please add a new card and try again."
@@ -890,7 +901,7 @@ class PaymentService:
                 payment_intent_record.requires_action = True
             
             self.db.add(transaction)
-            await self.db.commit()
+            await save()
             await self.db.refresh(transaction)
             
             return {
@@ -1028,7 +1039,7 @@ class PaymentService:
         try:
             # Create refund in Stripe
             refund_amount = amount or payment_intent.amount_breakdown.get("total", 0)
-            stripe_refund = stripe.Refund.create(
+            stripe_refund = await get_stripe_gateway().create_refund(
                 payment_intent=payment_intent.stripe_payment_intent_id,
                 amount=int(refund_amount * 100),  # Convert to cents
                 reason=reason
@@ -1170,8 +1181,17 @@ class PaymentService:
             # Determine retry strategy
             retry_strategy = self._determine_retry_strategy(failure_reason, payment_intent)
             
+            # Subscription retries run as a delayed job at the retry time
+            subscription_retry = None
+            if payment_intent.subscription_id and retry_strategy["should_retry"]:
+                subscription_retry = await self._set_subscription_retry(payment_intent.subscription_id, retry_strategy)
+            
             await self.db.commit()
             
+            if subscription_retry:
+                from services.subscriptions.scheduler import schedule_subscription_retry
+                await schedule_subscription_retry(**subscription_retry)
+            
             logger.info(f"Payment failure handled: {payment_intent_id}, reason: {failure_reason.value}")
             
             return {
@@ -1417,6 +1437,28 @@ class PaymentService:
         except Exception as e:
             logger.error(f"Error handling payment failure notification: {e}")
 
+    async def _set_subscription_retry(
+        self,
+        subscription_id: UUID,
+        retry_strategy: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Set next_retry_date on a subscription awaiting payment (unless a retry is already
+        pending) and return the retry to schedule once committed
+        """
+        subscription = await self.db.get(Subscription, subscription_id)
+        if not subscription or subscription.status != "payment_failed":
+            return None
+        
+        now = datetime.now(timezone.utc)
+        if not subscription.next_retry_date or subscription.next_retry_date <= now:
+            subscription.next_retry_date = now + timedelta(hours=retry_strategy["next_retry_in_hours"])
+        return {
+            "subscription_id": subscription.id,
+            "retry_at": subscription.next_retry_date,
+            "attempt": subscription.payment_retry_count or 0
+        }
+
     def _determine_retry_strategy(
         self,
         failure_reason: PaymentFailureReason,
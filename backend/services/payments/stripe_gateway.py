@@ -0,0 +1,231 @@
+"""
+Non-blocking Stripe gateway
+The stripe SDK's create/retrieve calls are synchronous and would block the event loop for
+the whole network round trip. StripeGateway talks to the Stripe REST API over one pooled
+aiohttp session per process instead, with request timeouts and retries (exponential
+backoff on 429/5xx/connection errors, honouring Stripe-Should-Retry). Every POST carries
+an idempotency key, the caller's or a generated one, so a retried request can never
+charge twice.
+
+Responses are returned as StripeObjects and failures raised as the SDK's stripe.error
+classes, so callers keep attribute access and their existing except clauses.
+
+Point STRIPE_API_URL at the stand-in server (services.payments.stripe_standin) to run the
+payment paths locally without reaching Stripe.
+"""
+import asyncio
+import random
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+import aiohttp
+import stripe
+from core.config import settings
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+STRIPE_API_VERSION = "2024-04-10"
+RETRYABLE_STATUSES = {409, 429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 8.0
+
+
+def encode_params(params: Dict[str, Any], prefix: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Form-encode nested params the way Stripe expects (metadata[key], items[0][price])"""
+    encoded = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            encoded.extend(encode_params(value, name))
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    encoded.extend(encode_params(item, f"{name}[{index}]"))
+                else:
+                    encoded.append((f"{name}[{index}]", _scalar(item)))
+        else:
+            encoded.append((name, _scalar(value)))
+    return encoded
+
+
+def _scalar(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _retry_delay(attempt: int) -> float:
+    return min(0.5 * (2 ** attempt), MAX_RETRY_DELAY) * random.uniform(0.8, 1.2)
+
+
+def _stripe_error(status: int, body: Any, raw_body: str, headers: Dict[str, str]) -> stripe.error.StripeError:
+    """The stripe.error exception the SDK would raise for this response"""
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    message = error.get("message") or f"Stripe API error ({status})"
+    code = error.get("code")
+    param = error.get("param")
+    details = {"http_body": raw_body, "http_status": status, "json_body": body if isinstance(body, dict) else None, "headers": headers}
+
+    if status == 429:
+        return stripe.error.RateLimitError(message, code=code, **details)
+    if error.get("type") == "card_error" or status == 402:
+        return stripe.error.CardError(message, param, code, **details)
+    if error.get("type") == "idempotency_error":
+        return stripe.error.IdempotencyError(message, code=code, **details)
+    if status in (400, 404):
+        return stripe.error.InvalidRequestError(message, param, code, **details)
+    if status == 401:
+        return stripe.error.AuthenticationError(message, code=code, **details)
+    if status == 403:
+        return stripe.error.PermissionError(message, code=code, **details)
+    return stripe.error.APIError(message, code=code, **details)
+
+
+class StripeGateway:
+    """Async, pooled client for the Stripe endpoints the payment services use"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.base_url = (base_url or settings.STRIPE_API_URL).rstrip('/')
+        self.api_key = api_key or settings.STRIPE_SECRET_KEY or ''
+        self.pool_size = pool_size or settings.STRIPE_POOL_SIZE
+        self.timeout = timeout or settings.STRIPE_TIMEOUT
+        self.max_retries = settings.STRIPE_MAX_RETRIES if max_retries is None else max_retries
+        self.loop = asyncio.get_running_loop()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=60),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Stripe-Version": STRIPE_API_VERSION,
+                },
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> stripe.StripeObject:
+        """
+        Call the API and return the response as a StripeObject
+        Raises the matching stripe.error exception once retries are exhausted.
+        """
+        session = self._get_session()
+        url = f"{self.base_url}/v1{path}"
+        encoded = encode_params(params or {})
+        headers = {}
+        if method == "POST":
+            # Same key on every attempt, so Stripe replays rather than repeats a request
+            headers["Idempotency-Key"] = idempotency_key or str(uuid4())
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if method == "GET":
+                    response_cm = session.get(url, params=encoded, headers=headers)
+                else:
+                    response_cm = session.request(method, url, data=encoded, headers=headers)
+                async with response_cm as response:
+                    raw_body = await response.text()
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = None
+
+                    if response.status < 300 and isinstance(body, dict):
+                        return stripe.StripeObject.construct_from(body, self.api_key)
+
+                    should_retry = response.headers.get("Stripe-Should-Retry")
+                    retryable = should_retry == "true" or (should_retry is None and response.status in RETRYABLE_STATUSES)
+                    if retryable and attempt < self.max_retries:
+                        delay = _retry_delay(attempt)
+                        logger.warning(
+                            f"Stripe returned {response.status}, retrying in {delay:.1f}s",
+                            metadata={"path": path, "attempt": attempt + 1}
+                        )
+                        await asyncio.sleep(delay)
+                        continue
+                    raise _stripe_error(response.status, body, raw_body, dict(response.headers))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise stripe.error.APIConnectionError(f"Stripe request failed: {e}") from e
+                delay = _retry_delay(attempt)
+                logger.warning(
+                    f"Stripe request failed, retrying in {delay:.1f}s",
+                    metadata={"path": path, "attempt": attempt + 1},
+                    exception=e
+                )
+                await asyncio.sleep(delay)
+
+        raise stripe.error.APIConnectionError("Stripe retries exhausted")
+
+    async def create_customer(self, idempotency_key: Optional[str] = None, **params) -> stripe.StripeObject:
+        return await self.request("POST", "/customers", params, idempotency_key)
+
+    async def retrieve_customer(self, customer_id: str) -> stripe.StripeObject:
+        return await self.request("GET", f"/customers/{customer_id}")
+
+    async def create_payment_method(self, idempotency_key: Optional[str] = None, **params) -> stripe.StripeObject:
+        return await self.request("POST", "/payment_methods", params, idempotency_key)
+
+    async def retrieve_payment_method(self, payment_method_id: str) -> stripe.StripeObject:
+        return await self.request("GET", f"/payment_methods/{payment_method_id}")
+
+    async def attach_payment_method(self, payment_method_id: str, customer: str) -> stripe.StripeObject:
+        return await self.request("POST", f"/payment_methods/{payment_method_id}/attach", {"customer": customer})
+
+    async def detach_payment_method(self, payment_method_id: str) -> stripe.StripeObject:
+        return await self.request("POST", f"/payment_methods/{payment_method_id}/detach")
+
+    async def retrieve_token(self, token_id: str) -> stripe.StripeObject:
+        return await self.request("GET", f"/tokens/{token_id}")
+
+    async def create_payment_intent(self, idempotency_key: Optional[str] = None, **params) -> stripe.StripeObject:
+        return await self.request("POST", "/payment_intents", params, idempotency_key)
+
+    async def confirm_payment_intent(
+        self,
+        payment_intent_id: str,
+        idempotency_key: Optional[str] = None,
+        **params
+    ) -> stripe.StripeObject:
+        return await self.request("POST", f"/payment_intents/{payment_intent_id}/confirm", params, idempotency_key)
+
+    async def create_refund(self, idempotency_key: Optional[str] = None, **params) -> stripe.StripeObject:
+        return await self.request("POST", "/refunds", params, idempotency_key)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_gateway: Optional[StripeGateway] = None
+
+
+def get_stripe_gateway() -> StripeGateway:
+    """Process-wide gateway, bound to the running event loop (recreated if the loop changed)"""
+    global _gateway
+    if _gateway is None or _gateway.loop is not asyncio.get_running_loop():
+        _gateway = StripeGateway()
+    return _gateway
+
+
+async def close_stripe_gateway():
+    global _gateway
+    if _gateway is not None:
+        gateway, _gateway = _gateway, None
+        await gateway.close()
@@ -0,0 +1,216 @@
+"""
+Local stand-in for the Stripe API endpoints StripeGateway uses
+Keeps customers, payment methods, payment intents and refunds in memory and answers with
+Stripe-shaped objects and errors, replaying responses for repeated Idempotency-Keys like
+Stripe does. Payment methods whose id contains "declined" fail confirmation with a
+card_error, and fail_every=N answers every Nth request with a 503 to exercise retries.
+
+    python -m services.payments.stripe_standin --port 12111
+    STRIPE_API_URL=http://localhost:12111
+"""
+import argparse
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from aiohttp import web
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_standin{next(_ids):06d}"
+
+
+def _error(status: int, message: str, error_type: str = "invalid_request_error", **extra) -> web.Response:
+    return web.json_response({"error": {"type": error_type, "message": message, **extra}}, status=status)
+
+
+def _card(last4: str = "4242") -> Dict[str, Any]:
+    return {"brand": "visa", "last4": last4, "exp_month": 12, "exp_year": 2030, "funding": "credit"}
+
+
+def decode_params(fields) -> Dict[str, Any]:
+    """Undo Stripe form encoding (metadata[key]=v, items[0][price]=p) into nested dicts"""
+    params: Dict[str, Any] = {}
+    for name, value in fields.items():
+        parts = name.replace("]", "").split("[")
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return params
+
+
+class StripeStandIn:
+    def __init__(self, fail_every: int = 0):
+        self.fail_every = fail_every
+        self.requests = 0
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.idempotent: Dict[Tuple[str, str], Tuple[int, Dict[str, Any]]] = {}
+
+    def _store(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        obj.setdefault("created", int(time.time()))
+        obj.setdefault("livemode", False)
+        self.objects[obj["id"]] = obj
+        return obj
+
+    def _get(self, object_type: str, object_id: str) -> Optional[Dict[str, Any]]:
+        obj = self.objects.get(object_id)
+        if obj is None and object_type == "payment_method" and object_id.startswith("pm_"):
+            # Test payment method ids (pm_card_visa, pm_card_declined) exist implicitly
+            obj = self._store({"id": object_id, "object": "payment_method", "type": "card", "card": _card(), "customer": None})
+        if obj is None or obj["object"] != object_type:
+            return None
+        return obj
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        self.requests += 1
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return _error(503, "Service unavailable", "api_error")
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            return _error(401, "You did not provide an API key.")
+
+        key = request.headers.get("Idempotency-Key")
+        if request.method == "POST" and key and (request.path, key) in self.idempotent:
+            status, body = self.idempotent[(request.path, key)]
+            return web.json_response(body, status=status, headers={"Idempotent-Replayed": "true"})
+
+        response = await handler(request)
+        if request.method == "POST" and key and response.status < 500:
+            self.idempotent[(request.path, key)] = (response.status, json.loads(response.body))
+        return response
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        if request.method == "GET":
+            return decode_params(request.query)
+        return decode_params(await request.post())
+
+    async def create_customer(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        return web.json_response(self._store({
+            "id": _new_id("cus"), "object": "customer",
+            "email": params.get("email"), "name": params.get("name"), "metadata": params.get("metadata", {}),
+        }))
+
+    async def retrieve_customer(self, request: web.Request) -> web.Response:
+        customer = self._get("customer", request.match_info["id"])
+        if customer is None:
+            return _error(404, f"No such customer: '{request.match_info['id']}'", code="resource_missing")
+        return web.json_response(customer)
+
+    async def create_payment_method(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        return web.json_response(self._store({
+            "id": _new_id("pm"), "object": "payment_method",
+            "type": params.get("type", "card"), "card": _card(), "customer": None,
+        }))
+
+    async def retrieve_payment_method(self, request: web.Request) -> web.Response:
+        payment_method = self._get("payment_method", request.match_info["id"])
+        if payment_method is None:
+            return _error(404, f"No such PaymentMethod: '{request.match_info['id']}'", code="resource_missing")
+        return web.json_response(payment_method)
+
+    async def attach_payment_method(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        payment_method = self._get("payment_method", request.match_info["id"])
+        if payment_method is None:
+            return _error(404, f"No such PaymentMethod: '{request.match_info['id']}'", code="resource_missing")
+        if self._get("customer", params.get("customer", "")) is None:
+            return _error(404, f"No such customer: '{params.get('customer')}'", code="resource_missing")
+        if payment_method["customer"]:
+            return _error(400, "The payment method you provided has already been attached to a customer.")
+        payment_method["customer"] = params["customer"]
+        return web.json_response(payment_method)
+
+    async def detach_payment_method(self, request: web.Request) -> web.Response:
+        payment_method = self._get("payment_method", request.match_info["id"])
+        if payment_method is None or not payment_method["customer"]:
+            return _error(400, "The payment method you provided is not attached to a customer so detachment is impossible.")
+        payment_method["customer"] = None
+        return web.json_response(payment_method)
+
+    async def retrieve_token(self, request: web.Request) -> web.Response:
+        token_id = request.match_info["id"]
+        return web.json_response({"id": token_id, "object": "token", "type": "card", "card": _card(), "used": False})
+
+    async def create_payment_intent(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        intent_id = _new_id("pi")
+        return web.json_response(self._store({
+            "id": intent_id, "object": "payment_intent",
+            "amount": int(params.get("amount", 0)), "currency": params.get("currency", "usd"),
+            "customer": params.get("customer"), "metadata": params.get("metadata", {}),
+            "payment_method": params.get("payment_method"),
+            "status": "requires_payment_method" if not params.get("payment_method") else "requires_confirmation",
+            "client_secret": f"{intent_id}_secret_standin",
+        }))
+
+    async def confirm_payment_intent(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        intent = self._get("payment_intent", request.match_info["id"])
+        if intent is None:
+            return _error(404, f"No such payment_intent: '{request.match_info['id']}'", code="resource_missing")
+        payment_method = params.get("payment_method") or intent.get("payment_method")
+        if not payment_method:
+            return _error(400, "You must provide a payment method to confirm this PaymentIntent.")
+        if "declined" in payment_method:
+            intent["status"] = "requires_payment_method"
+            return _error(
+                402, "Your card was declined.", "card_error",
+                code="card_declined", decline_code="generic_decline", payment_intent=intent
+            )
+        intent.update(payment_method=payment_method, status="succeeded")
+        return web.json_response(intent)
+
+    async def create_refund(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        intent = self._get("payment_intent", params.get("payment_intent", ""))
+        if intent is None:
+            return _error(404, f"No such payment_intent: '{params.get('payment_intent')}'", code="resource_missing")
+        if intent["status"] != "succeeded":
+            return _error(400, "This PaymentIntent does not have a successful charge to refund.")
+        return web.json_response(self._store({
+            "id": _new_id("re"), "object": "refund",
+            "amount": int(params.get("amount", intent["amount"])), "currency": intent["currency"],
+            "payment_intent": intent["id"], "reason": params.get("reason"),
+            "metadata": params.get("metadata", {}), "status": "succeeded",
+        }))
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_post("/v1/customers", self.create_customer)
+        app.router.add_get("/v1/customers/{id}", self.retrieve_customer)
+        app.router.add_post("/v1/payment_methods", self.create_payment_method)
+        app.router.add_get("/v1/payment_methods/{id}", self.retrieve_payment_method)
+        app.router.add_post("/v1/payment_methods/{id}/attach", self.attach_payment_method)
+        app.router.add_post("/v1/payment_methods/{id}/detach", self.detach_payment_method)
+        app.router.add_get("/v1/tokens/{id}", self.retrieve_token)
+        app.router.add_post("/v1/payment_intents", self.create_payment_intent)
+        app.router.add_post("/v1/payment_intents/{id}/confirm", self.confirm_payment_intent)
+        app.router.add_post("/v1/refunds", self.create_refund)
+        return app
+
+
+async def start_standin(host: str = "127.0.0.1", port: int = 12111, fail_every: int = 0) -> Tuple[web.AppRunner, StripeStandIn]:
+    """Start the stand-in on host:port; call runner.cleanup() to stop it"""
+    standin = StripeStandIn(fail_every=fail_every)
+    runner = web.AppRunner(standin.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, standin
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local Stripe API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 503")
+    args = parser.parse_args(argv)
+    web.run_app(StripeStandIn(fail_every=args.fail_every).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -910,6 +910,9 @@ class ProductService:
         
         logger.info(f"Updated product fields: {update_dict}")
 
+        # (variant_id, old price, new price) for price-drop emails once committed
+        price_drops = []
+
         # Handle variant updates if provided
         if product_data.variants is not None:
             logger.info(f"Processing {len(product_data.variants)} variants")
@@ -934,6 +937,7 @@ class ProductService:
                         
                         # Flag to track if we made any changes
                         made_changes = False
+                        old_price = variant.current_price
                         
                         for field, value in variant_dict.items():
                             if value is not None:  # Only update if value is provided
@@ -943,6 +947,9 @@ class ProductService:
                                     made_changes = True
                                     logger.info(f"Updated variant.{field}: {old_value} -> {value}")
                         
+                        if variant.current_price < old_price:
+                            price_drops.append((variant.id, old_price, variant.current_price))
+                        
                         # Handle stock update via inventory
                         if variant_data.stock is not None:
                             if not variant.inventory:
@@ -1099,6 +1106,11 @@ class ProductService:
         await self.db.commit()
         logger.info(f"Product {product_id} updated successfully")
 
+        if price_drops:
+            from services.marketing import notify_price_drop
+            for variant_id, old_price, new_price in price_drops:
+                await notify_price_drop(variant_id, old_price, new_price)
+
         # Return the updated product
         return await self.get_product_by_id(product_id)
 
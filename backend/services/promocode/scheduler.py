@@ -1,11 +1,21 @@
 """
 Promocode Scheduler Service
 Handles automatic activation/deactivation of promocodes based on validity dates
+
+Each lifecycle step is one set-based UPDATE ... RETURNING code. Exact activation and
+expiry times are scheduled as delayed jobs (enqueue_at) when codes are created or edited,
+and the daily run schedules timers for anything coming up, so codes flip within a second
+of valid_from/valid_until rather than at the next midnight. Usage limits are enforced
+by the Redis counters in services.promocode.usage, and codes are deactivated when their
+counts are flushed. Pending counts are flushed before each status update, so the
+activation and limit checks on used_count see the Redis counters rather than a value up
+to one flush interval old. Every change is published on the promocode change channel.
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
-from datetime import datetime, timezone
-from typing import Dict, Any, List
+from sqlalchemy import select, update, and_, or_
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from uuid import UUID
 from core.logging import get_structured_logger
 
 from models.promocode import Promocode
@@ -13,6 +23,36 @@ from core.db import get_db
 
 logger = get_structured_logger(__name__)
 
+# How far ahead the daily run schedules activation/expiry timers
+TIMER_HORIZON = timedelta(hours=25)
+
+
+async def schedule_promocode_timers(promocode_id: Any, valid_from: Optional[datetime], valid_until: Optional[datetime]):
+    """
+    Schedule status refreshes at a code's future valid_from/valid_until
+    Job ids include the time, so editing the dates schedules new timers; timers left over
+    from old dates just find nothing to change.
+    """
+    from core.arq_worker import enqueue_at
+
+    now = datetime.now(timezone.utc)
+    for transition, at in (("activate", valid_from), ("expire", valid_until)):
+        if at is None or at <= now:
+            continue
+        try:
+            await enqueue_at(
+                'refresh_promocode_status_task',
+                at,
+                str(promocode_id),
+                job_id=f"promocode:{promocode_id}:{transition}:{int(at.timestamp())}"
+            )
+        except Exception as e:
+            logger.warning(
+                f"Failed to schedule promocode {transition} timer",
+                metadata={"promocode_id": str(promocode_id), "at": at.isoformat()},
+                exception=e
+            )
+
 
 class PromoCodeScheduler:
     """Service for managing promocode lifecycle based on validity dates"""
@@ -20,164 +60,109 @@ class PromoCodeScheduler:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def update_promocode_statuses(self) -> Dict[str, Any]:
+    async def _set_active(self, is_active: bool, condition, promocode_id: Optional[UUID] = None) -> List[str]:
+        """UPDATE matching codes whose flag differs; returns the codes that changed"""
+        conditions = [Promocode.is_active == (not is_active), condition]
+        if promocode_id is not None:
+            conditions.append(Promocode.id == promocode_id)
+        result = await self.db.execute(
+            update(Promocode)
+            .where(and_(*conditions))
+            .values(is_active=is_active)
+            .returning(Promocode.code)
+            .execution_options(synchronize_session=False)
+        )
+        return list(result.scalars().all())
+    
+    async def update_promocode_statuses(self, promocode_id: Optional[UUID] = None, redis=None) -> Dict[str, Any]:
         """
-        Update promocode statuses based on validity dates:
+        Update promocode statuses based on validity dates (all codes, or just promocode_id):
         - Activate promocodes that have reached their valid_from date
         - Deactivate promocodes that have passed their valid_until date
         - Deactivate promocodes that have reached their usage_limit
+        - Deactivate promocodes that are not valid yet
         """
-        current_time = datetime.now(timezone.utc)
+        from core.cache import get_redis
+        from services.promocode.service import publish_promocode_changes
+        from services.promocode.usage import drain_usage_counts
         
-        activated_count = 0
-        deactivated_count = 0
-        results = []
+        current_time = datetime.now(timezone.utc)
         
         try:
-            # ========================================
-            # STEP 1: Activate promocodes that should be active now
-            # ========================================
-            # Find inactive promocodes where:
-            # - valid_from is in the past (or null)
-            # - valid_until is in the future (or null)
-            # - usage_limit not reached (or null)
-            result = await self.db.execute(
-                select(Promocode).where(
-                    and_(
-                        Promocode.is_active == False,
-                        or_(
-                            Promocode.valid_from == None,
-                            Promocode.valid_from <= current_time
-                        ),
-                        or_(
-                            Promocode.valid_until == None,
-                            Promocode.valid_until > current_time
-                        ),
-                        or_(
-                            Promocode.usage_limit == None,
-                            Promocode.used_count < Promocode.usage_limit
-                        )
-                    )
-                )
-            )
-            
-            promocodes_to_activate = result.scalars().all()
+            # Bring used_count up to the Redis counters first, so a code that ran out
+            # since the last flush isn't reactivated
+            await drain_usage_counts(self.db, redis or await get_redis())
             
-            for promocode in promocodes_to_activate:
-                promocode.is_active = True
-                activated_count += 1
-                results.append({
-                    "code": promocode.code,
-                    "action": "activated",
-                    "reason": "validity period started",
-                    "valid_from": promocode.valid_from.isoformat() if promocode.valid_from else None,
-                    "valid_until": promocode.valid_until.isoformat() if promocode.valid_until else None
-                })
-                logger.info(f"✅ Activated promocode: {promocode.code}")
+            # Inactive promocodes inside their validity window with uses left
+            activated = await self._set_active(True, and_(
+                or_(Promocode.valid_from == None, Promocode.valid_from <= current_time),
+                or_(Promocode.valid_until == None, Promocode.valid_until > current_time),
+                or_(Promocode.usage_limit == None, Promocode.used_count < Promocode.usage_limit)
+            ), promocode_id)
+            expired = await self._set_active(False, and_(
+                Promocode.valid_until != None,
+                Promocode.valid_until <= current_time
+            ), promocode_id)
+            limit_reached = await self._set_active(False, and_(
+                Promocode.usage_limit != None,
+                Promocode.used_count >= Promocode.usage_limit
+            ), promocode_id)
+            not_yet_valid = await self._set_active(False, and_(
+                Promocode.valid_from != None,
+                Promocode.valid_from > current_time
+            ), promocode_id)
             
-            # ========================================
-            # STEP 2: Deactivate expired promocodes
-            # ========================================
-            # Find active promocodes where valid_until has passed
-            result = await self.db.execute(
-                select(Promocode).where(
-                    and_(
-                        Promocode.is_active == True,
-                        Promocode.valid_until != None,
-                        Promocode.valid_until <= current_time
-                    )
-                )
-            )
-            
-            expired_promocodes = result.scalars().all()
-            
-            for promocode in expired_promocodes:
-                promocode.is_active = False
-                deactivated_count += 1
-                results.append({
-                    "code": promocode.code,
-                    "action": "deactivated",
-                    "reason": "expired",
-                    "valid_until": promocode.valid_until.isoformat() if promocode.valid_until else None
-                })
-                logger.info(f"❌ Deactivated expired promocode: {promocode.code}")
-            
-            # ========================================
-            # STEP 3: Deactivate promocodes that reached usage limit
-            # ========================================
-            result = await self.db.execute(
-                select(Promocode).where(
-                    and_(
-                        Promocode.is_active == True,
-                        Promocode.usage_limit != None,
-                        Promocode.used_count >= Promocode.usage_limit
-                    )
-                )
-            )
-            
-            limit_reached_promocodes = result.scalars().all()
-            
-            for promocode in limit_reached_promocodes:
-                promocode.is_active = False
-                deactivated_count += 1
-                results.append({
-                    "code": promocode.code,
-                    "action": "deactivated",
-                    "reason": "usage_limit_reached",
-                    "used_count": promocode.used_count,
-                    "usage_limit": promocode.usage_limit
-                })
-                logger.info(f"❌ Deactivated promocode (limit reached): {promocode.code} ({promocode.used_count}/{promocode.usage_limit})")
-            
-            # ========================================
-            # STEP 4: Deactivate promocodes not yet valid
-            # ========================================
-            result = await self.db.execute(
-                select(Promocode).where(
-                    and_(
-                        Promocode.is_active == True,
-                        Promocode.valid_from != None,
-                        Promocode.valid_from > current_time
-                    )
-                )
-            )
-            
-            not_yet_valid_promocodes = result.scalars().all()
-            
-            for promocode in not_yet_valid_promocodes:
-                promocode.is_active = False
-                deactivated_count += 1
-                results.append({
-                    "code": promocode.code,
-                    "action": "deactivated",
-                    "reason": "not_yet_valid",
-                    "valid_from": promocode.valid_from.isoformat() if promocode.valid_from else None
-                })
-                logger.info(f"❌ Deactivated promocode (not yet valid): {promocode.code}")
-            
-            # Commit all changes
             await self.db.commit()
-            
-            logger.info(f"✅ Promocode status update completed: {activated_count} activated, {deactivated_count} deactivated")
-            
-            return {
-                "success": True,
-                "activated_count": activated_count,
-                "deactivated_count": deactivated_count,
-                "total_updated": activated_count + deactivated_count,
-                "timestamp": current_time.isoformat(),
-                "results": results
-            }
-            
         except Exception as e:
             await self.db.rollback()
             logger.error(f"❌ Failed to update promocode statuses: {e}")
             return {
                 "success": False,
                 "error": str(e),
-                "activated_count": activated_count,
-                "deactivated_count": deactivated_count
+                "activated_count": 0,
+                "deactivated_count": 0
             }
+        
+        results = (
+            [{"code": code, "action": "activated", "reason": "validity period started"} for code in activated]
+            + [{"code": code, "action": "deactivated", "reason": "expired"} for code in expired]
+            + [{"code": code, "action": "deactivated", "reason": "usage_limit_reached"} for code in limit_reached]
+            + [{"code": code, "action": "deactivated", "reason": "not_yet_valid"} for code in not_yet_valid]
+        )
+        for result in results:
+            logger.info(f"{'✅' if result['action'] == 'activated' else '❌'} Promocode {result['code']} {result['action']} ({result['reason']})")
+        await publish_promocode_changes(results)
+        
+        activated_count = len(activated)
+        deactivated_count = len(results) - activated_count
+        if promocode_id is None:
+            logger.info(f"✅ Promocode status update completed: {activated_count} activated, {deactivated_count} deactivated")
+        
+        return {
+            "success": True,
+            "activated_count": activated_count,
+            "deactivated_count": deactivated_count,
+            "total_updated": len(results),
+            "timestamp": current_time.isoformat(),
+            "results": results
+        }
+    
+    async def schedule_upcoming_timers(self, horizon: timedelta = TIMER_HORIZON) -> int:
+        """Schedule timers for validity boundaries inside the horizon (covers codes edited outside the API)"""
+        current_time = datetime.now(timezone.utc)
+        until = current_time + horizon
+        result = await self.db.execute(
+            select(Promocode.id, Promocode.valid_from, Promocode.valid_until).where(
+                or_(
+                    and_(Promocode.valid_from > current_time, Promocode.valid_from <= until),
+                    and_(Promocode.valid_until > current_time, Promocode.valid_until <= until)
+                )
+            )
+        )
+        rows = result.all()
+        for row in rows:
+            await schedule_promocode_timers(row.id, row.valid_from, row.valid_until)
+        return len(rows)
     
     async def get_active_promocodes(self) -> List[Promocode]:
         """Get all currently active and valid promocodes"""
@@ -1,11 +1,37 @@
+import json
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete
-from typing import List, Optional
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 from core.utils.uuid_utils import uuid7
 from models.promocode import Promocode
 from schemas.promos import PromocodeCreate, PromocodeUpdate
 from core.errors import APIException
+from core.logging import get_structured_logger
+
+logger = get_structured_logger(__name__)
+
+
+async def publish_promocode_changes(changes: List[Dict[str, Any]]):
+    """
+    Publish {code, action, reason} changes on the promocode change channel so caches of
+    promocodes can drop or refresh them; failures are logged, never raised
+    """
+    if not changes:
+        return
+    try:
+        from core.cache import RedisKeyManager, get_redis
+        
+        redis = await get_redis()
+        channel = RedisKeyManager.promocode_changes_channel()
+        async with redis.pipeline(transaction=False) as pipe:
+            for change in changes:
+                pipe.publish(channel, json.dumps(change))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish promocode changes", metadata={"count": len(changes)}, exception=e)
 
 
 class PromocodeService:
@@ -20,6 +46,7 @@ class PromocodeService:
         self.db.add(new_promocode)
         await self.db.commit()
         await self.db.refresh(new_promocode)
+        await self._after_change(new_promocode, "created")
         return new_promocode
 
     async def get_promocode_by_code(self, code: str) -> Optional[Promocode]:
@@ -39,11 +66,15 @@ class PromocodeService:
         if not promocode:
             raise APIException(status_code=404, message="Promocode not found")
 
+        previous_code = promocode.code
         for key, value in promocode_data.dict(exclude_unset=True).items():
             setattr(promocode, key, value)
 
         await self.db.commit()
         await self.db.refresh(promocode)
+        if previous_code != promocode.code:
+            await publish_promocode_changes([{"code": previous_code, "action": "deleted", "reason": "renamed"}])
+        await self._after_change(promocode, "updated")
         return promocode
 
     async def delete_promocode(self, promocode_id: UUID) -> bool:
@@ -51,34 +82,63 @@ class PromocodeService:
         if not promocode:
             return False
 
+        code = promocode.code
         await self.db.delete(promocode)
         await self.db.commit()
+        await publish_promocode_changes([{"code": code, "action": "deleted", "reason": "deleted"}])
         return True
 
-    async def increment_usage(self, promocode_id: UUID) -> Optional[Promocode]:
-        """Increment the used_count for a promocode when it's applied"""
-        promocode = await self.get_promocode_by_id(promocode_id)
-        if not promocode:
-            raise APIException(status_code=404, message="Promocode not found")
-        
-        # Increment usage count
-        promocode.used_count = (promocode.used_count or 0) + 1
-        
-        # Check if usage limit reached and deactivate if needed
-        if promocode.usage_limit and promocode.used_count >= promocode.usage_limit:
-            promocode.is_active = False
+    async def _after_change(self, promocode: Promocode, action: str):
+        """Publish an admin change and schedule the code's activation/expiry timers"""
+        from services.promocode.scheduler import schedule_promocode_timers
         
-        await self.db.commit()
-        await self.db.refresh(promocode)
+        await publish_promocode_changes([{"code": promocode.code, "action": action, "reason": "admin"}])
+        await schedule_promocode_timers(promocode.id, promocode.valid_from, promocode.valid_until)
+
+    async def _attach(self, snapshot: Dict[str, Any]) -> Promocode:
+        """Session-bound Promocode for a cached column snapshot, without a query"""
+        promocode = Promocode(**snapshot)
+        make_transient_to_detached(promocode)
+        return await self.db.merge(promocode, load=False)
+
+    async def increment_usage(self, promocode_id: UUID) -> Promocode:
+        """
+        Count one use of a promocode when it's applied
+        The limit check and increment happen in Redis (services.promocode.usage); the worker
+        flushes counts to used_count and deactivates codes that reached their limit.
+        The returned promocode belongs to this session and carries the live used_count,
+        which is set as its loaded value so committing the session doesn't write it back.
+        """
+        from services.promocode.usage import active_promocodes, reserve_usage
+
+        snapshot = active_promocodes.get_by_id(promocode_id)
+        if snapshot is not None:
+            promocode = await self._attach(snapshot)
+        else:
+            promocode = await self.get_promocode_by_id(promocode_id)
+            if not promocode:
+                raise APIException(status_code=404, message="Promocode not found")
+
+        used_count = await reserve_usage(self.db, promocode_id, promocode.usage_limit)
+        set_committed_value(promocode, "used_count", used_count)
         return promocode
     
     async def validate_promocode(self, code: str) -> tuple[bool, Optional[str], Optional[Promocode]]:
         """
         Validate a promocode and return (is_valid, error_message, promocode)
+        Active codes are read from the in-process map plus the Redis usage counter with no
+        query; any other code is looked up in Postgres so inactive codes still get their
+        own error instead of "not found".
         """
         from datetime import datetime, timezone
+        from services.promocode.usage import active_promocodes, get_usage_count
         
-        promocode = await self.get_promocode_by_code(code)
+        snapshot = await active_promocodes.get_snapshot(code)
+        if snapshot is not None:
+            promocode = await self._attach(snapshot)
+        else:
+            result = await self.db.execute(select(Promocode).where(Promocode.code == code))
+            promocode = result.scalars().first()
         
         if not promocode:
             return False, "Promocode not found", None
@@ -96,8 +156,11 @@ class PromocodeService:
         if promocode.valid_until and promocode.valid_until <= current_time:
             return False, "Promocode has expired", None
         
-        # Check usage limit
-        if promocode.usage_limit and promocode.used_count >= promocode.usage_limit:
+        # Check usage limit against the live counter (the stored used_count lags until flushed)
+        used_count = await get_usage_count(promocode.id)
+        if used_count is not None:
+            set_committed_value(promocode, "used_count", used_count)
+        if promocode.usage_limit and (promocode.used_count or 0) >= promocode.usage_limit:
             return False, "Promocode usage limit reached", None
         
         return True, None, promocode
@@ -0,0 +1,238 @@
+"""
+Promocode usage counters
+Redemptions are counted in Redis: one script call checks the usage limit and increments
+in a single round trip, so concurrent checkouts can never overshoot a limit and applying
+a code doesn't write to Postgres. Counters that changed are tracked in a dirty set and
+flushed to promocodes.used_count in batches by the worker; on worker startup the two
+sides are reconciled (Redis seeded or corrected from Postgres, unflushed counts
+re-marked dirty).
+
+Active codes are also kept in an in-process map (active_promocodes), reloaded from the
+promocode change channel, so validating a code needs no query.
+"""
+from typing import Any, Dict, Optional
+from uuid import UUID
+from sqlalchemy import select, update, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.cache import ChannelRefreshedCache, RedisKeyManager, get_redis
+from core.errors import APIException
+from core.logging import get_structured_logger
+from models.promocode import Promocode
+
+logger = get_structured_logger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+RECONCILE_PAGE_SIZE = 1000
+
+# INCR-if-below-limit. The counter must already be seeded from Postgres, otherwise a
+# lost Redis key would restart the count at zero.
+# KEYS[1] = usage counter, KEYS[2] = dirty set; ARGV = usage limit (-1 for none), promocode id
+# Returns the new count, -1 if the limit is already reached, -2 if the counter isn't seeded
+PROMOCODE_USAGE_LUA = """
+local used = redis.call('GET', KEYS[1])
+if not used then
+    return -2
+end
+local limit = tonumber(ARGV[1])
+if limit >= 0 and tonumber(used) >= limit then
+    return -1
+end
+used = redis.call('INCR', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return used
+"""
+
+_usage_script = None
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+async def _get_script(redis):
+    """Register the usage script once; redis-py sends EVALSHA and reloads it on NOSCRIPT"""
+    global _usage_script
+    if _usage_script is None or _usage_script.registered_client is not redis:
+        _usage_script = redis.register_script(PROMOCODE_USAGE_LUA)
+    return _usage_script
+
+
+async def get_usage_count(promocode_id: Any, redis=None) -> Optional[int]:
+    """Current redeemed count from Redis, or None if the counter isn't seeded"""
+    redis = redis or await get_redis()
+    value = await redis.get(RedisKeyManager.promocode_usage_key(str(promocode_id)))
+    return int(value) if value is not None else None
+
+
+async def reserve_usage(db: AsyncSession, promocode_id: UUID, usage_limit: Optional[int], redis=None) -> int:
+    """
+    Count one use of a promocode, enforcing usage_limit atomically; returns the new count
+    Raises APIException(400) once the limit is reached, or 404 if the code doesn't exist.
+    """
+    redis = redis or await get_redis()
+    script = await _get_script(redis)
+    keys = [RedisKeyManager.promocode_usage_key(str(promocode_id)), RedisKeyManager.promocode_usage_dirty_key()]
+    args = [usage_limit if usage_limit is not None else -1, str(promocode_id)]
+
+    result = int(await script(keys=keys, args=args))
+    if result == -2:
+        # First use since Redis lost the counter: seed it from Postgres and try again
+        used_count = (await db.execute(
+            select(Promocode.used_count).where(Promocode.id == promocode_id)
+        )).scalar_one_or_none()
+        if used_count is None and not await _exists(db, promocode_id):
+            raise APIException(status_code=404, message="Promocode not found")
+        await redis.set(keys[0], used_count or 0, nx=True)
+        result = int(await script(keys=keys, args=args))
+
+    if result == -1:
+        raise APIException(status_code=400, message="Promocode usage limit reached")
+    return result
+
+
+async def _exists(db: AsyncSession, promocode_id: UUID) -> bool:
+    return (await db.execute(select(Promocode.id).where(Promocode.id == promocode_id))).first() is not None
+
+
+async def flush_usage_counts(db: AsyncSession, redis, batch_size: int = FLUSH_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Write dirty usage counters to promocodes.used_count, batch_size codes per call
+    Codes whose flushed count reached their limit are deactivated in the same transaction.
+    On failure the ids are put back in the dirty set for the next run.
+    """
+    from services.promocode.service import publish_promocode_changes
+
+    dirty_key = RedisKeyManager.promocode_usage_dirty_key()
+    ids = [_decode(value) for value in (await redis.spop(dirty_key, batch_size) or [])]
+    if not ids:
+        return {"flushed": 0, "deactivated": 0}
+
+    counts = await redis.mget([RedisKeyManager.promocode_usage_key(promocode_id) for promocode_id in ids])
+    rows = [
+        {"id": UUID(promocode_id), "used_count": int(count)}
+        for promocode_id, count in zip(ids, counts)
+        if count is not None
+    ]
+
+    if not rows:
+        return {"flushed": 0, "deactivated": 0}
+
+    try:
+        # ORM bulk UPDATE by primary key: one executemany for the whole batch
+        await db.execute(update(Promocode), rows)
+        result = await db.execute(
+            update(Promocode)
+            .where(and_(
+                Promocode.id.in_([row["id"] for row in rows]),
+                Promocode.is_active == True,
+                Promocode.usage_limit != None,
+                Promocode.used_count >= Promocode.usage_limit
+            ))
+            .values(is_active=False)
+            .returning(Promocode.code)
+            .execution_options(synchronize_session=False)
+        )
+        deactivated = list(result.scalars().all())
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await redis.sadd(dirty_key, *ids)
+        raise
+
+    await publish_promocode_changes([
+        {"code": code, "action": "deactivated", "reason": "usage_limit_reached"} for code in deactivated
+    ])
+    return {"flushed": len(rows), "deactivated": len(deactivated)}
+
+
+async def drain_usage_counts(db: AsyncSession, redis) -> Dict[str, Any]:
+    """Flush batches until the dirty set is empty; returns the totals"""
+    totals = {"flushed": 0, "deactivated": 0}
+    while True:
+        result = await flush_usage_counts(db, redis)
+        totals["flushed"] += result["flushed"]
+        totals["deactivated"] += result["deactivated"]
+        if not result["flushed"]:
+            return totals
+
+
+async def reconcile_usage_counters(db: AsyncSession, redis) -> Dict[str, int]:
+    """
+    Bring Redis counters and promocodes.used_count back in line (worker startup)
+    Missing counters are seeded from Postgres, counters behind Postgres (e.g. Redis
+    restored from an old snapshot) are raised to it, and counters ahead of it have
+    unflushed uses, so they're marked dirty.
+    """
+    stats = {"seeded": 0, "corrected": 0, "dirty": 0}
+    dirty_key = RedisKeyManager.promocode_usage_dirty_key()
+    last_id = None
+    while True:
+        query = select(Promocode.id, Promocode.used_count).order_by(Promocode.id).limit(RECONCILE_PAGE_SIZE)
+        if last_id is not None:
+            query = query.where(Promocode.id > last_id)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        keys = [RedisKeyManager.promocode_usage_key(str(row.id)) for row in rows]
+        counts = await redis.mget(keys)
+        async with redis.pipeline(transaction=False) as pipe:
+            for row, key, count in zip(rows, keys, counts):
+                db_count = row.used_count or 0
+                if count is None:
+                    pipe.set(key, db_count, nx=True)
+                    stats["seeded"] += 1
+                elif int(count) < db_count:
+                    pipe.set(key, db_count)
+                    stats["corrected"] += 1
+                elif int(count) > db_count:
+                    pipe.sadd(dirty_key, str(row.id))
+                    stats["dirty"] += 1
+            await pipe.execute()
+    return stats
+
+
+class ActivePromocodes(ChannelRefreshedCache):
+    """
+    In-process map of active promocodes, keyed by code
+    Held as plain column snapshots so they outlive any session, and reloaded from the
+    promocode change channel.
+    """
+
+    def __init__(self, max_age: float = 60.0):
+        super().__init__(max_age)
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _snapshot(promocode: Promocode) -> Dict[str, Any]:
+        return {column.key: getattr(promocode, column.key) for column in Promocode.__table__.columns}
+
+    def channel(self) -> str:
+        return RedisKeyManager.promocode_changes_channel()
+
+    async def load(self):
+        from core.db import db_manager
+
+        async with db_manager.session_factory() as db:
+            result = await db.execute(select(Promocode).where(Promocode.is_active == True))
+            self._by_code = {promocode.code: self._snapshot(promocode) for promocode in result.scalars().all()}
+
+    async def get_snapshot(self, code: str) -> Optional[Dict[str, Any]]:
+        """Column snapshot of an active code, or None"""
+        await self.ensure_fresh()
+        return self._by_code.get(code)
+
+    async def get(self, code: str) -> Optional[Promocode]:
+        """Detached Promocode for an active code, or None"""
+        snapshot = await self.get_snapshot(code)
+        return Promocode(**snapshot) if snapshot else None
+
+    def get_by_id(self, promocode_id: Any) -> Optional[Dict[str, Any]]:
+        for snapshot in self._by_code.values():
+            if str(snapshot["id"]) == str(promocode_id):
+                return snapshot
+        return None
+
+
+active_promocodes = ActivePromocodes()
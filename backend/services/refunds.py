@@ -18,6 +18,7 @@ from schemas.refunds import RefundRequest, RefundResponse, RefundItemRequest
 from core.config import settings
 from core.logging import get_structured_logger
 import stripe
+from services.payments.stripe_gateway import get_stripe_gateway
 
 logger = get_structured_logger(__name__)
 
@@ -456,10 +457,11 @@ class RefundService:
                 raise Exception("Original payment transaction not found")
             
             # Create Stripe refund
-            stripe_refund = stripe.Refund.create(
+            stripe_refund = await get_stripe_gateway().create_refund(
                 payment_intent=transaction.stripe_payment_intent_id,
                 amount=int(refund.approved_amount * 100),  # Convert to cents
                 reason="requested_by_customer",
+                idempotency_key=f"refund_{refund.id}",  # One Stripe refund per refund record
                 metadata={
                     "refund_id": str(refund.id),
                     "order_id": str(refund.order_id),
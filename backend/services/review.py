@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, update, or_
 from typing import Optional, List
 from models.review import Review
 from models.product import Product
@@ -226,25 +226,48 @@ class ReviewService:
             traceback.print_exc()
             raise
 
-    async def recalculate_all_product_ratings(self):
-        """Recalculate ratings for all products that have reviews"""
-        # Get all products that have reviews
-        products_with_reviews = await self.db.execute(
-            select(Product.id, func.avg(Review.rating).label('avg_rating'), func.count(Review.id).label('review_count'))
-            .join(Review, Product.id == Review.product_id)
-            .where(Review.is_approved == True)
-            .group_by(Product.id)
-        )
-        
+    async def recalculate_all_product_ratings(self, chunk_size: int = 1000) -> int:
+        """
+        Recalculate ratings for all products from their approved reviews
+        Each product-id range is one UPDATE products ... FROM (SELECT ... GROUP BY)
+        committed on its own; products without approved reviews are reset to zero.
+        Returns the number of product rows whose rating actually changed.
+        """
+        from core.db import iter_id_ranges, id_range_conditions
+
         updated_count = 0
-        for product_id, avg_rating, review_count in products_with_reviews:
-            product = await self.db.get(Product, product_id)
-            if product:
-                product.rating_average = float(avg_rating) if avg_rating is not None else 0.0
-                product.rating_count = int(review_count) if review_count is not None else 0
-                product.review_count = int(review_count) if review_count is not None else 0
-                product.updated_at = datetime.utcnow()
-                await self.db.commit()
-                updated_count += 1
-        
-        return updated_count
\ No newline at end of file
+        async for lower, upper in iter_id_ranges(self.db, Product.id, chunk_size):
+            ratings = (
+                select(
+                    Product.id.label("product_id"),
+                    func.coalesce(func.avg(Review.rating), 0.0).label("avg_rating"),
+                    func.count(Review.id).label("review_count")
+                )
+                .outerjoin(Review, (Review.product_id == Product.id) & (Review.is_approved == True))
+                .where(*id_range_conditions(Product.id, lower, upper))
+                .group_by(Product.id)
+                .subquery()
+            )
+
+            result = await self.db.execute(
+                update(Product)
+                .where(
+                    Product.id == ratings.c.product_id,
+                    or_(
+                        Product.rating_average.is_distinct_from(ratings.c.avg_rating),
+                        Product.rating_count.is_distinct_from(ratings.c.review_count),
+                        Product.review_count.is_distinct_from(ratings.c.review_count)
+                    )
+                )
+                .values(
+                    rating_average=ratings.c.avg_rating,
+                    rating_count=ratings.c.review_count,
+                    review_count=ratings.c.review_count,
+                    updated_at=func.now()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            updated_count += result.rowcount or 0
+
+        return updated_count
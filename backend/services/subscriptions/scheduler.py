@@ -1,13 +1,22 @@
 """
 Subscription Scheduler Service
 Handles automatic creation of orders for periodic shipments
+
+Renewal runs are split up: the dispatcher pages due subscription ids by keyset and hands
+each page to a batch job, which prefetches the batch's users, default payment methods and
+variants in three queries and renews its subscriptions concurrently, each in its own
+session. A subscription is locked (SKIP LOCKED) and re-checked as due before it is charged,
+and the payment idempotency key is derived from the billing period and attempt, so
+overlapping runs or a retried job never charge twice.
 """
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 from uuid import UUID
+from core.config import settings
 from core.utils.uuid_utils import uuid7
 from core.logging import get_structured_logger
 
@@ -20,6 +29,118 @@ from core.db import get_db
 
 logger = get_structured_logger(__name__)
 
+RENEWAL_RUN_TTL = 7 * 86400
+
+
+def due_clause(current_time: datetime):
+    """Active subscriptions due for billing, or failed ones due for a payment retry"""
+    return and_(
+        Subscription.status.in_(["active", "payment_failed"]),
+        or_(
+            # Regular billing
+            and_(
+                Subscription.next_billing_date <= current_time,
+                Subscription.auto_renew == True,
+                Subscription.status == "active"
+            ),
+            # Payment retry
+            and_(
+                Subscription.next_retry_date <= current_time,
+                Subscription.status == "payment_failed",
+                Subscription.payment_retry_count < 3
+            )
+        )
+    )
+
+
+def renewal_idempotency_key(subscription: Subscription) -> str:
+    """
+    One payment per subscription, billing period and attempt
+    A re-run of the same renewal gets the recorded payment back instead of charging again.
+    """
+    period = subscription.next_billing_date or subscription.current_period_end
+    period_key = period.strftime("%Y%m%d") if period else "initial"
+    return f"subscription_{subscription.id}_{period_key}_{subscription.payment_retry_count or 0}"
+
+
+async def schedule_subscription_retry(subscription_id: Any, retry_at: datetime, attempt: int):
+    """
+    Schedule the payment retry as a delayed job at retry_at; one job per subscription and
+    attempt however many failure paths report the same failure. Failures are logged -
+    the periodic renewal run still picks up overdue retries.
+    """
+    from core.arq_worker import enqueue_at
+
+    try:
+        await enqueue_at(
+            'retry_subscription_payment_task',
+            retry_at,
+            str(subscription_id),
+            attempt,
+            retry_at.isoformat(),
+            job_id=f"subscription_retry:{subscription_id}:{attempt}"
+        )
+    except Exception as e:
+        logger.warning(
+            f"Failed to schedule payment retry for subscription {subscription_id}",
+            metadata={"attempt": attempt, "retry_at": retry_at.isoformat()},
+            exception=e
+        )
+
+
+async def record_renewal_progress(run_id: str, redis=None, **counts):
+    """Add to a renewal run's counters (a Redis hash), e.g. due=100 or succeeded=1"""
+    from core.cache import RedisKeyManager
+
+    if redis is None:
+        from core.cache import get_redis
+        redis = await get_redis()
+    key = RedisKeyManager.subscription_renewal_run_key(run_id)
+    async with redis.pipeline(transaction=False) as pipe:
+        for field, amount in counts.items():
+            pipe.hincrby(key, field, amount)
+        pipe.expire(key, RENEWAL_RUN_TTL)
+        await pipe.execute()
+
+
+async def get_renewal_run(run_id: str) -> Dict[str, int]:
+    from core.cache import RedisService, RedisKeyManager
+
+    counts = await RedisService().get_hash(RedisKeyManager.subscription_renewal_run_key(run_id)) or {}
+    return {field: int(value) for field, value in counts.items()}
+
+
+async def process_subscription_batch(
+    session_factory,
+    subscription_ids: List[UUID],
+    concurrency: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Renew one batch: prefetch shared lookups once, then process up to `concurrency`
+    subscriptions at a time, each in its own session
+    """
+    async with session_factory() as db:
+        prefetched = await SubscriptionScheduler(db).prefetch(subscription_ids)
+
+    semaphore = asyncio.Semaphore(concurrency or settings.SUBSCRIPTION_RENEWAL_CONCURRENCY)
+
+    async def renew(subscription_id: UUID) -> Dict[str, Any]:
+        async with semaphore:
+            async with session_factory() as db:
+                return await SubscriptionScheduler(db).process_subscription_id(subscription_id, prefetched)
+
+    # One subscription blowing up (a lost connection, say) must not drop the results of
+    # the others, which are committed and still need their progress and emails recorded
+    results = await asyncio.gather(*(renew(subscription_id) for subscription_id in subscription_ids), return_exceptions=True)
+    for subscription_id, result in zip(subscription_ids, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to renew subscription {subscription_id}", exception=result)
+    return [
+        {"success": False, "error": str(result), "subscription_id": str(subscription_id)}
+        if isinstance(result, BaseException) else result
+        for subscription_id, result in zip(subscription_ids, results)
+    ]
+
 
 class SubscriptionScheduler:
     """Service for managing subscription billing and order creation"""
@@ -27,83 +148,132 @@ class SubscriptionScheduler:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def process_due_subscriptions(self) -> Dict[str, Any]:
-        """Process all subscriptions that are due for billing"""
-        current_time = datetime.now(timezone.utc)
-        
-        # Find active subscriptions due for billing OR due for retry
+    async def due_subscription_ids(
+        self,
+        after: Optional[UUID] = None,
+        limit: Optional[int] = None,
+        current_time: Optional[datetime] = None
+    ) -> List[UUID]:
+        """Next page of due subscription ids, keyset-paged by id"""
+        query = select(Subscription.id).where(due_clause(current_time or datetime.now(timezone.utc)))
+        if after is not None:
+            query = query.where(Subscription.id > after)
         result = await self.db.execute(
-            select(Subscription).where(
-                and_(
-                    Subscription.status.in_(["active", "payment_failed"]),
-                    or_(
-                        # Regular billing
-                        and_(
-                            Subscription.next_billing_date <= current_time,
-                            Subscription.auto_renew == True,
-                            Subscription.status == "active"
-                        ),
-                        # Payment retry
-                        and_(
-                            Subscription.next_retry_date <= current_time,
-                            Subscription.status == "payment_failed",
-                            Subscription.payment_retry_count < 3
-                        )
-                    )
-                )
-            ).options(selectinload(Subscription.products))
+            query.order_by(Subscription.id).limit(limit or settings.SUBSCRIPTION_RENEWAL_BATCH_SIZE)
         )
-        
-        due_subscriptions = result.scalars().all()
+        return list(result.scalars().all())
+
+    async def prefetch(self, subscription_ids: List[UUID]) -> Dict[str, Dict[UUID, Any]]:
+        """Users, default payment methods (by user) and variants for a batch of subscriptions"""
+        rows = (await self.db.execute(
+            select(Subscription.user_id, Subscription.variant_ids).where(Subscription.id.in_(subscription_ids))
+        )).all()
+        user_ids = {row.user_id for row in rows}
+        variant_ids = {UUID(variant_id) for row in rows for variant_id in row.variant_ids or []}
+
+        users = (await self.db.execute(select(User).where(User.id.in_(user_ids)))).scalars().all() if user_ids else []
+        payment_methods = (await self.db.execute(
+            select(PaymentMethod).where(
+                PaymentMethod.user_id.in_(user_ids),
+                PaymentMethod.is_default == True
+            )
+        )).scalars().all() if user_ids else []
+        variants = (await self.db.execute(
+            select(ProductVariant).where(ProductVariant.id.in_(variant_ids)).options(selectinload(ProductVariant.product))
+        )).scalars().all() if variant_ids else []
+
+        return {
+            "users": {user.id: user for user in users},
+            "payment_methods": {method.user_id: method for method in payment_methods},
+            "variants": {variant.id: variant for variant in variants},
+        }
+
+    async def process_due_subscriptions(self) -> Dict[str, Any]:
+        """Process all subscriptions that are due for billing, one keyset batch at a time"""
+        current_time = datetime.now(timezone.utc)
         
         processed_count = 0
         failed_count = 0
+        total_due = 0
         results = []
+        after = None
         
-        for subscription in due_subscriptions:
-            try:
-                result = await self.process_subscription(subscription)
+        while True:
+            subscription_ids = await self.due_subscription_ids(after=after, current_time=current_time)
+            if not subscription_ids:
+                break
+            after = subscription_ids[-1]
+            total_due += len(subscription_ids)
+            prefetched = await self.prefetch(subscription_ids)
+            
+            for subscription_id in subscription_ids:
+                result = await self.process_subscription_id(subscription_id, prefetched)
+                if result.get("skipped"):
+                    continue
                 if result["success"]:
                     processed_count += 1
-                    results.append({
-                        "subscription_id": str(subscription.id),
-                        "order_id": result["order_id"],
-                        "order_number": result["order_number"],
-                        "user_email": result["user_email"],
-                        "status": "success"
-                    })
+                    results.append({**result, "status": "success"})
                 else:
                     failed_count += 1
                     results.append({
-                        "subscription_id": str(subscription.id),
+                        "subscription_id": result["subscription_id"],
                         "status": "failed",
                         "reason": result.get("error", "Unknown error"),
-                        "retry_count": subscription.payment_retry_count
+                        "retry_count": result.get("retry_count")
                     })
-            except Exception as e:
-                failed_count += 1
-                results.append({
-                    "subscription_id": str(subscription.id),
-                    "status": "failed",
-                    "reason": str(e)
-                })
-                logger.error(f"Failed to process subscription {subscription.id}: {e}")
         
         return {
             "processed_count": processed_count,
             "failed_count": failed_count,
-            "total_due": len(due_subscriptions),
+            "total_due": total_due,
             "results": results
         }
+
+    async def process_subscription_id(
+        self,
+        subscription_id: UUID,
+        prefetched: Optional[Dict[str, Dict[UUID, Any]]] = None,
+        due_by: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Lock the subscription and renew it if it is still due (as of due_by, default now)
+        Subscriptions another worker is renewing, or that were renewed since the batch was
+        paged, are skipped.
+        """
+        current_time = max(datetime.now(timezone.utc), due_by) if due_by else datetime.now(timezone.utc)
+        result = await self.db.execute(
+            select(Subscription)
+            .where(Subscription.id == subscription_id, due_clause(current_time))
+            .options(selectinload(Subscription.products))
+            .with_for_update(skip_locked=True, of=Subscription)
+        )
+        subscription = result.scalar_one_or_none()
+        if subscription is None:
+            await self.db.rollback()
+            return {"success": False, "skipped": True, "subscription_id": str(subscription_id)}
+        
+        result = await self.process_subscription(subscription, prefetched)
+        return {**result, "subscription_id": str(subscription_id)}
     
-    async def process_subscription(self, subscription: Subscription) -> Dict[str, Any]:
-        """Process a single subscription - payment first, then order"""
+    async def process_subscription(
+        self,
+        subscription: Subscription,
+        prefetched: Optional[Dict[str, Dict[UUID, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process a single subscription - payment first, then order
+        `prefetched` (see prefetch) saves the user, payment method and variant lookups.
+        """
+        subscription_id = subscription.id
         try:
             # Get user
-            user_result = await self.db.execute(
-                select(User).where(User.id == subscription.user_id)
-            )
-            user = user_result.scalar_one_or_none()
+            if prefetched is not None:
+                user = prefetched["users"].get(subscription.user_id)
+            else:
+                user_result = await self.db.execute(
+                    select(User).where(User.id == subscription.user_id)
+                )
+                user = user_result.scalar_one_or_none()
             if not user:
                 raise Exception(f"User not found for subscription {subscription.id}")
             
@@ -112,12 +282,15 @@ class SubscriptionScheduler:
                 raise Exception(f"No products in subscription {subscription.id}")
             
             variant_uuids = [UUID(vid) for vid in subscription.variant_ids]
-            variant_result = await self.db.execute(
-                select(ProductVariant).where(
-                    ProductVariant.id.in_(variant_uuids)
-                ).options(selectinload(ProductVariant.product))
-            )
-            variants = variant_result.scalars().all()
+            if prefetched is not None:
+                variants = [prefetched["variants"][vid] for vid in variant_uuids if vid in prefetched["variants"]]
+            else:
+                variant_result = await self.db.execute(
+                    select(ProductVariant).where(
+                        ProductVariant.id.in_(variant_uuids)
+                    ).options(selectinload(ProductVariant.product))
+                )
+                variants = variant_result.scalars().all()
             
             if not variants:
                 raise Exception(f"No valid variants found for subscription {subscription.id}")
@@ -133,15 +306,18 @@ class SubscriptionScheduler:
             from services.payments import PaymentService
             
             # Get user's default payment method
-            payment_method_result = await self.db.execute(
-                select(PaymentMethod).where(
-                    and_(
-                        PaymentMethod.user_id == subscription.user_id,
-                        PaymentMethod.is_default == True
+            if prefetched is not None:
+                payment_method = prefetched["payment_methods"].get(subscription.user_id)
+            else:
+                payment_method_result = await self.db.execute(
+                    select(PaymentMethod).where(
+                        and_(
+                            PaymentMethod.user_id == subscription.user_id,
+                            PaymentMethod.is_default == True
+                        )
                     )
                 )
-            )
-            payment_method = payment_method_result.scalar_one_or_none()
+                payment_method = payment_method_result.scalar_one_or_none()
             
             if not payment_method:
                 raise Exception(f"No default payment method found for user {subscription.user_id}")
@@ -150,15 +326,22 @@ class SubscriptionScheduler:
             order_number = await self._generate_order_number()
             order_id = uuid7()
             
+            idempotency_key = renewal_idempotency_key(subscription)
+            
+            # Flush only: the subscription stays locked until the order is committed with it
             payment_service = PaymentService(self.db)
             payment_result = await payment_service.process_payment_idempotent(
                 user_id=subscription.user_id,
                 order_id=order_id,
                 amount=pricing["total"],
                 payment_method_id=payment_method.id,
-                idempotency_key=f"subscription_{subscription.id}_{order_id}",
-                request_id=str(order_id)
+                idempotency_key=idempotency_key,
+                request_id=str(order_id),
+                commit=False
             )
+            if payment_result.get("cached") and payment_result.get("order_id"):
+                # A payment recorded by an earlier attempt whose order wasn't created
+                order_id = UUID(payment_result["order_id"])
             
             # Check payment status
             if payment_result.get("status") != "succeeded":
@@ -209,6 +392,13 @@ class SubscriptionScheduler:
                 
                 await self.db.commit()
                 
+                if subscription.status == "payment_failed" and subscription.next_retry_date:
+                    await schedule_subscription_retry(
+                        subscription_id,
+                        subscription.next_retry_date,
+                        subscription.payment_retry_count
+                    )
+                
                 return {
                     "success": False,
                     "error": error_message,
@@ -219,97 +409,121 @@ class SubscriptionScheduler:
             logger.info(f"✅ Payment succeeded for subscription {subscription.id}, creating order...")
             
             # ========================================
-            # STEP 2: CREATE ORDER (only after successful payment)
+            # STEP 2-5: ORDER, ITEMS, INVENTORY, SUBSCRIPTION
             # ========================================
+            # In a savepoint, under the subscription lock taken by process_subscription_id.
+            # If any of it fails the charge and its Transaction row are still committed:
+            # the subscription stays due, and the next attempt gets the recorded payment back
+            # by idempotency key and creates the order against it instead of charging again.
+            try:
+                async with self.db.begin_nested():
+                    # Get shipping address
+                    shipping_address = await self._get_shipping_address(subscription)
             
-            # Get shipping address
-            shipping_address = await self._get_shipping_address(subscription)
-            
-            # Get quantities
-            variant_quantities = subscription.subscription_metadata.get("variant_quantities", {}) if subscription.subscription_metadata else {}
+                    # Get quantities
+                    variant_quantities = subscription.subscription_metadata.get("variant_quantities", {}) if subscription.subscription_metadata else {}
             
-            order = Order(
-                id=order_id,
-                user_id=subscription.user_id,
-                order_number=order_number,
-                order_status=OrderStatus.CONFIRMED,
-                payment_status=PaymentStatus.PAID,
-                fulfillment_status=FulfillmentStatus.UNFULFILLED,
-                source=OrderSource.API,
-                subtotal=pricing["subtotal"],
-                tax_amount=pricing["tax"],
-                shipping_cost=pricing["shipping"],
-                discount_amount=pricing.get("discount", 0.0),
-                total_amount=pricing["total"],
-                currency=subscription.currency or "USD",
-                shipping_method=subscription.delivery_type or "standard",
-                shipping_address=shipping_address,
-                billing_address=shipping_address,
-                subscription_id=subscription.id
-            )
+                    order = Order(
+                        id=order_id,
+                        user_id=subscription.user_id,
+                        order_number=order_number,
+                        order_status=OrderStatus.CONFIRMED,
+                        payment_status=PaymentStatus.PAID,
+                        fulfillment_status=FulfillmentStatus.UNFULFILLED,
+                        source=OrderSource.API,
+                        subtotal=pricing["subtotal"],
+                        tax_amount=pricing["tax"],
+                        shipping_cost=pricing["shipping"],
+                        discount_amount=pricing.get("discount", 0.0),
+                        total_amount=pricing["total"],
+                        currency=subscription.currency or "USD",
+                        shipping_method=subscription.delivery_type or "standard",
+                        shipping_address=shipping_address,
+                        billing_address=shipping_address,
+                        subscription_id=subscription.id
+                    )
             
-            self.db.add(order)
-            await self.db.flush()
+                    self.db.add(order)
+                    await self.db.flush()
             
-            # ========================================
-            # STEP 3: CREATE ORDER ITEMS
-            # ========================================
-            for variant_price in pricing["variant_prices"]:
-                variant_id = UUID(variant_price["id"])
-                variant = next((v for v in variants if v.id == variant_id), None)
+                    # ========================================
+                    # STEP 3: CREATE ORDER ITEMS
+                    # ========================================
+                    for variant_price in pricing["variant_prices"]:
+                        variant_id = UUID(variant_price["id"])
+                        variant = next((v for v in variants if v.id == variant_id), None)
                 
-                if variant:
-                    qty = variant_price["qty"]
-                    price = variant_price["price"]
+                        if variant:
+                            qty = variant_price["qty"]
+                            price = variant_price["price"]
                     
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        variant_id=variant.id,
-                        quantity=qty,
-                        price_per_unit=price,
-                        total_price=price * qty
-                    )
+                            order_item = OrderItem(
+                                order_id=order.id,
+                                variant_id=variant.id,
+                                quantity=qty,
+                                price_per_unit=price,
+                                total_price=price * qty
+                            )
                     
-                    self.db.add(order_item)
+                            self.db.add(order_item)
             
-            await self.db.flush()
+                    await self.db.flush()
             
-            # ========================================
-            # STEP 4: UPDATE INVENTORY
-            # ========================================
-            from services.inventory import InventoryService
-            from schemas.inventory import StockAdjustmentCreate
+                    # ========================================
+                    # STEP 4: UPDATE INVENTORY
+                    # ========================================
+                    from services.inventory import InventoryService
+                    from schemas.inventory import StockAdjustmentCreate
             
-            inventory_service = InventoryService(self.db, None)
+                    inventory_service = InventoryService(self.db, None)
             
-            for variant_price in pricing["variant_prices"]:
-                variant_id = UUID(variant_price["id"])
-                qty = variant_price["qty"]
+                    for variant_price in pricing["variant_prices"]:
+                        variant_id = UUID(variant_price["id"])
+                        qty = variant_price["qty"]
                 
-                adjustment = StockAdjustmentCreate(
-                    variant_id=variant_id,
-                    quantity_change=-qty,
-                    reason=f"Subscription order: {order.order_number}",
-                    notes=f"Auto-adjusted for subscription {subscription.id}"
-                )
+                        adjustment = StockAdjustmentCreate(
+                            variant_id=variant_id,
+                            quantity_change=-qty,
+                            reason=f"Subscription order: {order.order_number}",
+                            notes=f"Auto-adjusted for subscription {subscription.id}"
+                        )
                 
-                await inventory_service.adjust_stock(
-                    adjustment,
-                    adjusted_by_user_id=subscription.user_id,
-                    commit=False
-                )
+                        await inventory_service.adjust_stock(
+                            adjustment,
+                            adjusted_by_user_id=subscription.user_id,
+                            commit=False
+                        )
             
-            # ========================================
-            # STEP 5: UPDATE SUBSCRIPTION
-            # ========================================
-            subscription.status = "active"
-            subscription.last_payment_error = None
-            subscription.payment_retry_count = 0  # Reset retry count on success
-            subscription.last_payment_attempt = datetime.now(timezone.utc)
-            subscription.next_retry_date = None
+                    # ========================================
+                    # STEP 5: UPDATE SUBSCRIPTION
+                    # ========================================
+                    subscription.status = "active"
+                    subscription.last_payment_error = None
+                    subscription.payment_retry_count = 0  # Reset retry count on success
+                    subscription.last_payment_attempt = datetime.now(timezone.utc)
+                    subscription.next_retry_date = None
             
-            # Update billing dates
-            await self._update_billing_dates(subscription)
+                    # Update billing dates
+                    await self._update_billing_dates(subscription)
+            except Exception as e:
+                subscription.last_payment_attempt = datetime.now(timezone.utc)
+                subscription.last_payment_error = f"Charged but order creation failed: {e}"
+                await self.db.commit()
+                logger.error(
+                    f"Subscription {subscription_id} was charged but its order could not be created",
+                    metadata={
+                        "order_id": str(order_id),
+                        "transaction_id": payment_result.get("transaction_id"),
+                        "idempotency_key": idempotency_key
+                    },
+                    exception=e
+                )
+                return {
+                    "success": False,
+                    "error": f"Charged but order creation failed: {e}",
+                    "charged": True,
+                    "transaction_id": payment_result.get("transaction_id")
+                }
             
             await self.db.commit()
             
@@ -324,7 +538,7 @@ class SubscriptionScheduler:
             
         except Exception as e:
             await self.db.rollback()
-            logger.error(f"Failed to process subscription {subscription.id}: {e}")
+            logger.error(f"Failed to process subscription {subscription_id}: {e}")
             return {
                 "success": False,
                 "error": str(e)
@@ -333,7 +547,8 @@ class SubscriptionScheduler:
     async def _generate_order_number(self) -> str:
         """Generate unique order number"""
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%d")
-        short_uuid = str(uuid7())[:8].upper()
+        # The low bits of a UUIDv7 are random; its first 8 hex digits are a timestamp
+        short_uuid = uuid7().hex[-8:].upper()
         return f"SUB-{timestamp}-{short_uuid}"
     
     async def _get_shipping_address(self, subscription: Subscription) -> Dict[str, Any]:
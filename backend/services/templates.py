@@ -5,10 +5,11 @@ import os
 from typing import Dict, Any, Optional
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape, Template, TemplateError
+from jinja2 import Template, TemplateError
 from pydantic import BaseModel
 from core.logging import get_structured_logger
 from core.config import settings
+from core.utils.templating import get_template_env, invalidate_template_cache
 
 logger = get_structured_logger(__name__)
 
@@ -52,39 +53,11 @@ class JinjaTemplateService:
         # Create template directory if it doesn't exist
         self.template_dir.mkdir(parents=True, exist_ok=True)
         
-        # Initialize Jinja environment with security settings
-        self.env = Environment(
-            loader=FileSystemLoader(str(self.template_dir)),
-            autoescape=select_autoescape(['html', 'xml']),
-            trim_blocks=True,
-            lstrip_blocks=True
-        )
-        
-        # Add custom filters for common formatting
-        self.env.filters['currency'] = self._format_currency
-        self.env.filters['date'] = self._format_date
-        self.env.filters['datetime'] = self._format_datetime
+        # Shared precompiled environment; currency/date/datetime filters come with it
+        self.env = get_template_env(self.template_dir, trim_blocks=True, lstrip_blocks=True)
         
         logger.info(f"JinjaTemplateService initialized with template directory: {self.template_dir}")
     
-    def _format_currency(self, value: float, currency: str = "USD") -> str:
-        """Format currency values"""
-        if currency == "USD":
-            return f"${value:.2f}"
-        return f"{value:.2f} {currency}"
-    
-    def _format_date(self, value) -> str:
-        """Format date values"""
-        if hasattr(value, 'strftime'):
-            return value.strftime('%B %d, %Y')
-        return str(value)
-    
-    def _format_datetime(self, value) -> str:
-        """Format datetime values"""
-        if hasattr(value, 'strftime'):
-            return value.strftime('%B %d, %Y at %I:%M %p')
-        return str(value)
-    
     async def render_email_template(
         self,
         template_name: str,
@@ -241,6 +214,9 @@ class JinjaTemplateService:
             with open(template_path, 'w', encoding='utf-8') as f:
                 f.write(content)
             
+            # The shared environment never re-checks sources in production
+            invalidate_template_cache(self.template_dir)
+            
             logger.info(f"Template file created: {template_path}")
             return True
             
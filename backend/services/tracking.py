@@ -229,6 +229,14 @@ class VariantTrackingService:
         await self.db.commit()
         await self.db.refresh(price_history)
         
+        # Tell everyone who wishlisted or carted the variant if it got cheaper
+        from services.marketing import notify_price_drop
+        await notify_price_drop(
+            variant_id,
+            old_sale_price or old_price,
+            new_sale_price or new_price
+        )
+        
         # Get affected subscriptions for impact analysis
         affected_subscriptions_query = select(Subscription).where(
             and_(
@@ -0,0 +1,429 @@
+"""
+Streaming warehouse feed import
+Parses CSV/NDJSON feeds incrementally and applies them chunk by chunk: each chunk is
+staged with COPY into a temp table, then applied with set-based SQL (one UPDATE on
+inventory plus one INSERT into stock_adjustments). Bad rows go to a per-import error file.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from core.errors import APIException
+from core.utils.uuid_utils import uuid7
+from core.inventory_feed import queue_stock_change
+from core.logging import get_structured_logger
+from services.outbox import add_outbox_event, PRODUCT_AVAILABILITY_CHANGED
+
+logger = get_structured_logger(__name__)
+
+SUPPORTED_FORMATS = ("csv", "ndjson")
+IMPORT_REASON = "warehouse_sync"
+IMPORT_PROGRESS_TTL = 86400  # Keep progress around for a day
+
+# Staging table lives for one chunk transaction only (ON COMMIT DROP), so it is safe with pooled connections
+STAGE_TABLE = "warehouse_import_stage"
+STAGE_COLUMNS = ["line_no", "variant_id", "sku", "quantity", "adjustment_id"]
+
+CREATE_STAGE_SQL = text(f"""
+    CREATE TEMP TABLE {STAGE_TABLE} (
+        line_no integer NOT NULL,
+        variant_id uuid,
+        sku text,
+        quantity integer NOT NULL,
+        adjustment_id uuid NOT NULL
+    ) ON COMMIT DROP
+""")
+
+RESOLVE_SKUS_SQL = text(f"""
+    UPDATE {STAGE_TABLE} s
+    SET variant_id = pv.id
+    FROM product_variants pv
+    WHERE s.variant_id IS NULL AND pv.sku = s.sku
+""")
+
+UNMATCHED_ROWS_SQL = text(f"""
+    SELECT s.line_no, s.variant_id, s.sku
+    FROM {STAGE_TABLE} s
+    WHERE NOT EXISTS (SELECT 1 FROM inventory i WHERE i.variant_id = s.variant_id)
+    ORDER BY s.line_no
+""")
+
+# Lock the chunk's inventory rows in a consistent order so concurrent writers can't deadlock us
+# and the old quantities read by the apply statement are current
+LOCK_INVENTORY_SQL = text(f"""
+    SELECT i.id
+    FROM inventory i
+    WHERE i.variant_id IN (SELECT variant_id FROM {STAGE_TABLE} WHERE variant_id IS NOT NULL)
+    ORDER BY i.id
+    FOR UPDATE OF i
+""")
+
+# The last row for a variant within the chunk wins; unchanged quantities are skipped.
+# Returns one row per changed variant for the inventory change feed
+APPLY_CHUNK_SQL = text(f"""
+    WITH src AS (
+        SELECT DISTINCT ON (s.variant_id)
+            s.variant_id, s.quantity, s.adjustment_id
+        FROM {STAGE_TABLE} s
+        WHERE s.variant_id IS NOT NULL
+        ORDER BY s.variant_id, s.line_no DESC
+    ),
+    changes AS (
+        SELECT i.id AS inventory_id, i.quantity_available AS old_quantity, src.quantity AS new_quantity, src.adjustment_id
+        FROM src
+        JOIN inventory i ON i.variant_id = src.variant_id
+    ),
+    updated AS (
+        UPDATE inventory i
+        SET quantity = c.new_quantity,
+            quantity_available = c.new_quantity,
+            version = i.version + 1,
+            updated_at = now(),
+            last_restocked_at = CASE WHEN c.new_quantity > c.old_quantity THEN now() ELSE i.last_restocked_at END
+        FROM changes c
+        WHERE i.id = c.inventory_id AND c.new_quantity <> c.old_quantity
+        RETURNING i.id AS inventory_id, i.variant_id, i.version, c.old_quantity, c.new_quantity, c.adjustment_id
+    ),
+    adjustments AS (
+        INSERT INTO stock_adjustments (id, inventory_id, quantity_change, reason, adjusted_by_user_id, notes, created_by, created_at, version)
+        SELECT u.adjustment_id, u.inventory_id, u.new_quantity - u.old_quantity, CAST(:reason AS varchar), CAST(:user_id AS uuid),
+               'Warehouse sync: ' || u.old_quantity || ' -> ' || u.new_quantity, CAST(:user_id AS uuid), now(), 1
+        FROM updated u
+        RETURNING id
+    )
+    SELECT u.variant_id, pv.product_id, u.old_quantity, u.new_quantity, u.version, u.adjustment_id
+    FROM updated u
+    JOIN product_variants pv ON pv.id = u.variant_id
+""")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines without buffering more than one partial line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def parse_warehouse_record(record: Dict[str, Any]) -> Tuple[Optional[UUID], Optional[str], int]:
+    """Validate one feed record, returning (variant_id, sku, quantity); raises ValueError on bad input"""
+    variant_ref = str(record.get("variant_id") or "").strip()
+    sku = str(record.get("sku") or "").strip()
+    if not variant_ref and not sku:
+        raise ValueError("Row needs a variant_id or sku")
+
+    variant_id = None
+    if variant_ref:
+        try:
+            variant_id = UUID(variant_ref)
+        except ValueError:
+            raise ValueError(f"Invalid variant_id '{variant_ref}'")
+
+    raw_quantity = record.get("quantity")
+    try:
+        quantity = int(str(raw_quantity).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity '{raw_quantity}'")
+    if quantity < 0:
+        raise ValueError(f"Quantity cannot be negative ({quantity})")
+
+    # variant_id wins when both are given; SKUs are resolved in SQL per chunk
+    if variant_id is not None:
+        sku = ""
+    return variant_id, sku or None, quantity
+
+
+async def iter_warehouse_rows(
+    chunks: AsyncIterator[bytes],
+    fmt: str = "csv"
+) -> AsyncIterator[Tuple[int, Optional[Tuple[Optional[UUID], Optional[str], int]], Optional[str], str]]:
+    """
+    Parse a CSV (with header row) or NDJSON feed incrementally
+    Yields (line_no, parsed_row, error, raw_line); exactly one of parsed_row/error is set.
+    CSV fields may be quoted but must not contain embedded newlines.
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise APIException(status_code=400, message=f"Unsupported import format '{fmt}'")
+
+    header: Optional[List[str]] = None
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+
+        try:
+            if fmt == "ndjson":
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Expected a JSON object")
+            else:
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [column.strip().lower() for column in values]
+                    if "quantity" not in header or ("variant_id" not in header and "sku" not in header):
+                        raise APIException(
+                            status_code=400,
+                            message="CSV header must contain 'quantity' and 'variant_id' or 'sku'"
+                        )
+                    continue
+                record = dict(zip(header, values))
+
+            yield line_no, parse_warehouse_record(record), None, line
+        except APIException:
+            raise
+        except (ValueError, csv.Error) as e:
+            yield line_no, None, str(e), line
+
+
+class ImportErrorFile:
+    """
+    Lazily created CSV of rejected rows (line, error, row)
+    Rows are buffered and written in a worker thread, so the event loop never blocks on disk.
+    """
+
+    FLUSH_ROWS = 1000
+
+    def __init__(self, path: str, keep: Optional[List[Dict[str, Any]]] = None):
+        self.path = path
+        self.count = 0
+        self.keep = keep
+        self._pending: List[List[Any]] = []
+        self._file = None
+        self._writer = None
+
+    async def write(self, line_no: int, error: str, raw: str = ""):
+        self._pending.append([line_no, error, raw[:1000]])
+        self.count += 1
+        if self.keep is not None:
+            self.keep.append({"line": line_no, "error": error})
+        if len(self._pending) >= self.FLUSH_ROWS:
+            await self.flush()
+
+    def _write_rows(self, rows: List[List[Any]]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["line", "error", "row"])
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    async def flush(self):
+        if self._pending:
+            rows, self._pending = self._pending, []
+            await asyncio.to_thread(self._write_rows, rows)
+
+    async def close(self):
+        await self.flush()
+        if self._file is not None:
+            file, self._file = self._file, None
+            await asyncio.to_thread(file.close)
+
+
+class WarehouseImportService:
+    """Applies streamed warehouse feeds to inventory in COPY-staged, set-based chunks"""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        chunk_size: Optional[int] = None,
+        error_dir: Optional[str] = None
+    ):
+        self.db = db
+        self.chunk_size = chunk_size or settings.WAREHOUSE_IMPORT_CHUNK_SIZE
+        self.error_dir = error_dir or settings.WAREHOUSE_IMPORT_ERROR_DIR
+
+    def error_file_path(self, import_id: str) -> str:
+        return os.path.join(self.error_dir, f"{import_id}_errors.csv")
+
+    async def import_feed(
+        self,
+        chunks: AsyncIterator[bytes],
+        fmt: str = "csv",
+        import_id: Optional[str] = None,
+        user_id: Optional[UUID] = None,
+        progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        results: Optional[List[Dict[str, Any]]] = None,
+        rejected: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Stream a feed into inventory, committing once per chunk
+        The feed sets absolute quantities; every change is recorded as a stock adjustment.
+        Bad rows go to the error file; a chunk the database rejects stops the import with
+        status "failed" (chunks committed before it stay applied).
+        `progress` is awaited with the running summary after every chunk. When given,
+        `results` collects one entry per changed variant and `rejected` one per bad row.
+        """
+        import_id = import_id or str(uuid7())
+        started = time.perf_counter()
+        errors = ImportErrorFile(self.error_file_path(import_id), keep=rejected)
+        summary = {
+            "import_id": import_id,
+            # Who ran it; only they (or an admin) may read its progress and rejected rows
+            "user_id": str(user_id) if user_id else None,
+            "status": "running",
+            "format": fmt,
+            "total_rows": 0,
+            "matched_count": 0,
+            "updated_count": 0,
+            "unchanged_count": 0,
+            "error_count": 0,
+            "chunks": 0,
+            "error_file": None,
+            "elapsed_seconds": 0.0
+        }
+
+        async def flush(batch: List[Tuple]):
+            await self._apply_chunk(batch, summary, errors, user_id, results)
+            await errors.flush()
+            summary["chunks"] += 1
+            summary["error_count"] = errors.count
+            summary["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+            if progress:
+                await progress(dict(summary))
+
+        batch: List[Tuple] = []
+        try:
+            async for line_no, parsed, error, raw in iter_warehouse_rows(chunks, fmt):
+                summary["total_rows"] += 1
+                if error:
+                    await errors.write(line_no, error, raw)
+                    continue
+
+                variant_id, sku, quantity = parsed
+                batch.append((line_no, variant_id, sku, quantity, uuid7()))
+                if len(batch) >= self.chunk_size:
+                    await flush(batch)
+                    batch = []
+
+            if batch:
+                await flush(batch)
+            summary["status"] = "completed"
+        except Exception as e:
+            summary["status"] = "failed"
+            summary["message"] = e.message if isinstance(e, APIException) else str(e)
+            logger.error(f"Warehouse import failed", metadata={"import_id": import_id}, exception=e)
+            raise
+        finally:
+            await errors.close()
+            summary["error_count"] = errors.count
+            summary["error_file"] = errors.path if errors.count else None
+            summary["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+            if progress:
+                await progress(dict(summary))
+
+        logger.info(f"Warehouse import completed", metadata={
+            "import_id": import_id,
+            "total_rows": summary["total_rows"],
+            "updated_count": summary["updated_count"],
+            "error_count": summary["error_count"],
+            "elapsed_seconds": summary["elapsed_seconds"]
+        })
+        return summary
+
+    async def _apply_chunk(
+        self,
+        batch: List[Tuple],
+        summary: Dict[str, Any],
+        errors: ImportErrorFile,
+        user_id: Optional[UUID],
+        results: Optional[List[Dict[str, Any]]] = None
+    ):
+        """Stage one chunk with COPY and apply it in a single transaction"""
+        try:
+            conn = await self.db.connection()
+            await conn.execute(CREATE_STAGE_SQL)
+            raw_connection = await conn.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                STAGE_TABLE,
+                records=batch,
+                columns=STAGE_COLUMNS
+            )
+
+            await conn.execute(RESOLVE_SKUS_SQL)
+            for row in (await conn.execute(UNMATCHED_ROWS_SQL)).all():
+                if row.variant_id is None:
+                    await errors.write(row.line_no, f"Unknown SKU '{row.sku}'")
+                else:
+                    await errors.write(row.line_no, f"No inventory record for variant {row.variant_id}")
+
+            matched_count = len((await conn.execute(LOCK_INVENTORY_SQL)).all())
+            updated_rows = (await conn.execute(
+                APPLY_CHUNK_SQL,
+                {"reason": IMPORT_REASON, "user_id": str(user_id) if user_id else None}
+            )).all()
+            for row in updated_rows:
+                queue_stock_change(self.db, row.variant_id, row.product_id, row.new_quantity, row.version)
+            # Availability is marked through the outbox in the chunk's own transaction, whether or
+            # not the change feed (published best effort after commit) is on
+            for product_id in {row.product_id for row in updated_rows if row.product_id}:
+                add_outbox_event(self.db, PRODUCT_AVAILABILITY_CHANGED, product_id)
+            await self.db.commit()
+        except Exception as e:
+            # Bad rows were already sent to the error file; a database or COPY failure stops
+            # the import so it is reported as failed rather than completed with gaps
+            await self.db.rollback()
+            logger.error(f"Warehouse import chunk failed", metadata={
+                "first_line": batch[0][0],
+                "rows": len(batch)
+            }, exception=e)
+            raise APIException(
+                status_code=500,
+                message=f"Warehouse import stopped at the chunk starting on line {batch[0][0]}: {e}"
+            ) from e
+
+        summary["matched_count"] += matched_count
+        summary["updated_count"] += len(updated_rows)
+        summary["unchanged_count"] += matched_count - len(updated_rows)
+        if results is not None:
+            results.extend(
+                {
+                    "variant_id": str(row.variant_id),
+                    "quantity_change": row.new_quantity - row.old_quantity,
+                    "new_quantity": row.new_quantity,
+                    "adjustment_id": str(row.adjustment_id)
+                }
+                for row in updated_rows
+            )
+
+        # Nudge the outbox relay; if this fails the scheduled relay still dispatches the events
+        if updated_rows:
+            try:
+                from core.arq_worker import enqueue_outbox_relay
+                await enqueue_outbox_relay()
+            except Exception as arq_error:
+                logger.warning(f"Failed to enqueue outbox relay for warehouse import: {arq_error}")
+
+
+async def store_import_progress(summary: Dict[str, Any]):
+    """Publish import progress to Redis so other requests can poll it"""
+    from core.cache import RedisService, RedisKeyManager
+
+    await RedisService().set_with_expiry(
+        RedisKeyManager.warehouse_import_key(summary["import_id"]),
+        summary,
+        IMPORT_PROGRESS_TTL
+    )
+
+
+async def get_import_progress(import_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the last published progress for an import"""
+    from core.cache import RedisService, RedisKeyManager
+
+    return await RedisService().get_data(RedisKeyManager.warehouse_import_key(import_id))
@@ -1,28 +1,64 @@
 """
 Webhook Service - Secure Stripe webhook handling with comprehensive security
 Processes Stripe webhooks with signature verification, rate limiting, and secure message publishing
+
+Ingestion is two-phase. The endpoint verifies the signature, dedupes on the event id (Redis
+first, then the unique stripe_event_id in the webhook_events inbox), records the event and
+returns, so Stripe gets its 200 within milliseconds. Worker jobs then process pending
+events in order per payment intent, settling bursts of payment_intent.succeeded in one
+transaction. Delivery to the handlers is at-least-once; they only set statuses.
 """
+import json
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, and_, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from fastapi import HTTPException, Request
-from models.payments import Transaction, PaymentIntent
+from models.payments import Transaction, PaymentIntent, WebhookEvent
 from models.orders import Order
 from services.payments import PaymentService
 from services.inventory import InventoryService
+from services.outbox import add_outbox_event, ORDER_INVOICE_PREGENERATION
 from core.auth.webhook import verify_stripe_webhook_request, WebhookSecurityError
 from uuid import UUID
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
 from core.config import settings
 from core.logging import get_structured_logger
 
 logger = get_structured_logger(__name__)
 
+WEBHOOK_DEDUPE_TTL = 7 * 86400  # Stripe retries deliveries for up to 3 days
+WEBHOOK_BATCH_SIZE = 200
+WEBHOOK_MAX_ATTEMPTS = 5
+
+
+def event_payment_intent_id(event: Dict[str, Any]) -> Optional[str]:
+    """The payment intent an event is about (its ordering key), if any"""
+    obj = event.get("data", {}).get("object", {})
+    if obj.get("object") == "payment_intent":
+        return obj.get("id")
+    payment_intent = obj.get("payment_intent")
+    if isinstance(payment_intent, dict):
+        return payment_intent.get("id")
+    return payment_intent
+
+
+def _merge_transaction_metadata(transaction: Transaction, **fields):
+    """Merge fields into the transaction's JSON metadata text"""
+    current = transaction.transaction_metadata
+    if isinstance(current, str):
+        try:
+            current = json.loads(current)
+        except ValueError:
+            current = {"note": current}
+    transaction.transaction_metadata = json.dumps({**(current or {}), **fields}, default=str)
+
 
 class WebhookService:
     """
     Secure Stripe webhook handling with signature verification
-    Processes webhooks in real-time without storing webhook events
+    Events are recorded in the webhook_events inbox and processed by worker jobs
     """
     
     def __init__(self, db: AsyncSession):
@@ -37,9 +73,9 @@ class WebhookService:
         signature: str
     ) -> Dict[str, Any]:
         """
-        Handle Stripe webhook with comprehensive security verification
+        Verify a Stripe webhook and record it for processing (phase one)
         """
-        start_time = datetime.utcnow()
+        start_time = time.monotonic()
         
         try:
             # Comprehensive security verification
@@ -56,34 +92,186 @@ class WebhookService:
                     detail="Webhook verification failed"
                 )
             
-            event = verification_result["event"]
-            security_metadata = verification_result["security_metadata"]
-            
-            # Process the verified event
-            result = await self._process_webhook_event(event)
-            
-            # Publish secure event update
-            await self._publish_webhook_event(event, result, security_metadata)
+            # The verified raw body is the event as plain JSON, ready for the inbox
+            event = json.loads(request_body)
+            accepted = await self.record_event(event)
+            if accepted:
+                await self._request_processing()
             
-            # Log processing completion
-            processing_time = (datetime.utcnow() - start_time).total_seconds()
-            logger.info(f"Webhook processed successfully: {event['id']} in {processing_time:.3f}s")
+            processing_time = time.monotonic() - start_time
+            logger.info(
+                f"Webhook {'accepted' if accepted else 'duplicate'}: {event['id']} in {processing_time:.3f}s",
+                metadata={"event_type": event["type"]}
+            )
             
             return {
-                "status": "success",
+                "status": "accepted" if accepted else "duplicate",
                 "event_id": event["id"],
                 "event_type": event["type"],
-                "processing_time": processing_time,
-                "result": result
+                "processing_time": processing_time
             }
             
         except WebhookSecurityError as e:
             logger.error(f"Webhook security error: {e}")
             raise HTTPException(status_code=401, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Webhook processing error: {e}")
+            # A non-2xx makes Stripe redeliver, which is what we want if the event wasn't recorded
+            logger.error(f"Webhook ingestion error: {e}")
             raise HTTPException(status_code=500, detail="Webhook processing failed")
+    
+    async def record_event(self, event: Dict[str, Any]) -> bool:
+        """Add a verified event to the inbox; False if it was already received"""
+        from core.cache import RedisKeyManager, get_redis
         
+        seen_key = RedisKeyManager.webhook_event_seen_key(event["id"])
+        redis = None
+        try:
+            redis = await get_redis()
+            if not await redis.set(seen_key, 1, nx=True, ex=WEBHOOK_DEDUPE_TTL):
+                return False
+        except Exception as e:
+            # The inbox's unique event id still dedupes
+            logger.warning(f"Webhook dedupe via Redis unavailable", metadata={"event_id": event["id"]}, exception=e)
+            redis = None
+        
+        try:
+            result = await self.db.execute(
+                pg_insert(WebhookEvent)
+                .values(
+                    stripe_event_id=event["id"],
+                    event_type=event["type"],
+                    stripe_payment_intent_id=event_payment_intent_id(event),
+                    payload=event,
+                    stripe_created=datetime.fromtimestamp(event.get("created") or time.time(), timezone.utc)
+                )
+                .on_conflict_do_nothing(index_elements=[WebhookEvent.stripe_event_id])
+                .returning(WebhookEvent.id)
+            )
+            inserted = result.scalar_one_or_none() is not None
+            await self.db.commit()
+            return inserted
+        except Exception:
+            await self.db.rollback()
+            if redis is not None:
+                # Let Stripe's redelivery through
+                await redis.delete(seen_key)
+            raise
+    
+    async def _request_processing(self):
+        try:
+            from core.arq_worker import enqueue_webhook_processing
+            await enqueue_webhook_processing()
+        except Exception as e:
+            # The inbox is drained on a schedule as well
+            logger.warning(f"Failed to enqueue webhook processing", exception=e)
+    
+    async def process_pending_events(self, batch_size: int = WEBHOOK_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Process the oldest pending inbox events (phase two); callers ensure one drain at a time
+        Events are grouped by payment intent and handled in order within each group; when one
+        fails, the rest of its group waits for the retry. Intents whose only pending event is
+        payment_intent.succeeded are settled together in one transaction.
+        """
+        rows = (await self.db.execute(
+            select(WebhookEvent.id, WebhookEvent.stripe_event_id, WebhookEvent.event_type,
+                   WebhookEvent.stripe_payment_intent_id, WebhookEvent.payload)
+            .where(WebhookEvent.status == "pending")
+            .order_by(WebhookEvent.stripe_created, WebhookEvent.id)
+            .limit(batch_size)
+        )).all()
+        stats = {"fetched": len(rows), "processed": 0, "failed": 0}
+        if not rows:
+            return stats
+        
+        groups: Dict[str, List[Any]] = {}
+        for row in rows:
+            groups.setdefault(row.stripe_payment_intent_id or row.stripe_event_id, []).append(row)
+        
+        succeeded = [
+            group[0] for group in groups.values()
+            if len(group) == 1 and group[0].event_type == "payment_intent.succeeded"
+        ]
+        if succeeded:
+            if await self._process_succeeded_batch(succeeded):
+                stats["processed"] += len(succeeded)
+            else:
+                for row in succeeded:
+                    stats["processed" if await self._process_inbox_event(row) else "failed"] += 1
+        
+        succeeded_ids = {row.id for row in succeeded}
+        for group in groups.values():
+            for row in group:
+                if row.id in succeeded_ids:
+                    continue
+                if not await self._process_inbox_event(row):
+                    stats["failed"] += 1
+                    break
+                stats["processed"] += 1
+        return stats
+    
+    async def _process_succeeded_batch(self, rows: List[Any]) -> bool:
+        try:
+            results = await self._handle_payments_succeeded(
+                [row.payload["data"]["object"] for row in rows],
+                processed_event_ids=[row.id for row in rows]
+            )
+        except Exception as e:
+            await self.db.rollback()
+            logger.warning(
+                f"Batched payment_intent.succeeded failed, processing events one by one",
+                metadata={"count": len(rows)},
+                exception=e
+            )
+            return False
+        for row in rows:
+            await self._publish_webhook_event(row.payload, results.get(row.stripe_payment_intent_id, {}), {})
+        return True
+    
+    async def _process_inbox_event(self, row: Any) -> bool:
+        try:
+            result = await self._process_webhook_event(row.payload)
+            await self._mark_processed([row.id])
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            await self._record_failure(row.id, e)
+            return False
+        await self._publish_webhook_event(row.payload, result, {})
+        return True
+    
+    async def _mark_processed(self, event_ids: List[UUID]):
+        await self.db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(event_ids))
+            .values(
+                status="processed",
+                attempts=WebhookEvent.attempts + 1,
+                processed_at=datetime.now(timezone.utc),
+                last_error=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+    
+    async def _record_failure(self, event_id: UUID, error: Exception):
+        """Count a failed attempt; the event stays pending until WEBHOOK_MAX_ATTEMPTS"""
+        logger.error(f"Webhook event processing failed", metadata={"event_id": str(event_id)}, exception=error)
+        try:
+            await self.db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.id == event_id)
+                .values(
+                    attempts=WebhookEvent.attempts + 1,
+                    last_error=str(error)[:2000],
+                    status=case((WebhookEvent.attempts + 1 >= WEBHOOK_MAX_ATTEMPTS, "failed"), else_="pending")
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Failed to record webhook failure", metadata={"event_id": str(event_id)}, exception=e)
         
     async def _process_webhook_event(
         self,
@@ -111,53 +299,87 @@ class WebhookService:
 
     async def _handle_payment_succeeded(self, payment_intent_data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle successful payment webhook"""
-        stripe_payment_intent_id = payment_intent_data["id"]
+        results = await self._handle_payments_succeeded([payment_intent_data])
+        return results[payment_intent_data["id"]]
+
+    async def _handle_payments_succeeded(
+        self,
+        payment_intents: List[Dict[str, Any]],
+        processed_event_ids: Optional[List[UUID]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Confirm payments and their orders for many payment intents in one transaction
+        processed_event_ids are marked processed in the same transaction.
+        """
+        intents_by_id = {data["id"]: data for data in payment_intents}
         
-        # Find the transaction with lock to prevent race conditions
+        # Lock the payment transactions and their orders to prevent race conditions
         transaction_result = await self.db.execute(
             select(Transaction).where(
-                Transaction.stripe_payment_intent_id == stripe_payment_intent_id
+                and_(
+                    Transaction.stripe_payment_intent_id.in_(list(intents_by_id)),
+                    Transaction.transaction_type == "payment"
+                )
             ).with_for_update()
         )
-        transaction = transaction_result.scalar_one_or_none()
+        transactions = {t.stripe_payment_intent_id: t for t in transaction_result.scalars().all()}
         
-        if transaction:
-            # Update transaction status atomically
-            transaction.status = "succeeded"
-            transaction.transaction_details_metadata = {
-                **transaction.transaction_details_metadata,
-                "webhook_confirmed_at": datetime.utcnow().isoformat(),
-                "stripe_charges": payment_intent_data.get("charges", {})
-            }
+        order_ids = {t.order_id for t in transactions.values() if t.order_id}
+        orders = {}
+        if order_ids:
+            order_result = await self.db.execute(
+                select(Order).where(Order.id.in_(order_ids)).with_for_update()
+            )
+            orders = {order.id: order for order in order_result.scalars().all()}
+        
+        now = datetime.utcnow()
+        results = {}
+        for stripe_payment_intent_id, data in intents_by_id.items():
+            transaction = transactions.get(stripe_payment_intent_id)
+            if not transaction:
+                logger.warning(f"Transaction not found for payment intent {stripe_payment_intent_id}")
+                results[stripe_payment_intent_id] = {
+                    "action": "payment_confirmed",
+                    "warning": "transaction_not_found",
+                    "stripe_payment_intent_id": stripe_payment_intent_id
+                }
+                continue
             
-            # If this is an order payment, update order status atomically
-            if transaction.order_id:
-                order_result = await self.db.execute(
-                    select(Order).where(Order.id == transaction.order_id).with_for_update()
-                )
-                order = order_result.scalar_one_or_none()
-                
-                if order:
-                    # Update order status to confirmed atomically
-                    order.status = "confirmed"
-                    order.version += 1  # Optimistic locking increment
-                    
+            transaction.status = "succeeded"
+            _merge_transaction_metadata(
+                transaction,
+                webhook_confirmed_at=now.isoformat(),
+                stripe_charges=data.get("charges", {})
+            )
             
-            await self.db.commit()
+            # If this is an order payment, confirm the order
+            order = orders.get(transaction.order_id)
+            if order:
+                order.status = "confirmed"
+                order.confirmed_at = order.confirmed_at or now
+                order.version += 1  # Optimistic locking increment
+                # Pre-render the invoice once the confirmation commits
+                add_outbox_event(self.db, ORDER_INVOICE_PREGENERATION, order.id)
             
-            return {
+            results[stripe_payment_intent_id] = {
                 "action": "payment_confirmed",
                 "transaction_id": str(transaction.id),
                 "order_id": str(transaction.order_id) if transaction.order_id else None
             }
         
-        else:
-            logger.warning(f"Transaction not found for payment intent {stripe_payment_intent_id}")
-            return {
-                "action": "payment_confirmed",
-                "warning": "transaction_not_found",
-                "stripe_payment_intent_id": stripe_payment_intent_id
-            }
+        if processed_event_ids:
+            await self._mark_processed(processed_event_ids)
+        await self.db.commit()
+        
+        # Nudge the outbox relay; if this fails the scheduled relay still dispatches the events
+        if orders:
+            try:
+                from core.arq_worker import enqueue_outbox_relay
+                await enqueue_outbox_relay()
+            except Exception as e:
+                logger.warning(f"Failed to enqueue outbox relay after payment confirmation: {e}")
+        
+        return results
 
     async def _handle_payment_failed(self, payment_intent_data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle failed payment webhook with comprehensive failure handling"""
@@ -175,11 +397,11 @@ class WebhookService:
             # Update transaction status atomically
             transaction.status = "failed"
             transaction.failure_reason = payment_intent_data.get("last_payment_error", {}).get("message", "Payment failed")
-            transaction.transaction_details_metadata = {
-                **transaction.transaction_details_metadata,
-                "webhook_failed_at": datetime.utcnow().isoformat(),
-                "failure_details": payment_intent_data.get("last_payment_error", {})
-            }
+            _merge_transaction_metadata(
+                transaction,
+                webhook_failed_at=datetime.utcnow().isoformat(),
+                failure_details=payment_intent_data.get("last_payment_error", {})
+            )
             
             # If this is an order payment, update order status atomically
             if transaction.order_id:
@@ -0,0 +1,36 @@
+"""
+Shared fixtures for the local API stand-ins (Mailjet, Stripe) and their clients' retries
+"""
+from contextlib import asynccontextmanager
+
+import pytest
+
+
+@pytest.fixture
+def standin_client():
+    """
+    Start a stand-in on a free port and build a client for it:
+    async with standin_client(start_standin, make_client, fail_every) as (standin, client)
+    make_client gets the stand-in's base URL; the client is closed before the server stops.
+    """
+    @asynccontextmanager
+    async def run(start_standin, make_client, fail_every: int = 0):
+        runner, standin = await start_standin(port=0, fail_every=fail_every)
+        host, port = runner.addresses[0][:2]
+        client = make_client(f"http://{host}:{port}")
+        try:
+            yield standin, client
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return run
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    """Make a client module's _retry_delay return 0, so retry tests don't sleep"""
+    def patch(module):
+        monkeypatch.setattr(module, "_retry_delay", lambda *args, **kwargs: 0)
+
+    return patch
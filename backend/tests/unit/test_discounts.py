@@ -0,0 +1,119 @@
+"""
+Compiled discount rule evaluation (services.discounts.DiscountRuleIndex)
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from models.discounts import Discount
+from services.discounts import DiscountRule, DiscountRuleIndex
+
+pytestmark = pytest.mark.unit
+
+NOW = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def _rule(code: str, type: str = "percentage", value: float = 10, minimum_amount=None, maximum_discount=None, **window):
+    return DiscountRule(Discount(
+        code=code,
+        type=type,
+        value=value,
+        minimum_amount=minimum_amount,
+        maximum_discount=maximum_discount,
+        valid_from=window.get("valid_from", NOW - timedelta(days=1)),
+        valid_until=window.get("valid_until", NOW + timedelta(days=1)),
+        usage_limit=None,
+        used_count=0,
+        is_active=True,
+    ))
+
+
+def _codes(rules):
+    return sorted(rule.code for rule in rules)
+
+
+class TestCandidates:
+    def test_minimum_amount_is_inclusive(self):
+        index = DiscountRuleIndex([
+            _rule("ANY"),
+            _rule("OVER50", minimum_amount=50),
+            _rule("OVER100", minimum_amount=100),
+        ])
+
+        assert _codes(index.candidates(Decimal("49.99"), NOW)) == ["ANY"]
+        assert _codes(index.candidates(Decimal("50"), NOW)) == ["ANY", "OVER50"]
+        assert _codes(index.candidates(Decimal("250"), NOW)) == ["ANY", "OVER100", "OVER50"]
+
+    def test_groups_are_searched_per_type(self):
+        index = DiscountRuleIndex([
+            _rule("PCT", minimum_amount=80),
+            _rule("FIXED", type="fixed_amount", minimum_amount=20),
+            _rule("SHIP", type="free_shipping"),
+        ])
+
+        assert _codes(index.candidates(Decimal("30"), NOW)) == ["FIXED", "SHIP"]
+
+    def test_validity_window_is_checked_per_evaluation(self):
+        index = DiscountRuleIndex([
+            _rule("LATER", valid_from=NOW + timedelta(hours=1)),
+            _rule("OVER", valid_until=NOW - timedelta(seconds=1)),
+            _rule("NOW"),
+        ])
+
+        assert _codes(index.candidates(Decimal("10"), NOW)) == ["NOW"]
+        assert _codes(index.candidates(Decimal("10"), NOW + timedelta(hours=2))) == ["LATER", "NOW"]
+
+    def test_unknown_types_are_skipped(self):
+        index = DiscountRuleIndex([_rule("BOGO", type="buy_one_get_one"), _rule("PCT")])
+
+        assert len(index) == 1
+        assert _codes(index.candidates(Decimal("10"), NOW)) == ["PCT"]
+
+
+class TestBest:
+    def test_largest_saving_wins(self):
+        index = DiscountRuleIndex([
+            _rule("PCT10", value=10),
+            _rule("FIVE", type="fixed_amount", value=5),
+            _rule("SHIP", type="free_shipping"),
+        ])
+
+        rule, calculation = index.best(Decimal("80"), Decimal("12"), Decimal("4"), NOW)
+
+        assert rule.code == "SHIP"
+        assert calculation.discount_amount == Decimal("12")
+        assert calculation.final_total == Decimal("84")
+
+    def test_percentage_is_capped_by_maximum_discount(self):
+        index = DiscountRuleIndex([
+            _rule("PCT50", value=50, maximum_discount=20),
+            _rule("TWENTYFIVE", type="fixed_amount", value=25),
+        ])
+
+        rule, calculation = index.best(Decimal("200"), now=NOW)
+
+        assert rule.code == "TWENTYFIVE"
+        assert calculation.discount_amount == Decimal("25")
+
+    def test_fixed_amount_never_exceeds_the_subtotal(self):
+        index = DiscountRuleIndex([_rule("BIG", type="fixed_amount", value=100)])
+
+        rule, calculation = index.best(Decimal("30"), Decimal("5"), now=NOW)
+
+        assert calculation.discount_amount == Decimal("30")
+        assert calculation.final_total == Decimal("5")
+
+    def test_no_saving_returns_nothing(self):
+        index = DiscountRuleIndex([_rule("SHIP", type="free_shipping"), _rule("OVER", minimum_amount=100)])
+
+        assert index.best(Decimal("50"), Decimal("0"), now=NOW) == (None, None)
+
+    def test_best_many_matches_best(self):
+        index = DiscountRuleIndex([_rule("PCT10", value=10), _rule("FIVE", type="fixed_amount", value=5, minimum_amount=20)])
+        vectors = [(Decimal("10"), Decimal("0"), Decimal("0")), (Decimal("30"), Decimal("0"), Decimal("0"))]
+
+        results = index.best_many(vectors, NOW)
+
+        assert [rule.code for rule, _ in results] == ["PCT10", "FIVE"]
+        assert [calculation.discount_amount for _, calculation in results] == [Decimal("1"), Decimal("5")]
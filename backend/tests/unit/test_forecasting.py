@@ -0,0 +1,87 @@
+"""
+Vectorized SES / Croston forecasting (services.forecasting)
+"""
+import numpy as np
+import pytest
+
+from services.forecasting import croston_rates, forecast_matrix, ses_rates
+
+pytestmark = pytest.mark.unit
+
+
+class TestSesRates:
+    def test_constant_series_keeps_its_level(self):
+        demand = np.full((2, 30), 5.0)
+
+        np.testing.assert_allclose(ses_rates(demand, 0.2), [5.0, 5.0])
+
+    def test_matches_scalar_smoothing(self):
+        series = np.array([3, 0, 2, 5, 1, 4, 2, 6, 0, 3], dtype=np.float64)
+
+        level = series[:7].mean()
+        for value in series:
+            level += 0.3 * (value - level)
+
+        np.testing.assert_allclose(ses_rates(series[np.newaxis, :], 0.3), [level])
+
+    def test_rows_are_independent(self):
+        demand = np.array([[1.0] * 14, [10.0] * 14])
+
+        np.testing.assert_allclose(ses_rates(demand, 0.2), [1.0, 10.0])
+
+
+class TestCrostonRates:
+    def test_regular_intermittent_series(self):
+        # 4 units every other day: size 4, interval 2, SBA factor (1 - alpha / 2)
+        demand = np.array([[0.0, 4.0] * 20])
+
+        np.testing.assert_allclose(croston_rates(demand, 0.2), [0.9 * 4 / 2])
+
+    def test_row_without_demand_is_zero(self):
+        demand = np.zeros((1, 30))
+
+        np.testing.assert_allclose(croston_rates(demand, 0.2), [0.0])
+
+    def test_first_demand_sets_size_and_interval(self):
+        # Single sale of 6 on day 3: interval is the 3 periods it took to appear
+        demand = np.array([[0.0, 0.0, 6.0, 0.0]])
+
+        np.testing.assert_allclose(croston_rates(demand, 0.2), [0.9 * 6 / 3])
+
+
+class TestForecastMatrix:
+    def test_picks_method_per_row(self):
+        demand = np.array([
+            [2.0] * 28,  # sold every day
+            [0.0, 0.0, 0.0, 5.0] * 7,  # sold every fourth day
+            [0.0] * 28,  # never sold
+        ])
+
+        rate, std, method = forecast_matrix(demand)
+
+        assert list(method) == ["ses", "croston", "none"]
+        np.testing.assert_allclose(rate[0], 2.0)
+        assert rate[1] > 0
+        assert rate[2] == 0.0
+        np.testing.assert_allclose(std, demand.std(axis=1))
+
+    def test_intermittency_cut_off(self):
+        # 3 of 4 days with demand: ADI 1.33 is just over the Syntetos-Boylan cut-off
+        just_over = np.array([[1.0, 1.0, 1.0, 0.0] * 6])
+        # 4 of 5 days: ADI 1.25 stays smooth
+        under = np.array([[1.0, 1.0, 1.0, 1.0, 0.0] * 6])
+
+        assert forecast_matrix(just_over)[2][0] == "croston"
+        assert forecast_matrix(under)[2][0] == "ses"
+
+    def test_rates_are_never_negative(self):
+        demand = np.array([[5.0] * 7 + [0.0] * 21])
+
+        rate, _, _ = forecast_matrix(demand)
+
+        assert rate[0] >= 0.0
+
+    def test_empty_matrix(self):
+        rate, std, method = forecast_matrix(np.zeros((0, 30)))
+
+        assert rate.shape == std.shape == method.shape == (0,)
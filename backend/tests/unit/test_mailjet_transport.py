@@ -0,0 +1,103 @@
+"""
+MailjetTransport / MailjetBatchSender against the local Mailjet stand-in
+"""
+import asyncio
+
+import pytest
+
+from core.utils.messages import mailjet
+from core.utils.messages.mailjet import MailjetBatchSender, MailjetError, MailjetTransport, build_message
+from core.utils.messages.mailjet_standin import start_standin
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def mailjet_standin(standin_client, no_retry_delay):
+    """Stand-in plus a batch sender pointed at it"""
+    no_retry_delay(mailjet)
+
+    def start(fail_every: int = 0, max_retries: int = 2, batch_size: int = 10, linger_ms: int = 50):
+        return standin_client(
+            start_standin,
+            lambda base_url: MailjetBatchSender(
+                transport=MailjetTransport(base_url=base_url, max_retries=max_retries),
+                batch_size=batch_size,
+                linger_ms=linger_ms
+            ),
+            fail_every
+        )
+
+    return start
+
+
+def _message(index: int, domain: str = "example.com"):
+    return build_message(f"user{index}@{domain}", f"Subject {index}", f"<p>{index}</p>", custom_id=f"msg-{index}")
+
+
+async def test_concurrent_sends_are_coalesced_into_batches(mailjet_standin):
+    async with mailjet_standin(batch_size=10) as (standin, sender):
+        results = await asyncio.gather(*(sender.send(_message(i)) for i in range(25)))
+
+        assert sorted(len(batch) for batch in standin.batches) == [5, 10, 10]
+        assert all(result["status"] == "success" for result in results)
+        assert [result["recipients"] for result in results] == [[f"user{i}@example.com"] for i in range(25)]
+        assert len({result["message_ids"][0] for result in results}) == 25
+
+
+async def test_send_bulk_splits_into_full_batches(mailjet_standin):
+    async with mailjet_standin(batch_size=50) as (standin, sender):
+        results = await sender.send_bulk([_message(i) for i in range(120)])
+
+        assert standin.requests == 3
+        assert sorted(len(batch) for batch in standin.batches) == [20, 50, 50]
+        assert len(results) == 120
+        assert all(result["status"] == "success" for result in results)
+
+
+async def test_rejected_message_fails_alone_in_bulk(mailjet_standin):
+    async with mailjet_standin() as (standin, sender):
+        messages = [_message(i) for i in range(5)]
+        messages[2] = build_message("reject@example.com", "Subject", "<p>x</p>")
+
+        results = await sender.send_bulk(messages)
+
+        assert [result["status"] for result in results] == ["success", "success", "error", "success", "success"]
+        assert results[2]["errors"]
+        assert len(standin.messages) == 4
+
+
+async def test_rejected_message_raises_only_for_its_sender(mailjet_standin):
+    async with mailjet_standin() as (standin, sender):
+        results = await asyncio.gather(
+            sender.send(_message(1)),
+            sender.send(build_message("reject@example.com", "Subject", "<p>x</p>")),
+            sender.send(_message(2)),
+            return_exceptions=True
+        )
+
+        assert standin.requests == 1
+        assert results[0]["status"] == "success"
+        assert isinstance(results[1], MailjetError)
+        assert results[2]["status"] == "success"
+
+
+async def test_unavailable_response_is_retried(mailjet_standin):
+    async with mailjet_standin(fail_every=2) as (standin, sender):
+        first = await sender.send(_message(1))
+        second = await sender.send(_message(2))
+
+        # Request 2 got a 503 and was retried as request 3
+        assert standin.requests == 3
+        assert first["status"] == second["status"] == "success"
+        assert len(standin.messages) == 2
+
+
+async def test_gives_up_after_max_retries(mailjet_standin):
+    async with mailjet_standin(fail_every=1, max_retries=2) as (standin, sender):
+        with pytest.raises(MailjetError) as exc_info:
+            await sender.send(_message(1))
+
+        assert exc_info.value.status == 503
+        assert standin.requests == 3
+        assert standin.messages == []
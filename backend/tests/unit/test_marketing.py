@@ -0,0 +1,83 @@
+"""
+Restock detection over the inventory change feed (services.marketing)
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from core.config import settings
+from services.marketing import cart_abandonment_window, detect_restocks
+
+pytestmark = pytest.mark.unit
+
+
+class HashRedis:
+    """Stands in for the one Redis hash detect_restocks reads and writes; values come back as bytes"""
+
+    def __init__(self, levels=None):
+        self.levels = {key: str(value).encode() for key, value in (levels or {}).items()}
+
+    async def hmget(self, key, fields):
+        return [self.levels.get(field) for field in fields]
+
+    async def hset(self, key, mapping):
+        self.levels.update({field: str(value).encode() for field, value in mapping.items()})
+
+
+def _change(variant_id: str, new_available: int):
+    return {"variant_id": variant_id, "new_available": new_available}
+
+
+class TestDetectRestocks:
+    async def test_zero_to_positive_is_a_restock(self):
+        redis = HashRedis({"v1": 0})
+
+        restocked = await detect_restocks([_change("v1", 5)], redis=redis)
+
+        assert restocked == [_change("v1", 5)]
+        assert redis.levels["v1"] == b"5"
+
+    async def test_first_sighting_only_records_the_level(self):
+        redis = HashRedis()
+
+        assert await detect_restocks([_change("v1", 5)], redis=redis) == []
+        assert redis.levels["v1"] == b"5"
+
+    async def test_positive_to_positive_is_not_a_restock(self):
+        assert await detect_restocks([_change("v1", 8)], redis=HashRedis({"v1": 3})) == []
+
+    async def test_sell_out_and_restock_within_one_batch(self):
+        redis = HashRedis({"v1": 2})
+
+        restocked = await detect_restocks([_change("v1", 0), _change("v1", 4)], redis=redis)
+
+        assert restocked == [_change("v1", 4)]
+        assert redis.levels["v1"] == b"4"
+
+    async def test_one_entry_per_variant_with_the_latest_change(self):
+        redis = HashRedis({"v1": 0, "v2": 0})
+
+        restocked = await detect_restocks(
+            [_change("v1", 1), _change("v2", 3), _change("v1", 0), _change("v1", 6)],
+            redis=redis
+        )
+
+        assert sorted(restocked, key=lambda change: change["variant_id"]) == [_change("v1", 6), _change("v2", 3)]
+
+    async def test_negative_level_counts_as_out_of_stock(self):
+        assert await detect_restocks([_change("v1", 1)], redis=HashRedis({"v1": -2})) == [_change("v1", 1)]
+
+    async def test_no_changes_skips_redis(self):
+        assert await detect_restocks([], redis=None) == []
+
+
+class TestCartAbandonmentWindow:
+    def test_window_is_the_hour_before_the_idle_cut_off(self, monkeypatch):
+        monkeypatch.setattr(settings, "CART_ABANDONMENT_AFTER_HOURS", 24)
+
+        window = cart_abandonment_window(datetime(2026, 3, 2, 10, 37, tzinfo=timezone.utc))
+
+        assert window == {
+            "idle_since": datetime(2026, 3, 1, 9, tzinfo=timezone.utc).isoformat(),
+            "idle_before": datetime(2026, 3, 1, 10, tzinfo=timezone.utc).isoformat(),
+        }
@@ -0,0 +1,171 @@
+"""
+Rollup bucketing and zero-filled series reads (services.metrics_rollup)
+"""
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services.metrics_rollup import (
+    MetricsRollupService,
+    bucket_key,
+    bucket_revenue,
+    empty_metrics,
+    floor_bucket,
+    iter_buckets,
+)
+
+pytestmark = pytest.mark.unit
+
+
+class RollupSession:
+    """Stands in for AsyncSession.execute over a list of rollup rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        rows = self.rows
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: rows))
+
+
+def _row(bucket, order_count=1, revenue=10.0):
+    return SimpleNamespace(
+        bucket=bucket,
+        order_count=order_count,
+        paid_order_count=order_count,
+        revenue=revenue,
+        new_users=0,
+        status_breakdown=None,
+    )
+
+
+class TestFloorBucket:
+    def test_day_truncates_to_midnight_utc(self):
+        moment = datetime(2026, 3, 14, 15, 9, 26, 535, tzinfo=timezone.utc)
+
+        assert floor_bucket("day", moment) == datetime(2026, 3, 14, tzinfo=timezone.utc)
+
+    def test_hour_truncates_to_the_hour(self):
+        moment = datetime(2026, 3, 14, 15, 9, 26, tzinfo=timezone.utc)
+
+        assert floor_bucket("hour", moment) == datetime(2026, 3, 14, 15, tzinfo=timezone.utc)
+
+    def test_naive_moments_are_treated_as_utc(self):
+        assert floor_bucket("hour", datetime(2026, 3, 14, 15, 30)) == datetime(2026, 3, 14, 15, tzinfo=timezone.utc)
+
+    def test_aware_moments_are_converted_before_truncating(self):
+        # 01:30 at UTC+3 is still the previous UTC day
+        moment = datetime(2026, 3, 14, 1, 30, tzinfo=timezone(timedelta(hours=3)))
+
+        assert floor_bucket("day", moment) == datetime(2026, 3, 13, tzinfo=timezone.utc)
+        assert floor_bucket("hour", moment) == datetime(2026, 3, 13, 22, tzinfo=timezone.utc)
+
+
+class TestIterBuckets:
+    def test_day_range_is_inclusive_of_both_ends(self):
+        start = datetime(2026, 3, 1, 18, tzinfo=timezone.utc)
+        end = datetime(2026, 3, 4, 2, tzinfo=timezone.utc)
+
+        assert iter_buckets("day", start, end) == [
+            datetime(2026, 3, day, tzinfo=timezone.utc) for day in (1, 2, 3, 4)
+        ]
+
+    def test_hour_range_steps_hourly(self):
+        start = datetime(2026, 3, 1, 22, 45, tzinfo=timezone.utc)
+        end = datetime(2026, 3, 2, 1, 5, tzinfo=timezone.utc)
+
+        assert iter_buckets("hour", start, end) == [
+            datetime(2026, 3, 1, 22, tzinfo=timezone.utc),
+            datetime(2026, 3, 1, 23, tzinfo=timezone.utc),
+            datetime(2026, 3, 2, 0, tzinfo=timezone.utc),
+            datetime(2026, 3, 2, 1, tzinfo=timezone.utc),
+        ]
+
+    def test_start_and_end_in_the_same_bucket(self):
+        start = datetime(2026, 3, 1, 1, tzinfo=timezone.utc)
+
+        assert iter_buckets("day", start, start + timedelta(hours=5)) == [datetime(2026, 3, 1, tzinfo=timezone.utc)]
+
+    def test_end_before_start_is_empty(self):
+        start = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+        assert iter_buckets("day", start, start - timedelta(days=1)) == []
+
+
+class TestBucketValues:
+    def test_day_keys_are_dates_and_hour_keys_datetimes(self):
+        start = datetime(2026, 3, 1, 5, tzinfo=timezone.utc)
+
+        assert bucket_key("day", floor_bucket("day", start)) == date(2026, 3, 1)
+        assert bucket_key("hour", start) == start
+
+    def test_revenue_by_paid_status_only(self):
+        metrics = empty_metrics(date(2026, 3, 1))
+        metrics["revenue"] = 30.0
+        metrics["status_breakdown"] = {
+            "DELIVERED": {"orders": 2, "revenue": 20.0},
+            "CANCELLED": {"orders": 1, "revenue": 99.0},
+        }
+
+        assert bucket_revenue(metrics) == 30.0
+        assert bucket_revenue(metrics, "delivered") == 20.0
+        assert bucket_revenue(metrics, "cancelled") == 0.0
+
+
+class TestGetSeries:
+    async def test_closed_buckets_are_read_and_gaps_zero_filled(self):
+        start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        session = RollupSession([_row(date(2026, 3, 2), order_count=3, revenue=45.0)])
+
+        series = await MetricsRollupService(session).get_series("day", start, start + timedelta(days=2))
+
+        assert session.queries == 1
+        assert [entry["bucket"] for entry in series] == [date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 3)]
+        assert series[0] == empty_metrics(date(2026, 3, 1))
+        assert series[1]["order_count"] == 3
+        assert series[1]["revenue"] == 45.0
+        assert series[1]["status_breakdown"] == {}
+        assert series[2] == empty_metrics(date(2026, 3, 3))
+
+    async def test_current_bucket_is_aggregated_live(self, monkeypatch):
+        now = datetime.now(timezone.utc)
+        current = floor_bucket("hour", now)
+        previous = current - timedelta(hours=1)
+        service = MetricsRollupService(RollupSession([_row(previous)]))
+        aggregated = []
+
+        async def aggregate(unit, start, end):
+            aggregated.append((start, end))
+            live = empty_metrics(start)
+            live["order_count"] = 7
+            return {start: live}
+
+        monkeypatch.setattr(service, "aggregate", aggregate)
+
+        series = await service.get_series("hour", previous, now)
+
+        assert aggregated == [(current, current + timedelta(hours=1))]
+        assert [entry["order_count"] for entry in series] == [1, 7]
+
+    async def test_past_range_skips_live_aggregation(self, monkeypatch):
+        service = MetricsRollupService(RollupSession([]))
+
+        async def aggregate(unit, start, end):
+            raise AssertionError("closed range must not aggregate live")
+
+        monkeypatch.setattr(service, "aggregate", aggregate)
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+        series = await service.get_series("day", start, start + timedelta(days=1))
+
+        assert series == [empty_metrics(date(2026, 1, 1)), empty_metrics(date(2026, 1, 2))]
+
+    async def test_empty_range_does_not_query(self):
+        session = RollupSession([])
+        start = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+        assert await MetricsRollupService(session).get_series("day", start, start - timedelta(days=1)) == []
+        assert session.queries == 0
@@ -0,0 +1,147 @@
+"""
+Rate limiting: client identification and per-worker token leases (core.middleware.rate_limit)
+"""
+import asyncio
+import time
+
+import pytest
+from jose import jwt
+from starlette.datastructures import Headers
+
+from core.config import settings
+from core.middleware.rate_limit import RateLimitMiddleware, TokenLeaseBuckets
+
+pytestmark = pytest.mark.unit
+
+SECRET = "unit-test-secret-key-that-is-long-enough-for-hs256"
+
+
+class BudgetService:
+    """Stands in for RateLimitService.take_tokens with a plain per-key budget"""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.calls = []
+
+    async def take_tokens(self, key, limit, window_seconds, requested=1, returned=0, partial=False):
+        self.calls.append({"requested": requested, "returned": returned})
+        await asyncio.sleep(0)
+        self.budget += returned
+        granted = min(requested, self.budget) if partial else (requested if requested <= self.budget else 0)
+        self.budget -= granted
+        retry_after_ms = 0 if granted else 1000
+        return [granted, self.budget, retry_after_ms, 60000]
+
+
+@pytest.fixture
+def middleware(monkeypatch):
+    monkeypatch.setattr(settings, "SECRET_KEY", SECRET)
+    monkeypatch.setattr(settings, "ALGORITHM", "HS256")
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUSTED_PROXIES", ["10.0.0.0/8"])
+    return RateLimitMiddleware(app=None)
+
+
+@pytest.fixture
+async def make_buckets():
+    created = []
+
+    def make(budget: int, lease_ttl: float = 60):
+        service = BudgetService(budget)
+        buckets = TokenLeaseBuckets(service, lease_fraction=0.1, lease_ttl=lease_ttl)
+        created.append(buckets)
+        return service, buckets
+
+    yield make
+    for buckets in created:
+        if buckets._sweeper is not None:
+            buckets._sweeper.cancel()
+
+
+def _scope(peer: str = "203.0.113.7", headers=None):
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return {"type": "http", "client": (peer, 50000), "headers": raw, "path": "/v1/products", "method": "GET"}
+
+
+def _identify(middleware, peer="203.0.113.7", **headers):
+    scope = _scope(peer, {name.replace("_", "-"): value for name, value in headers.items()})
+    return middleware._get_client_identifier(scope, Headers(scope=scope))
+
+
+def _token(token_type="access", expires_in=300, sub="user-1"):
+    return jwt.encode({"sub": sub, "type": token_type, "exp": int(time.time()) + expires_in}, SECRET, algorithm="HS256")
+
+
+class TestClientIdentifier:
+    def test_valid_access_token_keys_on_the_user(self, middleware):
+        assert _identify(middleware, authorization=f"Bearer {_token()}") == "user:user-1"
+
+    def test_refresh_token_is_not_a_user(self, middleware):
+        assert _identify(middleware, authorization=f"Bearer {_token('refresh')}") == "ip:203.0.113.7"
+
+    def test_expired_or_forged_token_is_anonymous(self, middleware):
+        forged = jwt.encode({"sub": "admin", "type": "access"}, "some-other-secret", algorithm="HS256")
+
+        assert _identify(middleware, authorization=f"Bearer {_token(expires_in=-10)}") == "ip:203.0.113.7"
+        assert _identify(middleware, authorization=f"Bearer {forged}") == "ip:203.0.113.7"
+
+    def test_forwarded_headers_from_untrusted_peers_are_ignored(self, middleware):
+        assert _identify(middleware, x_forwarded_for="198.51.100.1", x_real_ip="198.51.100.2") == "ip:203.0.113.7"
+
+    def test_forwarded_for_is_read_from_the_right_through_trusted_proxies(self, middleware):
+        # The client prepended a spoofed hop; our proxies appended the real one and themselves
+        forwarded = "1.2.3.4, 198.51.100.9, 10.0.0.5"
+
+        assert _identify(middleware, peer="10.0.0.2", x_forwarded_for=forwarded) == "ip:198.51.100.9"
+
+    def test_real_ip_from_a_trusted_proxy(self, middleware):
+        assert _identify(middleware, peer="10.0.0.2", x_real_ip="198.51.100.3") == "ip:198.51.100.3"
+
+    def test_user_agent_does_not_change_the_key(self, middleware):
+        assert _identify(middleware, user_agent="a") == _identify(middleware, user_agent="b")
+
+
+class TestTokenLeaseBuckets:
+    async def test_lease_serves_requests_locally(self, make_buckets):
+        service, buckets = make_buckets(100)
+
+        results = [await buckets.acquire("k", 100, 60) for _ in range(10)]
+
+        assert all(result["allowed"] for result in results)
+        assert len(service.calls) == 1
+        assert service.calls[0]["requested"] == 10
+
+    async def test_concurrent_refills_are_single_flight(self, make_buckets):
+        service, buckets = make_buckets(100)
+
+        results = await asyncio.gather(*(buckets.acquire("k", 100, 60) for _ in range(10)))
+
+        assert all(result["allowed"] for result in results)
+        assert len(service.calls) == 1
+
+    async def test_denied_once_the_budget_is_gone(self, make_buckets):
+        service, buckets = make_buckets(3)
+
+        results = [await buckets.acquire("k", 100, 60) for _ in range(4)]
+
+        assert [result["allowed"] for result in results] == [True, True, True, False]
+        assert results[-1]["retry_after"] == 1
+
+    async def test_expired_lease_returns_its_unused_tokens(self, make_buckets):
+        service, buckets = make_buckets(100, lease_ttl=0.01)
+
+        await buckets.acquire("k", 100, 60)
+        await asyncio.sleep(0.02)
+        await buckets.acquire("k", 100, 60)
+
+        assert service.calls[1]["returned"] == 9
+
+    async def test_sweep_credits_idle_leases_once(self, make_buckets):
+        service, buckets = make_buckets(100, lease_ttl=0.01)
+
+        await buckets.acquire("k", 100, 60)
+        await asyncio.sleep(0.02)
+        await buckets.sweep()
+        await buckets.sweep()
+
+        assert service.budget == 99
+        assert [call["returned"] for call in service.calls] == [0, 9]
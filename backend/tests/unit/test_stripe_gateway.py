@@ -0,0 +1,171 @@
+"""
+StripeGateway against the local Stripe stand-in, and Stripe form encoding
+"""
+import pytest
+import stripe
+
+from services.payments import stripe_gateway
+from services.payments.stripe_gateway import StripeGateway, encode_params
+from services.payments.stripe_standin import decode_params, start_standin
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def stripe_standin(standin_client, no_retry_delay):
+    """Stand-in plus a gateway pointed at it"""
+    no_retry_delay(stripe_gateway)
+
+    def start(fail_every: int = 0, max_retries: int = 2):
+        return standin_client(
+            start_standin,
+            lambda base_url: StripeGateway(base_url=base_url, api_key="sk_test_standin", max_retries=max_retries),
+            fail_every
+        )
+
+    return start
+
+
+class TestEncodeParams:
+    def test_flat_params(self):
+        assert encode_params({"amount": 1999, "currency": "usd"}) == [("amount", "1999"), ("currency", "usd")]
+
+    def test_nested_dict(self):
+        params = {"metadata": {"order_id": "o-1", "user_id": "u-1"}}
+
+        assert encode_params(params) == [("metadata[order_id]", "o-1"), ("metadata[user_id]", "u-1")]
+
+    def test_deeply_nested_dict(self):
+        params = {"automatic_payment_methods": {"enabled": True, "allow_redirects": "never"}, "shipping": {"address": {"city": "Lagos"}}}
+
+        assert encode_params(params) == [
+            ("automatic_payment_methods[enabled]", "true"),
+            ("automatic_payment_methods[allow_redirects]", "never"),
+            ("shipping[address][city]", "Lagos"),
+        ]
+
+    def test_list_of_scalars(self):
+        assert encode_params({"expand": ["customer", "latest_charge"]}) == [
+            ("expand[0]", "customer"),
+            ("expand[1]", "latest_charge"),
+        ]
+
+    def test_list_of_dicts(self):
+        params = {"items": [{"price": "price_1", "quantity": 2}, {"price": "price_2", "metadata": {"gift": False}}]}
+
+        assert encode_params(params) == [
+            ("items[0][price]", "price_1"),
+            ("items[0][quantity]", "2"),
+            ("items[1][price]", "price_2"),
+            ("items[1][metadata][gift]", "false"),
+        ]
+
+    def test_none_values_are_omitted(self):
+        assert encode_params({"email": None, "name": "Ada", "metadata": {"note": None}}) == [("name", "Ada")]
+
+    def test_round_trips_through_standin_decoding(self):
+        params = {"amount": 500, "metadata": {"order_id": "o-1"}, "expand": ["customer"]}
+
+        assert decode_params(dict(encode_params(params))) == {
+            "amount": "500",
+            "metadata": {"order_id": "o-1"},
+            "expand": {"0": "customer"},
+        }
+
+
+async def test_customer_round_trip(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        customer = await gateway.create_customer(email="ada@example.com", name="Ada", metadata={"user_id": "u-1"})
+        fetched = await gateway.retrieve_customer(customer.id)
+
+        assert isinstance(customer, stripe.StripeObject)
+        assert fetched.id == customer.id
+        assert fetched.email == "ada@example.com"
+        assert fetched.metadata["user_id"] == "u-1"
+
+
+async def test_missing_customer_raises_invalid_request(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        with pytest.raises(stripe.error.InvalidRequestError) as exc_info:
+            await gateway.retrieve_customer("cus_missing")
+
+        assert exc_info.value.http_status == 404
+        assert exc_info.value.code == "resource_missing"
+
+
+async def test_attach_and_detach_payment_method(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        customer = await gateway.create_customer(email="ada@example.com")
+
+        attached = await gateway.attach_payment_method("pm_card_visa", customer=customer.id)
+        assert attached.customer == customer.id
+
+        with pytest.raises(stripe.error.InvalidRequestError, match="already been attached"):
+            await gateway.attach_payment_method("pm_card_visa", customer=customer.id)
+
+        detached = await gateway.detach_payment_method("pm_card_visa")
+        assert detached.customer is None
+
+
+async def test_payment_intent_confirm_and_refund(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        customer = await gateway.create_customer(email="ada@example.com")
+        intent = await gateway.create_payment_intent(
+            amount=2500,
+            currency="usd",
+            customer=customer.id,
+            metadata={"order_id": "o-1"}
+        )
+        assert intent.status == "requires_payment_method"
+
+        confirmed = await gateway.confirm_payment_intent(intent.id, payment_method="pm_card_visa")
+        assert confirmed.status == "succeeded"
+        assert confirmed.metadata["order_id"] == "o-1"
+
+        refund = await gateway.create_refund(payment_intent=intent.id, amount=1000)
+        assert refund.status == "succeeded"
+        assert refund.amount == 1000
+
+
+async def test_declined_card_raises_card_error(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        intent = await gateway.create_payment_intent(amount=2500, currency="usd")
+
+        with pytest.raises(stripe.error.CardError) as exc_info:
+            await gateway.confirm_payment_intent(intent.id, payment_method="pm_card_declined")
+
+        assert exc_info.value.http_status == 402
+        assert exc_info.value.code == "card_declined"
+        # Card errors are final; they are not retried
+        assert standin.requests == 2
+
+
+async def test_same_idempotency_key_replays_the_first_response(stripe_standin):
+    async with stripe_standin() as (standin, gateway):
+        first = await gateway.create_payment_intent(amount=2500, currency="usd", idempotency_key="order-1")
+        second = await gateway.create_payment_intent(amount=2500, currency="usd", idempotency_key="order-1")
+        other = await gateway.create_payment_intent(amount=2500, currency="usd", idempotency_key="order-2")
+
+        assert second.id == first.id
+        assert other.id != first.id
+        assert len([obj for obj in standin.objects.values() if obj["object"] == "payment_intent"]) == 2
+
+
+async def test_unavailable_response_is_retried_with_the_same_key(stripe_standin):
+    async with stripe_standin(fail_every=2) as (standin, gateway):
+        customer = await gateway.create_customer(email="ada@example.com")
+        # Request 2 gets a 503 and is retried as request 3
+        intent = await gateway.create_payment_intent(amount=2500, currency="usd", customer=customer.id)
+
+        assert standin.requests == 3
+        assert intent.customer == customer.id
+        assert len(standin.idempotent) == 2
+
+
+async def test_gives_up_after_max_retries(stripe_standin):
+    async with stripe_standin(fail_every=1, max_retries=2) as (standin, gateway):
+        with pytest.raises(stripe.error.APIError) as exc_info:
+            await gateway.create_customer(email="ada@example.com")
+
+        assert exc_info.value.http_status == 503
+        assert standin.requests == 3